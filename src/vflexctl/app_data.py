@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+__all__ = ["app_data_dir"]
+
+APP_NAME = "vflexctl"
+
+
+def app_data_dir() -> Path:
+    """
+    The directory vflexctl keeps its on-disk state in (tuned pacing, port indexes, etc.).
+
+    ``VFLEXCTL_DATA_DIR`` overrides it. Otherwise it's the platform's usual per-user config
+    location: ``$XDG_CONFIG_HOME/vflexctl`` (or ``~/.config/vflexctl``) on Linux,
+    ``~/Library/Application Support/vflexctl`` on macOS and ``%APPDATA%\\vflexctl`` on Windows.
+
+    The directory isn't created here; writers should create it when they need it.
+
+    :return: Path to the data directory.
+    """
+    if override := os.environ.get("VFLEXCTL_DATA_DIR"):
+        return Path(override)
+    if sys.platform == "win32":
+        return Path(os.environ.get("APPDATA", Path.home() / "AppData" / "Roaming")) / APP_NAME
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Application Support" / APP_NAME
+    return Path(os.environ.get("XDG_CONFIG_HOME", Path.home() / ".config")) / APP_NAME
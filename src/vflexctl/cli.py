@@ -1,23 +1,55 @@
 from enum import StrEnum
-from functools import partial
-from typing import Callable
+from functools import cache
+from operator import methodcaller
+from pathlib import Path
+from typing import Callable, TYPE_CHECKING, cast
 
 import click
 import typer
-from rich import print, console
 
-from vflexctl.command.led import LEDColour
 from vflexctl.context import AppContext
-from vflexctl.device_interface import VFlex
-from vflexctl.input_handler.voltage_convert import decimal_normalise_voltage
+
+if TYPE_CHECKING:
+    from rich.console import Console
+
+    from vflexctl.command.led import LEDColour
+    from vflexctl.daemon.client import RemoteVFlex
+    from vflexctl.device_interface.apply import Change, Profile
+    from vflexctl.device_interface import VFlex, VFlexFleet
+    from vflexctl.device_interface.timings import Timings
+    from vflexctl.midi_transport.replay import Replay
 
 __all__ = ["cli"]
 
+# Startup time matters for a CLI that gets called from scripts, so anything heavy (rich, mido,
+# structlog and the whole device stack) is imported inside the commands that need it. --help and
+# --version never touch MIDI. test/unit/test_startup.py keeps this honest.
+
 cli: typer.Typer = typer.Typer(name="vflexctl", no_args_is_help=True)
 
 
 VFLEX_MIDI_INTEGER_LIMIT = 65535
-stderr = console.Console(stderr=True)
+
+# How long (in seconds) ``apply`` trusts the state read when the devices were woken up.
+APPLY_STATE_TTL = 2.0
+
+
+@cache
+def _stderr() -> "Console":
+    from rich.console import Console
+
+    return Console(stderr=True)
+
+
+def print(*objects: object) -> None:
+    from rich import print as rich_print
+
+    rich_print(*objects)
+
+
+class BackendOption(StrEnum):
+    MIDO = "mido"
+    RTMIDI = "rtmidi"
 
 
 class LEDOption(StrEnum):
@@ -41,7 +73,9 @@ class LEDColourOption(StrEnum):
     MAGENTA = "magenta"
     CYAN = "cyan"
 
-    def to_led_colour(self) -> LEDColour:
+    def to_led_colour(self) -> "LEDColour":
+        from vflexctl.command.led import LEDColour
+
         return LEDColour[self.upper()]
 
 
@@ -52,11 +86,173 @@ def _get_app_context() -> AppContext:
     return obj
 
 
-def _get_connected_v_flex(full_handshake: bool = False) -> VFlex:
-    return VFlex.get_any(full_handshake=full_handshake)
+def _get_connected_v_flex(full_handshake: bool = False) -> "VFlex | RemoteVFlex":
+    socket_path = _get_app_context().socket_path
+    if socket_path is not None:
+        from vflexctl.daemon.client import DaemonClient, RemoteVFlex
+
+        try:
+            return RemoteVFlex(DaemonClient(socket_path), full_handshake=full_handshake)
+        except OSError as e:
+            _stderr().print(f"[yellow]Could not reach vflexctld ({e}), connecting to the VFlex directly.[/yellow]")
+    return _open_v_flex(full_handshake=full_handshake)
+
+
+def _open_v_flex(full_handshake: bool = False, port: str | None = None, event_driven: bool = False) -> "VFlex":
+    """
+    Opens the VFlex to run a command on directly: the connected one, or with ``--replay``, the one on
+    ``port`` in the capture (the first one if None).
+
+    :param event_driven: Whether to receive through a port callback instead of polling the port, for
+        commands that keep the port open for a long time.
+    """
+    from vflexctl.device_interface import VFlex
+
+    context = _get_app_context()
+    if context.replay is None:
+        return VFlex.get_any(
+            full_handshake=full_handshake,
+            backend=context.backend,
+            capture=context.capture,
+            timings=context.timings,
+            retry_policy=context.retry_policy,
+            event_driven=event_driven,
+        )
+    v_flex = VFlex(
+        context.replay.transport(port),
+        full_handshake=full_handshake,
+        capture=context.capture,
+        timings=context.timings,
+        retry_policy=context.retry_policy,
+        event_driven=event_driven,
+    )
+    # Pacing tuned for a real device would only slow a replay down (and could differ between machines).
+    v_flex.use_tuned_pacing = False
+    if context.replay.speed is None:
+        v_flex.pause_length = 0
+    return v_flex
+
+
+def report_replay(replay: "Replay") -> None:
+    """
+    Prints how the traffic of a ``--replay`` run compared with the capture, then closes it.
+    """
+    try:
+        if not replay.transports:
+            return None
+        for divergence in replay.divergences:
+            _stderr().print(f"[yellow]Diverged:[/yellow] {divergence}")
+        if replay.unsent:
+            _stderr().print(f"[yellow]{replay.unsent} captured MIDI message(s) were never sent.[/yellow]")
+        if replay.matched:
+            _stderr().print("[green]The traffic matched the capture.[/green]")
+    finally:
+        replay.close()
+    return None
+
 
+def report_timings(timings: "Timings") -> None:
+    """
+    Prints where the time went in each device operation of a ``--timings`` run, slowest phase first.
+    """
+    for timing in timings.operations:
+        phases = sorted(timing.phases.items(), key=lambda phase: phase[1], reverse=True)
+        breakdown = ", ".join(f"{name} {seconds * 1000:.2f} ms" for name, seconds in [*phases, ("other", timing.other)])
+        _stderr().print(f"[dim]{timing.operation}: {timing.total * 1000:.2f} ms ({breakdown})[/dim]")
+    return None
 
-def _current_state_str(v_flex: VFlex) -> str:
+
+def _get_selected_fleet(event_driven: bool = False) -> "VFlexFleet | None":
+    """
+    The devices picked with ``--all`` or ``--serial``, all woken up. None if neither option was
+    used, in which case commands work on the one connected VFlex (possibly through vflexctld).
+
+    :param event_driven: Whether to receive through a port callback instead of polling the ports.
+    """
+    context = _get_app_context()
+    if not context.select_all and not context.serials:
+        return None
+    from vflexctl.device_interface import VFlex, VFlexFleet
+
+    if context.replay is not None:
+        replayed = [
+            _open_v_flex(full_handshake=context.deep_adjust, port=port, event_driven=event_driven)
+            for port in context.replay.ports
+        ]
+        for v_flex in replayed:
+            v_flex.initial_wake_up()
+        fleet = VFlexFleet(v for v in replayed if not context.serials or v.serial_number in context.serials)
+    elif not context.select_all:
+        # Devices picked by serial number are found through the port index, which usually saves
+        # probing every port.
+        selected = []
+        for serial in dict.fromkeys(context.serials):
+            try:
+                selected.append(
+                    VFlex.with_serial(
+                        serial,
+                        full_handshake=context.deep_adjust,
+                        wake=True,
+                        backend=context.backend,
+                        capture=context.capture,
+                        timings=context.timings,
+                        retry_policy=context.retry_policy,
+                        event_driven=event_driven,
+                    )
+                )
+            except RuntimeError:
+                continue
+        fleet = VFlexFleet(selected)
+    else:
+        fleet = VFlexFleet.discover(
+            serials=context.serials or None,
+            full_handshake=context.deep_adjust,
+            backend=context.backend,
+            capture=context.capture,
+            timings=context.timings,
+            retry_policy=context.retry_policy,
+            event_driven=event_driven,
+        )
+    missing = [serial for serial in context.serials if serial not in fleet.devices]
+    if missing or not fleet:
+        fleet.close()
+        reason = f"with serial number(s) {', '.join(missing)}" if missing else "at all"
+        _stderr().print(f"[bold red]Error:[/bold red] Could not find a connected VFlex {reason}.")
+        raise typer.Exit(code=1)
+    return fleet
+
+
+def _load_profile(profile_path: Path) -> "Profile":
+    from vflexctl.device_interface.apply import load_profile_toml
+
+    try:
+        return load_profile_toml(profile_path)
+    except ValueError as e:
+        _stderr().print(f"[bold red]Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+
+def _get_profile_fleet(profile: "Profile", event_driven: bool = False) -> "VFlexFleet":
+    """
+    The devices picked with ``--all`` or ``--serial`` or, without either, the devices a profile
+    covers: every one if it has a default.
+
+    :param event_driven: Whether to receive through a port callback instead of polling the ports.
+    """
+    context = _get_app_context()
+    if not context.select_all and not context.serials:
+        if profile.default is not None:
+            context.select_all = True
+        else:
+            context.serials = list(profile.devices)
+    return cast("VFlexFleet", _get_selected_fleet(event_driven=event_driven))
+
+
+def _changes_str(changes: "list[Change]") -> str:
+    return ", ".join(change.replace("_", " ") for change in changes)
+
+
+def _current_state_str(v_flex: "VFlex | RemoteVFlex") -> str:
     message = f"""
 VFlex Serial Number: {v_flex.serial_number}
 Current Voltage: {float(v_flex.current_voltage or 0)/1000:.2f}
@@ -70,6 +266,12 @@ def get_current_v_flex_state() -> None:
     """
     Print the current state of the connected VFlex device. (Serial, Voltage & LED setting)
     """
+    fleet = _get_selected_fleet()
+    if fleet is not None:
+        # Discovery wakes every device up fully, so the state is already fresh.
+        print("\n\n".join(_current_state_str(v_flex) for v_flex in fleet))
+        fleet.close()
+        return None
     context = _get_app_context()
     v_flex = _get_connected_v_flex(full_handshake=context.deep_adjust)
     v_flex.initial_wake_up()
@@ -92,9 +294,11 @@ def set_v_flex_state(
     """
     Set voltage and/or LED state for the VFlex device. Prints the state after being set.
     """
+    from vflexctl.input_handler.voltage_convert import decimal_normalise_voltage
+
     if isinstance(voltage, float | int):
         if voltage > (VFLEX_MIDI_INTEGER_LIMIT - 1 / 1000):
-            stderr.print(
+            _stderr().print(
                 "Voltage is being set higher than what can be transmitted. [bold red]The Voltage will not be set.[/bold red]"
             )
             voltage = None
@@ -102,37 +306,295 @@ def set_v_flex_state(
             print("Voltage is being set to 0, or negative. [bold red]The Voltage will not be set.[/bold red]")
             voltage = None
     if all(x is None for x in [voltage, led, led_colour_option]):
-        stderr.print(
+        _stderr().print(
             "[bold red]Error:[/bold red] Specify at least one of "
             "[cyan]--voltage[/cyan], [cyan]--led[/cyan], or [cyan]--led-colour[/cyan]."
         )
         print(ctx.get_help())
         raise typer.Exit(code=1)
 
-    context = _get_app_context()
-    v_flex = _get_connected_v_flex(full_handshake=context.deep_adjust)
-    v_flex.initial_wake_up()
-    adjustments: list[Callable[[], None]] = []
+    adjustments: list[Callable[["VFlex | RemoteVFlex"], None]] = []
     message: list[str] = []
     if voltage is not None:
         message.append(f"Setting voltage to {decimal_normalise_voltage(voltage)}V")
-        adjustments.append(partial(v_flex.set_voltage_volts, voltage))
+        adjustments.append(methodcaller("set_voltage_volts", voltage))
     if led is not None:
         pre_msg = "Setting LED to "
         pre_msg += "be disabled during operation" if bool(led) else "always be on"
         message.append(pre_msg)
-        adjustments.append(partial(v_flex.set_led_state, bool(led)))
+        adjustments.append(methodcaller("set_led_state", bool(led)))
     if led_colour_option is not None:
         message.append(f"Setting LED colour to {led_colour_option}")
-        adjustments.append(partial(v_flex.set_led_colour, led_colour_option.to_led_colour()))
-    print("\n".join(message))
+        adjustments.append(methodcaller("set_led_colour", led_colour_option.to_led_colour()))
 
-    for func in adjustments:
-        try:
-            func()
-        except Exception as e:
-            v_flex.log.exception("Error when changing a setting", exc_info=e)
+    def _adjust(v_flex: "VFlex | RemoteVFlex") -> None:
+        for func in adjustments:
+            try:
+                func(v_flex)
+            except Exception as e:
+                v_flex.log.exception("Error when changing a setting", exc_info=e)
+
+    fleet = _get_selected_fleet()
+    if fleet is not None:
+        print(f"On {len(fleet)} VFlex device(s):")
+        print("\n".join(message))
+        fleet.run(_adjust)
+        print("State post set:")
+        print("\n\n".join(_current_state_str(v_flex) for v_flex in fleet))
+        fleet.close()
+        return None
+
+    context = _get_app_context()
+    v_flex = _get_connected_v_flex(full_handshake=context.deep_adjust)
+    v_flex.ensure_awake()
+    print("\n".join(message))
+    _adjust(v_flex)
 
     print("State post set:")
     print(_current_state_str(v_flex))
     return None
+
+
+@cli.command(name="apply")
+def apply_v_flex_profile(
+    profile_path: Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="TOML profile of the state each VFlex should be in."
+    ),
+    dry_run: bool = typer.Option(False, "--dry-run", help="Only show what would be written."),
+    force: bool = typer.Option(False, "--force", help="Write every setting in the profile, even ones that match."),
+) -> None:
+    """
+    Bring each VFlex in a TOML profile into the state it describes, writing only the settings that differ.
+    """
+    from vflexctl.device_interface.apply import apply_profile
+
+    profile = _load_profile(profile_path)
+    fleet = _get_profile_fleet(profile)
+    for v_flex in fleet:
+        # Opening the fleet woke every device up, which read its state: apply() can use that rather
+        # than reading it again.
+        v_flex.handshake_ttl = max(v_flex.handshake_ttl, APPLY_STATE_TTL)
+    try:
+        outcome = apply_profile(fleet, profile, force=force, dry_run=dry_run)
+    finally:
+        fleet.close()
+    for serial, changes in outcome.results.items():
+        settings = _changes_str(changes)
+        if not changes:
+            print(f"{serial}: up to date")
+        elif dry_run:
+            print(f"{serial}: would set {settings}")
+        else:
+            print(f"{serial}: set {settings}")
+    for serial, error in outcome.errors.items():
+        _stderr().print(f"[bold red]Error:[/bold red] {serial}: {error}")
+    if not outcome.ok:
+        raise typer.Exit(code=1)
+    return None
+
+
+@cli.command(name="reconcile")
+def reconcile_v_flex_profile(
+    profile_path: Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="TOML profile of the state each VFlex should be in."
+    ),
+    interval: float = typer.Option(1.0, "--interval", "-i", min=0.01, help="Shortest time between checks (seconds)."),
+    max_interval: float = typer.Option(
+        30.0, "--max-interval", min=0.01, help="Longest time between checks of a device that hasn't drifted (seconds)."
+    ),
+    max_checks: int = typer.Option(None, "--max-checks", min=1, help="Check at most this many devices at once."),
+    duration: float = typer.Option(None, "--duration", "-d", min=0, help="Stop after this many seconds."),
+    reconnect: bool = typer.Option(
+        True, "--reconnect/--no-reconnect", help="Reconnect to devices that are unplugged and plugged back in."
+    ),
+) -> None:
+    """
+    Keep each VFlex in a TOML profile in the state it describes, correcting any drift. Stop with Ctrl-C.
+    """
+    from vflexctl.device_interface.reconcile import Reconciler
+
+    profile = _load_profile(profile_path)
+    if max_interval < interval:
+        _stderr().print("[bold red]Error:[/bold red] --max-interval can't be shorter than --interval.")
+        raise typer.Exit(code=1)
+    # Reconciling keeps the ports busy for a long time, so it talks to the devices directly rather
+    # than through vflexctld, and receives through port callbacks rather than polling.
+    context = _get_app_context()
+    fleet = _get_profile_fleet(profile, event_driven=True)
+    try:
+        reconciler = Reconciler(
+            fleet,
+            profile,
+            interval=interval,
+            max_interval=max_interval,
+            max_checks=max_checks,
+            reconnect=reconnect and context.replay is None,
+            backend=context.backend,
+            on_reconnect=lambda v_flex: _stderr().print(f"[yellow]{v_flex.serial_number}: reconnected.[/yellow]"),
+        )
+    except ValueError as e:
+        fleet.close()
+        _stderr().print(f"[bold red]Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    try:
+        for outcome in reconciler.run(duration=duration):
+            for serial, changes in outcome.results.items():
+                if changes:
+                    print(f"{serial}: set {_changes_str(changes)}")
+            for serial, error in outcome.errors.items():
+                _stderr().print(f"[yellow]{serial}: check failed: {error}[/yellow]")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.close()
+        for schedule in reconciler.schedules.values():
+            _stderr().print(
+                f"{schedule.serial_number}: {schedule.checks} checks, {schedule.corrections} corrections, "
+                f"{schedule.errors} errors, checking every {schedule.interval:g}s"
+            )
+    return None
+
+
+@cli.command(name="tune")
+def tune_v_flex_pacing(
+    trials: int = typer.Option(5, "--trials", "-t", min=1, help="Reads each candidate pause has to pass in a row."),
+    save: bool = typer.Option(True, "--save/--no-save", help="Store the tuned pause for this device and firmware."),
+) -> None:
+    """
+    Find (and store) the shortest pause between MIDI messages that the connected VFlex handles reliably.
+    """
+    from vflexctl.midi_transport.senders import DEFAULT_PAUSE_LENGTH
+
+    fleet = _get_selected_fleet()
+    if fleet is not None:
+        print(f"Tuning MIDI pacing for {len(fleet)} VFlex device(s)...")
+        outcome = fleet.run(methodcaller("tune_pacing", trials=trials, save=save))
+        for serial, tuned_pause in outcome.results.items():
+            print(f"{serial}: {tuned_pause * 1000:.1f}ms (default {DEFAULT_PAUSE_LENGTH * 1000:.1f}ms)")
+        for serial, error in outcome.errors.items():
+            _stderr().print(f"[bold red]Error:[/bold red] {serial}: {error}")
+        fleet.close()
+        if not outcome.ok:
+            raise typer.Exit(code=1)
+        return None
+
+    context = _get_app_context()
+    v_flex = _get_connected_v_flex(full_handshake=context.deep_adjust)
+    v_flex.initial_wake_up()
+    print(f"Tuning MIDI pacing for VFlex {v_flex.serial_number} ({v_flex.firmware_version})...")
+    try:
+        tuned_pause = v_flex.tune_pacing(trials=trials, save=save)
+    except RuntimeError as e:
+        _stderr().print(f"[bold red]Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    print(f"Pause between MIDI messages: {tuned_pause * 1000:.1f}ms (default {DEFAULT_PAUSE_LENGTH * 1000:.1f}ms)")
+    if save:
+        print("Saved. Commands for this VFlex will use it from now on.")
+
+
+@cli.command(name="watch")
+def watch_v_flex(
+    interval: float = typer.Option(
+        1.0, "--interval", "-i", min=0, help="Seconds between samples (0: as fast as possible)."
+    ),
+    changes_only: bool = typer.Option(
+        False, "--changes-only", "-c", help="Only print samples where something changed."
+    ),
+    count: int = typer.Option(None, "--count", "-n", min=1, help="Stop after this many samples."),
+    duration: float = typer.Option(None, "--duration", "-d", min=0, help="Stop after this many seconds."),
+    reconnect: bool = typer.Option(
+        True,
+        "--reconnect/--no-reconnect",
+        help="Reconnect (restoring the voltage and LED state) if the VFlex is unplugged and plugged back in.",
+    ),
+) -> None:
+    """
+    Monitor the connected VFlex's voltage and LED state, printing samples as NDJSON. Stop with Ctrl-C.
+    """
+    import json
+    import sys
+
+    from vflexctl.device_interface.hotplug import AutoReconnect
+    from vflexctl.device_interface.watch import WatchStats
+
+    # Watching keeps the port busy for a long time, so it talks to the device directly rather than
+    # through vflexctld, and receives through a port callback rather than polling.
+    context = _get_app_context()
+    v_flex = _open_v_flex(full_handshake=context.deep_adjust, event_driven=True)
+    v_flex.initial_wake_up()
+    stats = WatchStats()
+    auto_reconnect = None
+    if reconnect and context.replay is None:
+        auto_reconnect = AutoReconnect(
+            v_flex,
+            backend=context.backend,
+            on_reconnect=lambda _: _stderr().print("[yellow]Reconnected to the VFlex.[/yellow]"),
+        ).start()
+    try:
+        for sample in v_flex.watch(interval, changes_only=changes_only, count=count, duration=duration, stats=stats):
+            sys.stdout.write(json.dumps(sample.to_dict()) + "\n")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if auto_reconnect is not None:
+            auto_reconnect.stop()
+        v_flex.close()
+        summary = stats.to_dict()
+        target = f"{summary['target_rate']:.1f}/s" if summary["target_rate"] is not None else "unlimited"
+        _stderr().print(
+            f"{summary['samples']} samples in {summary['elapsed']:.1f}s: {summary['achieved_rate']:.1f}/s achieved "
+            f"(target {target}), {summary['missed_deadlines']} missed deadlines, {summary['errors']} errors, "
+            f"max lateness {summary['max_lateness'] * 1000:.1f}ms"
+        )
+
+
+@cli.command(name="play")
+def play_v_flex_profile(
+    profile: Path = typer.Argument(None, exists=True, dir_okay=False, help="CSV of time,volts rows to play."),
+    ramp_from: float = typer.Option(None, "--ramp-from", help="Play a linear ramp starting at this voltage."),
+    ramp_to: float = typer.Option(None, "--ramp-to", help="The voltage the ramp ends at."),
+    duration: float = typer.Option(10.0, "--duration", "-d", min=0, help="How long the ramp takes, in seconds."),
+    step: float = typer.Option(1.0, "--step", "-s", min=0.001, help="Seconds between the ramp's setpoints."),
+) -> None:
+    """
+    Step the connected VFlex's voltage through a CSV profile or a linear ramp, reporting the timing of each step.
+    """
+    from vflexctl.device_interface import VFlex
+    from vflexctl.device_interface.playback import StepTiming, load_profile_csv, ramp, validate_setpoints
+
+    try:
+        if profile is not None and ramp_from is None and ramp_to is None:
+            setpoints = load_profile_csv(profile)
+        elif profile is None and ramp_from is not None and ramp_to is not None:
+            setpoints = ramp(ramp_from, ramp_to, duration=duration, step_seconds=step)
+            validate_setpoints(setpoints)
+        else:
+            raise ValueError("Give either a CSV profile, or both --ramp-from and --ramp-to.")
+    except ValueError as e:
+        _stderr().print(f"[bold red]Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    def _print_step(step_timing: StepTiming) -> None:
+        print(
+            f"{step_timing.scheduled_at:8.3f}s  {step_timing.millivolts / 1000:6.2f}V  "
+            f"(reported {step_timing.reported_millivolts / 1000:.2f}V)  error {step_timing.error * 1000:+.1f}ms"
+        )
+
+    # A playback keeps the port busy for its whole run, so it talks to the device directly.
+    context = _get_app_context()
+    v_flex = _open_v_flex(full_handshake=context.deep_adjust)
+    try:
+        v_flex.initial_wake_up()
+        print(f"Playing {len(setpoints)} setpoints on VFlex {v_flex.serial_number}...")
+        report = v_flex.play(setpoints, on_step=_print_step)
+    finally:
+        v_flex.close()
+    print(
+        f"{len(report.steps)} steps: max error {report.max_error * 1000:.1f}ms, "
+        f"mean error {report.mean_error * 1000:.1f}ms, drift {report.drift * 1000:+.1f}ms"
+    )
+    if report.mismatched_steps:
+        _stderr().print(
+            f"[yellow]{len(report.mismatched_steps)} step(s) reported a different voltage to the one set.[/yellow]"
+        )
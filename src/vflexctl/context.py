@@ -1,7 +1,41 @@
-from pydantic import BaseModel
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from vflexctl.device_interface.retry import RetryPolicy
+    from vflexctl.device_interface.timings import Timings
+    from vflexctl.midi_transport.capture import CaptureWriter
+    from vflexctl.midi_transport.replay import Replay
+    from vflexctl.midi_transport.transport import Backend
 
-class AppContext(BaseModel):
+
+@dataclass
+class AppContext:
 
     # Whether to run the "full handshake" on the VFlex when adjusting.
     deep_adjust: bool
+
+    # Socket of a running vflexctld to send commands through (None to talk to the device directly).
+    socket_path: Path | None = None
+
+    # Run device commands on every connected VFlex (--all).
+    select_all: bool = False
+
+    # Run device commands on the VFlex devices with these serial numbers (--serial).
+    serials: list[str] = field(default_factory=list)
+
+    # The MIDI library to open ports with (--backend).
+    backend: "Backend" = "mido"
+
+    # Where to record the MIDI traffic to and from devices (--capture), None to not record it.
+    capture: "CaptureWriter | None" = None
+
+    # A capture to replay in place of the connected devices (--replay), None to use the devices.
+    replay: "Replay | None" = None
+
+    # Where to record the per-phase timings of device operations (--timings), None to not record them.
+    timings: "Timings | None" = None
+
+    # The timeouts and retries for device commands (--timeout/--retries), None for the defaults.
+    retry_policy: "RetryPolicy | None" = None
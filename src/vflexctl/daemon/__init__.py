@@ -0,0 +1,7 @@
+"""
+vflexctld: a long-running process that keeps a VFlex open and awake, so that ``vflexctl`` commands
+can run as thin clients over a Unix domain socket.
+
+The server (``vflexctl.daemon.server``) imports the full device stack. The client side
+(``vflexctl.daemon.client``) doesn't, which keeps CLI calls through the daemon cheap.
+"""
@@ -0,0 +1,118 @@
+import socket
+from pathlib import Path
+from typing import Any, Literal
+
+import structlog
+
+from vflexctl.daemon.protocol import MAX_MESSAGE_SIZE, decode_message, encode_message
+
+__all__ = ["DaemonClient", "DaemonError", "RemoteVFlex"]
+
+
+class DaemonError(RuntimeError):
+    """
+    A request to vflexctld failed. ``error_type`` is the name of the exception raised in the daemon
+    (e.g. ``SerialNumberMismatchError``), or ``InvalidRequest``.
+    """
+
+    def __init__(self, error_type: str, message: str):
+        self.error_type = error_type
+        super().__init__(f"{error_type}: {message}")
+
+
+class DaemonClient:
+    """
+    A connection to vflexctld. The connection is opened on creation and reused for every request.
+    """
+
+    def __init__(self, socket_path: Path, *, timeout: float = 30.0) -> None:
+        self.socket_path = socket_path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(str(socket_path))
+        except OSError:
+            self._socket.close()
+            raise
+        self._reader = self._socket.makefile("rb")
+
+    def close(self) -> None:
+        self._reader.close()
+        self._socket.close()
+
+    def request(self, method: str, *, full_handshake: bool = False, **params: Any) -> dict[str, Any]:
+        """
+        Sends one request to the daemon and waits for its response.
+
+        :param method: The daemon method to run.
+        :param full_handshake: Whether the daemon should use full handshakes for this request.
+        :param params: Keyword arguments for the method.
+        :return: The response (with ``result`` and ``state``).
+        :raises DaemonError: The daemon couldn't run the request.
+        :raises ConnectionError: The daemon closed the connection.
+        """
+        self._socket.sendall(encode_message({"method": method, "params": params, "full_handshake": full_handshake}))
+        line = self._reader.readline(MAX_MESSAGE_SIZE + 1)
+        if not line:
+            raise ConnectionError("vflexctld closed the connection.")
+        response = decode_message(line)
+        if not response.get("ok"):
+            raise DaemonError(str(response.get("error")), str(response.get("message")))
+        return response
+
+
+class RemoteVFlex:
+    """
+    Stand-in for a ``VFlex`` that is owned by vflexctld. It has the parts of the VFlex interface
+    the CLI uses, runs each call in the daemon and mirrors the daemon's cached device state.
+    """
+
+    serial_number: str | None = None
+    firmware_version: str | None = None
+    current_voltage: int | None = None
+    led_state: bool | None = None
+    led_state_str: str = ""
+
+    def __init__(self, client: DaemonClient, *, full_handshake: bool = False) -> None:
+        self.client = client
+        self.full_handshake = full_handshake
+        self.log = structlog.get_logger("vflexctl.RemoteVFlex").bind(socket_path=str(client.socket_path))
+
+    def _call(self, method: str, **params: Any) -> Any:
+        response = self.client.request(method, full_handshake=self.full_handshake, **params)
+        for key, value in response["state"].items():
+            setattr(self, key, value)
+        return response.get("result")
+
+    def close(self) -> None:
+        self.client.close()
+
+    def ensure_awake(self) -> None:
+        self._call("ensure_awake")
+
+    def initial_wake_up(self) -> None:
+        """
+        Reads the device's state. The daemon only runs the full wake-up if the device is new to it.
+        """
+        self._call("read")
+
+    def get_voltage(self) -> int:
+        return int(self._call("get_voltage"))
+
+    def get_led_state(self) -> bool:
+        return bool(self._call("get_led_state"))
+
+    def set_voltage(self, millivolts: int) -> None:
+        self._call("set_voltage", millivolts=millivolts)
+
+    def set_voltage_volts(self, volts: float) -> None:
+        self._call("set_voltage_volts", volts=volts)
+
+    def set_led_state(self, led_state: bool | Literal[0, 1]) -> None:
+        self._call("set_led_state", led_state=bool(led_state))
+
+    def set_led_colour(self, led_colour: int) -> None:
+        self._call("set_led_colour", colour=int(led_colour))
+
+    def tune_pacing(self, *, trials: int = 5, save: bool = True) -> float:
+        return float(self._call("tune_pacing", trials=trials, save=save))
@@ -0,0 +1,45 @@
+"""
+Wire format shared by vflexctld and its clients: one JSON object per line over a Unix domain socket.
+
+A request is ``{"method": str, "params": dict, "full_handshake": bool}``. A response is either
+``{"ok": true, "result": ..., "state": {...}}`` or ``{"ok": false, "error": str, "message": str}``,
+where ``state`` is the daemon's cached view of the device after the request ran.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+__all__ = ["default_socket_path", "encode_message", "decode_message", "MAX_MESSAGE_SIZE"]
+
+# Requests and responses are tiny; anything bigger than this is a misbehaving peer.
+MAX_MESSAGE_SIZE = 64 * 1024
+
+
+def default_socket_path() -> Path:
+    """
+    Where vflexctld listens by default: ``$VFLEXCTL_SOCKET`` if set, otherwise ``vflexctl.sock``
+    in ``$XDG_RUNTIME_DIR``, falling back to a per-user name in the temp directory.
+
+    :return: The socket path.
+    """
+    if override := os.environ.get("VFLEXCTL_SOCKET"):
+        return Path(override)
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(runtime_dir) / "vflexctl.sock"
+    import tempfile
+
+    user_id = os.getuid() if hasattr(os, "getuid") else os.getlogin()
+    return Path(tempfile.gettempdir()) / f"vflexctl-{user_id}.sock"
+
+
+def encode_message(message: dict[str, Any]) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_message(line: bytes) -> dict[str, Any]:
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError("Expected a JSON object.")
+    return message
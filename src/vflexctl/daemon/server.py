@@ -0,0 +1,256 @@
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+from collections.abc import Callable
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any
+
+import structlog
+import typer
+
+from vflexctl.command.led import LEDColour
+from vflexctl.daemon.protocol import MAX_MESSAGE_SIZE, decode_message, default_socket_path, encode_message
+from vflexctl.device_interface import VFlex
+from vflexctl.exceptions import UnsafeAdjustmentError
+from vflexctl.metrics import Metrics, MetricsServer, TextfileWriter
+
+__all__ = ["VFlexDaemon", "daemon_cli", "DEFAULT_HANDSHAKE_TTL"]
+
+# The daemon is the only thing talking to the device, so a verified serial number can be trusted
+# for a while longer than a one-off CLI call would.
+DEFAULT_HANDSHAKE_TTL = 5.0
+
+log = structlog.get_logger("vflexctl.daemon")
+
+
+def _state(v_flex: VFlex) -> dict[str, Any]:
+    return {
+        "serial_number": v_flex.serial_number,
+        "firmware_version": v_flex.firmware_version,
+        "current_voltage": v_flex.current_voltage,
+        "led_state": v_flex.led_state,
+        "led_state_str": v_flex.led_state_str,
+        "pause_length": v_flex.pause_length,
+    }
+
+
+def _read(v_flex: VFlex) -> None:
+    """
+    Wakes a new device up fully, or re-reads the voltage and LED state of one that's already awake.
+    """
+    if v_flex.serial_number is None:
+        v_flex.initial_wake_up()
+        return None
+    v_flex.read()
+    return None
+
+
+def _set_led_colour(v_flex: VFlex, colour: int) -> None:
+    v_flex.set_led_colour(LEDColour(colour))
+
+
+# Methods clients may call, mapped to what they run on the daemon's VFlex.
+_METHODS: dict[str, Callable[..., Any]] = {
+    "ensure_awake": VFlex.ensure_awake,
+    "read": _read,
+    "get_voltage": VFlex.get_voltage,
+    "get_led_state": VFlex.get_led_state,
+    "set_voltage": VFlex.set_voltage,
+    "set_voltage_volts": VFlex.set_voltage_volts,
+    "set_led_state": VFlex.set_led_state,
+    "set_led_colour": _set_led_colour,
+    "tune_pacing": VFlex.tune_pacing,
+    "state": lambda v_flex: None,
+}
+
+
+class VFlexDaemon:
+    """
+    Owns a warm VFlex (open port, woken up, cached state) and serves requests for it over a Unix
+    domain socket, so CLI calls only pay for the protocol exchanges they actually need.
+
+    Requests are handled one at a time. If a request fails for any reason other than a safety check,
+    the VFlex is closed and dropped, and the next request opens (and wakes) it again.
+    """
+
+    def __init__(
+        self,
+        socket_path: Path,
+        *,
+        handshake_ttl: float = DEFAULT_HANDSHAKE_TTL,
+        v_flex_factory: Callable[[], VFlex] | None = None,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self.socket_path = socket_path
+        self.handshake_ttl = handshake_ttl
+        self.metrics = metrics
+        self.v_flex_factory = v_flex_factory or (lambda: VFlex.get_any(event_driven=True))
+        self.v_flex: VFlex | None = None
+        self._lock = threading.Lock()
+        self._server: _DaemonServer | None = None
+
+    def _get_v_flex(self) -> VFlex:
+        if self.v_flex is None:
+            log.info("Opening VFlex")
+            self.v_flex = self.v_flex_factory()
+            self.v_flex.handshake_ttl = self.handshake_ttl
+            if self.metrics is not None:
+                self.v_flex.metrics = self.metrics
+        return self.v_flex
+
+    def _drop_v_flex(self) -> None:
+        if self.v_flex is None:
+            return None
+        try:
+            self.v_flex.close()
+        except Exception as e:
+            log.warning("Error closing VFlex", error=str(e))
+        self.v_flex = None
+        return None
+
+    def handle_request(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        Runs one request against the VFlex.
+
+        :param request: The decoded request.
+        :return: The response to send back.
+        """
+        method = request.get("method")
+        params = request.get("params") or {}
+        handler = _METHODS.get(method) if isinstance(method, str) else None
+        if handler is None or not isinstance(params, dict):
+            return _error_response("InvalidRequest", f"Unknown method or bad params: {method!r}")
+
+        with self._lock:
+            try:
+                v_flex = self._get_v_flex()
+                v_flex.full_handshake = bool(request.get("full_handshake", False))
+                result = handler(v_flex, **params)
+            except UnsafeAdjustmentError as e:
+                log.warning("Request stopped by a safety check", method=method, error=str(e))
+                return _error_response(type(e).__name__, str(e))
+            except Exception as e:
+                log.exception("Request failed, dropping the VFlex", method=method, exc_info=e)
+                self._drop_v_flex()
+                return _error_response(type(e).__name__, str(e))
+            return {"ok": True, "result": result, "state": _state(v_flex)}
+
+    def _prepare_socket_path(self) -> None:
+        if not self.socket_path.exists():
+            return None
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except OSError:
+            log.info("Removing stale socket", socket_path=str(self.socket_path))
+            self.socket_path.unlink()
+            return None
+        finally:
+            probe.close()
+        raise RuntimeError(f"vflexctld is already running on {self.socket_path}")
+
+    def serve_forever(self) -> None:
+        """
+        Listens on the socket until ``shutdown()`` is called. The socket is only accessible to the
+        current user, and is removed (and the VFlex closed) on the way out.
+        """
+        self._prepare_socket_path()
+        self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # The socket is created by bind(), with the umask's permissions. Narrowing them afterwards would
+        # leave a window where another user (e.g. in a shared temp directory) could connect.
+        previous_umask = os.umask(0o177)
+        try:
+            self._server = _DaemonServer(str(self.socket_path), self)
+        finally:
+            os.umask(previous_umask)
+        log.info("vflexctld listening", socket_path=str(self.socket_path))
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+            with self._lock:
+                self._drop_v_flex()
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def _error_response(error: str, message: str) -> dict[str, Any]:
+    return {"ok": False, "error": error, "message": message}
+
+
+class _DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: VFlexDaemon) -> None:
+        self.vflex_daemon = daemon
+        super().__init__(socket_path, _RequestHandler)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: _DaemonServer
+
+    def handle(self) -> None:
+        while line := self.rfile.readline(MAX_MESSAGE_SIZE + 1):
+            if len(line) > MAX_MESSAGE_SIZE:
+                self.wfile.write(encode_message(_error_response("InvalidRequest", "Request too large")))
+                return None
+            try:
+                request = decode_message(line)
+            except ValueError as e:
+                response = _error_response("InvalidRequest", str(e))
+            else:
+                response = self.server.vflex_daemon.handle_request(request)
+            self.wfile.write(encode_message(response))
+        return None
+
+
+daemon_cli: typer.Typer = typer.Typer(name="vflexctld", add_completion=False)
+
+
+@daemon_cli.command()
+def run_daemon(
+    socket_path: Path = typer.Option(
+        None, "--socket", help="Socket to listen on. Defaults to $VFLEXCTL_SOCKET, or vflexctl.sock in the runtime dir."
+    ),
+    handshake_ttl: float = typer.Option(
+        DEFAULT_HANDSHAKE_TTL, "--handshake-ttl", min=0, help="Seconds a verified serial number stays trusted."
+    ),
+    metrics_port: int | None = typer.Option(
+        None, "--metrics-port", min=0, max=65535, help="Serve Prometheus metrics over HTTP on this port, at /metrics."
+    ),
+    metrics_host: str = typer.Option("127.0.0.1", "--metrics-host", help="Address to serve the metrics on."),
+    metrics_file: Path | None = typer.Option(
+        None, "--metrics-file", dir_okay=False, help="Write Prometheus metrics to this file (e.g. for node_exporter)."
+    ),
+    metrics_interval: float = typer.Option(
+        15.0, "--metrics-interval", min=0.1, help="Seconds between writes of --metrics-file."
+    ),
+    verbose: bool = typer.Option(False, "--verbose", "-v", help="Enable verbose logging"),
+) -> None:
+    """
+    Keep a VFlex open and awake, and serve vflexctl commands for it over a Unix domain socket.
+    """
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.INFO if verbose else logging.WARNING)
+    )
+    metrics = Metrics() if metrics_port is not None or metrics_file is not None else None
+    daemon = VFlexDaemon(socket_path or default_socket_path(), handshake_ttl=handshake_ttl, metrics=metrics)
+
+    def _stop(*_: object) -> None:
+        threading.Thread(target=daemon.shutdown).start()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    with ExitStack() as exporters:
+        if metrics is not None and metrics_port is not None:
+            exporters.enter_context(MetricsServer(metrics, host=metrics_host, port=metrics_port))
+        if metrics is not None and metrics_file is not None:
+            exporters.enter_context(TextfileWriter(metrics, metrics_file, interval=metrics_interval))
+        daemon.serve_forever()
@@ -1,3 +1,5 @@
 from .vflex import VFlex
+from .async_vflex import AsyncVFlex
+from .fleet import VFlexFleet
 
-__all__ = ["VFlex"]
+__all__ = ["VFlex", "AsyncVFlex", "VFlexFleet"]
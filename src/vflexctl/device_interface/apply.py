@@ -0,0 +1,296 @@
+import json
+import tomllib
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Literal, TYPE_CHECKING, cast
+
+import structlog
+
+from vflexctl.app_data import app_data_dir
+from vflexctl.command.led import LEDColour
+from vflexctl.input_handler.voltage_convert import voltage_to_millivolt
+
+if TYPE_CHECKING:
+    from vflexctl.device_interface.fleet import FleetResults, VFlexFleet
+    from vflexctl.device_interface.core import VFlexCore
+    from vflexctl.device_interface.vflex import VFlex
+
+__all__ = [
+    "Change",
+    "DesiredState",
+    "Profile",
+    "load_profile_toml",
+    "pending_changes",
+    "apply_profile",
+    "desired_states",
+    "recall_led_colours",
+    "remember_led_colours",
+    "led_colours_file",
+    "load_led_colours",
+    "update_led_colours",
+]
+
+# The largest voltage that fits in the two protocol bytes, in millivolts.
+MAX_MILLIVOLTS = 0xFFFF
+
+# The settings a profile can change, in the order they're written.
+type Change = Literal["voltage", "led_state", "led_colour"]
+
+# How the LED state is written in a profile, as on the command line (see ``vflexctl set --led``).
+LED_STATES: dict[str, bool] = {"always-on": False, "disabled": True}
+
+log = structlog.get_logger("vflexctl.apply")
+
+
+@dataclass(frozen=True, slots=True)
+class DesiredState:
+    """
+    The state a VFlex should be in. Settings left as None are left alone.
+    """
+
+    millivolts: int | None = None
+    led_state: bool | None = None
+    led_colour: LEDColour | None = None
+
+    @property
+    def changes(self) -> list[Change]:
+        """
+        :return: The settings this state sets, whatever the device's state.
+        """
+        settings: list[tuple[Change, object]] = [
+            ("voltage", self.millivolts),
+            ("led_state", self.led_state),
+            ("led_colour", self.led_colour),
+        ]
+        return [change for change, value in settings if value is not None]
+
+    def over(self, base: "DesiredState") -> "DesiredState":
+        """
+        :param base: The state to fall back on.
+        :return: This state, with the settings it leaves alone taken from ``base``.
+        """
+        return DesiredState(
+            millivolts=base.millivolts if self.millivolts is None else self.millivolts,
+            led_state=base.led_state if self.led_state is None else self.led_state,
+            led_colour=base.led_colour if self.led_colour is None else self.led_colour,
+        )
+
+
+@dataclass
+class Profile:
+    """
+    The desired state of a set of devices, by serial number, with an optional default for any device
+    the profile doesn't list.
+    """
+
+    devices: dict[str, DesiredState] = field(default_factory=dict)
+    default: DesiredState | None = None
+
+    def for_serial(self, serial_number: str) -> DesiredState | None:
+        """
+        :param serial_number: The serial number of a VFlex.
+        :return: The state it should be in, or None if the profile doesn't cover it.
+        """
+        desired = self.devices.get(serial_number)
+        if desired is None or self.default is None:
+            return desired or self.default
+        return desired.over(self.default)
+
+
+def _desired_state(table: Any, where: str) -> DesiredState:
+    if not isinstance(table, dict):
+        raise ValueError(f"{where}: expected a table of settings.")
+    unknown = set(table) - {"voltage", "led", "led_colour"}
+    if unknown:
+        raise ValueError(f"{where}: unknown setting(s) {', '.join(sorted(unknown))}.")
+    millivolts = led_state = led_colour = None
+    if "voltage" in table:
+        voltage = table["voltage"]
+        if isinstance(voltage, bool) or not isinstance(voltage, int | float | str):
+            raise ValueError(f"{where}: voltage should be a number of volts, got {voltage!r}.")
+        millivolts = voltage_to_millivolt(voltage)
+        if not 0 < millivolts <= MAX_MILLIVOLTS:
+            raise ValueError(f"{where}: {voltage}V can't be set.")
+    if "led" in table:
+        if table["led"] not in LED_STATES:
+            raise ValueError(f"{where}: led should be one of {', '.join(LED_STATES)}, got {table['led']!r}.")
+        led_state = LED_STATES[table["led"]]
+    if "led_colour" in table:
+        name = table["led_colour"]
+        if not isinstance(name, str) or name.upper() not in LEDColour.__members__:
+            colours = ", ".join(colour.name.lower() for colour in LEDColour)
+            raise ValueError(f"{where}: led_colour should be one of {colours}, got {name!r}.")
+        led_colour = LEDColour[name.upper()]
+    return DesiredState(millivolts=millivolts, led_state=led_state, led_colour=led_colour)
+
+
+def load_profile_toml(path: Path) -> Profile:
+    """
+    Loads a profile from a TOML file. Each device is a table under ``devices``, keyed by serial
+    number, and an optional ``default`` table covers every other device::
+
+        [default]
+        led = "always-on"
+
+        [devices.SIM00001]
+        voltage = 12
+        led_colour = "blue"
+
+    ``voltage`` is in volts, ``led`` is ``always-on`` or ``disabled`` and ``led_colour`` is one of
+    the colours of ``vflexctl set --led-colour``.
+
+    :param path: The TOML file.
+    :return: The profile.
+    :raises ValueError: The file isn't valid TOML, or isn't a valid profile.
+    """
+    try:
+        document = tomllib.loads(path.read_text())
+    except tomllib.TOMLDecodeError as e:
+        raise ValueError(f"{path}: {e}") from e
+    unknown = set(document) - {"default", "devices"}
+    if unknown:
+        raise ValueError(f"{path}: unknown table(s) {', '.join(sorted(unknown))}.")
+    devices = document.get("devices", {})
+    if not isinstance(devices, dict):
+        raise ValueError(f"{path}: devices should be a table of serial numbers.")
+    profile = Profile(
+        devices={serial: _desired_state(table, f"{path}: devices.{serial}") for serial, table in devices.items()},
+        default=_desired_state(document["default"], f"{path}: default") if "default" in document else None,
+    )
+    if not profile.devices and profile.default is None:
+        raise ValueError(f"{path}: the profile doesn't set anything.")
+    return profile
+
+
+def pending_changes(v_flex: "VFlexCore", desired: DesiredState) -> list[Change]:
+    """
+    Compares the state a VFlex was last known to be in with the state it should be in. An unknown
+    setting counts as different. The LED colour can't be read back from the device, so it's compared
+    with the last colour set.
+
+    :param v_flex: The VFlex, with its state read.
+    :param desired: The state it should be in.
+    :return: The settings that need writing.
+    """
+    changes: list[Change] = []
+    if desired.millivolts is not None and v_flex.current_voltage != desired.millivolts:
+        changes.append("voltage")
+    if desired.led_state is not None and v_flex.led_state != desired.led_state:
+        changes.append("led_state")
+    if desired.led_colour is not None and v_flex.led_colour != desired.led_colour:
+        changes.append("led_colour")
+    return changes
+
+
+def led_colours_file() -> Path:
+    """
+    :return: The path to the JSON file that maps serial numbers to the LED colour last applied to
+        them, since the colour can't be read back from the device.
+    """
+    return app_data_dir() / "led_colours.json"
+
+
+def load_led_colours(*, path: Path | None = None) -> dict[str, LEDColour]:
+    """
+    :param path: The file to read. Defaults to ``led_colours_file()``.
+    :return: The LED colour last applied to each device, by serial number. Empty if the file can't be read.
+    """
+    path = path or led_colours_file()
+    try:
+        stored = json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log.warning("Could not read the applied LED colours.", path=str(path), error=str(e))
+        return {}
+    if not isinstance(stored, dict):
+        return {}
+    return {serial: LEDColour[name] for serial, name in stored.items() if name in LEDColour.__members__}
+
+
+def update_led_colours(colours: Mapping[str, LEDColour], *, path: Path | None = None) -> None:
+    """
+    Stores the LED colours applied to some devices, keeping the entries for any others.
+
+    :param colours: The colour applied to each device, by serial number.
+    :param path: The file to write. Defaults to ``led_colours_file()``.
+    """
+    path = path or led_colours_file()
+    stored = load_led_colours(path=path)
+    updated = {**stored, **colours}
+    if updated == stored:
+        return None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps({serial: colour.name for serial, colour in updated.items()}, indent=2, sort_keys=True)
+        )
+    except OSError as e:
+        log.warning("Could not store the applied LED colours.", path=str(path), error=str(e))
+    return None
+
+
+def desired_states(fleet: "VFlexFleet", profile: Profile) -> dict[str, DesiredState]:
+    """
+    :param fleet: The devices.
+    :param profile: The state they should be in.
+    :return: The state each device in the fleet that the profile covers should be in, by serial number.
+    """
+    desired: dict[str, DesiredState] = {}
+    for serial in fleet.serial_numbers:
+        if (state := profile.for_serial(serial)) is not None:
+            desired[serial] = state
+    return desired
+
+
+def recall_led_colours(fleet: "VFlexFleet", serials: Iterable[str]) -> None:
+    """
+    Fills in the LED colour last applied to each device (see ``led_colours_file()``), where it isn't
+    already known.
+
+    :param fleet: The devices.
+    :param serials: The serial numbers of the devices to fill in.
+    """
+    applied_colours = load_led_colours()
+    for serial in serials:
+        if fleet[serial].led_colour is None:
+            fleet[serial].led_colour = applied_colours.get(serial)
+    return None
+
+
+def remember_led_colours(fleet: "VFlexFleet", serials: Iterable[str]) -> None:
+    """
+    Stores the LED colour of each device, where it's known, for ``recall_led_colours()``.
+
+    :param fleet: The devices.
+    :param serials: The serial numbers of the devices to store.
+    """
+    update_led_colours({serial: colour for serial in serials if (colour := fleet[serial].led_colour) is not None})
+    return None
+
+
+def apply_profile(
+    fleet: "VFlexFleet", profile: Profile, *, force: bool = False, dry_run: bool = False
+) -> "FleetResults[list[Change]]":
+    """
+    Brings every device in a fleet that the profile covers into the state it describes, concurrently
+    (see ``VFlex.apply()``). The LED colours applied are remembered between runs, so an unchanged
+    colour isn't written again.
+
+    :param fleet: The devices.
+    :param profile: The state they should be in.
+    :param force: Write every setting in the profile, whether or not it differs.
+    :param dry_run: Only work out what would be written.
+    :return: The settings written (or that would be) on each device covered, by serial number.
+    """
+    desired = desired_states(fleet, profile)
+    recall_led_colours(fleet, desired)
+
+    def _apply(v_flex: "VFlex") -> list[Change]:
+        return v_flex.apply(desired[cast(str, v_flex.serial_number)], force=force, dry_run=dry_run)
+
+    outcome = fleet.run(_apply, desired)
+    if not dry_run:
+        remember_led_colours(fleet, desired)
+    return outcome
@@ -0,0 +1,418 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Coroutine
+from functools import wraps
+from types import TracebackType
+from typing import Any, Concatenate, Literal, ParamSpec, Self, TypeVar, cast
+
+import structlog
+from mido.ports import BaseIOPort
+
+from vflexctl.command.led import LEDColour
+from vflexctl.device_interface.apply import Change, DesiredState
+from vflexctl.device_interface.core import Flush, Receive, ReceiveReplies, Send, Step, Steps, VFlexCore, Wait
+from vflexctl.device_interface.query import QueryResults
+from vflexctl.device_interface.retry import RetryPolicy
+from vflexctl.device_interface.timings import Timings
+from vflexctl.device_interface.vflex import DEFAULT_PORT_NAME, timed_open_ioport
+from vflexctl.input_handler.voltage_convert import voltage_to_millivolt
+from vflexctl.metrics import Metrics
+from vflexctl.midi_transport.async_receiver import AsyncReceiver
+from vflexctl.midi_transport.capture import CaptureWriter, CapturingTransport
+from vflexctl.midi_transport.senders import async_send_sequence
+from vflexctl.midi_transport.transport import Backend, MIDITransport, get_ioport_names
+from vflexctl.types import VFlexProtoMessage
+
+__all__ = ["AsyncVFlex"]
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def timed(
+    func: Callable[Concatenate["AsyncVFlex", P], Awaitable[R]],
+) -> Callable[Concatenate["AsyncVFlex", P], Coroutine[Any, Any, R]]:
+    """
+    Runs the decorated AsyncVFlex method as an operation, holding ``AsyncVFlex.lock`` throughout, and
+    records it under the method's name (see ``VFlexCore._operation()``).
+
+    The lock isn't reentrant, so decorated methods mustn't await each other. They run the core's
+    steps instead.
+    """
+
+    @wraps(func)
+    async def wrapper(v_flex: "AsyncVFlex", *args: P.args, **kwargs: P.kwargs) -> R:
+        async with v_flex.lock:
+            with v_flex._operation(func.__name__):
+                return await func(v_flex, *args, **kwargs)
+
+    return cast(Callable[Concatenate["AsyncVFlex", P], Coroutine[Any, Any, R]], wrapper)
+
+
+def coalesced(
+    func: Callable[["AsyncVFlex"], Awaitable[R]],
+) -> Callable[["AsyncVFlex"], Coroutine[Any, Any, R]]:
+    """
+    Shares the decorated AsyncVFlex read between everyone awaiting it at once: unless the same read
+    is already in flight, it's run, otherwise this waits for (and returns) that one's result instead.
+    Cancelling one caller doesn't cancel the read for the others.
+    """
+
+    @wraps(func)
+    async def wrapper(v_flex: "AsyncVFlex") -> R:
+        name = func.__name__
+        in_flight = v_flex._in_flight.get(name)
+        if in_flight is None:
+            in_flight = asyncio.ensure_future(func(v_flex))
+            v_flex._in_flight[name] = in_flight
+            in_flight.add_done_callback(lambda _: v_flex._in_flight.pop(name, None))
+        return cast(R, await asyncio.shield(in_flight))
+
+    return cast(Callable[["AsyncVFlex"], Coroutine[Any, Any, R]], wrapper)
+
+
+class AsyncVFlex(VFlexCore):
+    """
+    asyncio interface for a VFlex MIDI power adapter, with the same behaviour (and safety checks)
+    as ``VFlex``: both are drivers for the operations in ``VFlexCore``.
+
+    Messages are paced with ``asyncio.sleep()`` and replies arrive through an ``AsyncReceiver``,
+    so nothing blocks the event loop and one loop can drive many devices at once. Each device has a
+    lock, so concurrent calls on the same device queue up rather than talking over each other, and
+    concurrent reads of the voltage or LED state share a single exchange with the device.
+
+    It has to be created from inside the event loop it will be used on, and the port needs to
+    deliver messages through a callback (mido's rtmidi backend does).
+    """
+
+    # The underlying MIDI I/O port (or transport) used for sending and receiving messages.
+    io_port: BaseIOPort | MIDITransport
+
+    # Receives (and queues) the replies from the device on the event loop.
+    receiver: AsyncReceiver
+
+    # Where the MIDI traffic is being recorded, if anywhere.
+    capture: CaptureWriter | None = None
+
+    # Held for each operation (see ``timed()``).
+    lock: asyncio.Lock
+
+    # Reads currently in flight, by name, shared by everyone awaiting the same read.
+    _in_flight: dict[str, "asyncio.Future[Any]"]
+
+    def __init__(
+        self,
+        io_port: BaseIOPort | MIDITransport,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        handshake_ttl: float = 0.0,
+        capture: CaptureWriter | None = None,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> None:
+        self.capture = capture
+        if capture is not None:
+            # Recorded at the port, so replies a drain throws away as stale are captured too.
+            io_port = CapturingTransport(io_port, capture, serial_number=lambda: self.serial_number)
+        self.io_port = io_port
+        self.log = structlog.get_logger("vflexctl.AsyncVFlex").bind(io_port=io_port)
+        self.receiver = AsyncReceiver(io_port)
+        self.lock = asyncio.Lock()
+        self._in_flight = {}
+        super().__init__(
+            safe_adjust=safe_adjust,
+            full_handshake=full_handshake,
+            handshake_ttl=handshake_ttl,
+            timings=timings,
+            metrics=metrics,
+            retry_policy=retry_policy,
+        )
+
+    @classmethod
+    def with_io_name(
+        cls,
+        name: str,
+        *,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        handshake_ttl: float = 0.0,
+        backend: Backend = "mido",
+        capture: CaptureWriter | None = None,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> Self:
+        """
+        Gets a handle to a VFlex adapter using a provided port name.
+
+        :param name: The port name to use with MIDO to get the MIDI port.
+        :param safe_adjust: Whether (or not) to add extra checks for adjustments.
+        :param full_handshake: Whether (or not) to run the full wake cycle when adjusting parameters
+        :param handshake_ttl: How long a verified serial number stays fresh, in seconds.
+        :param backend: The MIDI library to open the port with ("rtmidi" skips mido, see ``RtMidiTransport``).
+        :param capture: Record all the MIDI traffic on the port to this capture.
+        :param timings: Record the per-phase timings of operations (including opening the port) here.
+        :param metrics: Record operational metrics (see ``vflexctl.metrics``) here.
+        :param retry_policy: The timeouts and retries for each command. Defaults to ``DEFAULT_RETRY_POLICY``.
+        :return: AsyncVFlex instance with the correct port for talking to it.
+        """
+        if name not in get_ioport_names(backend):
+            raise RuntimeError(f"I/O port name '{name}' not found.")
+        return cls(
+            timed_open_ioport(name, backend, timings),
+            safe_adjust=safe_adjust,
+            full_handshake=full_handshake,
+            handshake_ttl=handshake_ttl,
+            capture=capture,
+            timings=timings,
+            metrics=metrics,
+            retry_policy=retry_policy,
+        )
+
+    @classmethod
+    def get_any(
+        cls,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        handshake_ttl: float = 0.0,
+        backend: Backend = "mido",
+        capture: CaptureWriter | None = None,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> Self:
+        """
+        Gets _a_ handle to a VFlex adapter using the expected port name. See ``VFlex.get_any()``.
+
+        :param safe_adjust: Whether (or not) to add extra checks for adjustments.
+        :param full_handshake: Whether (or not) to run the full wake cycle when adjusting parameters
+        :param handshake_ttl: How long a verified serial number stays fresh, in seconds.
+        :param backend: The MIDI library to open the port with ("rtmidi" skips mido, see ``RtMidiTransport``).
+        :param capture: Record all the MIDI traffic on the port to this capture.
+        :param timings: Record the per-phase timings of operations (including opening the port) here.
+        :param metrics: Record operational metrics (see ``vflexctl.metrics``) here.
+        :param retry_policy: The timeouts and retries for each command. Defaults to ``DEFAULT_RETRY_POLICY``.
+        :return: AsyncVFlex instance with the correct port for talking to it.
+        """
+        matching_port = None
+        for port_name in get_ioport_names(backend):
+            if port_name.lower() == DEFAULT_PORT_NAME.lower():
+                matching_port = port_name
+                break
+        return cls(
+            timed_open_ioport(matching_port or DEFAULT_PORT_NAME, backend, timings),
+            safe_adjust=safe_adjust,
+            full_handshake=full_handshake,
+            handshake_ttl=handshake_ttl,
+            capture=capture,
+            timings=timings,
+            metrics=metrics,
+            retry_policy=retry_policy,
+        )
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Detaches the receiver and closes the MIDI port.
+        """
+        self.receiver.close()
+        self.io_port.close()
+
+    async def _run(self, steps: Steps[R]) -> R:
+        """
+        Runs the steps of an operation (see ``vflexctl.device_interface.core``) on the event loop.
+
+        :param steps: The operation's steps.
+        :return: The operation's result.
+        """
+        result: Any = None
+        error: Exception | None = None
+        try:
+            while True:
+                try:
+                    step = steps.send(result) if error is None else steps.throw(error)
+                except StopIteration as stop:
+                    return cast(R, stop.value)
+                try:
+                    result, error = await self._do(step), None
+                except Exception as e:
+                    result, error = None, e
+        finally:
+            steps.close()
+
+    async def _do(self, step: Step) -> Any:
+        """
+        Carries out one step.
+
+        :param step: The step.
+        :return: The step's result.
+        """
+        match step:
+            case Send(sequence, pause):
+                await async_send_sequence(self.io_port, sequence, pause=pause)
+                return None
+            case Receive(command_byte, timeout, on_first_message, on_timeout):
+                return await self.receiver.drain_until_frame(
+                    command_byte, seconds=timeout, on_first_message=on_first_message, on_timeout=on_timeout
+                )
+            case ReceiveReplies(command_bytes, timeout, on_first_message):
+                return await self.receiver.drain_until_replies(
+                    command_bytes, seconds=timeout, on_first_message=on_first_message
+                )
+            case Flush():
+                return self.receiver.drain_once()
+            case Wait(seconds):
+                await asyncio.sleep(seconds)
+                return None
+        raise TypeError(f"Unknown step: {step!r}")
+
+    @timed
+    async def wake_up(self, full_handshake: bool = False) -> None:
+        """
+        "Wakes up" the connected VFlex to get it ready to receive commands. Operations that need the
+        handshake run it automatically.
+
+        :param full_handshake: Whether to also read the LED state and voltage.
+        """
+        await self._run(self._wake_up(full_handshake=full_handshake))
+
+    @timed
+    async def initial_wake_up(self) -> None:
+        """
+        Convenience method to run wake_up with a full handshake.
+        """
+        await self._run(self._wake_up(full_handshake=True))
+
+    async def ensure_awake(self) -> None:
+        """
+        Runs ``initial_wake_up()`` unless it's already been done (the serial number, voltage and LED
+        state are all known).
+        """
+        if self.serial_number is None or self.current_voltage is None or self.led_state is None:
+            await self.initial_wake_up()
+
+    @timed
+    async def query(self, *commands: VFlexProtoMessage) -> QueryResults:
+        """
+        Sends several commands in one envelope and sorts the replies by command byte. See ``VFlex.query()``.
+
+        :param commands: The commands to send, without their length byte (e.g. ``[VFlexProto.CMD_GET_VOLTAGE]``).
+        :return: The replies, by command byte.
+        :raises ValueError: No commands were given.
+        :raises ReplyTimeoutError: A reply never arrived, even when sent on its own (with its retries).
+        """
+        return await self._run(self._query(*commands))
+
+    @timed
+    async def read(self) -> None:
+        """
+        Re-reads the voltage and LED state from the device, in a single round trip. See ``VFlex.read()``.
+        """
+        await self._run(self._read())
+
+    @timed
+    async def get_serial_number(self) -> str | None:
+        """
+        Fetches (or re-fetches) the serial number of the connected VFlex. See ``VFlex.get_serial_number()``.
+
+        :return: The serial number returned by the device.
+        :raises SerialNumberMismatchError: The serial number has changed between fetches.
+        """
+        return await self._run(self._get_serial_number())
+
+    @timed
+    async def get_firmware_version(self) -> str | None:
+        """
+        Get the firmware version of the device.
+
+        :return: The firmware version, also stored under self.firmware_version.
+        """
+        return await self._run(self._get_firmware_version())
+
+    @coalesced
+    @timed
+    async def get_voltage(self) -> int:
+        """
+        Gets the voltage from the device, and stores it under `self.current_voltage`.
+
+        :return: Integer for the current voltage, in millivolts.
+        """
+        return await self._run(self._get_voltage())
+
+    @coalesced
+    @timed
+    async def get_led_state(self) -> bool:
+        """
+        Gets the LED state from the device, and stores it under `self.led_state`.
+
+        :return: The LED state.
+        """
+        return await self._run(self._get_led_state())
+
+    @timed
+    async def set_voltage(self, millivolts: int) -> None:
+        """
+        Set the voltage for the device to the specified number of millivolts. See ``VFlex.set_voltage()``.
+
+        :param millivolts: The voltage to set the device to, in millivolts.
+        :return: Nothing, but updates the voltage for the object under self.current_voltage.
+        :raises VoltageMismatchError: The voltage changed since it was last read.
+        :raises ReplyTimeoutError: No attempt got a reply, and the voltage didn't change.
+        """
+        await self._run(self._set_voltage(millivolts))
+
+    async def set_voltage_volts(self, volts: float) -> None:
+        """
+        Set the voltage for the device to the specified number of volts.
+
+        :param volts: The voltage to set the device to, in volts.
+        """
+        await self.set_voltage(millivolts=voltage_to_millivolt(volts))
+
+    @timed
+    async def set_led_state(self, led_state: bool | Literal[0, 1]) -> None:
+        """
+        Set the LED state for the device to the specified LED state. See ``VFlex.set_led_state()``.
+
+        :param led_state: The LED state to set the device to.
+        :return: Nothing, but updates the LED state for the object under self.led_state.
+        :raises WriteNotAppliedError: The state read back was still different after the last attempt.
+        """
+        await self._run(self._set_led_state(led_state))
+
+    @timed
+    async def set_led_colour(self, led_colour: LEDColour) -> None:
+        """
+        Sets the LED colour on the connected VFlex.
+
+        :param led_colour: The colour to set.
+        :raises UnsupportedFirmwareVersionError: The firmware is older than APP.05.00.00.
+        """
+        await self._run(self._set_led_colour(led_colour))
+
+    @timed
+    async def apply(
+        self, desired: DesiredState, *, force: bool = False, dry_run: bool = False, refresh: bool = False
+    ) -> list[Change]:
+        """
+        Brings the device into a desired state, writing only the settings that differ from it. See
+        ``VFlex.apply()``.
+
+        :param desired: The state the device should be in.
+        :param force: Write every setting in ``desired``, whether or not it differs.
+        :param dry_run: Only work out what would be written.
+        :param refresh: Read the state even if the last read is still fresh.
+        :return: The settings written (or that would be, on a dry run).
+        """
+        return await self._run(self._apply(desired, force=force, dry_run=dry_run, refresh=refresh))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, AsyncVFlex) and self.serial_number == other.serial_number
@@ -0,0 +1,105 @@
+import json
+from pathlib import Path
+
+import structlog
+
+from vflexctl.app_data import app_data_dir
+from vflexctl.midi_transport.pacing import pacing_key
+
+__all__ = ["batching_file", "device_batches_queries", "port_batches_queries", "save_batching"]
+
+log = structlog.get_logger("vflexctl.batching")
+
+
+def batching_file() -> Path:
+    """
+    :return: The path to the JSON file that records which devices (and ports) don't answer batched
+        queries.
+    """
+    return app_data_dir() / "batching.json"
+
+
+def _read_batching_file(path: Path) -> dict[str, list[str]]:
+    try:
+        stored = json.loads(path.read_text())
+    except FileNotFoundError:
+        return {"devices": [], "ports": []}
+    except (OSError, ValueError) as e:
+        log.warning("Could not read the stored batching, batching queries.", path=str(path), error=str(e))
+        return {"devices": [], "ports": []}
+    if not isinstance(stored, dict):
+        stored = {}
+    return {
+        section: (
+            [key for key in stored.get(section, []) if isinstance(key, str)]
+            if isinstance(stored.get(section), list)
+            else []
+        )
+        for section in ("devices", "ports")
+    }
+
+
+def device_batches_queries(serial_number: str, firmware_version: str, *, path: Path | None = None) -> bool:
+    """
+    Like pacing, this is stored per device and per firmware version, so a firmware update gets
+    batching tried again.
+
+    :param serial_number: The serial number of the VFlex.
+    :param firmware_version: The firmware version string of the VFlex.
+    :param path: The batching file to read. Defaults to ``batching_file()``.
+    :return: False if the device has left part of a batch unanswered before, otherwise True.
+    """
+    return pacing_key(serial_number, firmware_version) not in _read_batching_file(path or batching_file())["devices"]
+
+
+def port_batches_queries(port_name: str, *, path: Path | None = None) -> bool:
+    """
+    The serial number isn't known until the first handshake (which is itself a batch), so the port
+    is checked before then. It's only a hint, replaced by the device's own record once that's known.
+
+    :param port_name: The name of the port.
+    :param path: The batching file to read. Defaults to ``batching_file()``.
+    :return: False if the device last seen on the port left part of a batch unanswered, otherwise True.
+    """
+    return port_name not in _read_batching_file(path or batching_file())["ports"]
+
+
+def save_batching(
+    batches: bool,
+    *,
+    serial_number: str | None = None,
+    firmware_version: str | None = None,
+    port_name: str | None = None,
+    path: Path | None = None,
+) -> None:
+    """
+    Records whether a device (and/or the port it's on) answers batched queries, keeping the records
+    for any others. Nothing is written if nothing changed.
+
+    :param batches: Whether batched queries are answered.
+    :param serial_number: The serial number of the VFlex, if known.
+    :param firmware_version: The firmware version string of the VFlex, if known.
+    :param port_name: The name of the port the VFlex is on, if known.
+    :param path: The batching file to write. Defaults to ``batching_file()``.
+    """
+    path = path or batching_file()
+    stored = _read_batching_file(path)
+    keys: dict[str, str | None] = {"ports": port_name, "devices": None}
+    if serial_number is not None and firmware_version is not None:
+        keys["devices"] = pacing_key(serial_number, firmware_version)
+    updated = {section: set(stored[section]) for section in stored}
+    for section, key in keys.items():
+        if key is None:
+            continue
+        if batches:
+            updated[section].discard(key)
+        else:
+            updated[section].add(key)
+    if all(updated[section] == set(stored[section]) for section in stored):
+        return None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({section: sorted(updated[section]) for section in updated}, indent=2))
+    except OSError as e:
+        log.warning("Could not store the batching.", path=str(path), error=str(e))
+    return None
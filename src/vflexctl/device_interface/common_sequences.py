@@ -3,20 +3,44 @@ Common commands, into a list of MIDI notes. These are here so that they don't ne
 made with command_preparation.
 """
 
+from functools import lru_cache
+
+from vflexctl.command.voltage import set_voltage_command
 from vflexctl.protocol import VFlexProto, prepare_command_for_sending, prepare_command_frame
 from vflexctl.types import MIDITriplet
 
-__all__ = ["GET_VOLTAGE_SEQUENCE", "GET_LED_STATE_SEQUENCE", "GET_SERIAL_NUMBER_SEQUENCE"]
+__all__ = [
+    "GET_VOLTAGE_SEQUENCE",
+    "GET_LED_STATE_SEQUENCE",
+    "GET_SERIAL_NUMBER_SEQUENCE",
+    "set_voltage_sequence",
+]
 
 
-type CommandList = list[
-    MIDITriplet
+type CommandList = tuple[
+    MIDITriplet, ...
 ]  # Already prepared command, good for sending, vs a VFlexProtoMessage which needs preparation
 
-GET_SERIAL_NUMBER_SEQUENCE: CommandList = prepare_command_for_sending(
-    prepare_command_frame([VFlexProto.CMD_GET_SERIAL_NUMBER])
+GET_SERIAL_NUMBER_SEQUENCE: CommandList = tuple(
+    prepare_command_for_sending(prepare_command_frame([VFlexProto.CMD_GET_SERIAL_NUMBER]))
+)
+
+GET_LED_STATE_SEQUENCE: CommandList = tuple(
+    prepare_command_for_sending(prepare_command_frame([VFlexProto.CMD_GET_LED_STATE]))
 )
 
-GET_LED_STATE_SEQUENCE: CommandList = prepare_command_for_sending(prepare_command_frame([VFlexProto.CMD_GET_LED_STATE]))
+GET_VOLTAGE_SEQUENCE: CommandList = tuple(
+    prepare_command_for_sending(prepare_command_frame([VFlexProto.CMD_GET_VOLTAGE]))
+)
+
+
+@lru_cache(maxsize=512)
+def set_voltage_sequence(millivolts: int) -> CommandList:
+    """
+    The prepared set voltage command for a voltage. Sequences are cached, so setting the same voltages
+    over and over (e.g. a profile, or a watch-and-correct loop) doesn't build them again each time.
 
-GET_VOLTAGE_SEQUENCE: CommandList = prepare_command_for_sending(prepare_command_frame([VFlexProto.CMD_GET_VOLTAGE]))
+    :param millivolts: The voltage to set, in millivolts.
+    :return: The MIDI sequence to send. It's shared, so it's a tuple.
+    """
+    return tuple(prepare_command_for_sending(prepare_command_frame(set_voltage_command(millivolts))))
@@ -0,0 +1,891 @@
+"""
+The protocol and state logic of a VFlex, shared by ``VFlex`` (sync) and ``AsyncVFlex`` (asyncio).
+
+``VFlexCore`` never touches the port. Each operation is a generator that yields the I/O it needs
+as steps (``Send``, ``Receive``, ``ReceiveReplies``, ``Flush`` and ``Wait``) and is sent back each
+step's result. The handshake and its TTL, the safety checks, retries, query batching, encoding
+commands and decoding replies all live here, once. The drivers only carry the steps out, on their
+own kind of port, receiver and clock. An exception raised doing a step is thrown back into the
+operation at that step.
+"""
+
+from collections.abc import Callable, Generator, Iterator, Sequence
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass
+from functools import partial, wraps
+from time import monotonic, perf_counter
+from typing import Any, Concatenate, Literal, ParamSpec, TypeVar, cast
+
+import structlog
+from mido.ports import BaseIOPort
+
+from vflexctl.command.hardware_info import get_firmware_version_command
+from vflexctl.command.led import LEDColour, set_led_colour_command, set_led_state_command
+from vflexctl.device_interface.apply import Change, DesiredState, pending_changes
+from vflexctl.device_interface.batching import device_batches_queries, port_batches_queries, save_batching
+from vflexctl.device_interface.common_sequences import (
+    GET_LED_STATE_SEQUENCE,
+    GET_SERIAL_NUMBER_SEQUENCE,
+    GET_VOLTAGE_SEQUENCE,
+    set_voltage_sequence,
+)
+from vflexctl.device_interface.playback import PlaybackReport, Setpoint, StepTiming, compile_setpoints
+from vflexctl.device_interface.query import QueryResults, reply_command_byte
+from vflexctl.device_interface.retry import (
+    DEFAULT_RETRY_POLICY,
+    DEFAULT_TIMEOUT,
+    READ_COMMANDS,
+    CommandPolicy,
+    RetryPolicy,
+)
+from vflexctl.device_interface.timings import Phase, Timings
+from vflexctl.exceptions import (
+    InvalidProtocolMessageLengthError,
+    ReplyTimeoutError,
+    SerialNumberMismatchError,
+    UnsupportedFirmwareVersionError,
+    VoltageMismatchError,
+    WriteNotAppliedError,
+)
+from vflexctl.metrics import Metrics
+from vflexctl.midi_transport.pacing import load_pacing
+from vflexctl.midi_transport.senders import DEFAULT_PAUSE_LENGTH
+from vflexctl.midi_transport.transport import MIDITransport
+from vflexctl.protocol import (
+    VFlexProto,
+    prepare_command_for_sending,
+    prepare_command_frame,
+    protocol_message_from_midi_messages,
+    protocol_messages_from_midi_messages,
+)
+from vflexctl.protocol.coders import (
+    get_millivolts_from_protocol_message,
+    protocol_decode_firmware_version,
+    protocol_decode_led_state,
+    protocol_decode_serial_number,
+)
+from vflexctl.types import MIDITriplet, VFlexProtoMessage
+
+__all__ = [
+    "VFlexCore",
+    "Step",
+    "Steps",
+    "Send",
+    "Receive",
+    "ReceiveReplies",
+    "Flush",
+    "Wait",
+    "STATE_COMMANDS",
+]
+
+# The commands that read the device's state, batched alongside the handshake where possible.
+STATE_COMMANDS: tuple[VFlexProtoMessage, ...] = ([VFlexProto.CMD_GET_LED_STATE], [VFlexProto.CMD_GET_VOLTAGE])
+
+# What VFlexCore._phase() gives when timings are off: nullcontext() can be entered any number of times.
+_NO_PHASE: AbstractContextManager[None] = nullcontext()
+
+
+@dataclass(frozen=True, slots=True)
+class Send:
+    """
+    Sends a prepared MIDI sequence, pausing ``pause`` seconds after each message. Gives back None.
+    """
+
+    sequence: Sequence[MIDITriplet]
+    pause: float
+
+
+@dataclass(frozen=True, slots=True)
+class Receive:
+    """
+    Waits up to ``timeout`` seconds for the reply to a command, like ``drain_until_frame()``. Gives
+    back the reply's MIDI messages, or everything received if it didn't arrive in time.
+    """
+
+    # The command byte the reply should have, or None to accept any complete reply.
+    command_byte: int | None
+    timeout: float
+
+    # Called once, as soon as the first MIDI message arrives.
+    on_first_message: Callable[[], None] | None = None
+
+    # Called if the reply didn't arrive (complete) in time.
+    on_timeout: Callable[[], None] | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ReceiveReplies:
+    """
+    Waits up to ``timeout`` seconds for the replies to a batch of commands, like
+    ``drain_until_replies()``. Gives back everything received.
+    """
+
+    command_bytes: frozenset[int]
+    timeout: float
+
+    # Called once, as soon as the first MIDI message arrives.
+    on_first_message: Callable[[], None] | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class Flush:
+    """
+    Takes everything already waiting on the port, without waiting. Gives back what was taken.
+    """
+
+
+@dataclass(frozen=True, slots=True)
+class Wait:
+    """
+    Waits ``seconds`` seconds. Gives back None.
+    """
+
+    seconds: float
+
+
+type Step = Send | Receive | ReceiveReplies | Flush | Wait
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# An operation (or part of one): yields the steps to carry out, and returns its result.
+Steps = Generator[Step, Any, R]
+
+
+def run_with_handshake(
+    func: Callable[Concatenate["VFlexCore", P], Steps[R]],
+) -> Callable[Concatenate["VFlexCore", P], Steps[R]]:
+    """
+    Runs the wake-up handshake before the decorated VFlexCore steps.
+
+    Handshakes don't stack: decorated steps run from inside others reuse the outer handshake. The
+    handshake is also skipped when the serial number was verified less than
+    ``VFlexCore.handshake_ttl`` seconds ago (and full handshakes aren't in use). If the steps raise,
+    the next operation always runs a fresh handshake.
+    """
+
+    @wraps(func)
+    def wrapper(core: "VFlexCore", *args: P.args, **kwargs: P.kwargs) -> Steps[R]:
+        if core._handshake_depth > 0:
+            return (yield from func(core, *args, **kwargs))
+        if not core.full_handshake and core.handshake_is_fresh:
+            core.log.debug("Skipping wake-up commands, the last handshake is still fresh")
+        else:
+            core.log.info("Running wake-up commands")
+            with core._phase(Phase.HANDSHAKE):
+                yield from core._wake_up(full_handshake=core.full_handshake)
+        with core._within_handshake():
+            return (yield from func(core, *args, **kwargs))
+
+    return cast(Callable[Concatenate["VFlexCore", P], Steps[R]], wrapper)
+
+
+class VFlexCore:
+    """
+    The state of a VFlex MIDI power adapter, and the steps of every operation on it. See the
+    module docstring, and ``VFlex``/``AsyncVFlex`` for the drivers that run them.
+    """
+
+    # The underlying MIDI I/O port (or transport), set by the driver. Only its name is used here.
+    io_port: BaseIOPort | MIDITransport
+
+    # Structured logger bound to this specific instance, set by the driver.
+    log: structlog.BoundLogger
+
+    # Cached serial number of the device (None until fetched).
+    serial_number: str | None = None
+
+    # Cached firmware version of the device (None until fetched).
+    firmware_version: str | None = None
+
+    # Last known voltage in millivolts, retrieved from the device.
+    current_voltage: int | None = None
+
+    # LED behaviour state as reported by the device.
+    led_state: bool | None = None
+
+    # The LED colour last set (the device can't report it).
+    led_colour: LEDColour | None = None
+
+    # Whether to enforce safety checks (e.g., ensuring serial number doesn't change).
+    safe_adjust: bool
+
+    # On handshakes, whether to run the full wake cycle or not
+    full_handshake: bool
+
+    # Pause after each MIDI message sent. Replaced by the tuned pause for the device (see `VFlex.tune_pacing()`)
+    # once the serial number and firmware version are known.
+    pause_length: float = DEFAULT_PAUSE_LENGTH
+
+    # Whether to look up (and use) a stored, tuned pause for the device after the wake-up.
+    use_tuned_pacing: bool = True
+
+    # Whether query() sends its commands in one envelope. Turned off (falling back to one command per
+    # envelope) if the device leaves part of a batch unanswered.
+    batch_queries: bool = True
+
+    # Whether to remember devices (and ports) that leave batches unanswered, so later instances send one
+    # command per envelope from the start (see ``vflexctl.device_interface.batching``).
+    use_stored_batching: bool = True
+
+    # Whether the device has left part of a batch unanswered on this instance.
+    _batch_left_unanswered: bool = False
+
+    # Where the per-phase timings of operations are recorded, if anywhere (see ``vflexctl.device_interface.timings``).
+    timings: Timings | None = None
+
+    # Where operational metrics (latencies, traffic, timeouts, errors) are recorded, if anywhere (see ``vflexctl.metrics``).
+    metrics: Metrics | None = None
+
+    # The timeouts and retries for each command sent (see ``vflexctl.device_interface.retry``).
+    retry_policy: RetryPolicy = DEFAULT_RETRY_POLICY
+
+    # How long (in seconds) a verified serial number stays "fresh". While fresh, operations skip the
+    # handshake, and the voltage guard trusts a voltage the device reported within the same window.
+    # 0 turns this off, so every operation runs its handshake.
+    handshake_ttl: float = 0.0
+
+    # monotonic() timestamps of the last serial number verification and the last voltage reported by the device.
+    _serial_verified_at: float | None = None
+    _voltage_confirmed_at: float | None = None
+
+    # How many handshake scopes (see ``_within_handshake()``) are currently open on this instance.
+    _handshake_depth: int = 0
+
+    # How many operations (see ``_operation()``) are currently running on this instance.
+    _operation_depth: int = 0
+
+    def __init__(
+        self,
+        *,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        handshake_ttl: float = 0.0,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> None:
+        """
+        Called by the drivers once the port is attached.
+        """
+        self.safe_adjust = safe_adjust
+        self.full_handshake = full_handshake
+        self.handshake_ttl = handshake_ttl
+        self.timings = timings
+        self.metrics = metrics
+        if retry_policy is not None:
+            self.retry_policy = retry_policy
+        if self.use_stored_batching and (port_name := self._port_name) is not None:
+            self.batch_queries = port_batches_queries(port_name)
+
+    @property
+    def _port_name(self) -> str | None:
+        port_name = getattr(self.io_port, "name", None)
+        return port_name if isinstance(port_name, str) else None
+
+    def use_quick_handshakes(self) -> None:
+        self.full_handshake = False
+
+    def use_full_handshakes(self) -> None:
+        self.full_handshake = True
+
+    def _is_fresh(self, timestamp: float | None) -> bool:
+        return timestamp is not None and monotonic() - timestamp < self.handshake_ttl
+
+    @property
+    def handshake_is_fresh(self) -> bool:
+        """
+        Whether the serial number was verified within the last ``handshake_ttl`` seconds.
+        """
+        return self.serial_number is not None and self._is_fresh(self._serial_verified_at)
+
+    def expire_handshake(self) -> None:
+        """
+        Forgets when the serial number and voltage were last confirmed, so the next operation runs
+        its full set of checks.
+        """
+        self._serial_verified_at = None
+        self._voltage_confirmed_at = None
+
+    def _confirm_voltage(self, millivolts: int) -> None:
+        self.current_voltage = millivolts
+        self._voltage_confirmed_at = monotonic()
+
+    @contextmanager
+    def _within_handshake(self) -> Iterator[None]:
+        """
+        Runs the block as part of a handshake that's already been done, so ``run_with_handshake``
+        steps run inside it don't run their own. If the block raises, the handshake is expired, so
+        the next operation runs a fresh one.
+        """
+        self._handshake_depth += 1
+        try:
+            yield
+        except Exception:
+            self.expire_handshake()
+            raise
+        finally:
+            self._handshake_depth -= 1
+
+    @contextmanager
+    def _operation(self, name: str) -> Iterator[None]:
+        """
+        Records the block as an operation: its phases in ``timings`` and its latency (and anything it
+        raises) in ``metrics``, for whichever are set. Operations don't stack: one started inside
+        another is part of the outer one.
+
+        :param name: The operation's name.
+        """
+        if (self.timings is None and self.metrics is None) or self._operation_depth > 0:
+            yield None
+            return
+        metrics = self.metrics
+        error: Exception | None = None
+        self._operation_depth += 1
+        started_at = perf_counter()
+        try:
+            with _NO_PHASE if self.timings is None else self.timings.operation(name):
+                yield None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._operation_depth -= 1
+            if metrics is not None:
+                metrics.observe_operation(name, perf_counter() - started_at, error)
+
+    def _phase(self, phase: Phase) -> AbstractContextManager[None]:
+        """
+        :param phase: The phase of the current operation about to run.
+        :return: A context manager that times the phase, if timings are being recorded.
+        """
+        if self.timings is None:
+            return _NO_PHASE
+        return self.timings.phase(phase)
+
+    def _on_first_message(self) -> Callable[[], None] | None:
+        """
+        :return: The callback for the receivers that moves the timings on from waiting for a reply to
+            receiving it, or None if timings aren't being recorded.
+        """
+        return None if self.timings is None else partial(self.timings.switch, Phase.FRAME)
+
+    def _send(self, sequence: Sequence[MIDITriplet], *, pause: float | None = None) -> Steps[None]:
+        """
+        Sends a prepared MIDI sequence to the device.
+
+        :param sequence: The MIDI messages to send.
+        :param pause: The pause after each message. Defaults to ``pause_length``.
+        """
+        with self._phase(Phase.SEND):
+            yield Send(sequence, self.pause_length if pause is None else pause)
+        if self.metrics is not None:
+            self.metrics.count_sent(len(sequence))
+
+    def _receive(
+        self, command_byte: int | None = None, *, timeout: float = DEFAULT_TIMEOUT
+    ) -> Steps[list[MIDITriplet]]:
+        """
+        Waits for the reply frame to a command.
+
+        :param command_byte: The command byte the reply should have, or None to accept any complete frame.
+        :param timeout: The longest to wait for the reply, in seconds.
+        :return: The MIDI messages for the reply.
+        """
+        with self._phase(Phase.FIRST_BYTE):
+            midi_messages: list[MIDITriplet] = yield Receive(
+                command_byte,
+                timeout,
+                self._on_first_message(),
+                None if self.metrics is None else self.metrics.count_timeouts,
+            )
+        if self.metrics is not None:
+            self.metrics.count_received(len(midi_messages))
+        return midi_messages
+
+    def _receive_message(self, command_byte: int, *, timeout: float = DEFAULT_TIMEOUT) -> Steps[VFlexProtoMessage]:
+        """
+        Waits for the reply frame to a command and decodes it.
+
+        :param command_byte: The command byte the reply should have.
+        :param timeout: The longest to wait for the reply, in seconds.
+        :return: The reply's protocol message.
+        :raises ReplyTimeoutError: The reply didn't arrive (complete) in time.
+        """
+        midi_messages = yield from self._receive(command_byte, timeout=timeout)
+        with self._phase(Phase.DECODE):
+            try:
+                return protocol_message_from_midi_messages(midi_messages)
+            except (ValueError, IndexError) as e:
+                # What the receivers give back on a timeout is too short to decode.
+                raise ReplyTimeoutError(command_byte, 1, timeout) from e
+
+    def _receive_replies(
+        self, command_bytes: set[int], *, timeout: float = DEFAULT_TIMEOUT
+    ) -> Steps[list[MIDITriplet]]:
+        """
+        Waits for the replies to a batch of commands.
+
+        :param command_bytes: The command bytes of the replies expected.
+        :param timeout: The longest to wait for all the replies, in seconds.
+        :return: Everything received.
+        """
+        with self._phase(Phase.FIRST_BYTE):
+            midi_messages: list[MIDITriplet] = yield ReceiveReplies(
+                frozenset(command_bytes), timeout, self._on_first_message()
+            )
+        if self.metrics is not None:
+            self.metrics.count_received(len(midi_messages))
+        return midi_messages
+
+    def _flush(self) -> Steps[None]:
+        """
+        Throws away anything already waiting on the port.
+        """
+        midi_messages: list[MIDITriplet] = yield Flush()
+        if self.metrics is not None:
+            self.metrics.count_received(len(midi_messages))
+
+    def _back_off(self, policy: CommandPolicy, retry: int, command_byte: int) -> Steps[None]:
+        """
+        Waits before a retry, then throws away anything that turned up late for the failed attempt
+        (so it isn't taken for the reply to the next one).
+
+        :param policy: The policy for the command being retried.
+        :param retry: Which retry it is, counting from 1.
+        :param command_byte: The command being retried.
+        """
+        delay = policy.backoff(retry)
+        self.log.info("No reply from the VFlex, retrying", command_byte=command_byte, retry=retry, delay=delay)
+        if self.metrics is not None:
+            self.metrics.count_retries()
+        with self._phase(Phase.RETRY):
+            yield Wait(delay)
+        yield from self._flush()
+
+    def _request(
+        self, sequence: Sequence[MIDITriplet], command_byte: int, reply_command_byte: int | None = None
+    ) -> Steps[VFlexProtoMessage]:
+        """
+        Sends a command and waits for its reply, with the timeout from ``retry_policy``. A read whose
+        reply doesn't come is sent again, as many times as the policy allows. A write never is (see
+        ``_write_voltage()`` for how writes are retried).
+
+        :param sequence: The MIDI messages for the command.
+        :param command_byte: The command byte of the command.
+        :param reply_command_byte: The command byte the reply should have. Defaults to ``command_byte``.
+        :return: The reply's protocol message.
+        :raises ReplyTimeoutError: The reply didn't arrive on any attempt.
+        """
+        policy = self.retry_policy.for_command(command_byte)
+        reply_command_byte = command_byte if reply_command_byte is None else reply_command_byte
+        attempts = policy.retries + 1 if command_byte in READ_COMMANDS else 1
+        error: ReplyTimeoutError | None = None
+        for attempt in range(attempts):
+            if attempt:
+                yield from self._back_off(policy, attempt, command_byte)
+            yield from self._send(sequence)
+            try:
+                return (yield from self._receive_message(reply_command_byte, timeout=policy.timeout))
+            except ReplyTimeoutError as e:
+                error = e
+        raise ReplyTimeoutError(reply_command_byte, attempts, policy.timeout) from error
+
+    def _wake_up(self, full_handshake: bool = False) -> Steps[None]:
+        """
+        "Wakes up" the connected VFlex to get it ready to receive commands. ``run_with_handshake``
+        steps run this automatically.
+
+        :param full_handshake: Whether to also read the LED state and voltage (if they aren't known yet).
+        """
+        if not full_handshake:
+            yield from self._handshake_query()
+            return None
+        results = yield from self._handshake_query(*STATE_COMMANDS)
+        if self.led_state is None:
+            self.led_state = protocol_decode_led_state(results[VFlexProto.CMD_GET_LED_STATE])
+        if self.current_voltage is None:
+            self._confirm_voltage(get_millivolts_from_protocol_message(results[VFlexProto.CMD_GET_VOLTAGE]))
+        return None
+
+    def _handshake_query(self, *commands: VFlexProtoMessage) -> Steps[QueryResults]:
+        """
+        Runs the handshake (the serial number check, plus getting the firmware version if it isn't known
+        yet) with ``commands`` in the same batch, so it all takes one round trip.
+
+        :param commands: Extra commands to send with the handshake.
+        :return: The replies, including the handshake's.
+        :raises SerialNumberMismatchError: The serial number has changed between fetches.
+        """
+        fetch_firmware_version = self.firmware_version is None
+        handshake: list[VFlexProtoMessage] = [[VFlexProto.CMD_GET_SERIAL_NUMBER]]
+        if fetch_firmware_version:
+            handshake.append(get_firmware_version_command())
+            yield from self._flush()
+        results = yield from self._query(*handshake, *commands)
+        self._verify_serial_number(results[VFlexProto.CMD_GET_SERIAL_NUMBER])
+        if fetch_firmware_version:
+            self.firmware_version = protocol_decode_firmware_version(results[VFlexProto.CMD_GET_FIRMWARE_VERSION])
+            self._load_tuned_pacing()
+            self._load_batching()
+        return results
+
+    def _query(self, *commands: VFlexProtoMessage) -> Steps[QueryResults]:
+        """
+        Sends several commands in one envelope and sorts the replies by command byte, falling back to
+        one command per envelope if the device leaves any of them unanswered. See ``VFlex.query()``.
+
+        :param commands: The commands to send, without their length byte (e.g. ``[VFlexProto.CMD_GET_VOLTAGE]``).
+        :return: The replies, by command byte.
+        :raises ValueError: No commands were given.
+        :raises ReplyTimeoutError: A reply never arrived, even when sent on its own (with its retries).
+        """
+        if not commands:
+            raise ValueError("No commands to query.")
+        results = QueryResults()
+        unanswered = list(commands)
+        if self.batch_queries and len(commands) > 1:
+            expected = {reply_command_byte(command) for command in commands}
+            with self._phase(Phase.ENCODE):
+                sequence = prepare_command_for_sending([prepare_command_frame(command) for command in commands])
+            yield from self._send(sequence)
+            timeout = max(self.retry_policy.for_command(command[0]).timeout for command in commands)
+            midi_messages = yield from self._receive_replies(expected, timeout=timeout)
+            with self._phase(Phase.DECODE):
+                for protocol_message in protocol_messages_from_midi_messages(midi_messages):
+                    if protocol_message[1] in expected:
+                        results.replies[protocol_message[1]] = protocol_message
+            unanswered = [command for command in commands if reply_command_byte(command) not in results]
+            if unanswered and self.metrics is not None:
+                self.metrics.count_timeouts(len(unanswered))
+            if unanswered:
+                self.log.warning(
+                    "The VFlex didn't answer every command in a batch, sending one at a time from now on",
+                    unanswered=unanswered,
+                )
+                self.batch_queries = False
+                self._batch_left_unanswered = True
+                self._save_batching(False)
+        for command in unanswered:
+            command_byte = reply_command_byte(command)
+            with self._phase(Phase.ENCODE):
+                sequence = prepare_command_for_sending(prepare_command_frame(command))
+            results.replies[command_byte] = yield from self._request(sequence, command[0], command_byte)
+        return results
+
+    def _read(self) -> Steps[None]:
+        """
+        Re-reads the voltage and LED state from the device, with the handshake in the same batch when
+        one is due.
+        """
+        handshake_due = self._handshake_depth == 0 and (self.full_handshake or not self.handshake_is_fresh)
+        try:
+            if handshake_due:
+                results = yield from self._handshake_query(*STATE_COMMANDS)
+            else:
+                results = yield from self._query(*STATE_COMMANDS)
+            self.led_state = protocol_decode_led_state(results[VFlexProto.CMD_GET_LED_STATE])
+            self._confirm_voltage(get_millivolts_from_protocol_message(results[VFlexProto.CMD_GET_VOLTAGE]))
+        except Exception:
+            self.expire_handshake()
+            raise
+        return None
+
+    def _get_serial_number(self) -> Steps[str | None]:
+        return self._verify_serial_number(
+            (yield from self._request(GET_SERIAL_NUMBER_SEQUENCE, VFlexProto.CMD_GET_SERIAL_NUMBER))
+        )
+
+    def _verify_serial_number(self, protocol_message: list[int]) -> str | None:
+        """
+        Checks a serial number reply against the stored serial number (see ``VFlex.get_serial_number()``).
+
+        :param protocol_message: The reply to the serial number command.
+        :return: The serial number in the reply, or None if it couldn't be decoded (without safe_adjust).
+        :raises SerialNumberMismatchError: The serial number has changed between fetches.
+        """
+        try:
+            returned_serial_number = protocol_decode_serial_number(protocol_message)
+        except InvalidProtocolMessageLengthError as e:
+            self.log.exception("Failed to decode serial number.", exc_info=e)
+            self.expire_handshake()
+            if self.safe_adjust:
+                raise e
+            return None
+
+        if self.serial_number is None or not self.safe_adjust:
+            self.serial_number = returned_serial_number
+        if self.safe_adjust and self.serial_number != returned_serial_number:
+            self.expire_handshake()
+            raise SerialNumberMismatchError(
+                old_serial_number=self.serial_number, new_serial_number=returned_serial_number
+            )
+        self._serial_verified_at = monotonic()
+        return returned_serial_number
+
+    def _get_firmware_version(self) -> Steps[str | None]:
+        with self._phase(Phase.ENCODE):
+            command = prepare_command_for_sending(prepare_command_frame(get_firmware_version_command()))
+        yield from self._flush()
+        self.firmware_version = protocol_decode_firmware_version(
+            (yield from self._request(command, VFlexProto.CMD_GET_FIRMWARE_VERSION))
+        )
+        return self.firmware_version
+
+    def _load_tuned_pacing(self) -> None:
+        """
+        Switches to the stored, tuned pause for this device and firmware, if there is one.
+        Anything going wrong here falls back to the default pause.
+        """
+        if not self.use_tuned_pacing or self.serial_number is None or self.firmware_version is None:
+            return None
+        tuned_pause = load_pacing(self.serial_number, self.firmware_version)
+        self.pause_length = DEFAULT_PAUSE_LENGTH if tuned_pause is None else tuned_pause
+        self.log.debug("Using pause length", pause_length=self.pause_length, tuned=tuned_pause is not None)
+        return None
+
+    def _save_batching(self, batches: bool) -> None:
+        if self.use_stored_batching:
+            save_batching(
+                batches,
+                serial_number=self.serial_number,
+                firmware_version=self.firmware_version,
+                port_name=self._port_name,
+            )
+        return None
+
+    def _load_batching(self) -> None:
+        """
+        Once the serial number and firmware version are known, switches batching on or off from what's
+        stored for this device, in place of the port's record. A batch the handshake just saw go
+        unanswered is stored for the device.
+        """
+        if not self.use_stored_batching or self.serial_number is None or self.firmware_version is None:
+            return None
+        if self._batch_left_unanswered:
+            self._save_batching(False)
+            return None
+        batches = device_batches_queries(self.serial_number, self.firmware_version)
+        if batches != self.batch_queries:
+            # The port's record was for a different device (or an older firmware), so bring it up to date.
+            self._save_batching(batches)
+        self.batch_queries = batches
+        self.log.debug("Batching queries", batch_queries=batches)
+        return None
+
+    @run_with_handshake
+    def _get_voltage(self, *, update_self: bool = True) -> Steps[int]:
+        millivolts = get_millivolts_from_protocol_message(
+            (yield from self._request(GET_VOLTAGE_SEQUENCE, VFlexProto.CMD_GET_VOLTAGE))
+        )
+        self.log.debug("Retrieved current voltage", current_voltage=millivolts)
+        if update_self:
+            self._confirm_voltage(millivolts)
+        return millivolts
+
+    @run_with_handshake
+    def _get_led_state(self) -> Steps[bool]:
+        led_state = protocol_decode_led_state(
+            (yield from self._request(GET_LED_STATE_SEQUENCE, VFlexProto.CMD_GET_LED_STATE))
+        )
+        self.log.debug("Retrieved LED State", led_state=led_state)
+        self.led_state = led_state
+        return led_state
+
+    @run_with_handshake
+    def _guard_voltage(self) -> Steps[None]:
+        """
+        Guards against the voltage changing if self.safe_adjust is True. The re-read is skipped when the
+        device itself reported the stored voltage within the last ``handshake_ttl`` seconds.
+
+        :raises VoltageMismatchError: Subclass of UnsafeAdjustmentError, if the voltage stored does not match
+            the voltage that's re-retrieved.
+        """
+        if not self.safe_adjust or self._is_fresh(self._voltage_confirmed_at):
+            return None
+        reported_current_voltage = yield from self._get_voltage(update_self=False)
+        if reported_current_voltage != self.current_voltage:
+            raise VoltageMismatchError(stored_voltage=self.current_voltage, retrieved_voltage=reported_current_voltage)
+        self._voltage_confirmed_at = monotonic()
+        return None
+
+    @run_with_handshake
+    def _set_voltage(self, millivolts: int) -> Steps[None]:
+        yield from self._guard_voltage()
+        yield from self._write_voltage(millivolts)
+
+    def _write_voltage(self, millivolts: int) -> Steps[None]:
+        """
+        Sends the set voltage command and stores the voltage the device returns, without a handshake
+        or voltage guard of its own.
+
+        If the reply doesn't come, the write may still have landed. So before each retry (as many as
+        ``retry_policy`` allows) the voltage is read back, and the command is only sent again if the
+        device isn't at the new voltage yet.
+
+        :param millivolts: The voltage to set the device to, in millivolts.
+        :raises ReplyTimeoutError: No attempt got a reply, and the voltage didn't change.
+        """
+        with self._phase(Phase.ENCODE):
+            sequence = set_voltage_sequence(millivolts)
+        policy = self.retry_policy.for_command(VFlexProto.CMD_SET_VOLTAGE)
+        error: ReplyTimeoutError | None = None
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                yield from self._back_off(policy, attempt, VFlexProto.CMD_SET_VOLTAGE)
+                reported_voltage = yield from self._get_voltage()
+                if reported_voltage == millivolts:
+                    self.log.info("The voltage was set, only the reply was lost", millivolts=millivolts)
+                    return None
+            yield from self._send(sequence)
+            try:
+                reply = yield from self._receive_message(VFlexProto.CMD_GET_VOLTAGE, timeout=policy.timeout)
+            except ReplyTimeoutError as e:
+                error = e
+                continue
+            returned_voltage = get_millivolts_from_protocol_message(reply)
+            self.log.debug("Voltage returned after setting", returned_voltage=returned_voltage)
+            self._confirm_voltage(returned_voltage)
+            return None
+        raise ReplyTimeoutError(VFlexProto.CMD_GET_VOLTAGE, policy.retries + 1, policy.timeout) from error
+
+    @run_with_handshake
+    def _play(self, setpoints: list[Setpoint], on_step: Callable[[StepTiming], None] | None) -> Steps[PlaybackReport]:
+        """
+        Steps the voltage through a profile. See ``VFlex.play()``.
+        """
+        with self._phase(Phase.ENCODE):
+            sequences = compile_setpoints(setpoints)
+        yield from self._guard_voltage()
+        write_timeout = self.retry_policy.for_command(VFlexProto.CMD_SET_VOLTAGE).timeout
+        report = PlaybackReport()
+        started_at = monotonic()
+        for index, (setpoint, sequence) in enumerate(zip(setpoints, sequences)):
+            wait = started_at + setpoint.at - monotonic()
+            if wait > 0:
+                yield Wait(wait)
+            sent_at = monotonic() - started_at
+            yield from self._send(sequence)
+            # No retries while playing: a step sent late would throw the rest of the schedule out.
+            reported_millivolts = get_millivolts_from_protocol_message(
+                (yield from self._receive_message(VFlexProto.CMD_GET_VOLTAGE, timeout=write_timeout))
+            )
+            self._confirm_voltage(reported_millivolts)
+            step = StepTiming(
+                index=index,
+                millivolts=setpoint.millivolts,
+                reported_millivolts=reported_millivolts,
+                scheduled_at=setpoint.at,
+                sent_at=sent_at,
+            )
+            if reported_millivolts != setpoint.millivolts:
+                self.log.warning("The VFlex reported a different voltage to the one set", step=step)
+            report.steps.append(step)
+            if on_step is not None:
+                on_step(step)
+        return report
+
+    @run_with_handshake
+    def _set_led_state(self, led_state: bool | Literal[0, 1]) -> Steps[None]:
+        """
+        Sets the LED state, then reads it back. If it didn't change (e.g. the command was lost), it's
+        set again, as many times as ``retry_policy`` allows.
+
+        :param led_state: The LED state to set the device to.
+        :raises WriteNotAppliedError: The state read back was still different after the last attempt.
+        """
+        with self._phase(Phase.ENCODE):
+            command = prepare_command_for_sending(prepare_command_frame(set_led_state_command(led_state)))
+        policy = self.retry_policy.for_command(VFlexProto.CMD_SET_LED_STATE)
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                yield from self._back_off(policy, attempt, VFlexProto.CMD_SET_LED_STATE)
+            yield from self._send(command)
+            _ = yield from self._receive(timeout=policy.timeout)
+            self.led_state = protocol_decode_led_state(
+                (yield from self._request(GET_LED_STATE_SEQUENCE, VFlexProto.CMD_GET_LED_STATE))
+            )
+            self.log.debug("LED State returned after setting", led_state=self.led_state)
+            if self.led_state == bool(led_state):
+                return None
+        raise WriteNotAppliedError(VFlexProto.CMD_SET_LED_STATE, policy.retries + 1, bool(led_state), self.led_state)
+
+    @property
+    def supports_led_colour(self) -> bool:
+        """
+        If the VFlex supports setting the LED colour, introduced in APP.05.00.00. False while the
+        firmware version isn't known.
+        """
+        return self.firmware_version is not None and int(self.firmware_version.split(".")[1]) >= 5
+
+    def _set_led_colour(self, led_colour: LEDColour) -> Steps[None]:
+        """
+        Sets the LED colour, fetching the firmware version first if it isn't known. The device doesn't
+        reply, so there's nothing to retry on.
+
+        :param led_colour: The colour to set.
+        :raises UnsupportedFirmwareVersionError: The firmware is older than APP.05.00.00.
+        """
+        if self.firmware_version is None:
+            yield from self._get_firmware_version()
+        if not self.supports_led_colour:
+            raise UnsupportedFirmwareVersionError(self.firmware_version, "5.0.0")
+        with self._phase(Phase.ENCODE):
+            command = prepare_command_for_sending(prepare_command_frame(set_led_colour_command(led_colour)))
+        yield from self._flush()
+        yield from self._send(command)
+        self.led_colour = led_colour
+        return None
+
+    def _apply(self, desired: DesiredState, *, force: bool, dry_run: bool, refresh: bool) -> Steps[list[Change]]:
+        """
+        Brings the device into a desired state, writing only the settings that differ from it. See
+        ``VFlex.apply()``.
+        """
+        if refresh or not (
+            self.handshake_is_fresh and self._is_fresh(self._voltage_confirmed_at) and self.led_state is not None
+        ):
+            yield from self._read()
+        changes = desired.changes if force else pending_changes(self, desired)
+        if dry_run or not changes:
+            return changes
+        with self._within_handshake():
+            if "voltage" in changes:
+                yield from self._write_voltage(cast(int, desired.millivolts))
+            if "led_state" in changes:
+                yield from self._set_led_state(cast(bool, desired.led_state))
+            if "led_colour" in changes:
+                yield from self._set_led_colour(cast(LEDColour, desired.led_colour))
+        return changes
+
+    def _try_pause(self, pause: float) -> Steps[bool]:
+        """
+        Runs one read (serial number, then voltage) with a given pause between MIDI messages.
+
+        :param pause: The pause to try, in seconds.
+        :return: True if both replies came back complete and the serial number matched.
+        """
+        try:
+            yield from self._send(GET_SERIAL_NUMBER_SEQUENCE, pause=pause)
+            serial_number = protocol_decode_serial_number(
+                protocol_message_from_midi_messages((yield from self._receive(VFlexProto.CMD_GET_SERIAL_NUMBER)))
+            )
+            yield from self._send(GET_VOLTAGE_SEQUENCE, pause=pause)
+            get_millivolts_from_protocol_message(
+                protocol_message_from_midi_messages((yield from self._receive(VFlexProto.CMD_GET_VOLTAGE)))
+            )
+        except (ValueError, IndexError):
+            return False
+        return serial_number == self.serial_number
+
+    def _settle(self) -> Steps[None]:
+        """
+        Gives the device a moment to give up on a garbled command, throwing away anything it sends.
+        """
+        yield from self._flush()
+        yield from self._receive()
+        yield from self._flush()
+
+    @property
+    def led_state_str(self) -> str:
+        return "always on" if self.led_state is False else "disabled during operation"
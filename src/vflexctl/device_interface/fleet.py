@@ -0,0 +1,185 @@
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Self, Literal
+
+import structlog
+
+from vflexctl.command.led import LEDColour
+from vflexctl.device_interface.port_index import update_port_index
+from vflexctl.device_interface.retry import RetryPolicy
+from vflexctl.device_interface.timings import Timings
+from vflexctl.device_interface.vflex import VFlex, DEFAULT_PORT_NAME, matching_port_names, timed_open_ioport
+from vflexctl.metrics import Metrics
+from vflexctl.midi_transport.capture import CaptureWriter
+from vflexctl.midi_transport.transport import Backend
+
+__all__ = ["VFlexFleet", "FleetResults", "matching_port_names"]
+
+log = structlog.get_logger("vflexctl.VFlexFleet")
+
+
+@dataclass
+class FleetResults[R]:
+    """
+    The outcome of running something on several VFlex devices, keyed by serial number.
+    """
+
+    results: dict[str, R] = field(default_factory=dict)
+    errors: dict[str, Exception] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class VFlexFleet:
+    """
+    A set of VFlex devices, identified by serial number, that can be read from and set concurrently.
+
+    Every device has its own MIDI port, so each call runs one worker thread per device and the total
+    time is roughly that of the slowest device, rather than the sum of all of them.
+    """
+
+    # Devices in the fleet, by serial number.
+    devices: dict[str, VFlex]
+
+    def __init__(self, devices: Iterable[VFlex]) -> None:
+        self.devices = {}
+        for v_flex in devices:
+            if v_flex.serial_number is None:
+                raise ValueError("Fleet devices need to be woken up (so their serial number is known) first.")
+            self.devices[v_flex.serial_number] = v_flex
+
+    @classmethod
+    def discover(
+        cls,
+        port_name: str = DEFAULT_PORT_NAME,
+        *,
+        serials: Iterable[str] | None = None,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        event_driven: bool = False,
+        backend: Backend = "mido",
+        capture: CaptureWriter | None = None,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> Self:
+        """
+        Opens every port that looks like a VFlex and wakes each device up (in parallel) to find out
+        its serial number. Ports that fail to open or wake up are logged and skipped. The serial
+        numbers found are stored in the port index, for ``VFlex.with_serial()``.
+
+        :param port_name: The port name a VFlex reports.
+        :param serials: If provided, only keep devices with these serial numbers (the others are closed).
+        :param safe_adjust: Whether (or not) to add extra checks for adjustments.
+        :param full_handshake: Whether (or not) to run the full wake cycle when adjusting parameters
+        :param event_driven: Whether to receive through a port callback instead of polling the port.
+        :param backend: The MIDI library to open the ports with.
+        :param capture: Record all the MIDI traffic on every port to this capture.
+        :param timings: Record the per-phase timings of operations on every device here.
+        :param metrics: Record operational metrics for every device here.
+        :param retry_policy: The timeouts and retries for each command, on every device.
+        :return: A fleet of the devices found.
+        """
+        wanted = set(serials) if serials is not None else None
+        found: dict[str, str | None] = {}
+
+        def _open(name: str) -> VFlex | None:
+            try:
+                v_flex = VFlex(
+                    timed_open_ioport(name, backend, timings),
+                    safe_adjust=safe_adjust,
+                    full_handshake=full_handshake,
+                    event_driven=event_driven,
+                    capture=capture,
+                    timings=timings,
+                    metrics=metrics,
+                    retry_policy=retry_policy,
+                )
+            except Exception as e:
+                log.warning("Could not open port", port_name=name, error=str(e))
+                return None
+            try:
+                v_flex.initial_wake_up()
+            except Exception as e:
+                log.warning("Could not wake up the VFlex on port", port_name=name, error=str(e))
+                v_flex.close()
+                found[name] = None
+                return None
+            found[name] = v_flex.serial_number
+            if wanted is not None and v_flex.serial_number not in wanted:
+                v_flex.close()
+                return None
+            return v_flex
+
+        port_names = matching_port_names(port_name, backend)
+        if not port_names:
+            return cls([])
+        with ThreadPoolExecutor(max_workers=len(port_names), thread_name_prefix="vflex-discover") as pool:
+            opened = list(pool.map(_open, port_names))
+        update_port_index(found)
+        return cls(v_flex for v_flex in opened if v_flex is not None)
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def __iter__(self) -> Iterator[VFlex]:
+        return iter(self.devices.values())
+
+    def __getitem__(self, serial_number: str) -> VFlex:
+        return self.devices[serial_number]
+
+    @property
+    def serial_numbers(self) -> list[str]:
+        return list(self.devices)
+
+    def close(self) -> None:
+        for v_flex in self.devices.values():
+            v_flex.close()
+
+    def run[R](self, func: Callable[[VFlex], R], serials: Iterable[str] | None = None) -> FleetResults[R]:
+        """
+        Runs ``func`` on each device concurrently, one worker per device.
+
+        :param func: What to run. It's given the VFlex to run on.
+        :param serials: Only run on devices with these serial numbers. Defaults to the whole fleet.
+        :return: The return values and errors, by serial number.
+        :raises KeyError: One of the serial numbers isn't in the fleet.
+        """
+        targets = {serial: self.devices[serial] for serial in serials} if serials is not None else dict(self.devices)
+        outcome: FleetResults[R] = FleetResults()
+        if not targets:
+            return outcome
+        with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="vflex-fleet") as pool:
+            futures = {serial: pool.submit(func, v_flex) for serial, v_flex in targets.items()}
+            for serial, future in futures.items():
+                try:
+                    outcome.results[serial] = future.result()
+                except Exception as e:
+                    log.warning("Fleet operation failed on a device", serial_number=serial, error=str(e))
+                    outcome.errors[serial] = e
+        return outcome
+
+    def read(self, serials: Iterable[str] | None = None) -> FleetResults[tuple[int, bool]]:
+        """
+        Reads the voltage and LED state from each device.
+
+        :return: ``(millivolts, led_state)`` by serial number.
+        """
+        return self.run(lambda v_flex: (v_flex.get_voltage(), v_flex.get_led_state()), serials)
+
+    def set_voltage(self, millivolts: int, serials: Iterable[str] | None = None) -> FleetResults[None]:
+        return self.run(lambda v_flex: v_flex.set_voltage(millivolts), serials)
+
+    def set_voltage_volts(self, volts: float, serials: Iterable[str] | None = None) -> FleetResults[None]:
+        return self.run(lambda v_flex: v_flex.set_voltage_volts(volts), serials)
+
+    def set_led_state(
+        self, led_state: bool | Literal[0, 1], serials: Iterable[str] | None = None
+    ) -> FleetResults[None]:
+        return self.run(lambda v_flex: v_flex.set_led_state(led_state), serials)
+
+    def set_led_colour(self, led_colour: LEDColour, serials: Iterable[str] | None = None) -> FleetResults[None]:
+        return self.run(lambda v_flex: v_flex.set_led_colour(led_colour), serials)
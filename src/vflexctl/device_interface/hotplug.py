@@ -0,0 +1,277 @@
+import threading
+from collections.abc import Callable
+from types import TracebackType
+from typing import Any, Self
+
+import structlog
+
+from vflexctl.device_interface.port_index import update_port_index
+from vflexctl.device_interface.vflex import DEFAULT_PORT_NAME, VFlex, matching_port_names
+from vflexctl.midi_transport.transport import Backend, open_ioport
+
+__all__ = ["PortWatcher", "AutoReconnect"]
+
+log = structlog.get_logger("vflexctl.hotplug")
+
+
+class PortWatcher:
+    """
+    Polls the list of MIDI ports that look like a VFlex from a background thread, and reports ports
+    appearing and disappearing. MIDI backends don't give notifications for this, but listing the
+    ports is cheap, so polling a few times a second costs next to nothing.
+    """
+
+    # The ports found on the last poll.
+    ports: set[str]
+
+    def __init__(
+        self,
+        on_change: Callable[[set[str], set[str]], Any],
+        *,
+        port_name: str = DEFAULT_PORT_NAME,
+        backend: Backend = "mido",
+        interval: float = 0.25,
+        on_poll: Callable[[], Any] | None = None,
+    ) -> None:
+        """
+        :param on_change: Called (from the watcher's thread) with the ports added and the ports removed.
+        :param port_name: The port name a VFlex reports.
+        :param backend: The MIDI library to list the ports with.
+        :param interval: The time between polls, in seconds.
+        :param on_poll: Called (from the watcher's thread) after every poll, changes or not.
+        """
+        self.on_change = on_change
+        self.on_poll = on_poll
+        self.port_name = port_name
+        self.backend = backend
+        self.interval = interval
+        self.ports = set(matching_port_names(port_name, backend))
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def poll(self) -> tuple[set[str], set[str]]:
+        """
+        Lists the ports once, calling ``on_change`` if any were added or removed since the last poll.
+
+        :return: The ports added and the ports removed.
+        """
+        try:
+            ports = set(matching_port_names(self.port_name, self.backend))
+        except Exception as e:
+            log.warning("Could not list the MIDI ports", error=str(e))
+            return set(), set()
+        added, removed = ports - self.ports, self.ports - ports
+        self.ports = ports
+        if added or removed:
+            log.info("MIDI ports changed", added=sorted(added), removed=sorted(removed))
+            self.on_change(added, removed)
+        return added, removed
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+                if self.on_poll is not None:
+                    self.on_poll()
+            except Exception as e:
+                log.exception("Port change handler failed", exc_info=e)
+
+    def start(self) -> Self:
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="vflex-port-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.stop()
+
+
+class AutoReconnect:
+    """
+    Keeps a VFlex connected through being unplugged and plugged back in. When its port disappears,
+    every VFlex port that appears is checked for the same serial number (with one handshake), and
+    the first that has it is swapped in with ``VFlex.replace_port()``.
+
+    A device that was power cycled may come back at a different voltage or LED state. Unless
+    ``restore`` is off, the state the VFlex had cached is put back on the new port *before* it's
+    swapped in, so whatever is using the VFlex never talks to the device in between. Operations that
+    were in progress on the old port fail as they would have anyway.
+    """
+
+    v_flex: VFlex
+
+    # Set while the VFlex's port is there, cleared from it disappearing until it's reconnected.
+    connected: threading.Event
+
+    # How many times the VFlex has been reconnected.
+    reconnects: int
+
+    def __init__(
+        self,
+        v_flex: VFlex,
+        *,
+        port_name: str = DEFAULT_PORT_NAME,
+        backend: Backend = "mido",
+        interval: float = 0.25,
+        restore: bool = True,
+        on_reconnect: Callable[[VFlex], Any] | None = None,
+    ) -> None:
+        """
+        :param v_flex: The VFlex to keep connected. It needs to be woken up (so its serial number is known).
+        :param port_name: The port name a VFlex reports.
+        :param backend: The MIDI library to open new ports with.
+        :param interval: The time between checks of the port list, in seconds.
+        :param restore: Whether to put the cached voltage and LED state back on a reconnected device.
+        :param on_reconnect: Called (from the watcher's thread) after the VFlex is reconnected.
+        """
+        if v_flex.serial_number is None:
+            raise ValueError("The VFlex needs to be woken up (so its serial number is known) first.")
+        self.v_flex = v_flex
+        self.backend = backend
+        self.restore = restore
+        self.on_reconnect = on_reconnect
+        self.connected = threading.Event()
+        self.connected.set()
+        self.reconnects = 0
+        # Ports that appeared while disconnected, but didn't answer (yet). A device that's still
+        # starting up can take a moment, so they're tried again on each poll.
+        self._unanswered: set[str] = set()
+        self.watcher = PortWatcher(
+            self.on_port_change, port_name=port_name, backend=backend, interval=interval, on_poll=self.retry
+        )
+
+    @property
+    def port_name(self) -> str:
+        return str(self.v_flex.io_port.name)
+
+    def on_port_change(self, added: set[str], removed: set[str]) -> None:
+        """
+        Handles VFlex ports appearing and disappearing: notices the VFlex's own port going, and while
+        it's gone, checks each new port for it. Called by ``watcher``, or by whatever is watching the
+        ports when several devices share one ``PortWatcher`` (see ``Reconciler``).
+
+        :param added: The ports that appeared.
+        :param removed: The ports that disappeared.
+        """
+        if self.port_name in removed:
+            self.v_flex.log.warning("The VFlex's port disappeared, waiting for it to come back")
+            self.connected.clear()
+        self._unanswered -= removed
+        if self.connected.is_set():
+            return None
+        # The port a device comes back on usually has the same name, so try that first.
+        for name in sorted(added, key=lambda name: name != self.port_name):
+            self._unanswered.add(name)
+            if self._try_port(name):
+                return None
+        return None
+
+    def retry(self) -> None:
+        """
+        While disconnected, checks the ports that appeared but didn't answer again. Called by
+        ``watcher`` on each poll, or by whatever is watching the ports (like ``on_port_change()``).
+        """
+        if self.connected.is_set() or not self._unanswered:
+            return None
+        for name in sorted(self._unanswered):
+            if self._try_port(name):
+                return None
+        return None
+
+    def _try_port(self, name: str) -> bool:
+        """
+        :param name: A port that appeared while disconnected.
+        :return: Whether it had the VFlex on it (which is now reconnected).
+        """
+        try:
+            io_port = open_ioport(name, self.backend)
+        except Exception as e:
+            log.warning("Could not open port", port_name=name, error=str(e))
+            return False
+        # A separate VFlex on the new port, so the state is checked and restored without the one in
+        # use ever seeing the port.
+        probe = VFlex(
+            io_port,
+            safe_adjust=True,
+            capture=self.v_flex.capture,
+            timings=self.v_flex.timings,
+            metrics=self.v_flex.metrics,
+            retry_policy=self.v_flex.retry_policy,
+        )
+        probe.use_tuned_pacing = self.v_flex.use_tuned_pacing
+        try:
+            probe.initial_wake_up()
+            update_port_index({name: probe.serial_number})
+            if probe.serial_number != self.v_flex.serial_number:
+                # Another VFlex: no use retrying it.
+                self._unanswered.discard(name)
+                io_port.close()
+                return False
+            if self.restore:
+                self._restore(probe)
+        except Exception as e:
+            log.warning("Could not reconnect to the VFlex on port", port_name=name, error=str(e))
+            io_port.close()
+            return False
+        # Under the lock, so an operation running in another thread sees the new port and its state together.
+        with self.v_flex.lock:
+            self.v_flex.replace_port(io_port)
+            self.v_flex.firmware_version = probe.firmware_version
+            self.v_flex.pause_length = probe.pause_length
+            self.v_flex.current_voltage = probe.current_voltage
+            self.v_flex.led_state = probe.led_state
+        self.reconnects += 1
+        self._unanswered.clear()
+        self.connected.set()
+        self.v_flex.log.info("Reconnected to the VFlex", port_name=name)
+        if self.on_reconnect is not None:
+            self.on_reconnect(self.v_flex)
+        return True
+
+    def _restore(self, probe: VFlex) -> None:
+        """
+        Puts the cached voltage and LED state back on the device, where they differ.
+
+        :param probe: A woken-up VFlex on the new port.
+        """
+        voltage, led_state = self.v_flex.current_voltage, self.v_flex.led_state
+        if voltage is not None and probe.current_voltage != voltage:
+            self.v_flex.log.info("Restoring the voltage", millivolts=voltage, found=probe.current_voltage)
+            probe.set_voltage(voltage)
+        if led_state is not None and probe.led_state != led_state:
+            self.v_flex.log.info("Restoring the LED state", led_state=led_state, found=probe.led_state)
+            probe.set_led_state(led_state)
+
+    def wait_until_connected(self, timeout: float | None = None) -> bool:
+        """
+        :param timeout: How long to wait, in seconds. Waits forever if None.
+        :return: Whether the VFlex is connected.
+        """
+        return self.connected.wait(timeout)
+
+    def start(self) -> Self:
+        self.watcher.start()
+        return self
+
+    def stop(self) -> None:
+        self.watcher.stop()
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.stop()
@@ -0,0 +1,179 @@
+import csv
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from vflexctl.device_interface.common_sequences import set_voltage_sequence
+from vflexctl.input_handler.voltage_convert import voltage_to_millivolt
+from vflexctl.types import MIDITriplet
+
+__all__ = [
+    "Setpoint",
+    "StepTiming",
+    "PlaybackReport",
+    "ramp",
+    "load_profile_csv",
+    "validate_setpoints",
+    "compile_setpoints",
+]
+
+# The largest voltage that fits in the two protocol bytes, in millivolts.
+MAX_MILLIVOLTS = 0xFFFF
+
+
+class Setpoint(NamedTuple):
+    """
+    A voltage to set, and when to set it.
+    """
+
+    # Seconds from the start of the playback.
+    at: float
+
+    millivolts: int
+
+
+@dataclass(frozen=True, slots=True)
+class StepTiming:
+    """
+    How one step of a playback went.
+    """
+
+    index: int
+    millivolts: int
+
+    # The voltage the device reported back after the step.
+    reported_millivolts: int
+
+    # When the step was due, and when it was actually sent, in seconds from the start.
+    scheduled_at: float
+    sent_at: float
+
+    @property
+    def error(self) -> float:
+        """
+        How late (positive) or early (negative) the step was sent, in seconds.
+        """
+        return self.sent_at - self.scheduled_at
+
+
+@dataclass
+class PlaybackReport:
+    """
+    The timing of every step in a playback.
+
+    Steps are scheduled against the start of the playback rather than against the previous step,
+    so timing errors don't add up; ``drift`` is how far off the schedule the run had got by the end.
+    """
+
+    steps: list[StepTiming] = field(default_factory=list)
+
+    @property
+    def max_error(self) -> float:
+        return max((abs(step.error) for step in self.steps), default=0.0)
+
+    @property
+    def mean_error(self) -> float:
+        if not self.steps:
+            return 0.0
+        return sum(abs(step.error) for step in self.steps) / len(self.steps)
+
+    @property
+    def drift(self) -> float:
+        return self.steps[-1].error if self.steps else 0.0
+
+    @property
+    def mismatched_steps(self) -> list[StepTiming]:
+        """
+        Steps where the device reported back a different voltage to the one set.
+        """
+        return [step for step in self.steps if step.reported_millivolts != step.millivolts]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "steps": len(self.steps),
+            "max_error": round(self.max_error, 6),
+            "mean_error": round(self.mean_error, 6),
+            "drift": round(self.drift, 6),
+            "mismatched_steps": len(self.mismatched_steps),
+        }
+
+
+def ramp(start_volts: float, end_volts: float, *, duration: float, step_seconds: float = 1.0) -> list[Setpoint]:
+    """
+    A linear ramp from one voltage to another, one setpoint every ``step_seconds``, including both ends.
+
+    :param start_volts: The voltage to start at, in volts.
+    :param end_volts: The voltage to finish at, in volts.
+    :param duration: How long the ramp takes, in seconds.
+    :param step_seconds: The time between setpoints, in seconds.
+    :return: The setpoints.
+    """
+    if duration < 0 or step_seconds <= 0:
+        raise ValueError("The duration can't be negative, and the step has to be longer than 0 seconds.")
+    step_count = max(round(duration / step_seconds), 1)
+    return [
+        Setpoint(
+            at=duration * step / step_count,
+            millivolts=voltage_to_millivolt(start_volts + (end_volts - start_volts) * step / step_count),
+        )
+        for step in range(step_count + 1)
+    ]
+
+
+def load_profile_csv(path: Path) -> list[Setpoint]:
+    """
+    Loads a voltage profile from a CSV file of ``time,volts`` rows (time in seconds from the start).
+    A header row, blank lines and lines starting with ``#`` are skipped.
+
+    :param path: The CSV file.
+    :return: The setpoints, validated (see ``validate_setpoints()``).
+    :raises ValueError: A row couldn't be read, or the profile isn't valid.
+    """
+    setpoints: list[Setpoint] = []
+    header_skipped = False
+    with path.open(newline="") as profile:
+        for line_number, row in enumerate(csv.reader(profile), start=1):
+            if not row or not "".join(row).strip() or row[0].lstrip().startswith("#"):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"{path}:{line_number}: expected 'time,volts', got {row!r}")
+            try:
+                setpoints.append(Setpoint(at=float(row[0]), millivolts=voltage_to_millivolt(row[1].strip())))
+            except ValueError as e:
+                if not setpoints and not header_skipped:
+                    header_skipped = True
+                    continue
+                raise ValueError(f"{path}:{line_number}: expected 'time,volts', got {row!r}") from e
+    validate_setpoints(setpoints)
+    return setpoints
+
+
+def validate_setpoints(setpoints: list[Setpoint]) -> None:
+    """
+    Checks a profile can be played: at least one setpoint, times that don't go backwards, and voltages
+    that are above 0 and fit in the protocol.
+
+    :param setpoints: The setpoints to check.
+    :raises ValueError: The profile isn't valid.
+    """
+    if not setpoints:
+        raise ValueError("The profile has no setpoints.")
+    previous_at = 0.0
+    for index, setpoint in enumerate(setpoints):
+        if setpoint.at < previous_at:
+            raise ValueError(f"Setpoint {index} is at {setpoint.at}s, before the previous one ({previous_at}s).")
+        if not 0 < setpoint.millivolts <= MAX_MILLIVOLTS:
+            raise ValueError(f"Setpoint {index} is {setpoint.millivolts}mV, which can't be set.")
+        previous_at = setpoint.at
+
+
+def compile_setpoints(setpoints: list[Setpoint]) -> list[Sequence[MIDITriplet]]:
+    """
+    Prepares the MIDI sequence for every step ahead of time, so nothing but sending is left for
+    the playback itself. Repeated voltages share one sequence (see ``set_voltage_sequence()``).
+
+    :param setpoints: The setpoints.
+    :return: The MIDI sequence for each setpoint, in order.
+    """
+    return [set_voltage_sequence(setpoint.millivolts) for setpoint in setpoints]
@@ -0,0 +1,70 @@
+import json
+from collections.abc import Mapping
+from pathlib import Path
+
+import structlog
+
+from vflexctl.app_data import app_data_dir
+
+__all__ = ["port_index_file", "load_port_index", "update_port_index", "ports_for_serial"]
+
+log = structlog.get_logger("vflexctl.port_index")
+
+
+def port_index_file() -> Path:
+    """
+    :return: The path to the JSON file that maps port names to the serial number of the VFlex last
+        found on them.
+    """
+    return app_data_dir() / "ports.json"
+
+
+def load_port_index(*, path: Path | None = None) -> dict[str, str]:
+    """
+    Loads the port index. It's only ever a hint (adapters get moved between ports), so anything
+    going wrong reading it just gives an empty index.
+
+    :param path: The index file to read. Defaults to ``port_index_file()``.
+    :return: The serial number last seen on each port, by port name.
+    """
+    path = path or port_index_file()
+    try:
+        stored = json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log.warning("Could not read the port index, probing every port.", path=str(path), error=str(e))
+        return {}
+    if not isinstance(stored, dict):
+        return {}
+    return {port: serial for port, serial in stored.items() if isinstance(serial, str)}
+
+
+def update_port_index(serials: Mapping[str, str | None], *, path: Path | None = None) -> None:
+    """
+    Stores what was found on some ports, keeping the entries for any other ports. Nothing is
+    written if nothing changed.
+
+    :param serials: The serial number found on each port, by port name, or None to forget a port.
+    :param path: The index file to write. Defaults to ``port_index_file()``.
+    """
+    path = path or port_index_file()
+    stored = load_port_index(path=path)
+    updated = {port: serial for port, serial in {**stored, **serials}.items() if serial is not None}
+    if updated == stored:
+        return None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(updated, indent=2, sort_keys=True))
+    except OSError as e:
+        log.warning("Could not update the port index.", path=str(path), error=str(e))
+    return None
+
+
+def ports_for_serial(serial_number: str, *, path: Path | None = None) -> list[str]:
+    """
+    :param serial_number: The serial number of the VFlex.
+    :param path: The index file to read. Defaults to ``port_index_file()``.
+    :return: The ports the VFlex was last found on (usually one).
+    """
+    return [port for port, serial in load_port_index(path=path).items() if serial == serial_number]
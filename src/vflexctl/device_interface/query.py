@@ -0,0 +1,58 @@
+from dataclasses import dataclass, field
+
+from vflexctl.protocol import VFlexProto
+from vflexctl.protocol.coders import (
+    get_millivolts_from_protocol_message,
+    protocol_decode_firmware_version,
+    protocol_decode_led_state,
+    protocol_decode_serial_number,
+)
+from vflexctl.types import VFlexProtoMessage
+
+__all__ = ["QueryResults", "reply_command_byte"]
+
+
+def reply_command_byte(command: VFlexProtoMessage) -> int:
+    """
+    The command byte the VFlex replies with for a command. "Set" commands (command byte with the
+    top bit set) are answered with the matching "get" reply, e.g. a set voltage returns the voltage.
+
+    :param command: The command (without its length byte), e.g. ``[VFlexProto.CMD_GET_VOLTAGE]``.
+    :return: The command byte (proto[1]) of the reply.
+    """
+    return command[0] & 0x7F
+
+
+@dataclass
+class QueryResults:
+    """
+    The replies to a batch of commands (see ``VFlex.query()``), keyed by their command byte.
+
+    The properties decode the replies to the common commands, and raise the usual decoding errors
+    if the reply is malformed. A reply that wasn't asked for raises a KeyError.
+    """
+
+    # The reply protocol messages, by command byte (proto[1]).
+    replies: dict[int, list[int]] = field(default_factory=dict)
+
+    def __contains__(self, command_byte: int) -> bool:
+        return command_byte in self.replies
+
+    def __getitem__(self, command_byte: int) -> list[int]:
+        return self.replies[command_byte]
+
+    @property
+    def serial_number(self) -> str:
+        return protocol_decode_serial_number(self.replies[VFlexProto.CMD_GET_SERIAL_NUMBER])
+
+    @property
+    def firmware_version(self) -> str:
+        return protocol_decode_firmware_version(self.replies[VFlexProto.CMD_GET_FIRMWARE_VERSION])
+
+    @property
+    def millivolts(self) -> int:
+        return get_millivolts_from_protocol_message(self.replies[VFlexProto.CMD_GET_VOLTAGE])
+
+    @property
+    def led_state(self) -> bool:
+        return protocol_decode_led_state(self.replies[VFlexProto.CMD_GET_LED_STATE])
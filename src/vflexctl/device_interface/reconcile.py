@@ -0,0 +1,262 @@
+import threading
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, cast
+
+import structlog
+
+from vflexctl.device_interface.apply import (
+    Change,
+    DesiredState,
+    Profile,
+    desired_states,
+    recall_led_colours,
+    remember_led_colours,
+)
+from vflexctl.device_interface.fleet import FleetResults, VFlexFleet
+from vflexctl.device_interface.hotplug import AutoReconnect, PortWatcher
+from vflexctl.device_interface.vflex import DEFAULT_PORT_NAME, VFlex
+from vflexctl.midi_transport.transport import Backend
+
+__all__ = ["DeviceSchedule", "Reconciler"]
+
+log = structlog.get_logger("vflexctl.reconcile")
+
+
+@dataclass(slots=True)
+class DeviceSchedule:
+    """
+    When a device is next checked by a ``Reconciler``, and what checking it has found so far.
+    """
+
+    serial_number: str
+
+    # The time between checks, in seconds. It grows while the device stays in its desired state.
+    interval: float
+
+    # monotonic() time the next check is due.
+    due_at: float = 0.0
+
+    checks: int = 0
+
+    # Checks that found the device out of its desired state (and wrote it back).
+    corrections: int = 0
+    errors: int = 0
+
+    # The settings written by the last correction.
+    last_changes: list[Change] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "serial_number": self.serial_number,
+            "interval": round(self.interval, 3),
+            "checks": self.checks,
+            "corrections": self.corrections,
+            "errors": self.errors,
+            "last_changes": list(self.last_changes),
+        }
+
+
+class Reconciler:
+    """
+    Keeps the devices in a fleet in the state a profile describes, through resets, replugs and
+    manual changes.
+
+    Each check is one ``VFlex.apply()``: a single batched read of the voltage and LED state (with
+    the handshake, when one is due), followed by writes for only the settings that drifted. A
+    device found in its desired state is checked less and less often (``interval`` multiplied by
+    ``backoff`` each time, up to ``max_interval``), while one that drifted or failed goes back to
+    being checked every ``interval``. ``max_checks`` caps how many devices are checked at once, most
+    overdue first, so a large rack doesn't poll every device on every round.
+
+    Unplugged devices aren't checked. One port watcher, shared by the whole fleet, notices them
+    coming back (see ``AutoReconnect``), and a reconnected device is checked straight away.
+    """
+
+    fleet: VFlexFleet
+
+    # The state each device should be in, by serial number.
+    desired: dict[str, DesiredState]
+
+    schedules: dict[str, DeviceSchedule]
+
+    # Watches for devices being unplugged and plugged back in. None if ``reconnect`` is off.
+    watcher: PortWatcher | None
+
+    def __init__(
+        self,
+        fleet: VFlexFleet,
+        profile: Profile,
+        *,
+        interval: float = 1.0,
+        max_interval: float = 30.0,
+        backoff: float = 2.0,
+        max_checks: int | None = None,
+        reconnect: bool = True,
+        port_name: str = DEFAULT_PORT_NAME,
+        backend: Backend = "mido",
+        on_reconnect: Callable[[VFlex], Any] | None = None,
+    ) -> None:
+        """
+        :param fleet: The devices to keep in their desired state.
+        :param profile: The state they should be in. Devices it doesn't cover are left alone.
+        :param interval: The shortest time between checks of a device, in seconds.
+        :param max_interval: The longest time between checks of a device in its desired state, in seconds.
+        :param backoff: What the time between checks is multiplied by after each check that found
+            nothing to correct.
+        :param max_checks: The most devices to check at once. Unlimited if None.
+        :param reconnect: Whether to reconnect to devices that are unplugged and plugged back in.
+        :param port_name: The port name a VFlex reports.
+        :param backend: The MIDI library to open new ports with.
+        :param on_reconnect: Called (from the port watcher's thread) after a device is reconnected.
+        :raises ValueError: The profile doesn't cover any device in the fleet, or the timings don't make sense.
+        """
+        if interval <= 0 or max_interval < interval or backoff < 1:
+            raise ValueError("Need 0 < interval <= max_interval and backoff >= 1.")
+        if max_checks is not None and max_checks < 1:
+            raise ValueError("max_checks needs to be at least 1.")
+        self.fleet = fleet
+        self.desired = desired_states(fleet, profile)
+        if not self.desired:
+            raise ValueError("The profile doesn't cover any of the devices.")
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_checks = max_checks
+        self.on_reconnect = on_reconnect
+        self.schedules = {serial: DeviceSchedule(serial, interval) for serial in self.desired}
+        recall_led_colours(fleet, self.desired)
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._auto_reconnects: dict[str, AutoReconnect] = {}
+        self.watcher = None
+        if reconnect:
+            self._auto_reconnects = {
+                serial: AutoReconnect(
+                    fleet[serial], port_name=port_name, backend=backend, restore=False, on_reconnect=self._reconnected
+                )
+                for serial in self.desired
+            }
+            self.watcher = PortWatcher(
+                self._on_port_change, port_name=port_name, backend=backend, on_poll=self._retry_reconnects
+            )
+
+    def _on_port_change(self, added: set[str], removed: set[str]) -> None:
+        unclaimed = set(added)
+        for auto_reconnect in self._auto_reconnects.values():
+            auto_reconnect.on_port_change(unclaimed, removed)
+            # Once a port has been claimed, the devices still missing don't need to probe it.
+            if auto_reconnect.connected.is_set():
+                unclaimed.discard(auto_reconnect.port_name)
+        return None
+
+    def _retry_reconnects(self) -> None:
+        for auto_reconnect in self._auto_reconnects.values():
+            auto_reconnect.retry()
+        return None
+
+    def _reconnected(self, v_flex: VFlex) -> None:
+        # A replugged device has been power cycled, so whatever colour its LED had is gone.
+        v_flex.led_colour = None
+        schedule = self.schedules[cast(str, v_flex.serial_number)]
+        schedule.interval = self.interval
+        schedule.due_at = 0.0
+        self._wake.set()
+        if self.on_reconnect is not None:
+            self.on_reconnect(v_flex)
+        return None
+
+    def is_connected(self, serial_number: str) -> bool:
+        auto_reconnect = self._auto_reconnects.get(serial_number)
+        return auto_reconnect is None or auto_reconnect.connected.is_set()
+
+    def _check(self, v_flex: VFlex) -> list[Change]:
+        return v_flex.apply(self.desired[cast(str, v_flex.serial_number)], refresh=True)
+
+    def reconcile_once(self) -> FleetResults[list[Change]]:
+        """
+        Checks (and corrects) every connected device that's due, concurrently.
+
+        :return: The settings written on each device checked, by serial number.
+        """
+        now = monotonic()
+        due = sorted(
+            (
+                schedule
+                for schedule in self.schedules.values()
+                if schedule.due_at <= now and self.is_connected(schedule.serial_number)
+            ),
+            key=lambda schedule: schedule.due_at,
+        )[: self.max_checks]
+        outcome = self.fleet.run(self._check, [schedule.serial_number for schedule in due])
+        checked_at = monotonic()
+        corrected = []
+        for schedule in due:
+            serial = schedule.serial_number
+            schedule.checks += 1
+            if serial in outcome.errors:
+                schedule.errors += 1
+                schedule.interval = self.interval
+            elif changes := outcome.results[serial]:
+                log.info("Corrected a drifted VFlex", serial_number=serial, changes=changes)
+                schedule.corrections += 1
+                schedule.last_changes = changes
+                schedule.interval = self.interval
+                corrected.append(serial)
+            else:
+                schedule.interval = min(schedule.interval * self.backoff, self.max_interval)
+            schedule.due_at = checked_at + schedule.interval
+        if corrected:
+            remember_led_colours(self.fleet, corrected)
+        return outcome
+
+    def next_due_at(self) -> float | None:
+        """
+        :return: monotonic() time the next check is due, or None if every device is unplugged.
+        """
+        due_ats = [schedule.due_at for schedule in self.schedules.values() if self.is_connected(schedule.serial_number)]
+        return min(due_ats) if due_ats else None
+
+    def run(self, *, duration: float | None = None) -> Iterator[FleetResults[list[Change]]]:
+        """
+        Reconciles until ``stop()`` is called (or ``duration`` runs out), sleeping until the next
+        device is due in between.
+
+        :param duration: Stop after this many seconds. Runs until stopped if None.
+        :return: An iterator of the outcome of each round that checked at least one device.
+        """
+        started_at = monotonic()
+        self._stopped.clear()
+        if self.watcher is not None:
+            self.watcher.start()
+        try:
+            while not self._stopped.is_set():
+                self._wake.clear()
+                outcome = self.reconcile_once()
+                if outcome.results or outcome.errors:
+                    yield outcome
+                now = monotonic()
+                if duration is not None and now - started_at >= duration:
+                    break
+                next_due_at = self.next_due_at()
+                wake_at = next_due_at if next_due_at is not None else now + self.max_interval
+                if duration is not None:
+                    wake_at = min(wake_at, started_at + duration)
+                self._wake.wait(max(wake_at - now, 0.0))
+        finally:
+            if self.watcher is not None:
+                self.watcher.stop()
+
+    def stop(self) -> None:
+        """
+        Stops ``run()`` (from another thread), after the round in progress.
+        """
+        self._stopped.set()
+        self._wake.set()
+
+    def summary(self) -> list[dict[str, Any]]:
+        """
+        :return: Each device's schedule and counts, as dicts.
+        """
+        return [schedule.to_dict() for schedule in self.schedules.values()]
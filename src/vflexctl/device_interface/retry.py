@@ -0,0 +1,108 @@
+from collections.abc import Mapping
+from dataclasses import dataclass, field, replace
+from typing import Self
+
+from vflexctl.protocol import VFlexProto
+
+__all__ = ["CommandPolicy", "RetryPolicy", "READ_COMMANDS", "DEFAULT_TIMEOUT", "DEFAULT_RETRY_POLICY", "NO_RETRIES"]
+
+# How long to wait for a reply, in seconds, unless a policy says otherwise.
+DEFAULT_TIMEOUT = 0.5
+
+# Commands that only read from the device, so sending them again can't change anything.
+READ_COMMANDS: frozenset[int] = frozenset(
+    {
+        VFlexProto.CMD_GET_SERIAL_NUMBER,
+        VFlexProto.CMD_GET_HARDWARE_REVISION,
+        VFlexProto.CMD_GET_FIRMWARE_VERSION,
+        VFlexProto.CMD_GET_LED_STATE,
+        VFlexProto.CMD_GET_LED_COLOUR,
+        VFlexProto.CMD_GET_VOLTAGE,
+    }
+)
+
+
+@dataclass(frozen=True, slots=True)
+class CommandPolicy:
+    """
+    How long to wait for the reply to a command, and how to retry it when the reply doesn't come.
+    """
+
+    # How long to wait for the reply, in seconds.
+    timeout: float = DEFAULT_TIMEOUT
+
+    # How many more times to try after the first attempt. 0 doesn't retry.
+    retries: int = 0
+
+    # The pause before the first retry, in seconds. Each retry after that waits ``multiplier`` times
+    # longer than the one before, up to ``max_delay``.
+    delay: float = 0.05
+    multiplier: float = 2.0
+    max_delay: float = 1.0
+
+    def __post_init__(self) -> None:
+        if self.timeout <= 0:
+            raise ValueError("The timeout needs to be more than 0.")
+        if self.retries < 0 or self.delay < 0 or self.multiplier < 1:
+            raise ValueError("Need retries >= 0, delay >= 0 and multiplier >= 1.")
+
+    def backoff(self, retry: int) -> float:
+        """
+        :param retry: Which retry it is, counting from 1.
+        :return: How long to wait before it, in seconds.
+        """
+        return min(self.delay * self.multiplier ** (retry - 1), self.max_delay)
+
+
+@dataclass(frozen=True, slots=True)
+class RetryPolicy:
+    """
+    The timeouts and retries for every command a ``VFlex`` sends (``retry_policy=``).
+
+    Reads are safe to send again, so by default a lost reply to one is retried straight away. A
+    write whose reply was lost may still have landed: it's only sent again after reading the setting
+    back shows it didn't (see ``VFlex.set_voltage()`` and ``VFlex.set_led_state()``).
+    """
+
+    reads: CommandPolicy = CommandPolicy(retries=2)
+    writes: CommandPolicy = CommandPolicy(retries=1)
+
+    # Policies for particular commands, by command byte, in place of ``reads`` or ``writes``.
+    commands: Mapping[int, CommandPolicy] = field(default_factory=dict)
+
+    def for_command(self, command_byte: int) -> CommandPolicy:
+        """
+        :param command_byte: The command byte (e.g. ``VFlexProto.CMD_GET_VOLTAGE``).
+        :return: The policy for that command.
+        """
+        policy = self.commands.get(command_byte)
+        if policy is not None:
+            return policy
+        return self.reads if command_byte in READ_COMMANDS else self.writes
+
+    def with_overrides(self, *, timeout: float | None = None, retries: int | None = None) -> Self:
+        """
+        :param timeout: The timeout for every command, or None to keep each one's.
+        :param retries: The retries for every command, or None to keep each one's.
+        :return: This policy, with the timeout and/or retries of every command replaced.
+        """
+
+        def _override(policy: CommandPolicy) -> CommandPolicy:
+            return replace(
+                policy,
+                timeout=policy.timeout if timeout is None else timeout,
+                retries=policy.retries if retries is None else retries,
+            )
+
+        return replace(
+            self,
+            reads=_override(self.reads),
+            writes=_override(self.writes),
+            commands={command_byte: _override(policy) for command_byte, policy in self.commands.items()},
+        )
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+# Waits the default time for every reply and never retries (how vflexctl behaved before retry policies).
+NO_RETRIES = RetryPolicy(reads=CommandPolicy(), writes=CommandPolicy())
@@ -0,0 +1,201 @@
+import threading
+from collections import deque
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import StrEnum
+from time import perf_counter
+from typing import Any
+
+__all__ = ["Phase", "OperationTiming", "Timings"]
+
+
+class Phase(StrEnum):
+    PORT_OPEN = "port_open"
+    HANDSHAKE = "handshake"
+    ENCODE = "encode"
+    SEND = "send"
+    # From starting to wait for a reply until the first MIDI message of it arrives.
+    FIRST_BYTE = "first_byte"
+    # From the first MIDI message of a reply arriving until the reply is complete.
+    FRAME = "frame"
+    DECODE = "decode"
+    # Waiting to retry a command whose reply didn't come.
+    RETRY = "retry"
+
+
+@dataclass(slots=True)
+class OperationTiming:
+    """
+    Where the time went in one VFlex operation (e.g. ``set_voltage``).
+
+    Phases are timed exclusively: time spent in a phase nested inside another is only counted
+    against the inner one, under a ``/``-separated name (e.g. the sending done by a handshake is
+    ``handshake/send``). So the phases add up to the total, apart from ``other``: the time spent
+    outside any phase.
+    """
+
+    operation: str
+
+    # perf_counter() when the operation started.
+    started_at: float
+
+    # Seconds spent in the whole operation.
+    total: float = 0.0
+
+    # Seconds spent in each phase, by phase name.
+    phases: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def other(self) -> float:
+        return max(self.total - sum(self.phases.values()), 0.0)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "operation": self.operation,
+            "total": self.total,
+            "phases": dict(self.phases),
+            "other": self.other,
+        }
+
+
+class _Frame:
+    __slots__ = ("path", "started_at")
+
+    def __init__(self, path: str, started_at: float) -> None:
+        self.path = path
+        self.started_at = started_at
+
+
+class _OperationState:
+    __slots__ = ("operation", "stack")
+
+    def __init__(self, operation: OperationTiming) -> None:
+        self.operation = operation
+        self.stack: list[_Frame] = []
+
+
+# The operation each Timings is recording in the current context. Every thread starts with its own
+# context and every asyncio task with a copy of its creator's, so concurrent operations on either
+# are timed separately.
+_operations: ContextVar[Mapping["Timings", _OperationState]] = ContextVar("vflexctl_timings", default={})
+
+
+class Timings:
+    """
+    Records per-phase timings for VFlex operations. Give one to a ``VFlex`` (``timings=``) and every
+    public operation run on it is recorded here, newest last. One recorder can be shared between
+    devices, threads (e.g. a fleet) and asyncio tasks: each times its own operation.
+    """
+
+    # The operations recorded, oldest first. Only the most recent ``max_operations`` are kept.
+    operations: deque[OperationTiming]
+
+    def __init__(self, max_operations: int = 1000) -> None:
+        """
+        :param max_operations: How many operations to keep.
+        """
+        self.operations = deque(maxlen=max_operations)
+        self._lock = threading.Lock()
+
+    @property
+    def last(self) -> OperationTiming | None:
+        return self.operations[-1] if self.operations else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self.operations.clear()
+
+    @contextmanager
+    def operation(self, name: str) -> Iterator[OperationTiming | None]:
+        """
+        Times an operation. An operation started inside another one (on the same thread or asyncio
+        task) is timed as part of the outer one.
+
+        :param name: The operation's name.
+        :return: The timing being recorded, or None if it's part of an outer operation.
+        """
+        operations = _operations.get()
+        if self in operations:
+            yield None
+            return
+        timing = OperationTiming(name, perf_counter())
+        token = _operations.set({**operations, self: _OperationState(timing)})
+        try:
+            yield timing
+        finally:
+            timing.total = perf_counter() - timing.started_at
+            _operations.reset(token)
+            with self._lock:
+                self.operations.append(timing)
+
+    def _current(self) -> _OperationState | None:
+        return _operations.get().get(self)
+
+    @staticmethod
+    def _charge(state: _OperationState, frame: _Frame, now: float) -> None:
+        phases = state.operation.phases
+        phases[frame.path] = phases.get(frame.path, 0.0) + now - frame.started_at
+
+    @contextmanager
+    def phase(self, phase: Phase) -> Iterator[None]:
+        """
+        Times a phase of the current operation. Does nothing outside an operation.
+
+        :param phase: The phase.
+        """
+        state = self._current()
+        if state is None:
+            yield None
+            return
+        now = perf_counter()
+        stack = state.stack
+        if stack:
+            self._charge(state, stack[-1], now)
+        stack.append(_Frame(f"{stack[-1].path}/{phase}" if stack else str(phase), now))
+        try:
+            yield None
+        finally:
+            if stack:
+                now = perf_counter()
+                self._charge(state, stack.pop(), now)
+                if stack:
+                    stack[-1].started_at = now
+
+    def switch(self, phase: Phase) -> None:
+        """
+        Moves the current operation on from its innermost phase to ``phase`` (e.g. from waiting for the
+        first byte of a reply to waiting for the rest of it).
+
+        :param phase: The phase to move on to.
+        """
+        state = self._current()
+        if state is None or not state.stack:
+            return None
+        now = perf_counter()
+        frame = state.stack[-1]
+        self._charge(state, frame, now)
+        parent, _, _ = frame.path.rpartition("/")
+        frame.path = f"{parent}/{phase}" if parent else str(phase)
+        frame.started_at = now
+        return None
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        :return: The mean seconds per phase (plus ``total`` and ``other``) of each kind of operation
+            recorded, by operation name.
+        """
+        totals: dict[str, dict[str, float]] = {}
+        counts: dict[str, int] = {}
+        with self._lock:
+            operations = list(self.operations)
+        for timing in operations:
+            summed = totals.setdefault(timing.operation, {})
+            counts[timing.operation] = counts.get(timing.operation, 0) + 1
+            for name, seconds in (*timing.phases.items(), ("other", timing.other), ("total", timing.total)):
+                summed[name] = summed.get(name, 0.0) + seconds
+        return {
+            operation: {name: seconds / counts[operation] for name, seconds in phases.items()}
+            for operation, phases in totals.items()
+        }
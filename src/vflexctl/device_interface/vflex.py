@@ -1,106 +1,242 @@
-from collections.abc import Callable
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps, cached_property
-from typing import Self, TypeVar, ParamSpec, Concatenate, cast, Literal
+from time import sleep
+from typing import Any, Self, TypeVar, ParamSpec, Concatenate, cast, Literal
 
-import mido
 import structlog
 from mido.ports import BaseIOPort
 
-from vflexctl.command.hardware_info import get_firmware_version_command
-from vflexctl.command.led import set_led_state_command, set_led_colour_command, LEDColour
-from vflexctl.command.voltage import set_voltage_command
-from vflexctl.device_interface.common_sequences import (
-    GET_LED_STATE_SEQUENCE,
-    GET_VOLTAGE_SEQUENCE,
-    GET_SERIAL_NUMBER_SEQUENCE,
-)
-from vflexctl.exceptions import (
-    InvalidProtocolMessageLengthError,
-    SerialNumberMismatchError,
-    VoltageMismatchError,
-    UnsupportedFirmwareVersionError,
-)
+from vflexctl.command.led import LEDColour
+from vflexctl.device_interface.apply import Change, DesiredState
+from vflexctl.device_interface.core import Flush, Receive, ReceiveReplies, Send, Step, Steps, VFlexCore, Wait
+from vflexctl.device_interface.retry import RetryPolicy
 from vflexctl.input_handler.voltage_convert import voltage_to_millivolt
-from vflexctl.midi_transport.receivers import drain_incoming
-from vflexctl.midi_transport.senders import send_sequence
-from vflexctl.protocol import (
-    protocol_message_from_midi_messages,
-    prepare_command_frame,
-    prepare_command_for_sending,
-)
-from vflexctl.protocol.coders import (
-    get_millivolts_from_protocol_message,
-    protocol_decode_led_state,
-    protocol_decode_serial_number,
-    protocol_decode_firmware_version,
-)
+from vflexctl.metrics import Metrics
+from vflexctl.midi_transport.callback_receiver import CallbackReceiver
+from vflexctl.midi_transport.capture import CaptureWriter, CapturingTransport
+from vflexctl.device_interface.port_index import ports_for_serial, update_port_index
+from vflexctl.device_interface.playback import PlaybackReport, Setpoint, StepTiming
+from vflexctl.device_interface.query import QueryResults
+from vflexctl.device_interface.timings import Phase, Timings
+from vflexctl.device_interface.watch import WatchSample, WatchStats, watch
+from vflexctl.midi_transport.receivers import drain_once, drain_until_frame, drain_until_replies
+from vflexctl.midi_transport.pacing import save_pacing, with_safety_margin
+from vflexctl.midi_transport.senders import send_sequence, DEFAULT_PAUSE_LENGTH
+from vflexctl.midi_transport.transport import Backend, MIDITransport, get_ioport_names, open_ioport
+from vflexctl.types import VFlexProtoMessage
 
 DEFAULT_PORT_NAME = "Werewolf vFlex"
 
 __all__ = ["VFlex"]
 
+log = structlog.get_logger("vflexctl.VFlex")
+
+
+def matching_port_names(port_name: str = DEFAULT_PORT_NAME, backend: Backend = "mido") -> list[str]:
+    """
+    Lists every MIDI I/O port that looks like a VFlex. Backends add suffixes to tell devices with
+    the same name apart (e.g. ALSA's client/port numbers), so this matches on the start of the name.
+
+    :param port_name: The port name a VFlex reports.
+    :param backend: The MIDI library to list the ports with.
+    :return: The matching port names, in the order the backend lists them.
+    """
+    prefix = port_name.lower()
+    return list(dict.fromkeys(name for name in get_ioport_names(backend) if name.lower().startswith(prefix)))
+
 
 P = ParamSpec("P")
 R = TypeVar("R")
 
 
-def run_with_handshake(func: Callable[Concatenate["VFlex", P], R]) -> Callable[Concatenate["VFlex", P], R]:
+def timed(func: Callable[Concatenate["VFlex", P], R]) -> Callable[Concatenate["VFlex", P], R]:
+    """
+    Runs the decorated VFlex method as an operation, holding ``VFlex.lock`` throughout, and records
+    it under the method's name (see ``VFlexCore._operation()``).
+
+    Like handshakes, operations don't stack: a decorated method called from inside another one is
+    part of the outer operation.
+    """
 
     @wraps(func)
     def wrapper(v_flex: "VFlex", *args: P.args, **kwargs: P.kwargs) -> R:
-        v_flex.log.info("Running wake-up commands")
-        v_flex.wake_up(full_handshake=v_flex.full_handshake)
-        return func(v_flex, *args, **kwargs)
+        with v_flex.lock, v_flex._operation(func.__name__):
+            return func(v_flex, *args, **kwargs)
 
     return cast(Callable[Concatenate["VFlex", P], R], wrapper)
 
 
-class VFlex:
-    """High-level interface for communicating with a VFlex MIDI power adapter."""
-
-    # The underlying MIDI I/O port used for sending and receiving messages.
-    io_port: BaseIOPort
+def timed_open_ioport(name: str, backend: Backend, timings: Timings | None) -> BaseIOPort | MIDITransport:
+    """
+    Opens a MIDI port, recording it as an ``open_port`` operation in ``timings`` if given.
+    """
+    if timings is None:
+        return open_ioport(name, backend)
+    with timings.operation("open_port"), timings.phase(Phase.PORT_OPEN):
+        return open_ioport(name, backend)
 
-    # Structured logger bound to this specific VFlex instance.
-    log: structlog.BoundLogger
 
-    # Cached serial number of the device (None until fetched).
-    serial_number: str | None = None
+class VFlex(VFlexCore):
+    """
+    High-level interface for communicating with a VFlex MIDI power adapter.
 
-    # Cached firmware version of the device (None until fetched).
-    firmware_version: str | None = None
+    This is the blocking driver for ``VFlexCore``: it carries out each step of an operation on the
+    calling thread, receiving by polling the port or (``event_driven``) through a ``CallbackReceiver``.
+    """
 
-    # Last known voltage in millivolts, retrieved from the device.
-    current_voltage: int | None = None
+    # The underlying MIDI I/O port (or transport) used for sending and receiving messages.
+    io_port: BaseIOPort | MIDITransport
 
-    # LED behaviour state as reported by the device.
-    led_state: bool | None = None
+    # Callback-based receiver for the port, if event-driven receiving is in use (None when polling).
+    receiver: CallbackReceiver | None = None
 
-    # Whether to enforce safety checks (e.g., ensuring serial number doesn't change).
-    safe_adjust: bool
+    # Where the MIDI traffic is being recorded, if anywhere.
+    capture: CaptureWriter | None = None
 
-    # On handshakes, whether to run the full wake cycle or not
-    full_handshake: bool
+    # Held for each operation (see ``timed()``) and while the port is replaced, so an operation running
+    # in one thread never has the port swapped out from under it by another (e.g. a reconnect).
+    lock: threading.RLock
 
     def __init__(
-        self, io_port: BaseIOPort, safe_adjust: bool = True, full_handshake: bool = False, wake: bool = False
+        self,
+        io_port: BaseIOPort | MIDITransport,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        wake: bool = False,
+        event_driven: bool = False,
+        handshake_ttl: float = 0.0,
+        capture: CaptureWriter | None = None,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
     ) -> None:
-        self.io_port = io_port
-        self.log = structlog.get_logger("vflexctl.VFlex").bind(io_port=io_port)
-        self.safe_adjust = safe_adjust
-        self.full_handshake = full_handshake
+        self.lock = threading.RLock()
+        self.capture = capture
+        self._attach_port(io_port, event_driven=event_driven)
+        super().__init__(
+            safe_adjust=safe_adjust,
+            full_handshake=full_handshake,
+            handshake_ttl=handshake_ttl,
+            timings=timings,
+            metrics=metrics,
+            retry_policy=retry_policy,
+        )
         if wake:
             self.initial_wake_up()
 
-    def use_quick_handshakes(self) -> None:
-        self.full_handshake = False
+    def _attach_port(self, io_port: BaseIOPort | MIDITransport, *, event_driven: bool) -> None:
+        if self.capture is not None:
+            # Recorded at the port, so replies a drain throws away as stale are captured too.
+            io_port = CapturingTransport(io_port, self.capture, serial_number=lambda: self.serial_number)
+        self.io_port = io_port
+        self.log = structlog.get_logger("vflexctl.VFlex").bind(io_port=io_port)
+        self.receiver = CallbackReceiver(io_port) if event_driven else None
+
+    def replace_port(self, io_port: BaseIOPort | MIDITransport) -> None:
+        """
+        Switches to a new port for the same device (e.g. after it was unplugged and plugged back in),
+        closing the old one. The cached state is kept, but the next operation runs a fresh handshake.
+        Waits for any operation in progress (in another thread) to finish first.
 
-    def use_full_handshakes(self) -> None:
-        self.full_handshake = True
+        :param io_port: The new port.
+        """
+        with self.lock:
+            old_port, old_receiver = self.io_port, self.receiver
+            self._attach_port(io_port, event_driven=old_receiver is not None)
+            self.expire_handshake()
+        if old_receiver is not None:
+            old_receiver.close()
+        try:
+            old_port.close()
+        except Exception as e:
+            # The old port usually went away with the device, and some backends complain closing it.
+            self.log.debug("Could not close the old port", error=str(e))
+
+    def close(self) -> None:
+        """
+        Detaches the event-driven receiver (if there is one) and closes the MIDI port.
+        """
+        if self.receiver is not None:
+            self.receiver.close()
+            self.receiver = None
+        self.io_port.close()
+
+    def _run(self, steps: Steps[R]) -> R:
+        """
+        Runs the steps of an operation (see ``vflexctl.device_interface.core``) on this thread.
+
+        :param steps: The operation's steps.
+        :return: The operation's result.
+        """
+        result: Any = None
+        error: Exception | None = None
+        try:
+            while True:
+                try:
+                    step = steps.send(result) if error is None else steps.throw(error)
+                except StopIteration as stop:
+                    return cast(R, stop.value)
+                try:
+                    result, error = self._do(step), None
+                except Exception as e:
+                    result, error = None, e
+        finally:
+            steps.close()
+
+    def _do(self, step: Step) -> Any:
+        """
+        Carries out one step, receiving through the event-driven receiver if there is one.
+
+        :param step: The step.
+        :return: The step's result.
+        """
+        match step:
+            case Send(sequence, pause):
+                send_sequence(self.io_port, sequence, pause=pause)
+                return None
+            case Receive(command_byte, timeout, on_first_message, on_timeout):
+                if self.receiver is not None:
+                    return self.receiver.drain_until_frame(
+                        command_byte, seconds=timeout, on_first_message=on_first_message, on_timeout=on_timeout
+                    )
+                return drain_until_frame(
+                    self.io_port,
+                    command_byte,
+                    seconds=timeout,
+                    on_first_message=on_first_message,
+                    on_timeout=on_timeout,
+                )
+            case ReceiveReplies(command_bytes, timeout, on_first_message):
+                if self.receiver is not None:
+                    return self.receiver.drain_until_replies(
+                        command_bytes, seconds=timeout, on_first_message=on_first_message
+                    )
+                return drain_until_replies(
+                    self.io_port, command_bytes, seconds=timeout, on_first_message=on_first_message
+                )
+            case Flush():
+                return self.receiver.drain_once() if self.receiver is not None else drain_once(self.io_port)
+            case Wait(seconds):
+                sleep(seconds)
+                return None
+        raise TypeError(f"Unknown step: {step!r}")
 
     @classmethod
     def with_io_name(
-        cls, name: str, *, safe_adjust: bool = True, full_handshake: bool = False, wake: bool = False
+        cls,
+        name: str,
+        *,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        wake: bool = False,
+        event_driven: bool = False,
+        backend: Backend = "mido",
+        capture: CaptureWriter | None = None,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
     ) -> Self:
         """
         Gets a handle to a VFlex adapter using a provided port name.
@@ -109,15 +245,42 @@ class VFlex:
         :param safe_adjust: Whether (or not) to add extra checks for adjustments.
         :param full_handshake: Whether (or not) to run the full wake cycle when adjusting parameters
         :param wake: Whether to run initial_wake_up() on the instance as part of initialisation.
+        :param event_driven: Whether to receive through a port callback instead of polling the port.
+        :param backend: The MIDI library to open the port with ("rtmidi" skips mido, see ``RtMidiTransport``).
+        :param capture: Record all the MIDI traffic on the port to this capture.
+        :param timings: Record the per-phase timings of operations (including opening the port) here.
+        :param metrics: Record operational metrics (see ``vflexctl.metrics``) here.
+        :param retry_policy: The timeouts and retries for each command. Defaults to ``DEFAULT_RETRY_POLICY``.
         :return: VFlex instance with the correct port for talking to it.
         """
-        io_names = mido.get_ioport_names()
+        io_names = get_ioport_names(backend)
         if name not in io_names:
             raise RuntimeError(f"I/O port name '{name}' not found.")
-        return cls(mido.open_ioport(name), safe_adjust=safe_adjust, full_handshake=full_handshake, wake=wake)
+        return cls(
+            timed_open_ioport(name, backend, timings),
+            safe_adjust=safe_adjust,
+            full_handshake=full_handshake,
+            wake=wake,
+            event_driven=event_driven,
+            capture=capture,
+            timings=timings,
+            metrics=metrics,
+            retry_policy=retry_policy,
+        )
 
     @classmethod
-    def get_any(cls, safe_adjust: bool = True, full_handshake: bool = False, wake: bool = False) -> Self:
+    def get_any(
+        cls,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        wake: bool = False,
+        event_driven: bool = False,
+        backend: Backend = "mido",
+        capture: CaptureWriter | None = None,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> Self:
         """
         Gets _a_ handle to a VFlex adapter using the expected port name. If multiple are connected
         there's no guarantee that multiple calls for this will get the same one, so you should
@@ -126,34 +289,167 @@ class VFlex:
         :param safe_adjust: Whether (or not) to add extra checks for adjustments.
         :param full_handshake: Whether (or not) to run the full wake cycle when adjusting parameters
         :param wake: Whether to run initial_wake_up() on the instance as part of initialisation.
+        :param event_driven: Whether to receive through a port callback instead of polling the port.
+        :param backend: The MIDI library to open the port with ("rtmidi" skips mido, see ``RtMidiTransport``).
+        :param capture: Record all the MIDI traffic on the port to this capture.
+        :param timings: Record the per-phase timings of operations (including opening the port) here.
+        :param metrics: Record operational metrics (see ``vflexctl.metrics``) here.
+        :param retry_policy: The timeouts and retries for each command. Defaults to ``DEFAULT_RETRY_POLICY``.
         :return: VFlex instance with the correct port for talking to it.
         """
         matching_port = None
-        for port_name in mido.get_ioport_names():
+        for port_name in get_ioport_names(backend):
             if port_name.lower() == DEFAULT_PORT_NAME.lower():
                 matching_port = port_name
                 break
         return cls(
-            mido.open_ioport(matching_port or DEFAULT_PORT_NAME),
+            timed_open_ioport(matching_port or DEFAULT_PORT_NAME, backend, timings),
             safe_adjust=safe_adjust,
             full_handshake=full_handshake,
             wake=wake,
+            event_driven=event_driven,
+            capture=capture,
+            timings=timings,
+            metrics=metrics,
+            retry_policy=retry_policy,
         )
 
+    @classmethod
+    def with_serial(
+        cls,
+        serial_number: str,
+        *,
+        port_name: str = DEFAULT_PORT_NAME,
+        safe_adjust: bool = True,
+        full_handshake: bool = False,
+        wake: bool = False,
+        event_driven: bool = False,
+        backend: Backend = "mido",
+        capture: CaptureWriter | None = None,
+        timings: Timings | None = None,
+        metrics: Metrics | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> Self:
+        """
+        Gets a handle to the VFlex with a given serial number. The port it was last found on (see
+        ``vflexctl.device_interface.port_index``) is checked first, with a single query. Only if that
+        misses are the other ports that look like a VFlex probed, all at once. Whatever turns up on
+        each port checked is stored back in the index.
+
+        :param serial_number: The serial number of the VFlex.
+        :param port_name: The port name a VFlex reports.
+        :param safe_adjust: Whether (or not) to add extra checks for adjustments.
+        :param full_handshake: Whether (or not) to run the full wake cycle when adjusting parameters
+        :param wake: Whether to run initial_wake_up() on the instance. Its handshake is the query that
+            checks the serial number, so this doesn't cost an extra round trip.
+        :param event_driven: Whether to receive through a port callback instead of polling the port.
+        :param backend: The MIDI library to open the ports with.
+        :param capture: Record all the MIDI traffic on the port to this capture.
+        :param timings: Record the per-phase timings of operations (including opening the port) here.
+        :param metrics: Record operational metrics (see ``vflexctl.metrics``) here.
+        :param retry_policy: The timeouts and retries for each command. Defaults to ``DEFAULT_RETRY_POLICY``.
+        :return: VFlex instance for the device with the serial number.
+        :raises RuntimeError: No connected VFlex has that serial number.
+        """
+        candidates = matching_port_names(port_name, backend)
+        found: dict[str, str | None] = {}
+
+        def _probe(name: str) -> "VFlex | None":
+            try:
+                v_flex = cls(
+                    timed_open_ioport(name, backend, timings),
+                    safe_adjust=safe_adjust,
+                    full_handshake=full_handshake,
+                    event_driven=event_driven,
+                    capture=capture,
+                    timings=timings,
+                    metrics=metrics,
+                    retry_policy=retry_policy,
+                )
+            except Exception as e:
+                log.warning("Could not open port", port_name=name, error=str(e))
+                return None
+            try:
+                if wake:
+                    v_flex.initial_wake_up()
+                else:
+                    v_flex.get_serial_number()
+            except Exception as e:
+                log.warning("Could not get the serial number of the VFlex on port", port_name=name, error=str(e))
+                v_flex.close()
+                found[name] = None
+                return None
+            found[name] = v_flex.serial_number
+            if v_flex.serial_number != serial_number:
+                v_flex.close()
+                return None
+            return v_flex
+
+        try:
+            for name in ports_for_serial(serial_number):
+                if name in candidates and (v_flex := _probe(name)) is not None:
+                    return cast(Self, v_flex)
+            log.info("VFlex not found through the port index, probing every port", serial_number=serial_number)
+            remaining = [name for name in candidates if name not in found]
+            if remaining:
+                with ThreadPoolExecutor(max_workers=len(remaining), thread_name_prefix="vflex-probe") as pool:
+                    matches = [v_flex for v_flex in pool.map(_probe, remaining) if v_flex is not None]
+                for duplicate in matches[1:]:
+                    duplicate.close()
+                if matches:
+                    return cast(Self, matches[0])
+        finally:
+            update_port_index(found)
+        raise RuntimeError(f"No connected VFlex with serial number {serial_number}.")
+
+    @timed
     def wake_up(self, full_handshake: bool = False) -> None:
         """
-        "Wakes up" the connected VFlex to get it ready to receive commands. Functions
-        that use the `run_with_handshake()` decorator automatically use this.
+        "Wakes up" the connected VFlex to get it ready to receive commands. Operations that need the
+        handshake run it automatically.
 
         :return: Nothing, but ensures that the device is ready to receive commands.
         """
-        self.get_serial_number()
-        if self.firmware_version is None:
-            self.get_firmware_version()
-        if full_handshake:
-            self._initial_get_led_state()
-            self._initial_get_voltage()
+        self._run(self._wake_up(full_handshake=full_handshake))
+
+    @timed
+    def query(self, *commands: VFlexProtoMessage) -> QueryResults:
+        """
+        Sends several commands back to back in one ``COMMAND_START``/``COMMAND_END`` envelope, collects
+        the replies in one receive pass and sorts them by command byte. No handshake is run.
+
+        If the device leaves any command in the batch unanswered, those are sent again one at a time,
+        and later queries send one command per envelope straight away. That's stored, so other
+        instances (and later runs) on the same device do too.
 
+        :param commands: The commands to send, without their length byte (e.g. ``[VFlexProto.CMD_GET_VOLTAGE]``).
+        :return: The replies, by command byte.
+        :raises ValueError: No commands were given.
+        :raises ReplyTimeoutError: A reply never arrived, even when sent on its own (with its retries).
+        """
+        return self._run(self._query(*commands))
+
+    @timed
+    def read(self) -> None:
+        """
+        Re-reads the voltage and LED state from the device. When a handshake is due, it's sent in the
+        same batch, so this is a single round trip either way.
+
+        :return: Nothing, but updates self.current_voltage and self.led_state.
+        """
+        self._run(self._read())
+
+    def ensure_awake(self) -> None:
+        """
+        Runs ``initial_wake_up()`` unless it's already been done (the serial number, voltage and LED
+        state are all known). Useful when the same VFlex is reused across many operations.
+
+        :return:
+        """
+        if self.serial_number is None or self.current_voltage is None or self.led_state is None:
+            self.initial_wake_up()
+
+    @timed
     def initial_wake_up(self) -> None:
         """
         Convenience method to run wake_up with a full handshake.
@@ -162,6 +458,7 @@ class VFlex:
         """
         self.wake_up(full_handshake=True)
 
+    @timed
     def get_serial_number(self) -> str | None:
         """
         Fetches (or re-fetches) the serial number of the connected VFlex. If the object is set to `safe_adjust`,
@@ -171,52 +468,9 @@ class VFlex:
         :return: Nothing, but adds the serial number to the class if it's not there.
         :raises SerialNumberMismatchError: The serial number has changed between fetches.
         """
-        send_sequence(self.io_port, GET_SERIAL_NUMBER_SEQUENCE)
-        returned_data = drain_incoming(self.io_port)
-        try:
-            returned_serial_number = protocol_decode_serial_number(protocol_message_from_midi_messages(returned_data))
-        except InvalidProtocolMessageLengthError as e:
-            self.log.exception("Failed to decode serial number.", exc_info=e)
-            if self.safe_adjust:
-                raise e
-            return None
-
-        if self.serial_number is None or not self.safe_adjust:
-            self.serial_number = returned_serial_number
-        if self.safe_adjust and self.serial_number != returned_serial_number:
-            raise SerialNumberMismatchError(
-                old_serial_number=self.serial_number, new_serial_number=returned_serial_number
-            )
-        return returned_serial_number
-
-    def _initial_get_voltage(self) -> None:
-        """
-        Initial get voltage command. This is used to wake the device up in wake_up. To actually get voltage, you
-        likely want to use `get_voltage()`. Instead.
-
-        :return: Nothing, but adds the initial voltage into the object.
-        """
-        send_sequence(self.io_port, GET_VOLTAGE_SEQUENCE)
-        returned_data = drain_incoming(self.io_port)
-        if self.current_voltage is None:
-            self.current_voltage = get_millivolts_from_protocol_message(
-                protocol_message_from_midi_messages(returned_data)
-            )
-        return None
-
-    def _initial_get_led_state(self) -> None:
-        """
-        Initial get LED state command. This is used to wake the device up in wake_up. To actually get LED state, you
-        likely want to use `get_led_state()`. Instead.
-        :return:
-        """
-        send_sequence(self.io_port, GET_LED_STATE_SEQUENCE)
-        returned_data = drain_incoming(self.io_port)
-        if self.led_state is None:
-            self.led_state = protocol_decode_led_state(protocol_message_from_midi_messages(returned_data))
-        return None
+        return self._run(self._get_serial_number())
 
-    @run_with_handshake
+    @timed
     def get_voltage(self, *, update_self: bool = True) -> int:
         """
         Runs the "Get Voltage" command on device to get the voltage. This both returns the value, It also adds it to
@@ -225,15 +479,9 @@ class VFlex:
         :param update_self: On retrieving the voltage, whether to update `self.current_voltage` or not. Defaults to True.
         :return: Integer for the current voltage, in millivolts. (Float divide by 1000 to get the Volts)
         """
-        send_sequence(self.io_port, GET_VOLTAGE_SEQUENCE)
-        returned_data = drain_incoming(self.io_port)
-        millivolts = get_millivolts_from_protocol_message(protocol_message_from_midi_messages(returned_data))
-        self.log.debug("Retrieved current voltage", current_voltage=self.current_voltage)
-        if update_self:
-            self.current_voltage = millivolts
-        return millivolts
+        return self._run(self._get_voltage(update_self=update_self))
 
-    @run_with_handshake
+    @timed
     def get_led_state(self) -> bool:
         """
         Runs the "Get Led State" command on device to get the LED state. This both returns the value and adds it
@@ -241,14 +489,9 @@ class VFlex:
 
         :return:
         """
-        send_sequence(self.io_port, GET_LED_STATE_SEQUENCE)
-        returned_data = drain_incoming(self.io_port)
-        led_state = protocol_decode_led_state(protocol_message_from_midi_messages(returned_data))
-        self.log.debug("Retrieved LED State", led_state=led_state)
-        self.led_state = led_state
-        return led_state
+        return self._run(self._get_led_state())
 
-    @run_with_handshake
+    @timed
     def set_voltage(self, millivolts: int) -> None:
         """
         Set the voltage for the device to the specified number of millivolts. Updates the current voltage
@@ -257,16 +500,16 @@ class VFlex:
         The VFlex *should* return the new voltage, but if you wanted to be safer, run get_voltage() again
         after this.
 
+        If the reply doesn't come, the write may still have landed. So before each retry (as many as
+        ``retry_policy`` allows) the voltage is read back, and the command is only sent again if the
+        device isn't at the new voltage yet.
+
         :param millivolts: The voltage to set the device to, in millivolts.
         :return: Nothing, but updates the voltage for the object under self.current_voltage.
+        :raises VoltageMismatchError: The voltage changed since it was last read.
+        :raises ReplyTimeoutError: No attempt got a reply, and the voltage didn't change.
         """
-        self._guard_voltage()
-        command = prepare_command_for_sending(prepare_command_frame(set_voltage_command(millivolts)))
-        send_sequence(self.io_port, command)
-        returned_data = drain_incoming(self.io_port)
-        returned_voltage = get_millivolts_from_protocol_message(protocol_message_from_midi_messages(returned_data))
-        self.log.debug("Voltage returned after setting", returned_voltage=returned_voltage)
-        self.current_voltage = returned_voltage
+        self._run(self._set_voltage(millivolts))
 
     def set_voltage_volts(self, volts: float) -> None:
         """
@@ -277,7 +520,20 @@ class VFlex:
         """
         self.set_voltage(millivolts=voltage_to_millivolt(volts))
 
-    @run_with_handshake
+    @timed
+    def play(self, setpoints: list[Setpoint], *, on_step: Callable[[StepTiming], None] | None = None) -> PlaybackReport:
+        """
+        Steps the voltage through a profile (see ``vflexctl.device_interface.playback``), sending each
+        setpoint at its time. Every step's MIDI sequence is prepared before the first is sent, and the
+        whole run shares one handshake and one voltage guard.
+
+        :param setpoints: The profile to play, in order.
+        :param on_step: Called with each step's timing as soon as it's done.
+        :return: The timing of every step, with the device's reported voltage.
+        """
+        return self._run(self._play(setpoints, on_step))
+
+    @timed
     def set_led_state(self, led_state: bool | Literal[0, 1]) -> None:
         """
         Set the LED state for the device to the specified LED state. Updates the current LED state
@@ -288,29 +544,72 @@ class VFlex:
         - False, 0: LED is always on (0x00, default behaviour).
         - True, 1: LED is not always on (0x01, customised behaviour).
 
+        The state is read back after setting it. If it didn't change (e.g. the command was lost), it's
+        set again, as many times as ``retry_policy`` allows.
+
         :param led_state: The LED state to set the device to.
         :return: Nothing, but updates the LED state for the object under self.current_led_state.
+        :raises WriteNotAppliedError: The state read back was still different after the last attempt.
         """
-        command = prepare_command_for_sending(prepare_command_frame(set_led_state_command(led_state)))
-        send_sequence(self.io_port, command)
-        _ = drain_incoming(self.io_port)
-        send_sequence(self.io_port, GET_LED_STATE_SEQUENCE)
-        returned_data = drain_incoming(self.io_port)
-        self.led_state = protocol_decode_led_state(protocol_message_from_midi_messages(returned_data))
-        self.log.debug("LED State returned after setting", led_state=self.led_state)
+        self._run(self._set_led_state(led_state))
 
+    @timed
     def get_firmware_version(self) -> None:
         """
         Get the firmware version of the device.
 
         :return: Nothing, but updates the firmware version for the object under self.firmware_version.
         """
-        command = prepare_command_for_sending(prepare_command_frame(get_firmware_version_command()))
-        _ = drain_incoming(self.io_port)
-        send_sequence(self.io_port, command)
-        self.firmware_version = protocol_decode_firmware_version(
-            protocol_message_from_midi_messages(drain_incoming(self.io_port))
-        )
+        self._run(self._get_firmware_version())
+
+    def _pacing_trial(self, pause: float) -> bool:
+        """
+        Runs one read (serial number, then voltage) with a given pause between MIDI messages.
+
+        :param pause: The pause to try, in seconds.
+        :return: True if both replies came back complete and the serial number matched.
+        """
+        return self._run(self._try_pause(pause))
+
+    def _pause_is_reliable(self, pause: float, trials: int) -> bool:
+        for _ in range(trials):
+            if not self._pacing_trial(pause):
+                self.log.info("Pause length failed a trial", pause=pause)
+                self._run(self._settle())
+                return False
+        return True
+
+    def tune_pacing(self, *, trials: int = 5, resolution: float = 0.001, save: bool = True) -> float:
+        """
+        Finds the smallest pause between MIDI messages that this device handles reliably, with a
+        binary search between no pause and the default pause. Each candidate has to pass ``trials``
+        reads in a row. The result has the safety margin added, is used by this instance straight
+        away and (if ``save`` is set) is stored against the device's serial number and firmware
+        version, so later connections pick it up after their wake-up.
+
+        :param trials: The number of reads each candidate pause has to pass.
+        :param resolution: Stop searching once the range is narrower than this, in seconds.
+        :param save: Whether to store the tuned pause for later use.
+        :return: The tuned pause, in seconds.
+        :raises RuntimeError: The device isn't reliable even with the default pause.
+        """
+        if self.serial_number is None or self.firmware_version is None:
+            self.initial_wake_up()
+        low, high = 0.0, DEFAULT_PAUSE_LENGTH
+        if not self._pause_is_reliable(high, trials):
+            raise RuntimeError("The VFlex did not respond reliably with the default pause length. Not tuning.")
+        while high - low > resolution:
+            middle = (low + high) / 2
+            if self._pause_is_reliable(middle, trials):
+                high = middle
+            else:
+                low = middle
+        tuned_pause = with_safety_margin(high)
+        self.log.info("Tuned pause length", smallest_reliable_pause=high, tuned_pause=tuned_pause)
+        self.pause_length = tuned_pause
+        if save:
+            save_pacing(cast(str, self.serial_number), cast(str, self.firmware_version), tuned_pause)
+        return tuned_pause
 
     @cached_property
     def firmware_version_components(self) -> tuple[int, int, int]:
@@ -319,24 +618,26 @@ class VFlex:
         split_version = cast(str, self.firmware_version).split(".")[1:]
         return cast(tuple[int, int, int], tuple(int(x) for x in split_version))
 
-    @run_with_handshake
-    def _guard_voltage(self) -> None:
+    def watch(
+        self,
+        interval: float = 1.0,
+        *,
+        changes_only: bool = False,
+        count: int | None = None,
+        duration: float | None = None,
+        stats: WatchStats | None = None,
+    ) -> Iterator[WatchSample]:
         """
-        Guards against the voltage changing if self.safe_adjust is True.
-        :return: Nothing
-        :raises VoltageMismatchError: Subclass of UnsafeAdjustmentError, if the voltage stored does not match
-        the voltage that's re-retrieved.
-        """
-        if not self.safe_adjust:
-            return None
-        reported_current_voltage = self.get_voltage(update_self=False)
-        if reported_current_voltage != self.current_voltage:
-            raise VoltageMismatchError(stored_voltage=self.current_voltage, retrieved_voltage=reported_current_voltage)
-        return None
+        Samples the voltage and LED state on a fixed schedule. See ``vflexctl.device_interface.watch.watch()``.
 
-    @property
-    def led_state_str(self) -> str:
-        return "always on" if self.led_state is False else "disabled during operation"
+        :param interval: The time between samples, in seconds. 0 samples as fast as the device replies.
+        :param changes_only: Only yield samples where the voltage or LED state changed.
+        :param count: Stop after this many samples. Runs forever if None.
+        :param duration: Stop after this many seconds. Runs forever if None.
+        :param stats: Updated as the watch runs (sample rate achieved, missed deadlines, errors).
+        :return: An iterator of samples.
+        """
+        return watch(self, interval, changes_only=changes_only, count=count, duration=duration, stats=stats)
 
     @property
     def supports_pdo_scan(self) -> bool:
@@ -347,23 +648,36 @@ class VFlex:
         """
         return self.firmware_version_components[0] >= 5
 
-    @property
-    def supports_led_colour(self) -> bool:
-        return self.firmware_version_components[0] >= 5
-
+    @timed
     def set_led_colour(self, led_colour: LEDColour) -> None:
         """
         Sets the LED colour on the connected VFlex. Currently, there doesn't seem to be documentation
-        or code that gets the current LED colour when checking
+        or code that gets the current LED colour when checking. The device doesn't reply, so there's
+        nothing to retry on.
         :param led_colour:
         :return:
+        :raises UnsupportedFirmwareVersionError: The firmware is older than APP.05.00.00.
+        """
+        self._run(self._set_led_colour(led_colour))
+
+    @timed
+    def apply(
+        self, desired: DesiredState, *, force: bool = False, dry_run: bool = False, refresh: bool = False
+    ) -> list[Change]:
+        """
+        Brings the device into a desired state, writing only the settings that differ from it. The
+        state is read in one batched exchange (with the handshake, when one is due), or not at all if
+        the last handshake and voltage read are still fresh (see ``handshake_ttl``). The writes then
+        share that handshake, and the read stands in for the voltage guard.
+
+        :param desired: The state the device should be in.
+        :param force: Write every setting in ``desired``, whether or not it differs.
+        :param dry_run: Only work out what would be written.
+        :param refresh: Read the state even if the last read is still fresh (e.g. to catch the device
+            being changed by something else).
+        :return: The settings written (or that would be, on a dry run).
         """
-        if not self.supports_led_colour:
-            raise UnsupportedFirmwareVersionError(self.firmware_version, "5.0.0")
-        command = prepare_command_for_sending(prepare_command_frame(set_led_colour_command(led_colour)))
-        _ = drain_incoming(self.io_port)
-        send_sequence(self.io_port, command)
-        return None
+        return self._run(self._apply(desired, force=force, dry_run=dry_run, refresh=refresh))
 
     def __eq__(self, other: object) -> bool:
         return isinstance(other, VFlex) and self.serial_number == other.serial_number
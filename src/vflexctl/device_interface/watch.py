@@ -0,0 +1,172 @@
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from time import monotonic, sleep, time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from vflexctl.device_interface.vflex import VFlex
+
+__all__ = ["WatchSample", "WatchStats", "watch"]
+
+
+@dataclass(frozen=True, slots=True)
+class WatchSample:
+    """
+    One reading of a VFlex's state, taken by ``watch()``.
+    """
+
+    # Wall-clock time the sample was taken (seconds since the epoch).
+    timestamp: float
+
+    # Which sample this is, counting from 0 (including samples that weren't emitted).
+    sequence: int
+
+    serial_number: str | None
+    millivolts: int
+    led_state: bool
+
+    # Whether the voltage or LED state differs from the previous sample (always True for the first).
+    changed: bool
+
+    # How late the sample was started compared to its deadline, in seconds.
+    lateness: float
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "timestamp": self.timestamp,
+            "sequence": self.sequence,
+            "serial_number": self.serial_number,
+            "millivolts": self.millivolts,
+            "led_state": self.led_state,
+            "changed": self.changed,
+            "lateness": round(self.lateness, 6),
+        }
+
+
+@dataclass(slots=True)
+class WatchStats:
+    """
+    Running totals for a ``watch()``. They're plain counters, so they take the same memory however
+    long the watch runs.
+    """
+
+    # The target time between samples, in seconds.
+    interval: float = 0.0
+    samples: int = 0
+    emitted: int = 0
+    errors: int = 0
+
+    # Samples started after the next one was already due. The schedule skips ahead rather than
+    # bursting to catch up.
+    missed_deadlines: int = 0
+    max_lateness: float = 0.0
+    started_at: float | None = field(default=None, repr=False)
+    last_sample_at: float | None = field(default=None, repr=False)
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None or self.last_sample_at is None:
+            return 0.0
+        return self.last_sample_at - self.started_at
+
+    @property
+    def achieved_rate(self) -> float:
+        """
+        Samples per second actually taken (0 until there are two samples).
+        """
+        if self.samples < 2 or self.elapsed <= 0:
+            return 0.0
+        return (self.samples - 1) / self.elapsed
+
+    @property
+    def target_rate(self) -> float:
+        return 1 / self.interval if self.interval > 0 else float("inf")
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "emitted": self.emitted,
+            "errors": self.errors,
+            "missed_deadlines": self.missed_deadlines,
+            "max_lateness": round(self.max_lateness, 6),
+            "elapsed": round(self.elapsed, 6),
+            "achieved_rate": round(self.achieved_rate, 3),
+            "target_rate": self.target_rate if self.interval > 0 else None,
+        }
+
+
+def watch(
+    v_flex: "VFlex",
+    interval: float = 1.0,
+    *,
+    changes_only: bool = False,
+    count: int | None = None,
+    duration: float | None = None,
+    stats: WatchStats | None = None,
+) -> Iterator[WatchSample]:
+    """
+    Reads the voltage and LED state over and over, on a fixed schedule, keeping the port open. Each
+    read is one round trip (see ``VFlex.read()``), with the serial number checked as part of it
+    whenever the handshake is due.
+
+    Reads that fail (e.g. a reply that never came, or the port going away) are counted in
+    ``stats.errors`` and skipped. Safety check failures (e.g. a different VFlex answering) are raised.
+
+    :param v_flex: The VFlex to watch.
+    :param interval: The time between samples, in seconds. 0 samples as fast as the device replies.
+    :param changes_only: Only yield samples where the voltage or LED state changed.
+    :param count: Stop after this many samples (emitted or not). Runs forever if None.
+    :param duration: Stop after this many seconds. Runs forever if None.
+    :param stats: Updated as the watch runs, for the caller to report on.
+    :return: An iterator of samples.
+    """
+    stats = stats if stats is not None else WatchStats()
+    stats.interval = interval
+    previous: tuple[int, bool] | None = None
+    started_at = monotonic()
+    deadline = started_at
+    sequence = 0
+    while count is None or sequence < count:
+        now = monotonic()
+        if duration is not None and max(now, deadline) - started_at >= duration:
+            break
+        if now < deadline:
+            sleep(deadline - now)
+            now = monotonic()
+        lateness = now - deadline
+        stats.max_lateness = max(stats.max_lateness, lateness)
+        if interval > 0 and lateness >= interval:
+            stats.missed_deadlines += 1
+            deadline = now
+        deadline += interval
+
+        timestamp = time()
+        try:
+            v_flex.read()
+        except (ValueError, IndexError, OSError) as e:
+            v_flex.log.warning("Failed to read the VFlex while watching", error=str(e))
+            stats.errors += 1
+            sequence += 1
+            continue
+        finally:
+            stats.samples += 1
+            if stats.started_at is None:
+                stats.started_at = now
+            stats.last_sample_at = now
+
+        current = (int(v_flex.current_voltage or 0), bool(v_flex.led_state))
+        changed = current != previous
+        previous = current
+        sample = WatchSample(
+            timestamp=timestamp,
+            sequence=sequence,
+            serial_number=v_flex.serial_number,
+            millivolts=current[0],
+            led_state=current[1],
+            changed=changed,
+            lateness=lateness,
+        )
+        sequence += 1
+        if changed or not changes_only:
+            stats.emitted += 1
+            yield sample
@@ -2,6 +2,8 @@ __all__ = [
     "InvalidProtocolMessageLengthError",
     "InvalidProtocolMessageError",
     "IncorrectCommandByte",
+    "ReplyTimeoutError",
+    "WriteNotAppliedError",
     "UnsafeAdjustmentError",
     "SerialNumberMismatchError",
     "VoltageMismatchError",
@@ -48,6 +50,46 @@ class IncorrectCommandByte(InvalidProtocolMessageError):
         super().__init__(protocol_message, message)
 
 
+class ReplyTimeoutError(ValueError):
+    """
+    A reply from the VFlex didn't arrive (complete) in time, on any attempt. This is a ValueError
+    since, before retry policies, a lost reply surfaced as a reply that failed to decode.
+
+    :param command_byte: The command byte of the reply that was expected, if a particular one was.
+    :param attempts: How many times the command was sent.
+    :param timeout: How long each attempt waited for the reply, in seconds.
+    """
+
+    def __init__(self, command_byte: int | None, attempts: int, timeout: float):
+        self.command_byte = command_byte
+        self.attempts = attempts
+        self.timeout = timeout
+        reply = "A reply" if command_byte is None else f"The reply to command {command_byte:#04x}"
+        super().__init__(f"{reply} didn't arrive within {timeout:g}s, after {attempts} attempt(s).")
+
+
+class WriteNotAppliedError(ValueError):
+    """
+    A setting written to the VFlex still read back as something else after every attempt (e.g. the
+    device answered, but ignored the command). A ValueError, like ``ReplyTimeoutError``.
+
+    :param command_byte: The command byte of the write.
+    :param attempts: How many times the write was sent.
+    :param expected: The value written.
+    :param reported: The value the device reported after the last attempt.
+    """
+
+    def __init__(self, command_byte: int, attempts: int, expected: object, reported: object):
+        self.command_byte = command_byte
+        self.attempts = attempts
+        self.expected = expected
+        self.reported = reported
+        super().__init__(
+            f"Command {command_byte:#04x} wasn't applied after {attempts} attempt(s): "
+            f"wrote {expected!r}, but the device reports {reported!r}."
+        )
+
+
 class UnsafeAdjustmentError(Exception):
     """
     Base class for exceptions related to making adjustments on a VFlex where the target
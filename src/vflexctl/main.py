@@ -1,18 +1,62 @@
-import logging
-from importlib.metadata import version
+from functools import cache
+from pathlib import Path
+from typing import Any
 
-import structlog
 import typer
+from typer.core import TyperGroup
 
-from .cli import cli
+from .cli import BackendOption, cli, report_replay, report_timings
 from .context import AppContext
 
 APP_NAME = "vflexctl"
-__version__ = version(APP_NAME)
-__version_str__ = f"{APP_NAME} {__version__}"
+
+
+@cache
+def get_version() -> str:
+    """
+    The installed version of vflexctl. Looked up on first use rather than at import, since
+    ``importlib.metadata`` is slow to import and most commands never need it.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version(APP_NAME)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def get_version_str() -> str:
+    return f"{APP_NAME} {get_version()}"
+
+
+def __getattr__(name: str) -> Any:
+    # __version__ and __version_str__ used to be computed at import time; keep them available lazily.
+    if name == "__version__":
+        return get_version()
+    if name == "__version_str__":
+        return get_version_str()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _VersionedGroup(TyperGroup):
+    """
+    Root command group whose help text is the version string, worked out only when help is shown.
+    """
+
+    @property
+    def help(self) -> str:
+        return get_version_str()
+
+    @help.setter
+    def help(self, _value: str | None) -> None:
+        return None
 
 
 def configure_logging(verbose: bool, debug: bool) -> None:
+    import logging
+
+    import structlog
+
     if debug:
         level = logging.DEBUG
     elif verbose:
@@ -25,11 +69,11 @@ def configure_logging(verbose: bool, debug: bool) -> None:
 def show_version(val: bool) -> None:
     if not val:
         return
-    typer.echo(__version_str__)
+    typer.echo(get_version_str())
     raise typer.Exit(0)
 
 
-@cli.callback(help=__version_str__)
+@cli.callback(cls=_VersionedGroup)
 def main(
     ctx: typer.Context,
     deep_adjust: bool = typer.Option(
@@ -39,6 +83,53 @@ def main(
     ),
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Enable verbose logging"),
     debug: bool = typer.Option(False, "--debug", "-vv", help="Enable debug logging"),
+    use_daemon: bool = typer.Option(
+        True, "--daemon/--no-daemon", help="Send commands through vflexctld when it's running"
+    ),
+    select_all: bool = typer.Option(False, "--all", help="Run the command on every connected VFlex"),
+    serials: list[str] | None = typer.Option(
+        None, "--serial", "-s", help="Run the command on the VFlex with this serial number (repeatable)"
+    ),
+    backend: BackendOption = typer.Option(
+        BackendOption.MIDO,
+        "--backend",
+        help="MIDI library to talk to devices with (rtmidi skips mido's message objects)",
+    ),
+    capture_path: Path | None = typer.Option(
+        None,
+        "--capture",
+        dir_okay=False,
+        help="Record all MIDI traffic with the devices to this file (bypasses vflexctld)",
+    ),
+    replay_path: Path | None = typer.Option(
+        None,
+        "--replay",
+        exists=True,
+        dir_okay=False,
+        help="Replay a capture instead of talking to the devices, and report where the traffic differs from it",
+    ),
+    replay_speed: float | None = typer.Option(
+        None,
+        "--replay-speed",
+        help="Deliver replayed replies with their captured timing, at this speed (default: as fast as possible)",
+    ),
+    show_timings: bool = typer.Option(
+        False,
+        "--timings",
+        help="Print how long each phase of every device operation took (bypasses vflexctld)",
+    ),
+    timeout: float | None = typer.Option(
+        None,
+        "--timeout",
+        min=0.01,
+        help="Seconds to wait for each reply from a device (default 0.5, bypasses vflexctld)",
+    ),
+    retries: int | None = typer.Option(
+        None,
+        "--retries",
+        min=0,
+        help="Times to retry a command whose reply doesn't come (default 2 for reads, 1 for writes, bypasses vflexctld)",
+    ),
     _version: bool = typer.Option(
         False,
         "--version",
@@ -50,8 +141,53 @@ def main(
     """
     Global options for vflexctl.
     """
+    from .daemon.protocol import default_socket_path
+
     configure_logging(verbose, debug)
-    ctx.obj = AppContext(deep_adjust=deep_adjust)
+    socket_path = default_socket_path()
+    capture = None
+    if capture_path is not None:
+        from .midi_transport.capture import CaptureWriter
+
+        # vflexctld's traffic can't be recorded from here, so a capture always talks to the device directly.
+        use_daemon = False
+        capture = CaptureWriter(capture_path)
+        ctx.call_on_close(capture.close)
+    replay = None
+    if replay_path is not None:
+        from .midi_transport.replay import Replay
+
+        if replay_speed is not None and replay_speed <= 0:
+            raise typer.BadParameter("must be more than 0", param_hint="--replay-speed")
+        use_daemon = False
+        replay = Replay(replay_path, speed=replay_speed)
+        ctx.call_on_close(lambda: report_replay(replay))
+    timings = None
+    if show_timings:
+        from .device_interface.timings import Timings
+
+        # Operations run by vflexctld happen in another process, so timings need a direct connection.
+        use_daemon = False
+        timings = Timings()
+        ctx.call_on_close(lambda: report_timings(timings))
+    retry_policy = None
+    if timeout is not None or retries is not None:
+        from .device_interface.retry import DEFAULT_RETRY_POLICY
+
+        # vflexctld talks to the devices with its own policy.
+        use_daemon = False
+        retry_policy = DEFAULT_RETRY_POLICY.with_overrides(timeout=timeout, retries=retries)
+    ctx.obj = AppContext(
+        deep_adjust=deep_adjust,
+        socket_path=socket_path if use_daemon and socket_path.exists() else None,
+        select_all=select_all,
+        serials=serials or [],
+        backend="rtmidi" if backend == BackendOption.RTMIDI else "mido",
+        capture=capture,
+        replay=replay,
+        timings=timings,
+        retry_policy=retry_policy,
+    )
 
 
 if __name__ == "__main__":
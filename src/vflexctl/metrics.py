@@ -0,0 +1,393 @@
+import os
+import threading
+from bisect import bisect_left
+from collections.abc import Sequence
+from pathlib import Path
+from types import TracebackType
+from typing import Self, TYPE_CHECKING
+
+import structlog
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# Every VFlex imports this module, so the HTTP server (and tempfile) are only imported once they're
+# used: importing http.server alone adds tens of milliseconds to the CLI's startup.
+
+__all__ = ["Histogram", "Metrics", "MetricsServer", "TextfileWriter", "DEFAULT_BUCKETS"]
+
+log = structlog.get_logger("vflexctl.metrics")
+
+# Upper bounds (in seconds) of the latency histogram buckets. Most operations are a handful of MIDI
+# messages paced a few milliseconds apart, so the buckets are finest between 10ms and 500ms.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.15,
+    0.2,
+    0.3,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# The quantiles exported for each operation's latency, worked out from the histogram.
+EXPORTED_QUANTILES: tuple[float, ...] = (0.5, 0.99)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. Observing a value is a binary search and an increment, so it's
+    cheap enough for every operation. Quantiles are estimated from the buckets, and the max is exact.
+    Not thread safe on its own: ``Metrics`` guards it.
+    """
+
+    # The buckets' upper bounds, in seconds. Values above the last go in an implicit +Inf bucket.
+    bounds: tuple[float, ...]
+
+    # How many values fell in each bucket (not cumulative), with the +Inf bucket last.
+    counts: list[int]
+
+    count: int
+    sum: float
+    max: float
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile by interpolating linearly inside the bucket it falls in (as Prometheus'
+        ``histogram_quantile()`` does), capped at the largest value seen.
+
+        :param q: The quantile, from 0 to 1.
+        :return: The estimate, in seconds. 0 if nothing was observed.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+    def copy(self) -> "Histogram":
+        copied = Histogram(self.bounds)
+        copied.counts = list(self.counts)
+        copied.count, copied.sum, copied.max = self.count, self.sum, self.max
+        return copied
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Metrics:
+    """
+    Opt-in registry of operational metrics for VFlex devices. Give one to a ``VFlex`` (``metrics=``)
+    and it records:
+
+    - the latency of each operation (``set_voltage``, ``read``, ...), as a histogram with its p50,
+      p99 and max;
+    - the MIDI messages (and bytes) sent and received;
+    - replies that timed out, and the commands retried because of them;
+    - errors raised by operations, by exception type. That covers decoding failures
+      (``InvalidProtocolMessageLengthError``, ``IncorrectCommandByte``) and failed safety checks
+      (``SerialNumberMismatchError``, ``VoltageMismatchError``).
+
+    One registry can be shared between devices and threads. ``to_prometheus()`` gives everything in
+    the Prometheus text format, which ``MetricsServer`` serves over HTTP and ``TextfileWriter`` writes
+    for node_exporter's textfile collector.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """
+        :param buckets: Upper bounds of the latency histogram buckets, in seconds.
+        """
+        self.buckets = tuple(buckets)
+        self.latencies: dict[str, Histogram] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.timeouts = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def observe_operation(self, operation: str, seconds: float, error: BaseException | None = None) -> None:
+        """
+        Records one operation.
+
+        :param operation: The operation's name.
+        :param seconds: How long it took.
+        :param error: What it raised, if it failed.
+        """
+        with self._lock:
+            histogram = self.latencies.get(operation)
+            if histogram is None:
+                histogram = self.latencies[operation] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if error is not None:
+                key = (operation, type(error).__name__)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def count_sent(self, messages: int) -> None:
+        with self._lock:
+            self.messages_sent += messages
+
+    def count_received(self, messages: int) -> None:
+        with self._lock:
+            self.messages_received += messages
+
+    def count_timeouts(self, timeouts: int = 1) -> None:
+        with self._lock:
+            self.timeouts += timeouts
+
+    def count_retries(self, retries: int = 1) -> None:
+        with self._lock:
+            self.retries += retries
+
+    def error_count(self, error: type[BaseException] | str) -> int:
+        """
+        :param error: An exception type, or its name.
+        :return: How many operations raised it, whatever the operation.
+        """
+        name = error if isinstance(error, str) else error.__name__
+        with self._lock:
+            return sum(count for (_, error_name), count in self.errors.items() if error_name == name)
+
+    def to_prometheus(self) -> str:
+        """
+        :return: Every metric, in the Prometheus text exposition format.
+        """
+        with self._lock:
+            latencies = {operation: histogram.copy() for operation, histogram in sorted(self.latencies.items())}
+            errors = sorted(self.errors.items())
+            counters = {"sent": self.messages_sent, "received": self.messages_received}
+            timeouts = self.timeouts
+            retries = self.retries
+
+        lines = [
+            "# HELP vflexctl_operation_duration_seconds How long VFlex operations took.",
+            "# TYPE vflexctl_operation_duration_seconds histogram",
+        ]
+        for operation, histogram in latencies.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*histogram.bounds, float("inf")), histogram.counts):
+                cumulative += bucket_count
+                labels = _labels(operation=operation, le=_number(bound))
+                lines.append(f"vflexctl_operation_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels(operation=operation)
+            lines.append(f"vflexctl_operation_duration_seconds_sum{labels} {_number(histogram.sum)}")
+            lines.append(f"vflexctl_operation_duration_seconds_count{labels} {histogram.count}")
+        lines += [
+            "# HELP vflexctl_operation_duration_quantile_seconds Latency quantiles of VFlex operations, from the histogram.",
+            "# TYPE vflexctl_operation_duration_quantile_seconds gauge",
+        ]
+        for operation, histogram in latencies.items():
+            for q in EXPORTED_QUANTILES:
+                labels = _labels(operation=operation, quantile=str(q))
+                lines.append(f"vflexctl_operation_duration_quantile_seconds{labels} {_number(histogram.quantile(q))}")
+        lines += [
+            "# HELP vflexctl_operation_duration_max_seconds The slowest of each VFlex operation.",
+            "# TYPE vflexctl_operation_duration_max_seconds gauge",
+        ]
+        for operation, histogram in latencies.items():
+            lines.append(
+                f"vflexctl_operation_duration_max_seconds{_labels(operation=operation)} {_number(histogram.max)}"
+            )
+        for direction, messages in counters.items():
+            lines += [
+                f"# HELP vflexctl_midi_messages_{direction}_total MIDI messages {direction}.",
+                f"# TYPE vflexctl_midi_messages_{direction}_total counter",
+                f"vflexctl_midi_messages_{direction}_total {messages}",
+                f"# HELP vflexctl_midi_bytes_{direction}_total MIDI bytes {direction}.",
+                f"# TYPE vflexctl_midi_bytes_{direction}_total counter",
+                # Every message to and from a VFlex is a 3 byte note or envelope marker.
+                f"vflexctl_midi_bytes_{direction}_total {messages * 3}",
+            ]
+        lines += [
+            "# HELP vflexctl_timeouts_total Replies that didn't arrive (complete) in time.",
+            "# TYPE vflexctl_timeouts_total counter",
+            f"vflexctl_timeouts_total {timeouts}",
+            "# HELP vflexctl_retries_total Commands sent again after their reply didn't arrive.",
+            "# TYPE vflexctl_retries_total counter",
+            f"vflexctl_retries_total {retries}",
+            "# HELP vflexctl_errors_total Errors raised by VFlex operations, by exception type.",
+            "# TYPE vflexctl_errors_total counter",
+        ]
+        for (operation, error), count in errors:
+            lines.append(f"vflexctl_errors_total{_labels(operation=operation, error=error)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path) -> None:
+        """
+        Writes the metrics to a file, replacing it atomically so a collector never reads half of it.
+
+        :param path: The file to write (for node_exporter, a ``.prom`` file in its textfile directory).
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        import tempfile
+
+        descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                file.write(self.to_prometheus())
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+def _http_server(address: tuple[str, int], metrics: Metrics) -> "ThreadingHTTPServer":
+    """
+    :return: An HTTP server (not yet serving) that answers ``GET /metrics`` with the registry's metrics.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return None
+            body = metrics.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return None
+
+        def log_message(self, format: str, *args: object) -> None:
+            log.debug("Metrics request", request=format % args)
+
+    server = ThreadingHTTPServer(address, MetricsHandler)
+    server.daemon_threads = True
+    return server
+
+
+class MetricsServer:
+    """
+    Serves a registry's metrics at ``/metrics`` over HTTP, from a background thread. It only does any
+    work when scraped.
+    """
+
+    def __init__(self, metrics: Metrics, *, host: str = "127.0.0.1", port: int = 9464) -> None:
+        """
+        :param metrics: The registry to serve.
+        :param host: The address to listen on. Only the local machine by default.
+        :param port: The port to listen on. 0 picks a free one (see ``address``).
+        """
+        self._server = _http_server((host, port), metrics)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        host, port = self._server.server_address[:2]
+        return str(host), int(port)
+
+    def start(self) -> Self:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="vflex-metrics", daemon=True)
+            self._thread.start()
+            log.info("Serving metrics", address=self.address)
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.stop()
+
+
+class TextfileWriter:
+    """
+    Writes a registry's metrics to a file every ``interval`` seconds from a background thread, and
+    once more when stopped.
+    """
+
+    def __init__(self, metrics: Metrics, path: Path, *, interval: float = 15.0) -> None:
+        """
+        :param metrics: The registry to write.
+        :param path: The file to write.
+        :param interval: The time between writes, in seconds.
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def write(self) -> None:
+        try:
+            self.metrics.write_textfile(self.path)
+        except OSError as e:
+            log.warning("Could not write the metrics file", path=str(self.path), error=str(e))
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def start(self) -> Self:
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="vflex-metrics-textfile", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.stop()
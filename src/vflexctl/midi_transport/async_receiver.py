@@ -0,0 +1,196 @@
+import asyncio
+from collections import deque
+from collections.abc import Callable, Iterable
+from typing import Any, cast
+
+import structlog
+from mido import Message
+from mido.ports import BaseInput
+
+from vflexctl.protocol import StreamDecoder, prepare_command_for_sending
+from vflexctl.types import MIDITriplet
+from .transport import MIDITransport
+
+__all__ = ["AsyncReceiver"]
+
+log = structlog.get_logger("vflexctl.midi_receivers")
+
+
+class AsyncReceiver:
+    """
+    asyncio receiver for a MIDI input port.
+
+    Like ``CallbackReceiver``, this registers a callback on the port, but the callback hands each
+    message over to the event loop (with ``call_soon_threadsafe``) and waiting is done by awaiting,
+    so no thread is tied up while a reply is on its way.
+
+    It has to be created from inside the event loop it will be used on. Only one coroutine should
+    be draining it at a time (``AsyncVFlex`` makes sure of that).
+    """
+
+    # The port (or, for mido's IOPort wrapper, its input side) the callback is registered on.
+    callback_port: Any
+
+    def __init__(self, input_port: BaseInput | MIDITransport, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self.input_port = input_port
+        self.loop = loop or asyncio.get_running_loop()
+        self.callback_port = getattr(input_port, "input", input_port)
+        self._pending: deque[MIDITriplet] = deque()
+        self._arrived = asyncio.Event()
+        if isinstance(input_port, MIDITransport):
+            input_port.set_callback(self._on_triplet)
+        else:
+            self.callback_port.callback = self._on_message
+
+    def _on_message(self, message: Message) -> None:
+        self._on_triplet(cast(MIDITriplet, tuple(message.bytes())))
+
+    def _on_triplet(self, triplet: MIDITriplet) -> None:
+        # Called from the MIDI backend's thread.
+        try:
+            self.loop.call_soon_threadsafe(self._queue, triplet)
+        except RuntimeError:
+            log.debug("Event loop is closed, dropping MIDI message", message=triplet)
+
+    def _queue(self, triplet: MIDITriplet) -> None:
+        self._pending.append(triplet)
+        self._arrived.set()
+
+    def close(self) -> None:
+        """
+        Removes the callback from the port. Anything still queued is dropped.
+        """
+        if isinstance(self.input_port, MIDITransport):
+            self.input_port.set_callback(None)
+        else:
+            self.callback_port.callback = None
+        self._pending.clear()
+        self._arrived.clear()
+
+    def _take_pending(self) -> list[MIDITriplet]:
+        drained_bytes = list(self._pending)
+        self._pending.clear()
+        self._arrived.clear()
+        return drained_bytes
+
+    def drain_once(self) -> list[MIDITriplet]:
+        """
+        Returns every MIDI message received since the last drain, without waiting.
+
+        :return: A list of MIDI message bytes
+        """
+        return self._take_pending()
+
+    async def drain_incoming(self, *, seconds: float = 0.5) -> list[MIDITriplet]:
+        """
+        Collects MIDI messages for ``seconds`` seconds, then returns them.
+
+        :param seconds: The time to spend reading MIDI messages, in seconds.
+        :return: A list of MIDI message bytes
+        """
+        if seconds <= 0:
+            log.warning("Wait time was negative or 0 for draining incoming messages. They have not been drained.")
+            return list()
+        await asyncio.sleep(seconds)
+        drained_bytes = self._take_pending()
+        log.debug("Returning drained MIDI messages", drained_bytes=drained_bytes)
+        return drained_bytes
+
+    async def _wait_for_pending(self, end_time: float) -> bool:
+        """
+        Waits until at least one MIDI message is queued, or until the loop's clock reaches ``end_time``.
+
+        :return: False if the time ran out first.
+        """
+        remaining = end_time - self.loop.time()
+        if remaining <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self._arrived.wait(), timeout=remaining)
+        except TimeoutError:
+            # One last look, for anything that arrived right on the deadline.
+            return bool(self._pending)
+        return True
+
+    async def drain_until_frame(
+        self,
+        command_byte: int | None = None,
+        *,
+        seconds: float = 0.5,
+        on_first_message: Callable[[], Any] | None = None,
+        on_timeout: Callable[[], Any] | None = None,
+    ) -> list[MIDITriplet]:
+        """
+        Waits until a complete VFlex frame has arrived, or until ``seconds`` have passed,
+        waking as each message comes in.
+
+        :param command_byte: The command byte (proto[1]) the reply should have. If None, any complete reply is accepted.
+        :param seconds: The maximum time to spend waiting for the reply, in seconds.
+        :param on_first_message: Called once, as soon as the first MIDI message has been taken off the queue.
+        :param on_timeout: Called if the reply didn't arrive (complete) in time, before returning.
+        :return: The reply in its own envelope, or everything received if it didn't arrive in time.
+        """
+        if seconds <= 0:
+            log.warning("Wait time was negative or 0 for draining incoming messages. They have not been drained.")
+            if on_timeout is not None:
+                on_timeout()
+            return list()
+        decoder = StreamDecoder()
+        end_time = self.loop.time() + seconds
+        drained_bytes: list[MIDITriplet] = []
+        while True:
+            new_bytes = self._take_pending()
+            drained_bytes.extend(new_bytes)
+            if on_first_message is not None and drained_bytes:
+                on_first_message()
+                on_first_message = None
+            reply = decoder.feed_until_reply(new_bytes, command_byte)
+            if reply is not None:
+                log.debug("Returning drained MIDI reply", reply=reply)
+                return prepare_command_for_sending(reply)
+            if not await self._wait_for_pending(end_time):
+                break
+
+        log.debug("Timed out waiting for a complete MIDI frame", command_byte=command_byte, drained_bytes=drained_bytes)
+        if on_timeout is not None:
+            on_timeout()
+        return drained_bytes
+
+    async def drain_until_replies(
+        self,
+        command_bytes: Iterable[int],
+        *,
+        seconds: float = 0.5,
+        on_first_message: Callable[[], Any] | None = None,
+    ) -> list[MIDITriplet]:
+        """
+        Waits until a complete reply has arrived for every one of ``command_bytes``, or until
+        ``seconds`` have passed, waking as each message comes in.
+
+        :param command_bytes: The command bytes (proto[1]) of the replies expected.
+        :param seconds: The maximum time to spend waiting for the replies, in seconds.
+        :param on_first_message: Called once, as soon as the first MIDI message has been taken off the queue.
+        :return: Everything received, whether or not every reply arrived.
+        """
+        if seconds <= 0:
+            log.warning("Wait time was negative or 0 for draining incoming messages. They have not been drained.")
+            return list()
+        missing = set(command_bytes)
+        decoder = StreamDecoder()
+        end_time = self.loop.time() + seconds
+        drained_bytes: list[MIDITriplet] = []
+        while True:
+            new_bytes = self._take_pending()
+            drained_bytes.extend(new_bytes)
+            if on_first_message is not None and drained_bytes:
+                on_first_message()
+                on_first_message = None
+            missing.difference_update(protocol_message[1] for protocol_message in decoder.feed(new_bytes))
+            if not missing:
+                log.debug("Returning drained MIDI replies", drained_bytes=drained_bytes)
+                return drained_bytes
+            if not await self._wait_for_pending(end_time):
+                break
+
+        log.debug("Timed out waiting for MIDI replies", missing=missing, drained_bytes=drained_bytes)
+        return drained_bytes
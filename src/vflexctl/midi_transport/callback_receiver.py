@@ -0,0 +1,199 @@
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable
+from time import perf_counter
+from typing import Any, cast
+
+import structlog
+from mido import Message
+from mido.ports import BaseInput
+
+from vflexctl.protocol import StreamDecoder, prepare_command_for_sending
+from vflexctl.types import MIDITriplet
+from .transport import MIDITransport
+
+__all__ = ["CallbackReceiver"]
+
+log = structlog.get_logger("vflexctl.midi_receivers")
+
+
+class CallbackReceiver:
+    """
+    Event-driven receiver for a MIDI input port.
+
+    Instead of polling ``iter_pending()`` on a timer, this registers a callback on the port
+    (mido's rtmidi backend calls it from its own thread as each message arrives), queues the
+    triplets, and wakes any thread waiting on them straight away. Nothing runs while the
+    port is idle.
+
+    ``drain_once``, ``drain_incoming``, ``drain_until_frame`` and ``drain_until_replies`` behave the same as the
+    functions of the same name in ``vflexctl.midi_transport.receivers``.
+
+    While attached, the port can't be read with ``iter_pending()``/``receive()``; call
+    ``close()`` to hand the port back.
+    """
+
+    # The port (or, for mido's IOPort wrapper, its input side) the callback is registered on.
+    callback_port: Any
+
+    def __init__(self, input_port: BaseInput | MIDITransport) -> None:
+        self.input_port = input_port
+        # mido.open_ioport() wraps a separate input and output for backends without a native
+        # I/O port (rtmidi included). The callback has to go on the input.
+        self.callback_port = getattr(input_port, "input", input_port)
+        self._pending: deque[MIDITriplet] = deque()
+        self._arrived = threading.Condition()
+        if isinstance(input_port, MIDITransport):
+            input_port.set_callback(self._on_triplet)
+        else:
+            self.callback_port.callback = self._on_message
+
+    def _on_message(self, message: Message) -> None:
+        self._on_triplet(cast(MIDITriplet, tuple(message.bytes())))
+
+    def _on_triplet(self, triplet: MIDITriplet) -> None:
+        with self._arrived:
+            self._pending.append(triplet)
+            self._arrived.notify_all()
+
+    def close(self) -> None:
+        """
+        Removes the callback from the port. Anything still queued is dropped.
+        """
+        if isinstance(self.input_port, MIDITransport):
+            self.input_port.set_callback(None)
+        else:
+            self.callback_port.callback = None
+        with self._arrived:
+            self._pending.clear()
+
+    def _take_pending(self) -> list[MIDITriplet]:
+        drained_bytes = list(self._pending)
+        self._pending.clear()
+        return drained_bytes
+
+    def wait_for_pending(self, timeout: float) -> bool:
+        """
+        Blocks until at least one MIDI message is queued, or until ``timeout`` seconds pass.
+
+        :param timeout: The maximum time to wait, in seconds.
+        :return: True if there are messages waiting to be drained.
+        """
+        with self._arrived:
+            return self._arrived.wait_for(lambda: len(self._pending) > 0, timeout=max(timeout, 0))
+
+    def drain_once(self) -> list[MIDITriplet]:
+        """
+        Returns every MIDI message received since the last drain, without waiting.
+
+        :return: A list of MIDI message bytes
+        """
+        with self._arrived:
+            return self._take_pending()
+
+    def drain_incoming(self, *, seconds: float = 0.5) -> list[MIDITriplet]:
+        """
+        Collects MIDI messages for ``seconds`` seconds, then returns them.
+
+        :param seconds: The time to spend reading MIDI messages, in seconds.
+        :return: A list of MIDI message bytes
+        """
+        if seconds <= 0:
+            log.warning("Wait time was negative or 0 for draining incoming messages. They have not been drained.")
+            return list()
+        end_time = perf_counter() + seconds
+        drained_bytes: list[MIDITriplet] = []
+        with self._arrived:
+            while (remaining := end_time - perf_counter()) > 0:
+                self._arrived.wait(remaining)
+                drained_bytes.extend(self._take_pending())
+
+        log.debug("Returning drained MIDI messages", drained_bytes=drained_bytes)
+        return drained_bytes
+
+    def drain_until_frame(
+        self,
+        command_byte: int | None = None,
+        *,
+        seconds: float = 0.5,
+        on_first_message: Callable[[], Any] | None = None,
+        on_timeout: Callable[[], Any] | None = None,
+    ) -> list[MIDITriplet]:
+        """
+        Waits until a complete VFlex frame has arrived, or until ``seconds`` have passed,
+        waking as each message comes in.
+
+        :param command_byte: The command byte (proto[1]) the reply should have. If None, any complete reply is accepted.
+        :param seconds: The maximum time to spend waiting for the reply, in seconds.
+        :param on_first_message: Called once, as soon as the first MIDI message has been taken off the queue.
+        :param on_timeout: Called if the reply didn't arrive (complete) in time, before returning.
+        :return: The reply in its own envelope, or everything received if it didn't arrive in time.
+        """
+        if seconds <= 0:
+            log.warning("Wait time was negative or 0 for draining incoming messages. They have not been drained.")
+            if on_timeout is not None:
+                on_timeout()
+            return list()
+        decoder = StreamDecoder()
+        end_time = perf_counter() + seconds
+        drained_bytes: list[MIDITriplet] = []
+        with self._arrived:
+            while True:
+                new_bytes = self._take_pending()
+                drained_bytes.extend(new_bytes)
+                if on_first_message is not None and drained_bytes:
+                    on_first_message()
+                    on_first_message = None
+                reply = decoder.feed_until_reply(new_bytes, command_byte)
+                if reply is not None:
+                    log.debug("Returning drained MIDI reply", reply=reply)
+                    return prepare_command_for_sending(reply)
+                remaining = end_time - perf_counter()
+                if remaining <= 0 or not self._arrived.wait_for(lambda: len(self._pending) > 0, timeout=remaining):
+                    break
+
+        log.debug("Timed out waiting for a complete MIDI frame", command_byte=command_byte, drained_bytes=drained_bytes)
+        if on_timeout is not None:
+            on_timeout()
+        return drained_bytes
+
+    def drain_until_replies(
+        self,
+        command_bytes: Iterable[int],
+        *,
+        seconds: float = 0.5,
+        on_first_message: Callable[[], Any] | None = None,
+    ) -> list[MIDITriplet]:
+        """
+        Waits until a complete reply has arrived for every one of ``command_bytes``, or until
+        ``seconds`` have passed, waking as each message comes in.
+
+        :param command_bytes: The command bytes (proto[1]) of the replies expected.
+        :param seconds: The maximum time to spend waiting for the replies, in seconds.
+        :param on_first_message: Called once, as soon as the first MIDI message has been taken off the queue.
+        :return: Everything received, whether or not every reply arrived.
+        """
+        if seconds <= 0:
+            log.warning("Wait time was negative or 0 for draining incoming messages. They have not been drained.")
+            return list()
+        missing = set(command_bytes)
+        decoder = StreamDecoder()
+        end_time = perf_counter() + seconds
+        drained_bytes: list[MIDITriplet] = []
+        with self._arrived:
+            while True:
+                new_bytes = self._take_pending()
+                drained_bytes.extend(new_bytes)
+                if on_first_message is not None and drained_bytes:
+                    on_first_message()
+                    on_first_message = None
+                missing.difference_update(protocol_message[1] for protocol_message in decoder.feed(new_bytes))
+                if not missing:
+                    log.debug("Returning drained MIDI replies", drained_bytes=drained_bytes)
+                    return drained_bytes
+                remaining = end_time - perf_counter()
+                if remaining <= 0 or not self._arrived.wait_for(lambda: len(self._pending) > 0, timeout=remaining):
+                    break
+
+        log.debug("Timed out waiting for MIDI replies", missing=missing, drained_bytes=drained_bytes)
+        return drained_bytes
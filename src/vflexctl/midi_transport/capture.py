@@ -0,0 +1,418 @@
+"""
+Compact binary captures of the MIDI traffic to and from VFlex devices.
+
+A capture is two files:
+
+- ``FILE``: a fixed-size header (start time and a table of port names), then one fixed-size record
+  per MIDI message: a monotonic timestamp, the direction, the port, the device's serial number and
+  the 3 MIDI bytes.
+- ``FILE.idx``: a sidecar index with one fixed-size entry (timestamp, record number) for every frame
+  (every ``COMMAND_START``, in either direction).
+
+Everything is fixed-size, so writing is an append of a few bytes, and a reader can ``mmap`` both
+files and jump to a record, a frame or a point in time without reading what comes before it.
+"""
+
+import mmap
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable, Iterator
+from enum import IntEnum
+from pathlib import Path
+from time import monotonic, time
+from types import TracebackType
+from typing import Any, BinaryIO, Final, NamedTuple, Self, cast
+
+from mido.ports import BaseIOPort
+
+from vflexctl.protocol import VFlexProto
+from vflexctl.types import MIDITriplet
+from .receivers import drain_once
+from .senders import message_for_triplet
+from .transport import MIDITransport
+
+__all__ = [
+    "Direction",
+    "CaptureRecord",
+    "CaptureWriter",
+    "CaptureReader",
+    "CapturingTransport",
+    "index_path",
+    "rebuild_index",
+]
+
+MAGIC: Final[bytes] = b"VFLXCAP1"
+INDEX_MAGIC: Final[bytes] = b"VFLXIDX1"
+
+# magic, record size, port table size, wall-clock start time, monotonic start time.
+HEADER: Final[struct.Struct] = struct.Struct("<8sHHdd")
+MAX_PORTS: Final[int] = 32
+PORT_NAME_SIZE: Final[int] = 64
+HEADER_SIZE: Final[int] = 4096
+
+# timestamp, direction, port number, serial number, MIDI bytes (padded to 24 bytes).
+RECORD: Final[struct.Struct] = struct.Struct("<dBB8s3B3x")
+
+# magic, entry size (padded to 16 bytes).
+INDEX_HEADER: Final[struct.Struct] = struct.Struct("<8sI4x")
+
+# timestamp, record number of the frame's COMMAND_START.
+INDEX_ENTRY: Final[struct.Struct] = struct.Struct("<dQ")
+
+
+class Direction(IntEnum):
+    SENT = 0
+    RECEIVED = 1
+
+
+class CaptureRecord(NamedTuple):
+    # monotonic() when the message was sent or received.
+    timestamp: float
+    direction: Direction
+    port: str
+    # The serial number of the device on the port, if it was known at the time.
+    serial_number: str | None
+    triplet: MIDITriplet
+
+
+def index_path(path: Path) -> Path:
+    """
+    :param path: The capture file.
+    :return: Where its index is kept.
+    """
+    return path.with_name(path.name + ".idx")
+
+
+class CaptureWriter:
+    """
+    Appends MIDI messages to a capture. Safe to share between threads and ports (e.g. a whole fleet,
+    or a receiver's callback thread).
+    """
+
+    path: Path
+
+    def __init__(self, path: Path, *, buffer_size: int = 1 << 16) -> None:
+        """
+        :param path: The capture file to create (its index is written alongside it). Replaced if it exists.
+        :param buffer_size: How many bytes of records to buffer before writing them out.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._ports: dict[str, int] = {}
+        self._records = 0
+        self._file: BinaryIO = open(path, "w+b", buffering=buffer_size)
+        self._index: BinaryIO = open(index_path(path), "wb", buffering=buffer_size)
+        header = HEADER.pack(MAGIC, RECORD.size, MAX_PORTS, time(), monotonic())
+        self._file.write(header.ljust(HEADER_SIZE, b"\0"))
+        self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_ENTRY.size))
+
+    @property
+    def records(self) -> int:
+        return self._records
+
+    def _port_number(self, port: str) -> int:
+        number = self._ports.get(port)
+        if number is not None:
+            return number
+        if len(self._ports) >= MAX_PORTS:
+            raise ValueError(f"A capture can't hold more than {MAX_PORTS} ports.")
+        number = self._ports[port] = len(self._ports)
+        end = self._file.tell()
+        self._file.seek(HEADER.size + number * PORT_NAME_SIZE)
+        self._file.write(port.encode()[: PORT_NAME_SIZE - 1].ljust(PORT_NAME_SIZE, b"\0"))
+        self._file.seek(end)
+        return number
+
+    def record(
+        self, direction: Direction, triplet: MIDITriplet, *, port: str, serial_number: str | None = None
+    ) -> None:
+        """
+        Appends one MIDI message to the capture.
+
+        :param direction: Whether the message was sent to or received from the device.
+        :param triplet: The 3 MIDI bytes.
+        :param port: The name of the port it went through.
+        :param serial_number: The serial number of the device on the port, if known.
+        """
+        timestamp = monotonic()
+        serial = serial_number.encode()[:8] if serial_number else b""
+        with self._lock:
+            if self._file.closed:
+                return None
+            if triplet == VFlexProto.COMMAND_START:
+                self._index.write(INDEX_ENTRY.pack(timestamp, self._records))
+            self._file.write(RECORD.pack(timestamp, direction, self._port_number(port), serial, *triplet))
+            self._records += 1
+        return None
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+            self._index.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return None
+            self._file.close()
+            self._index.close()
+        return None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.close()
+
+
+class CaptureReader:
+    """
+    Reads a capture through ``mmap``, so opening one costs the same however big it is.
+
+    Records are indexed from 0 in the order they were written. Frames are numbered from 0 too, in the
+    order their ``COMMAND_START`` was sent or received. If the index is missing (e.g. it was deleted),
+    it's rebuilt first.
+    """
+
+    path: Path
+    ports: list[str]
+
+    # time() and monotonic() when the capture was started, to turn record timestamps into wall-clock times.
+    started_at: float
+    started_at_monotonic: float
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path, "rb") as capture:
+            self._data = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, max_ports, self.started_at, self.started_at_monotonic = HEADER.unpack_from(self._data)
+        if magic != MAGIC or record_size != RECORD.size:
+            self._data.close()
+            raise ValueError(f"{path} isn't a vflexctl capture (or was written by an incompatible version).")
+        names = [
+            self._data[offset : offset + PORT_NAME_SIZE].rstrip(b"\0").decode(errors="replace")
+            for offset in range(HEADER.size, HEADER.size + max_ports * PORT_NAME_SIZE, PORT_NAME_SIZE)
+        ]
+        self.ports = names[: next((i for i, name in enumerate(names) if not name), len(names))]
+        # A capture cut short mid-record (e.g. by a crash) just loses the partial record.
+        self._count = (len(self._data) - HEADER_SIZE) // RECORD.size
+
+        if not index_path(path).exists():
+            rebuild_index(path)
+        with open(index_path(path), "rb") as index:
+            self._index = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        self._frames = _FrameIndex(self._index, self._count)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> CaptureRecord:
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError("Capture record out of range")
+        timestamp, direction, port, serial, *triplet = RECORD.unpack_from(
+            self._data, HEADER_SIZE + position * RECORD.size
+        )
+        return CaptureRecord(
+            timestamp=timestamp,
+            direction=Direction(direction),
+            port=self.ports[port] if port < len(self.ports) else str(port),
+            serial_number=serial.rstrip(b"\0").decode(errors="replace") or None,
+            triplet=cast(MIDITriplet, tuple(triplet)),
+        )
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        return self.iter_records()
+
+    def iter_records(self, start: int = 0, stop: int | None = None) -> Iterator[CaptureRecord]:
+        """
+        :param start: The first record.
+        :param stop: The record to stop before. Runs to the end if None.
+        :return: The records, in order.
+        """
+        stop = self._count if stop is None else min(stop, self._count)
+        for position in range(start, stop):
+            yield self[position]
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._frames)
+
+    def frame_start(self, frame: int) -> int:
+        """
+        :param frame: The frame number.
+        :return: The record number of the frame's ``COMMAND_START``.
+        """
+        return self._frames.record(frame)
+
+    def frame(self, frame: int) -> list[CaptureRecord]:
+        """
+        The records of one frame: from its ``COMMAND_START`` up to the ``COMMAND_END`` in the same
+        direction on the same port (or the end of the capture).
+
+        :param frame: The frame number.
+        :return: The frame's records.
+        """
+        start = self[self.frame_start(frame)]
+        records = [start]
+        for record in self.iter_records(self.frame_start(frame) + 1):
+            if record.direction != start.direction or record.port != start.port:
+                continue
+            records.append(record)
+            if record.triplet in (VFlexProto.COMMAND_END, VFlexProto.COMMAND_START):
+                break
+        return records
+
+    def position_at(self, timestamp: float) -> int:
+        """
+        Finds the first record at or after a point in time. The index narrows it down to one frame's
+        worth of records, so this doesn't read the capture from the start.
+
+        :param timestamp: A ``monotonic()`` time (see ``started_at_monotonic``).
+        :return: The record number (``len(self)`` if every record is earlier).
+        """
+        frame = bisect_right(self._frames, timestamp, key=lambda entry: entry[0]) - 1
+        position = self._frames.record(frame) if frame >= 0 else 0
+        while position < self._count and self[position].timestamp < timestamp:
+            position += 1
+        return position
+
+    def frame_at(self, timestamp: float) -> int:
+        """
+        :param timestamp: A ``monotonic()`` time.
+        :return: The number of the first frame starting at or after ``timestamp``.
+        """
+        return bisect_left(self._frames, timestamp, key=lambda entry: entry[0])
+
+    def close(self) -> None:
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.close()
+
+
+class _FrameIndex:
+    """
+    The entries of an index file, as a sequence of ``(timestamp, record number)`` for ``bisect``.
+    Entries pointing past the end of the capture (written before a crash cut it short) are left out.
+    """
+
+    def __init__(self, data: mmap.mmap, record_count: int) -> None:
+        self._data = data
+        count = max(len(data) - INDEX_HEADER.size, 0) // INDEX_ENTRY.size
+        while count > 0 and self[count - 1][1] >= record_count:
+            count -= 1
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> tuple[float, int]:
+        return cast(
+            tuple[float, int], INDEX_ENTRY.unpack_from(self._data, INDEX_HEADER.size + position * INDEX_ENTRY.size)
+        )
+
+    def record(self, frame: int) -> int:
+        if not 0 <= frame < self._count:
+            raise IndexError("Capture frame out of range")
+        return self[frame][1]
+
+
+def rebuild_index(path: Path) -> int:
+    """
+    Writes the index for a capture from scratch, e.g. if it was lost.
+
+    :param path: The capture file.
+    :return: The number of frames indexed.
+    """
+    frames = 0
+    with open(path, "rb") as capture, open(index_path(path), "wb") as index:
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_ENTRY.size))
+        capture.seek(HEADER_SIZE)
+        position = 0
+        while len(chunk := capture.read(RECORD.size * 4096)) >= RECORD.size:
+            for offset in range(0, len(chunk) - RECORD.size + 1, RECORD.size):
+                timestamp, _, _, _, *triplet = RECORD.unpack_from(chunk, offset)
+                if tuple(triplet) == VFlexProto.COMMAND_START:
+                    index.write(INDEX_ENTRY.pack(timestamp, position))
+                    frames += 1
+                position += 1
+    return frames
+
+
+class CapturingTransport(MIDITransport):
+    """
+    Wraps a mido port (or another ``MIDITransport``) and records everything sent and received
+    through it to a ``CaptureWriter``. ``VFlex(..., capture=writer)`` sets this up.
+    """
+
+    def __init__(
+        self,
+        port: BaseIOPort | MIDITransport,
+        capture: CaptureWriter,
+        serial_number: Callable[[], str | None] = lambda: None,
+    ) -> None:
+        """
+        :param port: The port to wrap.
+        :param capture: Where to record the traffic.
+        :param serial_number: Gives the serial number of the device on the port at the time of each message.
+        """
+        self.port = port
+        self.capture = capture
+        self.serial_number = serial_number
+        self.name = str(port.name)
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.port.closed)
+
+    def _record(self, direction: Direction, triplet: MIDITriplet) -> None:
+        self.capture.record(direction, triplet, port=self.name, serial_number=self.serial_number())
+
+    def send_triplet(self, triplet: MIDITriplet) -> None:
+        self._record(Direction.SENT, triplet)
+        if isinstance(self.port, MIDITransport):
+            self.port.send_triplet(triplet)
+        else:
+            self.port.send(message_for_triplet(triplet))
+
+    def drain(self) -> list[MIDITriplet]:
+        drained_bytes = drain_once(self.port)
+        for triplet in drained_bytes:
+            self._record(Direction.RECEIVED, triplet)
+        return drained_bytes
+
+    def set_callback(self, callback: Callable[[MIDITriplet], Any] | None) -> None:
+        if isinstance(self.port, MIDITransport):
+            self.port.set_callback(None if callback is None else self._recording(callback))
+            return None
+        callback_port = getattr(self.port, "input", self.port)
+        if callback is None:
+            callback_port.callback = None
+            return None
+        recording = self._recording(callback)
+        callback_port.callback = lambda message: recording(cast(MIDITriplet, tuple(message.bytes())))
+        return None
+
+    def _recording(self, callback: Callable[[MIDITriplet], Any]) -> Callable[[MIDITriplet], Any]:
+        def _record_then_call(triplet: MIDITriplet) -> Any:
+            self._record(Direction.RECEIVED, triplet)
+            return callback(triplet)
+
+        return _record_then_call
+
+    def close(self) -> None:
+        self.port.close()
+
+    def __repr__(self) -> str:
+        return f"<CapturingTransport {self.port!r} -> {self.capture.path}>"
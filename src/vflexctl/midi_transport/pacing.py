@@ -0,0 +1,110 @@
+import json
+from pathlib import Path
+
+import structlog
+
+from vflexctl.app_data import app_data_dir
+from vflexctl.midi_transport.senders import DEFAULT_PAUSE_LENGTH
+
+__all__ = [
+    "PACING_SAFETY_FACTOR",
+    "PACING_SAFETY_OFFSET",
+    "pacing_file",
+    "pacing_key",
+    "load_pacing",
+    "save_pacing",
+    "forget_pacing",
+    "with_safety_margin",
+]
+
+# A tuned pause is the smallest pause that passed every trial, scaled by this factor and then
+# padded by the offset, so a device that handled no pause at all still gets a little slack.
+PACING_SAFETY_FACTOR = 1.5
+PACING_SAFETY_OFFSET = 0.001
+
+log = structlog.get_logger("vflexctl.pacing")
+
+
+def pacing_file() -> Path:
+    """
+    :return: The path to the JSON file that tuned pauses are stored in.
+    """
+    return app_data_dir() / "pacing.json"
+
+
+def pacing_key(serial_number: str, firmware_version: str) -> str:
+    """
+    Pacing is stored per device and per firmware version, as a firmware update could change
+    how quickly the device can take MIDI messages.
+
+    :param serial_number: The serial number of the VFlex.
+    :param firmware_version: The firmware version string of the VFlex (APP.XX.XX.XX).
+    :return: The key the tuned pause is stored under.
+    """
+    return f"{serial_number}@{firmware_version}"
+
+
+def with_safety_margin(pause: float) -> float:
+    """
+    Adds the safety margin to the smallest pause that was found to work, never going over the
+    default pause length.
+
+    :param pause: The smallest reliable pause, in seconds.
+    :return: The pause to use when sending, in seconds.
+    """
+    return min(DEFAULT_PAUSE_LENGTH, pause * PACING_SAFETY_FACTOR + PACING_SAFETY_OFFSET)
+
+
+def _read_pacing_file(path: Path) -> dict[str, float]:
+    try:
+        stored = json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log.warning("Could not read the stored pacing, using the default.", path=str(path), error=str(e))
+        return {}
+    if not isinstance(stored, dict):
+        return {}
+    return {key: float(value) for key, value in stored.items() if isinstance(value, int | float)}
+
+
+def load_pacing(serial_number: str, firmware_version: str, *, path: Path | None = None) -> float | None:
+    """
+    Loads the tuned pause for a device.
+
+    :param serial_number: The serial number of the VFlex.
+    :param firmware_version: The firmware version string of the VFlex.
+    :param path: The pacing file to read. Defaults to ``pacing_file()``.
+    :return: The tuned pause in seconds, or None if this device/firmware hasn't been tuned.
+    """
+    return _read_pacing_file(path or pacing_file()).get(pacing_key(serial_number, firmware_version))
+
+
+def save_pacing(serial_number: str, firmware_version: str, pause: float, *, path: Path | None = None) -> None:
+    """
+    Stores a tuned pause for a device, keeping the values for any other devices.
+
+    :param serial_number: The serial number of the VFlex.
+    :param firmware_version: The firmware version string of the VFlex.
+    :param pause: The pause to store, in seconds. This should already include the safety margin.
+    :param path: The pacing file to write. Defaults to ``pacing_file()``.
+    """
+    path = path or pacing_file()
+    stored = _read_pacing_file(path)
+    stored[pacing_key(serial_number, firmware_version)] = pause
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(stored, indent=2, sort_keys=True))
+
+
+def forget_pacing(serial_number: str, firmware_version: str, *, path: Path | None = None) -> None:
+    """
+    Removes the tuned pause for a device, so it goes back to the default pause length.
+
+    :param serial_number: The serial number of the VFlex.
+    :param firmware_version: The firmware version string of the VFlex.
+    :param path: The pacing file to write. Defaults to ``pacing_file()``.
+    """
+    path = path or pacing_file()
+    stored = _read_pacing_file(path)
+    if stored.pop(pacing_key(serial_number, firmware_version), None) is not None:
+        path.write_text(json.dumps(stored, indent=2, sort_keys=True))
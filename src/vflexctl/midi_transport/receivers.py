@@ -1,15 +1,18 @@
+from collections.abc import Callable, Iterable
 from time import perf_counter, sleep
-from typing import cast
+from typing import Any, cast
 
 import structlog
 from mido.ports import BaseInput
 
+from vflexctl.protocol import StreamDecoder, prepare_command_for_sending
 from vflexctl.types import MIDITriplet
+from .transport import MIDITransport
 
 log = structlog.get_logger("vflexctl.midi_receivers")
 
 
-def drain_incoming(input_port: BaseInput, *, seconds: float = 0.5) -> list[MIDITriplet]:
+def drain_incoming(input_port: BaseInput | MIDITransport, *, seconds: float = 0.5) -> list[MIDITriplet]:
     """
     "Drains" the MIDI input port for any midi messages currently available, and
     that become available over the next ``seconds`` seconds. This returns after
@@ -32,7 +35,106 @@ def drain_incoming(input_port: BaseInput, *, seconds: float = 0.5) -> list[MIDIT
     return drained_bytes
 
 
-def drain_once(input_port: BaseInput) -> list[MIDITriplet]:
+def drain_until_frame(
+    input_port: BaseInput | MIDITransport,
+    command_byte: int | None = None,
+    *,
+    seconds: float = 0.5,
+    on_first_message: Callable[[], Any] | None = None,
+    on_timeout: Callable[[], Any] | None = None,
+) -> list[MIDITriplet]:
+    """
+    Drains the MIDI input port until a complete VFlex frame has arrived, or until
+    ``seconds`` have passed. Unlike ``drain_incoming``, the time given is a ceiling
+    rather than a fixed cost: this returns as soon as the reply is in.
+
+    The reply is decoded as it arrives (see ``StreamDecoder``), and this returns as soon as its
+    envelope's ``COMMAND_END`` is in. Only the reply is returned, in its own ``COMMAND_START``/``COMMAND_END`` envelope, so
+    stale replies that were still waiting on the port don't get decoded in place of the one we asked
+    for. On a timeout, everything drained is returned as-is, and decoding it will fail in the same
+    way it would for ``drain_incoming``.
+
+    :param input_port: The MIDI input port to drain from
+    :param command_byte: The command byte (proto[1]) the reply should have. If None, any complete reply is accepted.
+    :param seconds: The maximum time to spend waiting for the reply, in seconds.
+    :param on_first_message: Called once, as soon as the first MIDI message has been drained.
+    :param on_timeout: Called if the reply didn't arrive (complete) in time, before returning.
+    :return: A list of MIDI message bytes
+    """
+    if seconds <= 0:
+        log.warning("Wait time was negative or 0 for draining incoming messages. They have not been drained.")
+        if on_timeout is not None:
+            on_timeout()
+        return list()
+    decoder = StreamDecoder()
+    end_time = perf_counter() + seconds
+    drained_bytes: list[MIDITriplet] = []
+    while True:
+        new_bytes = drain_once(input_port)
+        drained_bytes.extend(new_bytes)
+        if on_first_message is not None and drained_bytes:
+            on_first_message()
+            on_first_message = None
+        reply = decoder.feed_until_reply(new_bytes, command_byte)
+        if reply is not None:
+            if decoder.messages_decoded > 1:
+                log.debug("Discarded replies received before the one expected", discarded=decoder.messages_decoded - 1)
+            log.debug("Returning drained MIDI reply", reply=reply)
+            return prepare_command_for_sending(reply)
+        if perf_counter() > end_time:
+            break
+        sleep(0.002)
+
+    log.debug("Timed out waiting for a complete MIDI frame", command_byte=command_byte, drained_bytes=drained_bytes)
+    if on_timeout is not None:
+        on_timeout()
+    return drained_bytes
+
+
+def drain_until_replies(
+    input_port: BaseInput | MIDITransport,
+    command_bytes: Iterable[int],
+    *,
+    seconds: float = 0.5,
+    on_first_message: Callable[[], Any] | None = None,
+) -> list[MIDITriplet]:
+    """
+    Drains the MIDI input port until a complete reply has arrived for every one of ``command_bytes``
+    (in any number of envelopes), or until ``seconds`` have passed. Used for batched commands,
+    where the replies are demultiplexed afterwards.
+
+    :param input_port: The MIDI input port to drain from
+    :param command_bytes: The command bytes (proto[1]) of the replies expected.
+    :param seconds: The maximum time to spend waiting for the replies, in seconds.
+    :param on_first_message: Called once, as soon as the first MIDI message has been drained.
+    :return: Everything drained, whether or not every reply arrived.
+    """
+    if seconds <= 0:
+        log.warning("Wait time was negative or 0 for draining incoming messages. They have not been drained.")
+        return list()
+    missing = set(command_bytes)
+    decoder = StreamDecoder()
+    end_time = perf_counter() + seconds
+    drained_bytes: list[MIDITriplet] = []
+    while True:
+        new_bytes = drain_once(input_port)
+        drained_bytes.extend(new_bytes)
+        if on_first_message is not None and drained_bytes:
+            on_first_message()
+            on_first_message = None
+        missing.difference_update(protocol_message[1] for protocol_message in decoder.feed(new_bytes))
+        if not missing:
+            log.debug("Returning drained MIDI replies", drained_bytes=drained_bytes)
+            return drained_bytes
+        if perf_counter() > end_time:
+            break
+        sleep(0.002)
+
+    log.debug("Timed out waiting for MIDI replies", missing=missing, drained_bytes=drained_bytes)
+    return drained_bytes
+
+
+def drain_once(input_port: BaseInput | MIDITransport) -> list[MIDITriplet]:
     """
     "Drains" the MIDI input port for any midi messages currently available. Once
     the pipe is empty (when BaseInput.iter_pending() stops yielding messages)
@@ -41,9 +143,11 @@ def drain_once(input_port: BaseInput) -> list[MIDITriplet]:
     Note that ``iter_pending()`` may return without yielding anything, so this
     function can legitimately return an empty list.
 
-    :param input_port: The MIDI input port to drain from
+    :param input_port: The MIDI input port (or transport) to drain from
     :return: A list of MIDI message bytes
     """
+    if isinstance(input_port, MIDITransport):
+        return input_port.drain()
     drained_bytes: list[MIDITriplet] = []
     for message in input_port.iter_pending():
         log.debug(
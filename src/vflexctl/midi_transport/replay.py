@@ -0,0 +1,283 @@
+"""
+Replaying captures (see ``vflexctl.midi_transport.capture``): a ``ReplayTransport`` stands in for
+the device on one of the captured ports, answering what's sent to it with the replies that were
+recorded, and noting wherever what's sent now differs from what was sent then.
+"""
+
+import threading
+from collections import deque
+from collections.abc import Callable
+from pathlib import Path
+from time import monotonic, sleep
+from types import TracebackType
+from typing import Any, NamedTuple, Self
+
+import structlog
+
+from vflexctl.protocol import VFlexProto
+from vflexctl.types import MIDITriplet
+from .capture import CaptureReader, CaptureRecord, Direction
+from .transport import MIDITransport
+
+__all__ = ["Divergence", "Replay", "ReplayTransport"]
+
+log = structlog.get_logger("vflexctl.replay")
+
+
+class Divergence(NamedTuple):
+    port: str
+    # The capture record number of the message that was expected (None if the capture had run out).
+    position: int | None
+    # What the capture says was sent (None if nothing more was expected).
+    expected: MIDITriplet | None
+    # What was actually sent (None if the message in the capture was never sent).
+    actual: MIDITriplet | None
+
+    def __str__(self) -> str:
+        where = "after the end of the capture" if self.position is None else f"at record {self.position}"
+        return f"{self.port} {where}: expected {self.expected}, sent {self.actual}"
+
+
+class Replay:
+    """
+    A capture opened for replaying, with a ``ReplayTransport`` for each of its ports and the
+    divergences found on all of them.
+    """
+
+    reader: CaptureReader
+
+    # How fast to replay, relative to the capture: 1.0 delivers each reply after the same delay as it
+    # had when recorded (measured from the message that was sent just before it). None delivers
+    # replies straight away.
+    speed: float | None
+
+    divergences: list[Divergence]
+
+    # The transports opened on the replay so far.
+    transports: "list[ReplayTransport]"
+
+    def __init__(self, capture: Path | CaptureReader, *, speed: float | None = None) -> None:
+        """
+        :param capture: The capture file (or an open reader for it).
+        :param speed: How fast to replay it. None (the default) for as fast as possible.
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError("Replay speed must be more than 0.")
+        self.reader = capture if isinstance(capture, CaptureReader) else CaptureReader(capture)
+        self.speed = speed
+        self.divergences = []
+        self.transports = []
+
+    @property
+    def ports(self) -> list[str]:
+        return list(self.reader.ports)
+
+    def transport(self, port: str | None = None) -> "ReplayTransport":
+        """
+        :param port: The captured port to replay. The first port in the capture if None.
+        :return: A transport replaying that port from the start.
+        """
+        if port is None:
+            if not self.reader.ports:
+                raise ValueError(f"{self.reader.path} has no traffic to replay.")
+            port = self.reader.ports[0]
+        if port not in self.reader.ports:
+            raise ValueError(f"{self.reader.path} has no traffic on port {port!r}.")
+        transport = ReplayTransport(self, port)
+        self.transports.append(transport)
+        return transport
+
+    @property
+    def unsent(self) -> int:
+        """
+        :return: How many captured messages (over every port replayed) haven't been sent yet.
+        """
+        return sum(transport.unsent for transport in self.transports)
+
+    @property
+    def matched(self) -> bool:
+        """
+        :return: Whether everything sent so far matched the capture, and everything in it was sent.
+        """
+        return not self.divergences and self.unsent == 0
+
+    def close(self) -> None:
+        for transport in self.transports:
+            transport.close()
+        self.reader.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.close()
+
+
+class ReplayTransport(MIDITransport):
+    """
+    Plays back one port of a capture. Each message sent is checked against the next message sent in
+    the capture, and the replies recorded after that message are then delivered, in their original
+    order.
+
+    Divergences are recorded (on the ``Replay``) and logged rather than raised, so the code being
+    replayed carries on as it would against a device. When a new frame is sent partway through a
+    captured one (the code sent a shorter frame than was recorded), the rest of the captured frame
+    is skipped, so one difference doesn't put every message after it out of step.
+    """
+
+    name: str
+
+    def __init__(self, replay: Replay, port: str) -> None:
+        """
+        :param replay: The replay this is part of (see ``Replay.transport()``).
+        :param port: The captured port to play back.
+        """
+        self.name = port
+        self.replay = replay
+        self._reader = replay.reader
+        self._position = 0
+        self._closed = False
+        self._pending: deque[tuple[float, MIDITriplet]] = deque()
+        self._condition = threading.Condition()
+        self._callback: Callable[[MIDITriplet], Any] | None = None
+        self._delivery_thread: threading.Thread | None = None
+        # Anything received before the first message was sent is waiting on the port from the start.
+        self._release_replies(monotonic(), None)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def unsent(self) -> int:
+        """
+        :return: How many captured messages haven't been sent yet.
+        """
+        return sum(
+            1
+            for record in self._reader.iter_records(self._position)
+            if record.port == self.name and record.direction == Direction.SENT
+        )
+
+    def _peek(self) -> tuple[int, CaptureRecord] | None:
+        """
+        :return: The next captured record on this port (and its position), without moving past it.
+        """
+        while self._position < len(self._reader):
+            record = self._reader[self._position]
+            if record.port == self.name:
+                return self._position, record
+            self._position += 1
+        return None
+
+    def _release_replies(self, sent_at: float, sent_record: CaptureRecord | None) -> None:
+        """
+        Moves past the received records up to the next sent one, queueing them for delivery.
+
+        :param sent_at: When the message they answer was sent.
+        :param sent_record: The captured message they answer, to time them from (None for no delay).
+        """
+        while (peeked := self._peek()) is not None and peeked[1].direction == Direction.RECEIVED:
+            record = peeked[1]
+            due = sent_at
+            if sent_record is not None and self.replay.speed is not None:
+                due += max(record.timestamp - sent_record.timestamp, 0.0) / self.replay.speed
+            self._queue(due, record.triplet)
+            self._position += 1
+
+    def _diverged(self, position: int | None, expected: MIDITriplet | None, actual: MIDITriplet | None) -> None:
+        divergence = Divergence(self.name, position, expected, actual)
+        log.warning("Replay diverged from the capture", divergence=str(divergence))
+        self.replay.divergences.append(divergence)
+
+    def send_triplet(self, triplet: MIDITriplet) -> None:
+        sent_at = monotonic()
+        peeked = self._peek()
+        if triplet == VFlexProto.COMMAND_START:
+            # Catch up to the next captured frame if the last one sent was cut short.
+            while peeked is not None and peeked[1].triplet != VFlexProto.COMMAND_START:
+                self._diverged(peeked[0], peeked[1].triplet, None)
+                self._position += 1
+                self._release_replies(sent_at, None)
+                peeked = self._peek()
+        if peeked is None:
+            self._diverged(None, None, triplet)
+            return None
+        position, record = peeked
+        if record.triplet == VFlexProto.COMMAND_START and triplet != VFlexProto.COMMAND_START:
+            # Sent more of a frame than was captured: there's nothing to match it against.
+            self._diverged(position, None, triplet)
+            return None
+        if record.triplet != triplet:
+            self._diverged(position, record.triplet, triplet)
+        self._position += 1
+        self._release_replies(sent_at, record)
+        return None
+
+    def _queue(self, due: float, triplet: MIDITriplet) -> None:
+        with self._condition:
+            callback = self._callback
+            if callback is None or self._delivery_thread is not None:
+                self._pending.append((due, triplet))
+                self._condition.notify()
+                return None
+        callback(triplet)
+        return None
+
+    def drain(self) -> list[MIDITriplet]:
+        drained_bytes: list[MIDITriplet] = []
+        with self._condition:
+            if self._callback is not None:
+                return drained_bytes
+            now = monotonic()
+            while self._pending and self._pending[0][0] <= now:
+                drained_bytes.append(self._pending.popleft()[1])
+        return drained_bytes
+
+    def set_callback(self, callback: Callable[[MIDITriplet], Any] | None) -> None:
+        with self._condition:
+            self._callback = callback
+            if callback is None:
+                return None
+            if self.replay.speed is not None:
+                # Replies have to wait until they're due, so they're delivered from a thread.
+                if self._delivery_thread is None:
+                    self._delivery_thread = threading.Thread(target=self._deliver_when_due, name=f"{self.name}-replay")
+                    self._delivery_thread.daemon = True
+                    self._delivery_thread.start()
+                self._condition.notify()
+                return None
+            pending, self._pending = self._pending, deque()
+        for _, triplet in pending:
+            callback(triplet)
+        return None
+
+    def _deliver_when_due(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed and self._callback is not None:
+                    self._condition.wait()
+                if self._closed or self._callback is None:
+                    self._delivery_thread = None
+                    return None
+                due, triplet = self._pending[0]
+                callback = self._callback
+            if (wait := due - monotonic()) > 0:
+                sleep(wait)
+            with self._condition:
+                if self._pending and self._pending[0] == (due, triplet):
+                    self._pending.popleft()
+                else:
+                    continue
+            callback(triplet)
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        return None
+
+    def __repr__(self) -> str:
+        return f"<ReplayTransport {self.name!r} of {self.replay.reader.path}{' (closed)' if self._closed else ''}>"
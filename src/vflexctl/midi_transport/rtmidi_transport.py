@@ -0,0 +1,110 @@
+from collections.abc import Callable
+from typing import Any, cast
+
+import structlog
+
+from vflexctl.types import MIDITriplet
+from .transport import MIDITransport
+
+__all__ = ["RtMidiTransport"]
+
+log = structlog.get_logger("vflexctl.rtmidi_transport")
+
+
+class RtMidiTransport(MIDITransport):
+    """
+    A ``MIDITransport`` straight on top of python-rtmidi's ``MidiIn``/``MidiOut``.
+
+    Messages go out as raw byte sequences (``MidiOut.send_message``) and come in as rtmidi's raw
+    byte lists, so there's no mido ``Message`` built or parsed on either side. Port names are the
+    same as mido's rtmidi backend lists.
+    """
+
+    name: str
+
+    def __init__(self, name: str, *, midi_in: Any = None, midi_out: Any = None) -> None:
+        """
+        :param name: The port name to open, for both input and output.
+        :param midi_in: An rtmidi ``MidiIn`` to use instead of opening one (it should already be open).
+        :param midi_out: An rtmidi ``MidiOut`` to use instead of opening one (it should already be open).
+        """
+        self.name = name
+        self._closed = False
+        if midi_in is None or midi_out is None:
+            import rtmidi
+
+            opened_in = midi_in is None
+            if midi_in is None:
+                midi_in = _open_port(rtmidi.MidiIn(), name)
+            if midi_out is None:
+                try:
+                    midi_out = _open_port(rtmidi.MidiOut(), name)
+                except Exception:
+                    if opened_in:
+                        midi_in.close_port()
+                        midi_in.delete()
+                    raise
+        self._midi_in = midi_in
+        self._midi_out = midi_out
+        # The VFlex doesn't send any of these, but MIDI clock (timing) in particular can turn up on a busy port.
+        self._midi_in.ignore_types(sysex=True, timing=True, active_sense=True)
+
+    @staticmethod
+    def get_ioport_names() -> list[str]:
+        """
+        :return: The names of the ports rtmidi can open for both input and output.
+        """
+        import rtmidi
+
+        midi_in, midi_out = rtmidi.MidiIn(), rtmidi.MidiOut()
+        try:
+            output_names = set(midi_out.get_ports())
+            return [name for name in midi_in.get_ports() if name in output_names]
+        finally:
+            midi_in.delete()
+            midi_out.delete()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def send_triplet(self, triplet: MIDITriplet) -> None:
+        self._midi_out.send_message(triplet)
+
+    def drain(self) -> list[MIDITriplet]:
+        drained_bytes: list[MIDITriplet] = []
+        while (event := self._midi_in.get_message()) is not None:
+            drained_bytes.append(cast(MIDITriplet, tuple(event[0])))
+        return drained_bytes
+
+    def set_callback(self, callback: Callable[[MIDITriplet], Any] | None) -> None:
+        if callback is None:
+            self._midi_in.cancel_callback()
+            return None
+
+        def _on_event(event: tuple[list[int], float], _data: Any) -> None:
+            callback(cast(MIDITriplet, tuple(event[0])))
+
+        self._midi_in.set_callback(_on_event)
+        return None
+
+    def close(self) -> None:
+        if self._closed:
+            return None
+        self._closed = True
+        for port in (self._midi_in, self._midi_out):
+            port.close_port()
+            port.delete()
+        return None
+
+    def __repr__(self) -> str:
+        return f"<RtMidiTransport {self.name!r}{' (closed)' if self._closed else ''}>"
+
+
+def _open_port(midi: Any, name: str) -> Any:
+    ports = midi.get_ports()
+    if name not in ports:
+        midi.delete()
+        raise OSError(f"Unknown port {name!r}")
+    midi.open_port(ports.index(name))
+    return midi
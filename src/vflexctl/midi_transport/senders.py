@@ -1,31 +1,72 @@
+import asyncio
+from collections.abc import Sequence
 from time import sleep
 
 import structlog
 from mido import Message
 from mido.ports import BaseOutput, BaseIOPort
 
+from vflexctl.protocol import VFlexProto
+from vflexctl.protocol.command_framing import MIDI_TRIPLET_FOR_PROTOCOL_BYTE
 from vflexctl.types import MIDITriplet
+from .transport import MIDITransport
 
 DEFAULT_PAUSE_LENGTH = 0.020
 
 log = structlog.get_logger("vflexctl.midi_senders")
 
+# Every MIDI message the VFlex protocol sends, built once. mido messages are immutable, so they're shared.
+_MESSAGES: dict[MIDITriplet, Message] = {
+    triplet: Message.from_bytes(triplet)
+    for triplet in (VFlexProto.COMMAND_START, VFlexProto.COMMAND_END, *MIDI_TRIPLET_FOR_PROTOCOL_BYTE)
+}
 
-def send_sequence(output: BaseOutput, sequence: list[MIDITriplet]) -> None:
+
+def message_for_triplet(triplet_data: MIDITriplet) -> Message:
+    """
+    The mido message for a MIDI triplet, from the prebuilt messages if it's part of the protocol.
+
+    :param triplet_data: The 3 bytes of the message.
+    :return: The message. Don't rely on it being a new object.
+    """
+    try:
+        return _MESSAGES[triplet_data]
+    except (KeyError, TypeError):
+        return Message.from_bytes(triplet_data)
+
+
+def _write(output: BaseOutput | MIDITransport, triplet_data: MIDITriplet) -> None:
+    if isinstance(output, MIDITransport):
+        output.send_triplet(triplet_data)
+    else:
+        output.send(message_for_triplet(triplet_data))
+
+
+def send_sequence(
+    output: BaseOutput | MIDITransport, sequence: Sequence[MIDITriplet], *, pause: float = DEFAULT_PAUSE_LENGTH
+) -> None:
     """
     Send a sequence of MIDI messages to a VFlex adapter. Used to run a command
     after it's been converted from the protocol into a list of MIDI messages.
 
+    The sequence is logged once; each message comes from the prebuilt messages rather than being built
+    (and logged) one by one.
+
     :param output: MIDI output to send the message to/through
     :param sequence: The sequence of MIDI messages to send
+    :param pause: The amount of time to pause after each message
     :return:
     """
-    log.info("Sending MIDI Sequence", sequence=sequence)
+    log.debug("Sending MIDI Sequence", sequence=sequence)
     for command in sequence:
-        send_triplet(output, command)
+        _write(output, command)
+        if pause > 0:
+            sleep(pause)
 
 
-def send_triplet(output: BaseOutput, triplet_data: MIDITriplet, *, pause: float = DEFAULT_PAUSE_LENGTH) -> None:
+def send_triplet(
+    output: BaseOutput | MIDITransport, triplet_data: MIDITriplet, *, pause: float = DEFAULT_PAUSE_LENGTH
+) -> None:
     """
     Send a single 3-byte MIDI message
 
@@ -34,7 +75,40 @@ def send_triplet(output: BaseOutput, triplet_data: MIDITriplet, *, pause: float
     :param pause: The amount of time to pause before returning
     :return:
     """
-    message = Message.from_bytes(triplet_data)
-    log.debug("Sending MIDI message", message=message.bytes(), port_name=output.name, is_output=output.is_output)
-    output.send(message)
+    log.debug("Sending MIDI message", message=triplet_data, port_name=output.name)
+    _write(output, triplet_data)
     sleep(pause)
+
+
+async def async_send_sequence(
+    output: BaseOutput | MIDITransport, sequence: Sequence[MIDITriplet], *, pause: float = DEFAULT_PAUSE_LENGTH
+) -> None:
+    """
+    Same as ``send_sequence()``, but pauses with ``asyncio.sleep()`` so the event loop keeps running
+    (e.g. talking to other devices) in between messages.
+
+    :param output: MIDI output to send the message to/through
+    :param sequence: The sequence of MIDI messages to send
+    :param pause: The amount of time to pause after each message
+    :return:
+    """
+    log.debug("Sending MIDI Sequence", sequence=sequence)
+    for command in sequence:
+        _write(output, command)
+        await asyncio.sleep(pause)
+
+
+async def async_send_triplet(
+    output: BaseOutput | MIDITransport, triplet_data: MIDITriplet, *, pause: float = DEFAULT_PAUSE_LENGTH
+) -> None:
+    """
+    Same as ``send_triplet()``, but pauses with ``asyncio.sleep()``.
+
+    :param output: MIDI output to send the message to/through
+    :param triplet_data: The 3 bytes to send
+    :param pause: The amount of time to pause before returning
+    :return:
+    """
+    log.debug("Sending MIDI message", message=triplet_data, port_name=output.name)
+    _write(output, triplet_data)
+    await asyncio.sleep(pause)
@@ -0,0 +1,85 @@
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from typing import Any, Literal
+
+import mido
+
+from vflexctl.types import MIDITriplet
+
+__all__ = ["MIDITransport", "Backend", "get_ioport_names", "open_ioport"]
+
+# Which library MIDI ports are opened with. "mido" ports pass mido Message objects around; "rtmidi"
+# talks to python-rtmidi directly with raw bytes (see ``RtMidiTransport``).
+type Backend = Literal["mido", "rtmidi"]
+
+
+class MIDITransport(ABC):
+    """
+    A MIDI connection to a VFlex that deals in raw MIDI triplets rather than mido messages.
+
+    ``VFlex`` (and the senders and receivers in ``vflexctl.midi_transport``) accept one anywhere
+    they take a mido I/O port, so a transport can skip mido's message objects entirely, or stand
+    in for a device altogether.
+    """
+
+    name: str
+
+    @property
+    @abstractmethod
+    def closed(self) -> bool: ...
+
+    @abstractmethod
+    def send_triplet(self, triplet: MIDITriplet) -> None:
+        """
+        Sends one MIDI message.
+
+        :param triplet: The 3 bytes to send.
+        """
+
+    @abstractmethod
+    def drain(self) -> list[MIDITriplet]:
+        """
+        Returns every MIDI message received since the last drain, without waiting. Nothing is
+        returned while a callback is set.
+
+        :return: A list of MIDI message bytes
+        """
+
+    @abstractmethod
+    def set_callback(self, callback: Callable[[MIDITriplet], Any] | None) -> None:
+        """
+        Has each received MIDI message passed to ``callback`` (from the backend's thread) instead of
+        being kept for ``drain()``.
+
+        :param callback: Called with each MIDI message received, or None to go back to draining.
+        """
+
+    @abstractmethod
+    def close(self) -> None: ...
+
+
+def get_ioport_names(backend: Backend = "mido") -> list[str]:
+    """
+    :param backend: The backend to list the ports of.
+    :return: The names of the MIDI ports that can be opened for both input and output.
+    """
+    if backend == "rtmidi":
+        from .rtmidi_transport import RtMidiTransport
+
+        return RtMidiTransport.get_ioport_names()
+    return list(mido.get_ioport_names())
+
+
+def open_ioport(name: str, backend: Backend = "mido") -> Any:
+    """
+    Opens a MIDI port for both input and output.
+
+    :param name: The port name.
+    :param backend: The backend to open it with.
+    :return: A mido I/O port, or a ``MIDITransport`` for the "rtmidi" backend.
+    """
+    if backend == "rtmidi":
+        from .rtmidi_transport import RtMidiTransport
+
+        return RtMidiTransport(name)
+    return mido.open_ioport(name)
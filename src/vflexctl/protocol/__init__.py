@@ -1,4 +1,13 @@
 from .protocol import VFlexProto, protocol_message_from_midi_messages
+from .stream_decoder import StreamDecoder, protocol_messages_from_midi_messages, missing_replies
 from .command_framing import prepare_command_frame, prepare_command_for_sending
 
-__all__ = ["VFlexProto", "protocol_message_from_midi_messages", "prepare_command_frame", "prepare_command_for_sending"]
+__all__ = [
+    "VFlexProto",
+    "protocol_message_from_midi_messages",
+    "protocol_messages_from_midi_messages",
+    "missing_replies",
+    "StreamDecoder",
+    "prepare_command_frame",
+    "prepare_command_for_sending",
+]
@@ -1,5 +1,5 @@
 from collections.abc import Iterable
-from typing import cast
+from typing import Final, cast
 
 import structlog
 
@@ -7,7 +7,12 @@ from . import VFlexProto
 from .logger import log
 from ..types import MIDITriplet, VFlexProtoMessage
 
-__all__ = ["prepare_command_frame", "prepare_command_for_sending"]
+__all__ = ["MIDI_TRIPLET_FOR_PROTOCOL_BYTE", "prepare_command_frame", "prepare_command_for_sending"]
+
+# The MIDI message for every protocol byte, built once so encoding is a lookup rather than a new tuple per byte.
+MIDI_TRIPLET_FOR_PROTOCOL_BYTE: Final[tuple[MIDITriplet, ...]] = tuple(
+    (VFlexProto.NOTE_STATUS, (protocol_byte >> 4) & 0x0F, protocol_byte & 0x0F) for protocol_byte in range(0x100)
+)
 
 
 def prepare_command_frame(sub_command: Iterable[int]) -> list[int]:
@@ -37,11 +42,7 @@ def midi_bytes_from_protocol_byte(protocol_byte: int) -> MIDITriplet:
     :param protocol_byte: The protocol byte to send as MIDI
     :return: The MIDI message as bytes
     """
-    return (
-        VFlexProto.NOTE_STATUS,
-        (protocol_byte >> 4) & 0x0F,
-        protocol_byte & 0x0F,
-    )
+    return MIDI_TRIPLET_FOR_PROTOCOL_BYTE[protocol_byte & 0xFF]
 
 
 def prepare_command_for_sending(frames: list[VFlexProtoMessage] | VFlexProtoMessage) -> list[MIDITriplet]:
@@ -60,7 +61,6 @@ def prepare_command_for_sending(frames: list[VFlexProtoMessage] | VFlexProtoMess
 
     command: list[MIDITriplet] = [VFlexProto.COMMAND_START]
     for frame in frames:
-        for byte_integer in frame:
-            command.append(midi_bytes_from_protocol_byte(byte_integer))
+        command.extend(MIDI_TRIPLET_FOR_PROTOCOL_BYTE[byte_integer & 0xFF] for byte_integer in frame)
     command.append(VFlexProto.COMMAND_END)
     return command
@@ -0,0 +1,173 @@
+from collections.abc import Iterable, Iterator
+from typing import Final, cast
+
+from .protocol import VFlexProto, protocol_byte_from_midi_bytes
+from ..types import MIDITriplet
+
+__all__ = ["StreamDecoder", "protocol_messages_from_midi_messages", "missing_replies"]
+
+# The length byte is one protocol byte, so no protocol message can be longer than this.
+MAX_MESSAGE_LENGTH: Final[int] = 0xFF
+
+
+class StreamDecoder:
+    """
+    Incremental decoder for the VFlex protocol.
+
+    MIDI messages are fed in as they arrive (one at a time or in chunks), and each protocol message
+    is handed back as soon as its last byte is in, without waiting for the ``COMMAND_END``. Several
+    length-prefixed messages packed into one ``COMMAND_START``/``COMMAND_END`` envelope come out one
+    by one.
+
+    It recovers from bad input rather than giving up on the stream:
+
+    - a message cut short by a ``COMMAND_END`` or a new ``COMMAND_START`` is dropped;
+    - nibbles outside an envelope, and anything that isn't a note-on (heartbeats, stray statuses), are skipped;
+    - an invalid length byte (below 2) makes the rest of that envelope be skipped.
+
+    Whatever was thrown away is counted in ``bytes_discarded``. Memory use is one fixed-size buffer,
+    however long the stream runs.
+    """
+
+    # Complete protocol messages decoded so far.
+    messages_decoded: int
+
+    # Protocol bytes thrown away (truncated messages, stray nibbles, the rest of corrupt envelopes).
+    bytes_discarded: int
+
+    def __init__(self) -> None:
+        self._buffer = bytearray(MAX_MESSAGE_LENGTH)
+        self._length = 0
+        self._in_envelope = False
+        self._skip_envelope = False
+        # The reply feed_until_reply() has found, while it waits for the end of its envelope.
+        self._reply: list[int] | None = None
+        self.messages_decoded = 0
+        self.bytes_discarded = 0
+
+    @property
+    def in_message(self) -> bool:
+        """
+        Whether part of a protocol message has been received, and the rest is still to come.
+        """
+        return self._length > 0
+
+    def reset(self) -> None:
+        """
+        Forgets any partly received message and envelope (the counters are kept).
+        """
+        self.bytes_discarded += self._length
+        self._length = 0
+        self._in_envelope = False
+        self._skip_envelope = False
+
+    def push(self, midi_message: MIDITriplet) -> list[int] | None:
+        """
+        Feeds one MIDI message to the decoder.
+
+        :param midi_message: The MIDI message received.
+        :return: The protocol message it completed, if any.
+        """
+        midi_message = cast(MIDITriplet, tuple(midi_message))
+        if midi_message == VFlexProto.COMMAND_START:
+            self.reset()
+            self._in_envelope = True
+            return None
+        if midi_message == VFlexProto.COMMAND_END:
+            self.reset()
+            return None
+        if len(midi_message) != 3 or midi_message[0] != VFlexProto.NOTE_STATUS:
+            return None
+        if not self._in_envelope or self._skip_envelope:
+            self.bytes_discarded += 1
+            return None
+
+        protocol_byte = protocol_byte_from_midi_bytes(midi_message)
+        if self._length == 0 and protocol_byte < 2:
+            # A message is at least its length and command bytes, so this envelope can't be trusted.
+            self.bytes_discarded += 1
+            self._skip_envelope = True
+            return None
+        self._buffer[self._length] = protocol_byte
+        self._length += 1
+        if self._length < self._buffer[0]:
+            return None
+        protocol_message = list(self._buffer[: self._length])
+        self._length = 0
+        self.messages_decoded += 1
+        return protocol_message
+
+    def feed(self, midi_messages: Iterable[MIDITriplet]) -> list[list[int]]:
+        """
+        Feeds a chunk of MIDI messages (e.g. everything from one drain) to the decoder.
+
+        :param midi_messages: The MIDI messages received.
+        :return: The protocol messages completed, in order.
+        """
+        return [protocol_message for protocol_message in map(self.push, midi_messages) if protocol_message is not None]
+
+    def feed_until_reply(
+        self, midi_messages: Iterable[MIDITriplet], command_byte: int | None = None
+    ) -> list[int] | None:
+        """
+        Feeds MIDI messages to the decoder until a reply to a command has arrived, along with the
+        ``COMMAND_END`` of its envelope. Replies to other commands (e.g. stale ones still waiting on the
+        port) are decoded and thrown away on the way.
+
+        :param midi_messages: The MIDI messages received.
+        :param command_byte: The command byte (proto[1]) the reply should have. If None, any protocol message counts.
+        :return: The reply's protocol message, or None if it isn't complete yet. Anything after it isn't fed.
+        """
+        for midi_message in midi_messages:
+            midi_message = cast(MIDITriplet, tuple(midi_message))
+            if midi_message == VFlexProto.COMMAND_START:
+                self._reply = None
+            elif midi_message == VFlexProto.COMMAND_END and self._reply is not None:
+                reply, self._reply = self._reply, None
+                self.push(midi_message)
+                return reply
+            protocol_message = self.push(midi_message)
+            if protocol_message is not None and self._reply is None:
+                if command_byte is None or protocol_message[1] == command_byte:
+                    self._reply = protocol_message
+        return None
+
+    def iter_decode(self, midi_messages: Iterable[MIDITriplet]) -> Iterator[list[int]]:
+        """
+        Decodes a (possibly endless) stream of MIDI messages lazily, yielding each protocol message
+        as soon as it's complete.
+
+        :param midi_messages: The MIDI messages, in the order they arrive.
+        :return: An iterator of protocol messages.
+        """
+        for midi_message in midi_messages:
+            protocol_message = self.push(midi_message)
+            if protocol_message is not None:
+                yield protocol_message
+
+
+def protocol_messages_from_midi_messages(midi_messages: list[MIDITriplet]) -> list[list[int]]:
+    """
+    Decode every complete protocol message in a list of received MIDI messages.
+
+    Unlike ``protocol_message_from_midi_messages``, this handles several ``COMMAND_START``/``COMMAND_END``
+    envelopes, and several length-prefixed messages packed back to back inside one envelope (which is
+    how a batch of commands is sent, see ``prepare_command_for_sending``). Incomplete messages, and
+    anything outside an envelope, are skipped.
+
+    :param midi_messages: The MIDI messages to decode.
+    :return: The protocol messages, in the order they arrived.
+    """
+    return StreamDecoder().feed(midi_messages)
+
+
+def missing_replies(midi_messages: list[MIDITriplet], command_bytes: Iterable[int]) -> set[int]:
+    """
+    Find which of the expected replies haven't fully arrived yet.
+
+    :param midi_messages: The MIDI messages received so far.
+    :param command_bytes: The command bytes (proto[1]) of the replies expected.
+    :return: The command bytes with no complete protocol message among ``midi_messages``.
+    """
+    received = {protocol_message[1] for protocol_message in protocol_messages_from_midi_messages(midi_messages)}
+    return set(command_bytes) - received
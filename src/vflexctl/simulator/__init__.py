@@ -0,0 +1,12 @@
+"""
+A simulated VFlex, for running (and benchmarking) the rest of vflexctl without the hardware.
+
+``SimulatedVFlex`` is an in-process mido port, so it can be handed straight to ``VFlex(...)``.
+``VirtualVFlex`` puts the same simulated device behind a virtual MIDI port (where the MIDI backend
+supports them), so code that finds the device by port name, like ``VFlex.get_any()``, runs unchanged.
+"""
+
+from .device import SimulatedDevice, SimulatedVFlex
+from .virtual_port import VirtualVFlex
+
+__all__ = ["SimulatedDevice", "SimulatedVFlex", "VirtualVFlex"]
@@ -0,0 +1,202 @@
+import queue
+import threading
+from collections import Counter
+from collections.abc import Callable
+from time import monotonic, sleep
+from typing import Any
+
+from mido import Message
+from mido.ports import BaseIOPort
+
+from vflexctl.command.led import LEDColour
+from vflexctl.protocol import StreamDecoder, VFlexProto, prepare_command_for_sending
+from vflexctl.types import MIDITriplet
+
+__all__ = ["SimulatedDevice", "SimulatedVFlex"]
+
+DEFAULT_PORT_NAME = "Werewolf vFlex"
+
+
+class SimulatedDevice:
+    """
+    The protocol side of a simulated VFlex: its state, and the replies it gives to each command.
+
+    It answers the serial number, hardware revision, firmware version, voltage, LED state and LED colour
+    commands in ``VFlexProto``. Each reply is sent in its own ``COMMAND_START``/``COMMAND_END``
+    envelope, and sets are answered with the matching get (a set voltage returns the voltage, as the
+    real device does). Setting the LED colour isn't answered, and is ignored before APP.05.00.00.
+
+    Timing is modelled as a device that handles one command at a time: each command takes
+    ``byte_delay`` seconds per protocol byte to process, and its reply arrives ``response_latency``
+    seconds after that.
+    """
+
+    serial_number: str
+    firmware_version: str
+    hardware_revision: str
+    millivolts: int
+    led_state: bool
+    led_colour: LEDColour
+
+    # Seconds between a command being processed and its reply arriving.
+    response_latency: float
+
+    # Seconds the device spends on each protocol byte of a command.
+    byte_delay: float
+
+    # How many of each command (by command byte) the device has received.
+    command_counts: Counter[int]
+
+    def __init__(
+        self,
+        *,
+        serial_number: str = "SIM00001",
+        firmware_version: str = "APP.05.00.00",
+        hardware_revision: str = "HW.01",
+        millivolts: int = 5000,
+        led_state: bool = False,
+        led_colour: LEDColour = LEDColour.WHITE,
+        response_latency: float = 0.0,
+        byte_delay: float = 0.0,
+    ) -> None:
+        if len(serial_number.encode()) != 8 or len(firmware_version.encode()) != 12:
+            raise ValueError("Serial numbers are 8 bytes long, and firmware versions 12 (APP.XX.XX.XX).")
+        self.serial_number = serial_number
+        self.firmware_version = firmware_version
+        self.hardware_revision = hardware_revision
+        self.millivolts = millivolts
+        self.led_state = led_state
+        self.led_colour = led_colour
+        self.response_latency = response_latency
+        self.byte_delay = byte_delay
+        self.command_counts = Counter()
+        self._decoder = StreamDecoder()
+        self._busy_until = 0.0
+
+    @property
+    def supports_led_colour(self) -> bool:
+        return int(self.firmware_version.split(".")[1]) >= 5
+
+    def reply_to(self, protocol_message: list[int]) -> list[int] | None:
+        """
+        Runs one command on the device.
+
+        :param protocol_message: The command, with its length byte.
+        :return: The reply protocol message, or None if the command isn't answered.
+        """
+        command_byte = protocol_message[1]
+        self.command_counts[command_byte] += 1
+        match command_byte:
+            case VFlexProto.CMD_GET_SERIAL_NUMBER:
+                return _reply(command_byte, self.serial_number.encode())
+            case VFlexProto.CMD_GET_HARDWARE_REVISION:
+                return _reply(command_byte, self.hardware_revision.encode())
+            case VFlexProto.CMD_GET_FIRMWARE_VERSION:
+                return _reply(command_byte, self.firmware_version.encode())
+            case VFlexProto.CMD_SET_VOLTAGE if len(protocol_message) >= 4:
+                self.millivolts = protocol_message[2] << 8 | protocol_message[3]
+                return self.reply_to([2, VFlexProto.CMD_GET_VOLTAGE])
+            case VFlexProto.CMD_GET_VOLTAGE:
+                return _reply(command_byte, [self.millivolts >> 8 & 0xFF, self.millivolts & 0xFF])
+            case VFlexProto.CMD_SET_LED_STATE if len(protocol_message) >= 3:
+                self.led_state = bool(protocol_message[2])
+                return self.reply_to([2, VFlexProto.CMD_GET_LED_STATE])
+            case VFlexProto.CMD_GET_LED_STATE:
+                return _reply(command_byte, [int(self.led_state)])
+            case VFlexProto.CMD_SET_LED_COLOUR if len(protocol_message) >= 5:
+                if self.supports_led_colour:
+                    self.led_colour = LEDColour(protocol_message[4])
+                return None
+            case VFlexProto.CMD_GET_LED_COLOUR:
+                return _reply(command_byte, [int(self.led_colour)])
+        return None
+
+    def receive(self, midi_message: MIDITriplet) -> tuple[float, list[MIDITriplet]] | None:
+        """
+        Feeds one MIDI message from the host to the device.
+
+        :param midi_message: The MIDI message sent to the device.
+        :return: When the reply is due (a ``monotonic()`` time) and its MIDI messages, if the message
+            completed a command that gets a reply.
+        """
+        protocol_message = self._decoder.push(midi_message)
+        if protocol_message is None:
+            return None
+        reply = self.reply_to(protocol_message)
+        self._busy_until = max(monotonic(), self._busy_until) + self.byte_delay * len(protocol_message)
+        if reply is None:
+            return None
+        return self._busy_until + self.response_latency, prepare_command_for_sending(reply)
+
+
+def _reply(command_byte: int, data: bytes | list[int]) -> list[int]:
+    return [len(data) + 2, command_byte, *data]
+
+
+class SimulatedVFlex(BaseIOPort):  # type: ignore[misc]
+    """
+    An in-process mido I/O port with a simulated VFlex on the other end. Pass it to ``VFlex(...)``
+    like a real port. Replies can be read with ``iter_pending()``/``receive()``, or through a
+    ``callback`` (so ``event_driven=True`` works too).
+
+    With no delays, replies are ready as soon as ``send()`` returns. Otherwise they're delivered from
+    a background thread when due.
+    """
+
+    # Called with each reply message instead of queueing it, like mido's rtmidi ports.
+    callback: Callable[[Message], Any] | None = None
+
+    def __init__(
+        self, name: str = DEFAULT_PORT_NAME, *, device: SimulatedDevice | None = None, **device_kwargs: Any
+    ) -> None:
+        """
+        :param name: The port name.
+        :param device: The simulated device. Made from ``device_kwargs`` (see ``SimulatedDevice``) if not given.
+        """
+        self.device = device if device is not None else SimulatedDevice(**device_kwargs)
+        self._replies: queue.Queue[tuple[float, list[MIDITriplet]] | None] = queue.Queue()
+        self._delivery_thread: threading.Thread | None = None
+        super().__init__(name)
+
+    def _send(self, msg: Message) -> None:
+        reply = self.device.receive(tuple(msg.bytes()))
+        if reply is None:
+            return None
+        due, midi_messages = reply
+        if due <= monotonic() and self._delivery_thread is None:
+            self._deliver(midi_messages)
+            return None
+        if self._delivery_thread is None:
+            self._delivery_thread = threading.Thread(target=self._deliver_when_due, name=f"{self.name}-replies")
+            self._delivery_thread.daemon = True
+            self._delivery_thread.start()
+        self._replies.put(reply)
+        return None
+
+    def _receive(self, block: bool = True) -> None:
+        # Replies are queued (or handed to the callback) as they're delivered.
+        return None
+
+    def _deliver(self, midi_messages: list[MIDITriplet]) -> None:
+        messages = [Message.from_bytes(list(triplet)) for triplet in midi_messages]
+        callback = self.callback
+        if callback is not None:
+            for message in messages:
+                callback(message)
+            return None
+        with self._lock:
+            self._messages.extend(messages)
+        return None
+
+    def _deliver_when_due(self) -> None:
+        while (reply := self._replies.get()) is not None:
+            due, midi_messages = reply
+            if (wait := due - monotonic()) > 0:
+                sleep(wait)
+            if not self.closed:
+                self._deliver(midi_messages)
+
+    def _close(self) -> None:
+        if self._delivery_thread is not None:
+            self._replies.put(None)
+            self._delivery_thread = None
@@ -0,0 +1,74 @@
+from types import TracebackType
+from typing import Any, Self
+
+import mido
+from mido.ports import BaseIOPort
+
+from .device import DEFAULT_PORT_NAME, SimulatedDevice, SimulatedVFlex
+
+__all__ = ["VirtualVFlex"]
+
+
+class VirtualVFlex:
+    """
+    A simulated VFlex behind a virtual MIDI port, so other processes (including ``vflexctl`` itself)
+    find it and talk to it like a real device, e.g. ``vflexctl read`` (or ``vflexctl --serial SIM00001 read``,
+    with the default serial number).
+
+    This needs a mido backend with virtual ports (rtmidi on Linux or macOS). For in-process use,
+    ``SimulatedVFlex`` doesn't need any MIDI backend at all.
+    """
+
+    name: str
+    device: SimulatedDevice
+
+    def __init__(self, name: str = DEFAULT_PORT_NAME, *, device: SimulatedDevice | None = None, **device_kwargs: Any):
+        """
+        :param name: The name of the virtual port.
+        :param device: The simulated device. Made from ``device_kwargs`` (see ``SimulatedDevice``) if not given.
+        """
+        self.name = name
+        self.device = device if device is not None else SimulatedDevice(**device_kwargs)
+        self._port: BaseIOPort | None = None
+        self._simulated: SimulatedVFlex | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._port is not None
+
+    def open(self) -> Self:
+        """
+        Opens the virtual port and starts answering commands sent to it.
+
+        :return: This VirtualVFlex.
+        :raises RuntimeError: The MIDI backend can't make virtual ports.
+        """
+        if self._port is not None:
+            return self
+        try:
+            port = mido.open_ioport(self.name, virtual=True)
+        except (NotImplementedError, OSError, IOError) as e:
+            raise RuntimeError(f"Couldn't open a virtual MIDI port (the MIDI backend may not support them): {e}") from e
+        simulated = SimulatedVFlex(self.name, device=self.device)
+        simulated.callback = port.send
+        getattr(port, "input", port).callback = simulated.send
+        self._port = port
+        self._simulated = simulated
+        return self
+
+    def close(self) -> None:
+        if self._port is not None:
+            getattr(self._port, "input", self._port).callback = None
+            self._port.close()
+            self._port = None
+        if self._simulated is not None:
+            self._simulated.close()
+            self._simulated = None
+
+    def __enter__(self) -> Self:
+        return self.open()
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.close()
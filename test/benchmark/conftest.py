@@ -0,0 +1,159 @@
+"""
+Benchmarks for the VFlex command paths. They're skipped unless ``VFLEXCTL_BENCHMARK=1`` is set:
+
+    VFLEXCTL_BENCHMARK=1 pytest test/benchmark
+
+Each benchmark records the wall-clock time and CPU time per operation (median and best of the
+rounds), and the peak allocation for one run. The results are written to ``.benchmarks/latest.json``. With ``VFLEXCTL_BENCHMARK_SAVE=1`` they're
+also saved as the baseline (``.benchmarks/baseline.json``, or ``VFLEXCTL_BENCHMARK_BASELINE``). When
+there's a baseline, a best time or peak allocation more than ``VFLEXCTL_BENCHMARK_THRESHOLD`` (default 0.25, i.e. 25%)
+over it fails the benchmark.
+
+Baselines depend on the machine, so they aren't committed; make one on a known-good commit first.
+"""
+
+import json
+import logging
+import os
+import statistics
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from time import perf_counter, process_time
+from typing import Any
+
+import pytest
+import structlog
+
+BENCHMARK_DIR = Path(__file__).resolve().parents[2] / ".benchmarks"
+
+# Regressions are judged on the best round, which is much less noisy than the median on a busy machine.
+# Timings below this are noise (timer resolution, scheduling), so regressions under it aren't flagged.
+NOISE_FLOOR_SECONDS = 0.000_005
+NOISE_FLOOR_BYTES = 256
+
+# A benchmark that looks like it regressed is measured again (adding to its rounds) this many times
+# before it fails, so a burst of load on the machine doesn't fail it on its own.
+REMEASURE_ATTEMPTS = 2
+
+
+def _enabled() -> bool:
+    return os.environ.get("VFLEXCTL_BENCHMARK", "") not in ("", "0")
+
+
+def _baseline_file() -> Path:
+    return Path(os.environ.get("VFLEXCTL_BENCHMARK_BASELINE", BENCHMARK_DIR / "baseline.json"))
+
+
+def _threshold() -> float:
+    return float(os.environ.get("VFLEXCTL_BENCHMARK_THRESHOLD", "0.25"))
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    if _enabled():
+        return
+    skip = pytest.mark.skip(reason="Benchmarks only run with VFLEXCTL_BENCHMARK=1")
+    benchmark_dir = Path(__file__).parent
+    for item in items:
+        if benchmark_dir in item.path.parents:
+            item.add_marker(skip)
+
+
+class Benchmark:
+    """
+    Measures one operation: ``rounds`` timed runs (after ``warmup`` untimed ones), then one more run
+    under ``tracemalloc`` for the allocations, so tracing doesn't slow down the timed runs.
+    """
+
+    def __init__(self, results: dict[str, dict[str, Any]], baseline: dict[str, dict[str, Any]], name: str) -> None:
+        self.results = results
+        self.baseline = baseline
+        self.name = name
+
+    def __call__(self, operation: Callable[[], Any], *, rounds: int = 200, warmup: int = 5) -> dict[str, Any]:
+        for _ in range(warmup):
+            operation()
+        wall_times: list[float] = []
+        cpu_times: list[float] = []
+        for attempt in range(1 + REMEASURE_ATTEMPTS):
+            self._time(operation, rounds, wall_times, cpu_times)
+            result = {
+                "rounds": len(wall_times),
+                "wall_seconds": statistics.median(wall_times),
+                "cpu_seconds": statistics.median(cpu_times),
+                "best_wall_seconds": min(wall_times),
+                "best_cpu_seconds": min(cpu_times),
+                "peak_alloc_bytes": self._peak_allocation(operation),
+            }
+            regressions = self._regressions(result)
+            if not regressions:
+                break
+        self.results[self.name] = result
+        if regressions:
+            pytest.fail(f"{self.name} regressed more than {_threshold():.0%}: " + "; ".join(regressions))
+        return result
+
+    @staticmethod
+    def _time(operation: Callable[[], Any], rounds: int, wall_times: list[float], cpu_times: list[float]) -> None:
+        for _ in range(rounds):
+            wall_start, cpu_start = perf_counter(), process_time()
+            operation()
+            cpu_times.append(process_time() - cpu_start)
+            wall_times.append(perf_counter() - wall_start)
+
+    @staticmethod
+    def _peak_allocation(operation: Callable[[], Any]) -> int:
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return peak - before
+
+    def _regressions(self, result: dict[str, Any]) -> list[str]:
+        baseline = self.baseline.get(self.name)
+        if baseline is None:
+            return []
+        threshold = _threshold()
+        regressions = []
+        for metric, floor in (
+            ("best_wall_seconds", NOISE_FLOOR_SECONDS),
+            ("best_cpu_seconds", NOISE_FLOOR_SECONDS),
+            ("peak_alloc_bytes", NOISE_FLOOR_BYTES),
+        ):
+            limit = max(baseline[metric] * (1 + threshold), baseline[metric] + floor)
+            if result[metric] > limit:
+                regressions.append(f"{metric}: {result[metric]:.6g} (baseline {baseline[metric]:.6g})")
+        return regressions
+
+
+@pytest.fixture(scope="session")
+def benchmark_results() -> Any:
+    baseline_file = _baseline_file()
+    baseline = json.loads(baseline_file.read_text()) if baseline_file.exists() else {}
+    results: dict[str, dict[str, Any]] = {}
+    yield results, baseline
+    if not results:
+        return
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    (BENCHMARK_DIR / "latest.json").write_text(json.dumps(results, indent=2, sort_keys=True))
+    if os.environ.get("VFLEXCTL_BENCHMARK_SAVE", "") not in ("", "0"):
+        baseline_file.parent.mkdir(parents=True, exist_ok=True)
+        baseline_file.write_text(json.dumps(baseline | results, indent=2, sort_keys=True))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def quiet_logging() -> Any:
+    """Log at the CLI's default level, so benchmarks don't measure debug logging to the terminal."""
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    yield
+    structlog.reset_defaults()
+
+
+@pytest.fixture
+def benchmark(request: pytest.FixtureRequest, benchmark_results: Any) -> Benchmark:
+    results, baseline = benchmark_results
+    return Benchmark(results, baseline, request.node.name)
@@ -0,0 +1,69 @@
+from vflexctl.command.led import set_led_state_command
+from vflexctl.command.voltage import get_voltage_command, set_voltage_command
+from vflexctl.protocol import (
+    StreamDecoder,
+    VFlexProto,
+    prepare_command_for_sending,
+    prepare_command_frame,
+    protocol_message_from_midi_messages,
+    protocol_messages_from_midi_messages,
+)
+from vflexctl.protocol.coders import (
+    get_millivolts_from_protocol_message,
+    protocol_decode_firmware_version,
+    protocol_decode_led_state,
+    protocol_decode_serial_number,
+)
+
+SERIAL_NUMBER_REPLY = [10, VFlexProto.CMD_GET_SERIAL_NUMBER, *b"BENCH001"]
+FIRMWARE_VERSION_REPLY = [14, VFlexProto.CMD_GET_FIRMWARE_VERSION, *b"APP.05.00.00"]
+VOLTAGE_REPLY = [4, VFlexProto.CMD_GET_VOLTAGE, 0x2E, 0xE0]
+LED_STATE_REPLY = [3, VFlexProto.CMD_GET_LED_STATE, 1]
+
+
+def test_encode_set_voltage(benchmark):
+    benchmark(lambda: prepare_command_for_sending(prepare_command_frame(set_voltage_command(12000))))
+
+
+def test_encode_set_led_state(benchmark):
+    benchmark(lambda: prepare_command_for_sending(prepare_command_frame(set_led_state_command(True))))
+
+
+def test_encode_batch(benchmark):
+    commands = [get_voltage_command(), [VFlexProto.CMD_GET_LED_STATE], [VFlexProto.CMD_GET_SERIAL_NUMBER]]
+    benchmark(lambda: prepare_command_for_sending([prepare_command_frame(command) for command in commands]))
+
+
+def test_decode_voltage_reply(benchmark):
+    midi_messages = prepare_command_for_sending(VOLTAGE_REPLY)
+    benchmark(lambda: get_millivolts_from_protocol_message(protocol_message_from_midi_messages(midi_messages)))
+
+
+def test_decode_serial_number_reply(benchmark):
+    midi_messages = prepare_command_for_sending(SERIAL_NUMBER_REPLY)
+    benchmark(lambda: protocol_decode_serial_number(protocol_message_from_midi_messages(midi_messages)))
+
+
+def test_decode_firmware_version_reply(benchmark):
+    midi_messages = prepare_command_for_sending(FIRMWARE_VERSION_REPLY)
+    benchmark(lambda: protocol_decode_firmware_version(protocol_message_from_midi_messages(midi_messages)))
+
+
+def test_decode_led_state_reply(benchmark):
+    midi_messages = prepare_command_for_sending(LED_STATE_REPLY)
+    benchmark(lambda: protocol_decode_led_state(protocol_message_from_midi_messages(midi_messages)))
+
+
+def test_decode_batch_replies(benchmark):
+    midi_messages = [
+        triplet
+        for reply in (SERIAL_NUMBER_REPLY, VOLTAGE_REPLY, LED_STATE_REPLY)
+        for triplet in prepare_command_for_sending(reply)
+    ]
+    benchmark(lambda: protocol_messages_from_midi_messages(midi_messages))
+
+
+def test_stream_decoder_push(benchmark):
+    decoder = StreamDecoder()
+    midi_messages = prepare_command_for_sending(SERIAL_NUMBER_REPLY)
+    benchmark(lambda: decoder.feed(midi_messages))
@@ -0,0 +1,36 @@
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.midi_transport.capture import CaptureWriter
+from vflexctl.midi_transport.replay import Replay
+from vflexctl.simulator import SimulatedVFlex
+
+VOLTAGES = [5000, 9000, 12000, 15000, 20000]
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """A captured session: a wake-up, then a sweep through some voltages."""
+    monkeypatch.setattr("vflexctl.device_interface.vflex.DEFAULT_PAUSE_LENGTH", 0.0)
+    path = tmp_path / "session.vcap"
+    with CaptureWriter(path) as capture:
+        v_flex = VFlex(SimulatedVFlex(serial_number="BENCH001"), wake=True, capture=capture)
+        for millivolts in VOLTAGES:
+            v_flex.set_voltage(millivolts)
+        v_flex.close()
+    return path
+
+
+def _replay_session(path):
+    with Replay(path) as replay:
+        v_flex = VFlex(replay.transport())
+        v_flex.use_tuned_pacing = False
+        v_flex.pause_length = 0
+        v_flex.initial_wake_up()
+        for millivolts in VOLTAGES:
+            v_flex.set_voltage(millivolts)
+        assert replay.matched
+
+
+def test_replay_session(benchmark, session):
+    benchmark(lambda: _replay_session(session), rounds=100)
@@ -0,0 +1,77 @@
+"""
+Per-message overhead of the mido path against the direct rtmidi transport. The MIDI drivers are
+replaced with no-ops, so only vflexctl's and mido's own work is measured.
+"""
+
+import mido
+import pytest
+from mido.ports import BaseIOPort
+
+from vflexctl.midi_transport.receivers import drain_once
+from vflexctl.midi_transport.rtmidi_transport import RtMidiTransport
+from vflexctl.midi_transport.senders import send_sequence
+from vflexctl.protocol import VFlexProto, prepare_command_for_sending
+
+SEQUENCE = prepare_command_for_sending([10, VFlexProto.CMD_GET_SERIAL_NUMBER, *b"BENCH001"])
+
+
+class NullPort(BaseIOPort):
+    def _send(self, msg):
+        pass
+
+    def _receive(self, block=True):
+        pass
+
+
+class NullMidiIn:
+    def __init__(self):
+        self.queued = []
+
+    def ignore_types(self, **kwargs):
+        pass
+
+    def get_message(self):
+        return (self.queued.pop(), 0.0) if self.queued else None
+
+
+class NullMidiOut:
+    def send_message(self, data):
+        pass
+
+
+@pytest.fixture
+def mido_port():
+    return NullPort("bench")
+
+
+@pytest.fixture
+def transport():
+    return RtMidiTransport("bench", midi_in=NullMidiIn(), midi_out=NullMidiOut())
+
+
+def test_send_sequence_mido(benchmark, mido_port):
+    benchmark(lambda: send_sequence(mido_port, SEQUENCE, pause=0), rounds=500)
+
+
+def test_send_sequence_rtmidi_transport(benchmark, transport):
+    benchmark(lambda: send_sequence(transport, SEQUENCE, pause=0), rounds=500)
+
+
+def test_drain_once_mido(benchmark, mido_port):
+    messages = [mido.Message.from_bytes(list(triplet)) for triplet in SEQUENCE]
+
+    def _drain():
+        mido_port._messages.extend(messages)
+        return drain_once(mido_port)
+
+    benchmark(_drain, rounds=500)
+
+
+def test_drain_once_rtmidi_transport(benchmark, transport):
+    raw = [list(triplet) for triplet in reversed(SEQUENCE)]
+
+    def _drain():
+        transport._midi_in.queued.extend(raw)
+        return drain_once(transport)
+
+    benchmark(_drain, rounds=500)
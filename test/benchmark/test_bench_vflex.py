@@ -0,0 +1,37 @@
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.simulator import SimulatedVFlex
+
+
+@pytest.fixture
+def v_flex(monkeypatch):
+    """
+    A woken VFlex on a simulated device with no latency and no pauses between MIDI messages, so
+    the benchmarks measure vflexctl's own overhead rather than sleeps.
+    """
+    monkeypatch.setattr("vflexctl.device_interface.vflex.DEFAULT_PAUSE_LENGTH", 0.0)
+    port = SimulatedVFlex(serial_number="BENCH001")
+    v_flex = VFlex(port, wake=True)
+    yield v_flex
+    v_flex.close()
+
+
+def test_vflex_wake_up(benchmark, v_flex):
+    benchmark(lambda: v_flex.wake_up(full_handshake=True), rounds=100)
+
+
+def test_vflex_get_voltage(benchmark, v_flex):
+    benchmark(v_flex.get_voltage, rounds=100)
+
+
+def test_vflex_set_voltage(benchmark, v_flex):
+    benchmark(lambda: v_flex.set_voltage(12000), rounds=100)
+
+
+def test_vflex_set_led_state(benchmark, v_flex):
+    benchmark(lambda: v_flex.set_led_state(True), rounds=100)
+
+
+def test_vflex_read(benchmark, v_flex):
+    benchmark(v_flex.read, rounds=100)
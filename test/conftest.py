@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_app_data_dir(tmp_path, monkeypatch):
+    """Keep tests away from the real on-disk state (tuned pacing etc.)."""
+    data_dir = tmp_path / "vflexctl-data"
+    monkeypatch.setenv("VFLEXCTL_DATA_DIR", str(data_dir))
+    yield data_dir
@@ -0,0 +1,176 @@
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from vflexctl.daemon.client import DaemonClient, DaemonError, RemoteVFlex
+from vflexctl.daemon.server import VFlexDaemon
+from vflexctl.device_interface import VFlex
+from vflexctl.exceptions import SerialNumberMismatchError
+from vflexctl.metrics import Metrics
+from vflexctl.simulator import SimulatedDevice, SimulatedVFlex
+
+
+@pytest.fixture
+def fake_device(mocker):
+    mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    # No batched replies, so every query falls back to one command at a time.
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_replies", return_value=[])
+    mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
+    mocker.patch("vflexctl.device_interface.core.get_millivolts_from_protocol_message", return_value=5000)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=False)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_firmware_version", return_value="APP.05.00.00")
+    yield mocker.patch("vflexctl.device_interface.core.protocol_decode_serial_number", return_value="fooSerial")
+
+
+@pytest.fixture
+def v_flex_factory(mocker):
+    yield mocker.MagicMock(side_effect=lambda: VFlex(mocker.MagicMock(name="io_port")))
+
+
+@pytest.fixture
+def running_daemon(tmp_path, v_flex_factory):
+    daemon = VFlexDaemon(tmp_path / "d.sock", v_flex_factory=v_flex_factory)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not daemon.socket_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield daemon
+    daemon.shutdown()
+    thread.join()
+
+
+def test_daemon_keeps_one_warm_v_flex_across_requests(fake_device, v_flex_factory, tmp_path):
+    daemon = VFlexDaemon(tmp_path / "d.sock", v_flex_factory=v_flex_factory)
+
+    first = daemon.handle_request({"method": "ensure_awake"})
+    second = daemon.handle_request({"method": "set_voltage_volts", "params": {"volts": 5}})
+
+    assert first["ok"] and second["ok"]
+    assert second["state"]["serial_number"] == "fooSerial"
+    assert second["state"]["current_voltage"] == 5000
+    v_flex_factory.assert_called_once()
+    assert daemon.v_flex.handshake_ttl == daemon.handshake_ttl
+
+
+def test_daemon_rejects_unknown_methods(fake_device, v_flex_factory, tmp_path):
+    daemon = VFlexDaemon(tmp_path / "d.sock", v_flex_factory=v_flex_factory)
+
+    response = daemon.handle_request({"method": "close"})
+
+    assert response == {"ok": False, "error": "InvalidRequest", "message": "Unknown method or bad params: 'close'"}
+    v_flex_factory.assert_not_called()
+
+
+def test_daemon_drops_the_v_flex_after_a_failure(mocker, fake_device, v_flex_factory, tmp_path):
+    daemon = VFlexDaemon(tmp_path / "d.sock", v_flex_factory=v_flex_factory)
+    daemon.handle_request({"method": "ensure_awake"})
+    mocker.patch.object(daemon.v_flex, "read", side_effect=OSError("port gone"))
+
+    response = daemon.handle_request({"method": "read"})
+
+    assert response["ok"] is False
+    assert response["error"] == "OSError"
+    assert daemon.v_flex is None
+
+
+def test_daemon_keeps_the_v_flex_after_a_safety_check_fails(mocker, fake_device, v_flex_factory, tmp_path):
+    daemon = VFlexDaemon(tmp_path / "d.sock", v_flex_factory=v_flex_factory)
+    daemon.handle_request({"method": "ensure_awake"})
+    daemon.v_flex.expire_handshake()
+    fake_device.return_value = "barSerial"
+
+    response = daemon.handle_request({"method": "set_voltage", "params": {"millivolts": 12000}})
+
+    assert response["error"] == SerialNumberMismatchError.__name__
+    assert daemon.v_flex is not None
+
+
+def test_remote_v_flex_runs_calls_in_the_daemon_and_mirrors_state(fake_device, running_daemon):
+    remote = RemoteVFlex(DaemonClient(running_daemon.socket_path))
+    try:
+        remote.ensure_awake()
+        assert remote.serial_number == "fooSerial"
+        assert remote.led_state_str == "always on"
+
+        remote.set_led_colour(3)
+        remote.set_voltage_volts(5.0)
+        assert remote.current_voltage == 5000
+
+        with pytest.raises(DaemonError) as exc:
+            remote.client.request("nope")
+        assert exc.value.error_type == "InvalidRequest"
+    finally:
+        remote.close()
+
+
+def test_daemon_socket_is_private_and_removed_on_shutdown(fake_device, running_daemon):
+    socket_path = running_daemon.socket_path
+    assert socket_path.stat().st_mode & 0o777 == 0o600
+    running_daemon.shutdown()
+    deadline = time.monotonic() + 5
+    while socket_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not socket_path.exists()
+
+
+def test_daemon_socket_is_private_from_the_moment_it_is_bound(mocker, tmp_path, v_flex_factory):
+    server_bind = socketserver.UnixStreamServer.server_bind
+    modes = []
+
+    def _server_bind(server):
+        server_bind(server)
+        modes.append(os.stat(server.server_address).st_mode & 0o777)
+        raise RuntimeError("Stop after binding")
+
+    mocker.patch.object(socketserver.UnixStreamServer, "server_bind", _server_bind)
+    previous_umask = os.umask(0o022)
+    try:
+        with pytest.raises(RuntimeError):
+            VFlexDaemon(tmp_path / "d.sock", v_flex_factory=v_flex_factory).serve_forever()
+        # The process's own umask is left as it was.
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(previous_umask)
+    assert modes == [0o600]
+
+
+def test_daemon_refuses_to_start_twice(fake_device, running_daemon, v_flex_factory):
+    second = VFlexDaemon(running_daemon.socket_path, v_flex_factory=v_flex_factory)
+    with pytest.raises(RuntimeError):
+        second.serve_forever()
+
+
+def test_daemon_replaces_a_stale_socket(tmp_path, v_flex_factory):
+    socket_path = tmp_path / "d.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(socket_path))
+    stale.close()
+
+    daemon = VFlexDaemon(socket_path, v_flex_factory=v_flex_factory)
+    daemon._prepare_socket_path()
+
+    assert not socket_path.exists()
+
+
+def test_daemon_records_metrics_for_its_v_flex(tmp_path):
+    device = SimulatedDevice(serial_number="SIMTEST1")
+    metrics = Metrics()
+    daemon = VFlexDaemon(
+        tmp_path / "d.sock", v_flex_factory=lambda: VFlex(SimulatedVFlex(device=device)), metrics=metrics
+    )
+    daemon.handle_request({"method": "ensure_awake"})
+    daemon.v_flex.expire_handshake()
+    device.serial_number = "SIMTEST2"
+
+    response = daemon.handle_request({"method": "set_voltage", "params": {"millivolts": 12000}})
+
+    assert response["error"] == SerialNumberMismatchError.__name__
+    assert daemon.v_flex.metrics is metrics
+    assert metrics.error_count(SerialNumberMismatchError) == 1
+    assert set(metrics.latencies) == {"initial_wake_up", "set_voltage"}
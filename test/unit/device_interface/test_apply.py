@@ -0,0 +1,120 @@
+import pytest
+
+from vflexctl.command.led import LEDColour
+from vflexctl.device_interface import VFlex, VFlexFleet
+from vflexctl.device_interface.apply import (
+    DesiredState,
+    Profile,
+    apply_profile,
+    load_led_colours,
+    load_profile_toml,
+    update_led_colours,
+)
+from vflexctl.protocol import VFlexProto
+from vflexctl.simulator import SimulatedVFlex
+
+WRITE_COMMANDS = (VFlexProto.CMD_SET_VOLTAGE, VFlexProto.CMD_SET_LED_STATE, VFlexProto.CMD_SET_LED_COLOUR)
+
+
+def _writes(v_flex: VFlex) -> dict[int, int]:
+    counts = v_flex.io_port.device.command_counts
+    return {command: counts[command] for command in WRITE_COMMANDS if counts[command]}
+
+
+@pytest.fixture
+def v_flex():
+    v_flex = VFlex(SimulatedVFlex("Werewolf vFlex:0", serial_number="SIMTEST1", millivolts=5000), wake=True)
+    yield v_flex
+    v_flex.close()
+
+
+def test_load_profile_toml_merges_the_default(tmp_path):
+    path = tmp_path / "bench.toml"
+    path.write_text(
+        '[default]\nled = "disabled"\nvoltage = 5\n\n[devices.SIMTEST1]\nvoltage = 12.5\nled_colour = "blue"\n'
+    )
+    profile = load_profile_toml(path)
+    assert profile.for_serial("SIMTEST1") == DesiredState(12500, True, LEDColour.BLUE)
+    assert profile.for_serial("SIMTEST2") == DesiredState(5000, True)
+    assert Profile({"SIMTEST1": DesiredState(9000)}).for_serial("SIMTEST2") is None
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "not toml",
+        "",
+        "[devices.SIMTEST1]\nvoltage = true\n",
+        "[devices.SIMTEST1]\nvoltage = 70\n",
+        '[devices.SIMTEST1]\nled = "on"\n',
+        '[devices.SIMTEST1]\nled_colour = "purple"\n',
+        "[devices.SIMTEST1]\ncurrent = 3\n",
+        "[defaults]\nvoltage = 5\n",
+    ],
+)
+def test_load_profile_toml_rejects_bad_profiles(tmp_path, text):
+    path = tmp_path / "bench.toml"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        load_profile_toml(path)
+
+
+def test_apply_only_writes_what_differs(v_flex):
+    desired = DesiredState(millivolts=12000, led_state=False, led_colour=LEDColour.RED)
+    assert v_flex.apply(desired) == ["voltage", "led_colour"]
+    assert v_flex.io_port.device.millivolts == 12000
+    assert _writes(v_flex) == {VFlexProto.CMD_SET_VOLTAGE: 1, VFlexProto.CMD_SET_LED_COLOUR: 1}
+
+    assert v_flex.apply(desired) == []
+    assert _writes(v_flex) == {VFlexProto.CMD_SET_VOLTAGE: 1, VFlexProto.CMD_SET_LED_COLOUR: 1}
+
+
+def test_apply_reads_the_state_once(v_flex):
+    v_flex.expire_handshake()
+    counts = v_flex.io_port.device.command_counts
+    before = counts[VFlexProto.CMD_GET_SERIAL_NUMBER]
+    v_flex.apply(DesiredState(millivolts=9000, led_state=True))
+    assert counts[VFlexProto.CMD_GET_SERIAL_NUMBER] == before + 1
+
+
+def test_apply_dry_run_and_force(v_flex):
+    desired = DesiredState(millivolts=5000, led_state=True)
+    assert v_flex.apply(desired, dry_run=True) == ["led_state"]
+    assert _writes(v_flex) == {}
+    assert v_flex.apply(desired, force=True) == ["voltage", "led_state"]
+    assert _writes(v_flex) == {VFlexProto.CMD_SET_VOLTAGE: 1, VFlexProto.CMD_SET_LED_STATE: 1}
+
+
+def test_apply_expires_the_handshake_when_a_write_fails(v_flex, mocker):
+    v_flex.handshake_ttl = 60.0
+    v_flex.read()
+    mocker.patch.object(v_flex, "_set_led_state", side_effect=RuntimeError("lost"))
+    with pytest.raises(RuntimeError):
+        v_flex.apply(DesiredState(led_state=True))
+    assert not v_flex.handshake_is_fresh
+    assert v_flex._handshake_depth == 0
+
+
+def test_apply_profile_remembers_the_led_colour():
+    profile = Profile({"SIMTEST1": DesiredState(led_colour=LEDColour.GREEN)})
+    devices = [SimulatedVFlex("Werewolf vFlex:0", serial_number="SIMTEST1")]
+    fleet = VFlexFleet([VFlex(devices[0], wake=True)])
+    assert apply_profile(fleet, profile, dry_run=True).results == {"SIMTEST1": ["led_colour"]}
+    assert load_led_colours() == {}
+    assert apply_profile(fleet, profile).results == {"SIMTEST1": ["led_colour"]}
+    assert load_led_colours() == {"SIMTEST1": LEDColour.GREEN}
+    fleet.close()
+
+    # A new process doesn't know the colour, but the stored one stands in for it.
+    fleet = VFlexFleet([VFlex(SimulatedVFlex("Werewolf vFlex:0", device=devices[0].device), wake=True)])
+    assert apply_profile(fleet, profile).results == {"SIMTEST1": []}
+    fleet.close()
+
+
+def test_update_led_colours_keeps_other_devices(tmp_path):
+    path = tmp_path / "led_colours.json"
+    update_led_colours({"SIMTEST1": LEDColour.RED}, path=path)
+    update_led_colours({"SIMTEST2": LEDColour.BLUE}, path=path)
+    assert load_led_colours(path=path) == {"SIMTEST1": LEDColour.RED, "SIMTEST2": LEDColour.BLUE}
+    path.write_text("not json")
+    assert load_led_colours(path=path) == {}
@@ -0,0 +1,299 @@
+import asyncio
+
+import mido
+import pytest
+
+from vflexctl.command.led import LEDColour
+from vflexctl.device_interface import AsyncVFlex
+from vflexctl.device_interface.apply import DesiredState
+from vflexctl.device_interface.retry import CommandPolicy, RetryPolicy
+from vflexctl.device_interface.timings import Phase, Timings
+from vflexctl.exceptions import (
+    ReplyTimeoutError,
+    SerialNumberMismatchError,
+    VoltageMismatchError,
+    UnsupportedFirmwareVersionError,
+    WriteNotAppliedError,
+)
+from vflexctl.metrics import Metrics
+from vflexctl.protocol import VFlexProto, prepare_command_for_sending, protocol_messages_from_midi_messages
+
+# Short timeouts and no waiting between attempts, so lost replies don't slow the tests down.
+POLICY = RetryPolicy(
+    reads=CommandPolicy(timeout=0.05, retries=2, delay=0), writes=CommandPolicy(timeout=0.05, retries=1, delay=0)
+)
+
+
+class FakeVFlexPort:
+    """Answers VFlex commands through ``callback``, like an rtmidi-backed port would."""
+
+    name = "Werewolf vFlex"
+    is_output = True
+
+    def __init__(self, serial_number="SERIAL01", firmware_version="APP.05.00.00"):
+        self.callback = None
+        self.serial_number = serial_number
+        self.firmware_version = firmware_version
+        self.millivolts = 5000
+        self.led_state = 0
+        self.received = []
+        self.commands = []
+        self.envelopes = 0
+        # What to lose of the next few commands with each command byte: the "command" or only its "reply".
+        self.losses = {}
+        # Whether set LED state commands are applied (rather than answered and ignored).
+        self.applies_led_state = True
+        self.closed = False
+
+    def send(self, message):
+        triplet = tuple(message.bytes())
+        self.received.append(triplet)
+        if triplet == VFlexProto.COMMAND_END:
+            commands = protocol_messages_from_midi_messages(self.received)
+            self.received = []
+            self.envelopes += 1
+            self.commands.extend(command[1] for command in commands)
+            replies = [reply for command in commands if (reply := self._reply(command)) is not None]
+            if replies:
+                # Reply from the event loop's next turn, as if it came from the MIDI thread.
+                asyncio.get_running_loop().call_soon(self._deliver, replies)
+
+    def lose(self, command_byte, *what):
+        self.losses.setdefault(command_byte, []).extend(what)
+
+    def _reply(self, command):
+        losses = self.losses.get(command[1])
+        if not losses:
+            return self._apply(command)
+        if losses.pop(0) == "reply":
+            self._apply(command)
+        return None
+
+    def _apply(self, command):
+        match command[1]:
+            case VFlexProto.CMD_GET_SERIAL_NUMBER:
+                return [10, command[1], *self.serial_number.encode()]
+            case VFlexProto.CMD_GET_FIRMWARE_VERSION:
+                return [14, command[1], *self.firmware_version.encode()]
+            case VFlexProto.CMD_SET_VOLTAGE:
+                self.millivolts = command[2] << 8 | command[3]
+                return [4, VFlexProto.CMD_GET_VOLTAGE, self.millivolts >> 8, self.millivolts & 0xFF]
+            case VFlexProto.CMD_GET_VOLTAGE:
+                return [4, command[1], self.millivolts >> 8, self.millivolts & 0xFF]
+            case VFlexProto.CMD_SET_LED_STATE:
+                if self.applies_led_state:
+                    self.led_state = command[2]
+                return [2, command[1]]
+            case VFlexProto.CMD_GET_LED_STATE:
+                return [3, command[1], self.led_state]
+        return None
+
+    def _deliver(self, replies):
+        for triplet in prepare_command_for_sending(replies):
+            self.callback(mido.Message.from_bytes(list(triplet)))
+
+    def close(self):
+        self.closed = True
+
+
+def _run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=10))
+
+
+async def _awake_v_flex(port, **kwargs):
+    v_flex = AsyncVFlex(port, **kwargs)
+    v_flex.use_tuned_pacing = False
+    v_flex.pause_length = 0
+    await v_flex.initial_wake_up()
+    return v_flex
+
+
+@pytest.fixture
+def port():
+    yield FakeVFlexPort()
+
+
+def test_initial_wake_up_reads_the_device_state(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port)
+        return v_flex.serial_number, v_flex.firmware_version, v_flex.current_voltage, v_flex.led_state
+
+    assert _run(scenario()) == ("SERIAL01", "APP.05.00.00", 5000, False)
+
+
+def test_set_voltage_and_led_state(port):
+    async def scenario():
+        async with await _awake_v_flex(port) as v_flex:
+            await v_flex.set_voltage_volts(12)
+            await v_flex.set_led_state(True)
+            return v_flex.current_voltage, v_flex.led_state
+
+    assert _run(scenario()) == (12000, True)
+    assert port.millivolts == 12000
+    assert port.closed
+
+
+def test_set_voltage_guards_against_the_voltage_changing(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port)
+        port.millivolts = 9000
+        await v_flex.set_voltage(12000)
+
+    with pytest.raises(VoltageMismatchError):
+        _run(scenario())
+    assert port.millivolts == 9000
+
+
+def test_safe_adjust_guards_on_serial_number_changing(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port)
+        port.serial_number = "SERIAL02"
+        await v_flex.set_voltage(12000)
+
+    with pytest.raises(SerialNumberMismatchError):
+        _run(scenario())
+
+
+def test_concurrent_reads_share_one_exchange(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port)
+        port.commands.clear()
+        return await asyncio.gather(*(v_flex.get_voltage() for _ in range(1000)))
+
+    assert _run(scenario()) == [5000] * 1000
+    # One handshake (serial number) and a single voltage read for all 1000 callers.
+    assert port.commands == [VFlexProto.CMD_GET_SERIAL_NUMBER, VFlexProto.CMD_GET_VOLTAGE]
+
+
+def test_concurrent_writes_take_turns(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port, handshake_ttl=60)
+        port.commands.clear()
+        await asyncio.gather(v_flex.set_voltage(9000), v_flex.set_led_state(True))
+
+    _run(scenario())
+    assert port.commands == [
+        VFlexProto.CMD_SET_VOLTAGE,
+        VFlexProto.CMD_SET_LED_STATE,
+        VFlexProto.CMD_GET_LED_STATE,
+    ]
+
+
+def test_one_event_loop_drives_many_devices():
+    ports = [FakeVFlexPort(serial_number=f"SERIAL{i:02}") for i in range(20)]
+
+    async def scenario():
+        v_flexes = await asyncio.gather(*(_awake_v_flex(port) for port in ports))
+        await asyncio.gather(*(v_flex.set_voltage(15000) for v_flex in v_flexes))
+        return [v_flex.serial_number for v_flex in v_flexes]
+
+    assert _run(scenario()) == [f"SERIAL{i:02}" for i in range(20)]
+    assert all(port.millivolts == 15000 for port in ports)
+
+
+def test_set_led_colour_needs_firmware_5():
+    port = FakeVFlexPort(firmware_version="APP.04.00.00")
+
+    async def scenario():
+        v_flex = await _awake_v_flex(port)
+        await v_flex.set_led_colour(LEDColour.RED)
+
+    with pytest.raises(UnsupportedFirmwareVersionError):
+        _run(scenario())
+
+
+def test_initial_wake_up_is_one_round_trip(port):
+    async def scenario():
+        return await _awake_v_flex(port)
+
+    v_flex = _run(scenario())
+    assert port.envelopes == 1
+    assert v_flex.batch_queries
+
+
+def test_apply_only_writes_what_differs(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port, handshake_ttl=60)
+        port.commands.clear()
+        return await v_flex.apply(DesiredState(millivolts=5000, led_state=True))
+
+    assert _run(scenario()) == ["led_state"]
+    assert port.commands == [VFlexProto.CMD_SET_LED_STATE, VFlexProto.CMD_GET_LED_STATE]
+
+
+def test_concurrent_operations_are_timed_separately():
+    ports = [FakeVFlexPort(serial_number=f"SERIAL{i:02}") for i in range(5)]
+    timings = Timings()
+
+    async def scenario():
+        v_flexes = await asyncio.gather(*(_awake_v_flex(port, timings=timings) for port in ports))
+        timings.clear()
+        await asyncio.gather(*(v_flex.set_voltage(9000) for v_flex in v_flexes))
+
+    _run(scenario())
+    assert [timing.operation for timing in timings.operations] == ["set_voltage"] * 5
+    for timing in timings.operations:
+        assert set(timing.phases) >= {Phase.HANDSHAKE, f"{Phase.HANDSHAKE}/{Phase.SEND}", Phase.SEND}
+
+
+def test_metrics_record_operations_traffic_and_timeouts(port):
+    metrics = Metrics()
+
+    async def scenario():
+        v_flex = await _awake_v_flex(port, metrics=metrics)
+        await v_flex.set_voltage(12000)
+        port.lose(VFlexProto.CMD_GET_SERIAL_NUMBER, "command", "command", "command")
+        await v_flex.get_serial_number()
+
+    with pytest.raises(ReplyTimeoutError):
+        _run(scenario())
+    assert set(metrics.latencies) == {"initial_wake_up", "set_voltage", "get_serial_number"}
+    assert metrics.messages_sent > 0 and metrics.messages_received > 0
+    # The default policy retries a lost read twice.
+    assert metrics.timeouts == 3
+    assert metrics.retries == 2
+    assert metrics.error_count(ReplyTimeoutError) == 1
+
+
+def test_lost_replies_are_retried_then_given_up_on(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port, handshake_ttl=60, retry_policy=POLICY)
+        port.lose(VFlexProto.CMD_GET_VOLTAGE, "command", "reply")
+        millivolts = await v_flex.get_voltage()
+        port.lose(VFlexProto.CMD_GET_LED_STATE, "command", "command", "command")
+        with pytest.raises(ReplyTimeoutError) as error:
+            await v_flex.get_led_state()
+        return millivolts, error.value.attempts
+
+    assert _run(scenario()) == (5000, 3)
+
+
+def test_a_lost_write_is_sent_again_only_after_a_read(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port, handshake_ttl=60, retry_policy=POLICY)
+        port.commands.clear()
+        port.lose(VFlexProto.CMD_SET_LED_STATE, "reply")
+        await v_flex.set_led_state(True)
+        lost_reply = list(port.commands)
+        port.commands.clear()
+        port.lose(VFlexProto.CMD_SET_LED_STATE, "command")
+        await v_flex.set_led_state(False)
+        return lost_reply, list(port.commands)
+
+    lost_reply, lost_command = _run(scenario())
+    assert lost_reply == [VFlexProto.CMD_SET_LED_STATE, VFlexProto.CMD_GET_LED_STATE]
+    assert lost_command == [VFlexProto.CMD_SET_LED_STATE, VFlexProto.CMD_GET_LED_STATE] * 2
+    assert port.led_state == 0
+
+
+def test_a_write_the_device_never_applies_fails(port):
+    async def scenario():
+        v_flex = await _awake_v_flex(port, handshake_ttl=60, retry_policy=POLICY)
+        port.applies_led_state = False
+        port.commands.clear()
+        with pytest.raises(WriteNotAppliedError) as error:
+            await v_flex.set_led_state(True)
+        return error.value.attempts, v_flex.led_state
+
+    assert _run(scenario()) == (2, False)
+    assert port.commands.count(VFlexProto.CMD_SET_LED_STATE) == 2
@@ -0,0 +1,84 @@
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.device_interface import batching
+from vflexctl.device_interface.retry import CommandPolicy, RetryPolicy
+from vflexctl.protocol import VFlexProto
+from vflexctl.simulator import SimulatedDevice, SimulatedVFlex
+
+POLICY = RetryPolicy(reads=CommandPolicy(timeout=0.05), writes=CommandPolicy(timeout=0.05))
+
+
+@pytest.fixture
+def non_batching_device(mocker):
+    """A simulated device that only answers the first command in each envelope. Counts the replies it drops."""
+    device = SimulatedDevice()
+    receive = device.receive
+    envelope = {"answered": False, "dropped": 0}
+
+    def _receive(midi_message):
+        if tuple(midi_message) == VFlexProto.COMMAND_START:
+            envelope["answered"] = False
+        reply = receive(midi_message)
+        if reply is None:
+            return None
+        if envelope["answered"]:
+            envelope["dropped"] += 1
+            return None
+        envelope["answered"] = True
+        return reply
+
+    mocker.patch.object(device, "receive", side_effect=_receive)
+    device.envelope = envelope
+    return device
+
+
+def test_batching_file_lives_in_the_app_data_dir(isolated_app_data_dir):
+    assert batching.batching_file() == isolated_app_data_dir / "batching.json"
+
+
+def test_save_batching_keeps_other_devices_and_ports():
+    batching.save_batching(False, serial_number="SERIAL01", firmware_version="APP.05.00.00", port_name="A")
+    batching.save_batching(False, port_name="B")
+    batching.save_batching(True, port_name="A")
+
+    assert not batching.device_batches_queries("SERIAL01", "APP.05.00.00")
+    assert batching.device_batches_queries("SERIAL01", "APP.05.01.00")
+    assert batching.port_batches_queries("A")
+    assert not batching.port_batches_queries("B")
+
+
+def test_stored_batching_falls_back_on_a_corrupt_file():
+    path = batching.batching_file()
+    path.parent.mkdir(parents=True)
+    path.write_text("[not json")
+    assert batching.device_batches_queries("SERIAL01", "APP.05.00.00")
+    assert batching.port_batches_queries("A")
+
+
+def test_a_second_v_flex_on_a_non_batching_device_never_batches(non_batching_device):
+    first = VFlex(SimulatedVFlex(device=non_batching_device), retry_policy=POLICY)
+    first.initial_wake_up()
+    assert not first.batch_queries
+    assert non_batching_device.envelope["dropped"]
+
+    non_batching_device.envelope["dropped"] = 0
+    second = VFlex(SimulatedVFlex(device=non_batching_device), retry_policy=POLICY)
+    assert not second.batch_queries
+    second.initial_wake_up()
+    second.read()
+
+    assert not second.batch_queries
+    assert non_batching_device.envelope["dropped"] == 0
+    assert (second.serial_number, second.current_voltage) == ("SIM00001", 5000)
+
+
+def test_a_batching_device_replaces_a_stale_port_record():
+    batching.save_batching(False, port_name="Werewolf vFlex")
+    v_flex = VFlex(SimulatedVFlex(), retry_policy=POLICY)
+    assert not v_flex.batch_queries
+
+    v_flex.initial_wake_up()
+
+    assert v_flex.batch_queries
+    assert batching.port_batches_queries("Werewolf vFlex")
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+from vflexctl.device_interface import VFlex, VFlexFleet
+from vflexctl.device_interface.fleet import matching_port_names
+
+
+@pytest.fixture
+def fake_ports(mocker):
+    """Three VFlex ports (and an unrelated one), where each device's serial number is its port name."""
+    port_names = ["Werewolf vFlex:0", "Werewolf vFlex:1", "Some Synth", "Werewolf vFlex:2"]
+    mocker.patch("vflexctl.midi_transport.transport.mido.get_ioport_names", return_value=port_names)
+    mocker.patch(
+        "vflexctl.midi_transport.transport.mido.open_ioport",
+        side_effect=lambda name: mocker.MagicMock(name=name, port_name=name),
+    )
+
+    def _wake_up(v_flex: VFlex) -> None:
+        v_flex.serial_number = v_flex.io_port.port_name
+
+    mocker.patch.object(VFlex, "initial_wake_up", autospec=True, side_effect=_wake_up)
+    yield port_names
+
+
+def _fleet_of(mocker, *serials: str) -> VFlexFleet:
+    devices = []
+    for serial in serials:
+        v_flex = VFlex(mocker.MagicMock(name=serial), safe_adjust=False)
+        v_flex.serial_number = serial
+        devices.append(v_flex)
+    return VFlexFleet(devices)
+
+
+def test_matching_port_names_matches_on_the_start_of_the_name(fake_ports):
+    assert matching_port_names() == ["Werewolf vFlex:0", "Werewolf vFlex:1", "Werewolf vFlex:2"]
+
+
+def test_discover_opens_and_wakes_every_v_flex(fake_ports):
+    fleet = VFlexFleet.discover()
+    assert fleet.serial_numbers == ["Werewolf vFlex:0", "Werewolf vFlex:1", "Werewolf vFlex:2"]
+
+
+def test_discover_closes_devices_not_asked_for(fake_ports):
+    fleet = VFlexFleet.discover(serials=["Werewolf vFlex:1"])
+    assert fleet.serial_numbers == ["Werewolf vFlex:1"]
+
+
+def test_discover_skips_devices_that_fail_to_wake_up(mocker, fake_ports):
+    def _wake_up(v_flex: VFlex) -> None:
+        if v_flex.io_port.port_name.endswith(":1"):
+            raise TimeoutError("No reply")
+        v_flex.serial_number = v_flex.io_port.port_name
+
+    VFlex.initial_wake_up.side_effect = _wake_up  # type: ignore[attr-defined]
+    fleet = VFlexFleet.discover()
+    assert fleet.serial_numbers == ["Werewolf vFlex:0", "Werewolf vFlex:2"]
+
+
+def test_fleet_needs_woken_up_devices(mocker):
+    with pytest.raises(ValueError):
+        VFlexFleet([VFlex(mocker.MagicMock(), safe_adjust=False)])
+
+
+def test_run_runs_on_every_device_concurrently(mocker):
+    fleet = _fleet_of(mocker, "A", "B", "C")
+    # Every call waits for the others, so this only finishes if they all run at the same time.
+    barrier = threading.Barrier(len(fleet), timeout=5)
+
+    def _func(v_flex: VFlex) -> str:
+        barrier.wait()
+        return f"done {v_flex.serial_number}"
+
+    outcome = fleet.run(_func)
+    assert outcome.ok
+    assert outcome.results == {"A": "done A", "B": "done B", "C": "done C"}
+
+
+def test_run_collects_errors_by_serial_number(mocker):
+    fleet = _fleet_of(mocker, "A", "B")
+    error = RuntimeError("Bad device")
+
+    def _func(v_flex: VFlex) -> int:
+        if v_flex.serial_number == "B":
+            raise error
+        return 1
+
+    outcome = fleet.run(_func)
+    assert not outcome.ok
+    assert outcome.results == {"A": 1}
+    assert outcome.errors == {"B": error}
+
+
+def test_run_only_runs_on_the_given_serials(mocker):
+    fleet = _fleet_of(mocker, "A", "B", "C")
+    outcome = fleet.run(lambda v_flex: v_flex.serial_number, serials=["C"])
+    assert outcome.results == {"C": "C"}
+    with pytest.raises(KeyError):
+        fleet.run(lambda v_flex: None, serials=["D"])
+
+
+def test_set_voltage_sets_every_device(mocker):
+    fleet = _fleet_of(mocker, "A", "B")
+    mock_set = mocker.patch.object(VFlex, "set_voltage", autospec=True)
+    assert fleet.set_voltage(9000).ok
+    assert sorted(call.args[0].serial_number for call in mock_set.call_args_list) == ["A", "B"]
+    assert all(call.args[1] == 9000 for call in mock_set.call_args_list)
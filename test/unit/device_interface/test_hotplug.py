@@ -0,0 +1,157 @@
+import threading
+import time
+
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.device_interface.hotplug import AutoReconnect, PortWatcher
+from vflexctl.device_interface.port_index import load_port_index
+from vflexctl.simulator import SimulatedDevice, SimulatedVFlex
+
+
+class FakeMIDI:
+    """The MIDI ports currently plugged in, each with a simulated device behind it."""
+
+    def __init__(self, mocker):
+        self.devices: dict[str, SimulatedDevice] = {}
+        self.failing_opens: set[str] = set()
+        mocker.patch("vflexctl.midi_transport.transport.mido.get_ioport_names", side_effect=lambda: list(self.devices))
+        mocker.patch("vflexctl.midi_transport.transport.mido.open_ioport", side_effect=self.open)
+
+    def open(self, name):
+        if name in self.failing_opens:
+            self.failing_opens.discard(name)
+            raise OSError(f"{name} is busy")
+        return SimulatedVFlex(name, device=self.devices[name])
+
+    def plug(self, name, **device_kwargs):
+        self.devices[name] = SimulatedDevice(**device_kwargs)
+        return self.devices[name]
+
+
+@pytest.fixture
+def midi(mocker):
+    return FakeMIDI(mocker)
+
+
+@pytest.fixture
+def v_flex(midi):
+    midi.plug("Werewolf vFlex:0", serial_number="SIMTEST1", millivolts=5000)
+    v_flex = VFlex(midi.open("Werewolf vFlex:0"), wake=True)
+    v_flex.set_voltage(12000)
+    v_flex.set_led_state(True)
+    yield v_flex
+    v_flex.close()
+
+
+def test_port_watcher_reports_ports_coming_and_going(mocker, midi):
+    midi.plug("Werewolf vFlex:0")
+    on_change = mocker.Mock()
+    watcher = PortWatcher(on_change)
+    assert watcher.ports == {"Werewolf vFlex:0"}
+
+    midi.plug("Werewolf vFlex:1")
+    midi.plug("Some Synth")
+    del midi.devices["Werewolf vFlex:0"]
+    assert watcher.poll() == ({"Werewolf vFlex:1"}, {"Werewolf vFlex:0"})
+    on_change.assert_called_once_with({"Werewolf vFlex:1"}, {"Werewolf vFlex:0"})
+
+    assert watcher.poll() == (set(), set())
+    on_change.assert_called_once()
+
+
+def test_auto_reconnect_restores_the_state_on_the_new_port(midi, v_flex):
+    auto_reconnect = AutoReconnect(v_flex)
+    old_port = v_flex.io_port
+
+    del midi.devices["Werewolf vFlex:0"]
+    auto_reconnect.watcher.poll()
+    assert not auto_reconnect.connected.is_set()
+
+    # It comes back on a different port, power cycled back to its defaults.
+    device = midi.plug("Werewolf vFlex:1", serial_number="SIMTEST1", millivolts=5000, led_state=False)
+    auto_reconnect.watcher.poll()
+    assert auto_reconnect.wait_until_connected(timeout=0)
+    assert auto_reconnect.reconnects == 1
+    assert v_flex.io_port.name == "Werewolf vFlex:1"
+    assert old_port.closed
+    assert (device.millivolts, device.led_state) == (12000, True)
+    assert load_port_index()["Werewolf vFlex:1"] == "SIMTEST1"
+
+    v_flex.set_voltage(9000)
+    assert device.millivolts == 9000
+
+
+def test_auto_reconnect_leaves_the_state_alone_without_restore(midi, v_flex):
+    auto_reconnect = AutoReconnect(v_flex, restore=False)
+    del midi.devices["Werewolf vFlex:0"]
+    auto_reconnect.watcher.poll()
+    device = midi.plug("Werewolf vFlex:0", serial_number="SIMTEST1", millivolts=5000)
+    auto_reconnect.watcher.poll()
+    assert auto_reconnect.connected.is_set()
+    assert device.millivolts == 5000
+    assert v_flex.current_voltage == 5000
+
+
+def test_auto_reconnect_ignores_other_devices_and_retries_busy_ports(midi, v_flex):
+    auto_reconnect = AutoReconnect(v_flex)
+    del midi.devices["Werewolf vFlex:0"]
+    auto_reconnect.watcher.poll()
+
+    other = midi.plug("Werewolf vFlex:1", serial_number="SIMTEST2", millivolts=5000)
+    auto_reconnect.watcher.poll()
+    assert not auto_reconnect.connected.is_set()
+    assert other.millivolts == 5000
+
+    midi.plug("Werewolf vFlex:0", serial_number="SIMTEST1")
+    midi.failing_opens.add("Werewolf vFlex:0")
+    auto_reconnect.watcher.poll()
+    assert not auto_reconnect.connected.is_set()
+
+    auto_reconnect.retry()
+    assert auto_reconnect.connected.is_set()
+    assert v_flex.io_port.name == "Werewolf vFlex:0"
+
+
+def test_auto_reconnect_needs_a_woken_up_v_flex(midi):
+    midi.plug("Werewolf vFlex:0")
+    with pytest.raises(ValueError):
+        AutoReconnect(VFlex(midi.open("Werewolf vFlex:0")))
+
+
+def test_replace_port_keeps_event_driven_receiving(midi):
+    midi.plug("Werewolf vFlex:0", serial_number="SIMTEST1")
+    v_flex = VFlex(midi.open("Werewolf vFlex:0"), wake=True, event_driven=True)
+    device = midi.plug("Werewolf vFlex:1", serial_number="SIMTEST1")
+    v_flex.replace_port(midi.open("Werewolf vFlex:1"))
+    assert v_flex.receiver is not None
+    v_flex.set_voltage(15000)
+    assert device.millivolts == 15000
+    v_flex.close()
+
+
+def test_replace_port_waits_for_an_operation_in_progress(midi, v_flex):
+    old_device = v_flex.io_port.device
+    old_device.response_latency = 0.1
+    new_device = midi.plug("Werewolf vFlex:1", serial_number="SIMTEST1")
+    errors = []
+
+    def _read():
+        try:
+            v_flex.read()
+        except Exception as e:
+            errors.append(e)
+
+    reading = threading.Thread(target=_read)
+    sent_before = sum(old_device.command_counts.values())
+    reading.start()
+    while sum(old_device.command_counts.values()) == sent_before:
+        time.sleep(0.001)
+    # The read is waiting on its reply from the old port, so swapping the port now has to wait for it.
+    v_flex.replace_port(midi.open("Werewolf vFlex:1"))
+    reading.join()
+
+    assert errors == []
+    assert sum(new_device.command_counts.values()) == 0
+    v_flex.get_voltage()
+    assert sum(new_device.command_counts.values()) > 0
@@ -0,0 +1,108 @@
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.device_interface.playback import (
+    PlaybackReport,
+    Setpoint,
+    StepTiming,
+    compile_setpoints,
+    load_profile_csv,
+    ramp,
+    validate_setpoints,
+)
+from vflexctl.protocol import VFlexProto, prepare_command_for_sending
+
+
+def test_ramp_includes_both_ends():
+    assert ramp(5, 6, duration=2, step_seconds=0.5) == [
+        Setpoint(0.0, 5000),
+        Setpoint(0.5, 5250),
+        Setpoint(1.0, 5500),
+        Setpoint(1.5, 5750),
+        Setpoint(2.0, 6000),
+    ]
+
+
+def test_load_profile_csv_skips_header_comments_and_blank_lines(tmp_path):
+    profile = tmp_path / "profile.csv"
+    profile.write_text("time,volts\n# warm up\n0,5\n\n1.5, 12.004\n3,20\n")
+
+    assert load_profile_csv(profile) == [Setpoint(0.0, 5000), Setpoint(1.5, 12000), Setpoint(3.0, 20000)]
+
+
+def test_load_profile_csv_reports_the_bad_line(tmp_path):
+    profile = tmp_path / "profile.csv"
+    profile.write_text("time,volts\n0,5\n1,twelve\n")
+
+    with pytest.raises(ValueError, match="profile.csv:3"):
+        load_profile_csv(profile)
+
+
+@pytest.mark.parametrize(
+    "setpoints",
+    [[], [Setpoint(1, 5000), Setpoint(0.5, 5000)], [Setpoint(0, 0)], [Setpoint(0, 70000)]],
+)
+def test_validate_setpoints_rejects_bad_profiles(setpoints):
+    with pytest.raises(ValueError):
+        validate_setpoints(setpoints)
+
+
+def test_compile_setpoints_prepares_each_voltage_once():
+    compiled = compile_setpoints([Setpoint(0, 5000), Setpoint(1, 12000), Setpoint(2, 5000)])
+
+    assert list(compiled[0]) == prepare_command_for_sending([4, VFlexProto.CMD_SET_VOLTAGE, 0x13, 0x88])
+    assert compiled[0] is compiled[2]
+
+
+def test_report_summarises_step_timing():
+    report = PlaybackReport(
+        [
+            StepTiming(0, 5000, 5000, scheduled_at=0.0, sent_at=0.001),
+            StepTiming(1, 6000, 5900, scheduled_at=1.0, sent_at=1.004),
+            StepTiming(2, 7000, 7000, scheduled_at=2.0, sent_at=1.999),
+        ]
+    )
+
+    assert report.max_error == pytest.approx(0.004)
+    assert report.mean_error == pytest.approx(0.002)
+    assert report.drift == pytest.approx(-0.001)
+    assert [step.index for step in report.mismatched_steps] == [1]
+
+
+def test_play_sends_precompiled_steps_on_schedule_with_one_handshake(mocker):
+    clock = mocker.MagicMock(return_value=50.0)
+    mocker.patch("vflexctl.device_interface.core.monotonic", clock)
+    mocker.patch(
+        "vflexctl.device_interface.vflex.sleep",
+        side_effect=lambda seconds: setattr(clock, "return_value", clock.return_value + seconds),
+    )
+    mock_send = mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
+    reported = mocker.patch(
+        "vflexctl.device_interface.core.get_millivolts_from_protocol_message", side_effect=[5000, 6000, 7000]
+    )
+    v_flex = VFlex(mocker.MagicMock(name="io_port"), safe_adjust=False)
+    v_flex.serial_number = "fooSerial"
+    v_flex.firmware_version = "APP.05.00.00"
+    v_flex._wake_up = mocker.MagicMock(name="_wake_up")
+    setpoints = [Setpoint(0, 5000), Setpoint(1, 6000), Setpoint(2.5, 7000)]
+    on_step = mocker.MagicMock(name="on_step")
+
+    report = v_flex.play(setpoints, on_step=on_step)
+
+    v_flex._wake_up.assert_called_once()
+    assert [c.args[1] for c in mock_send.call_args_list] == compile_setpoints(setpoints)
+    assert [step.sent_at for step in report.steps] == [0, 1, 2.5]
+    assert report.drift == 0
+    assert on_step.call_count == 3
+    assert v_flex.current_voltage == 7000
+    assert reported.call_count == 3
+
+
+def test_set_voltage_sequences_are_cached_across_calls():
+    first = compile_setpoints([Setpoint(0, 9000)])[0]
+    second = compile_setpoints([Setpoint(0, 9000)])[0]
+
+    assert first is second
+    assert isinstance(first, tuple)
@@ -0,0 +1,82 @@
+import pytest
+
+from vflexctl.device_interface import VFlex, VFlexFleet
+from vflexctl.device_interface import port_index
+from vflexctl.protocol import VFlexProto
+from vflexctl.simulator import SimulatedVFlex
+
+SERIALS = {"Werewolf vFlex:0": "SIMTEST0", "Werewolf vFlex:1": "SIMTEST1", "Werewolf vFlex:2": "SIMTEST2"}
+
+
+@pytest.fixture
+def simulated_ports(mocker):
+    """Three simulated VFlex ports (and an unrelated one). Returns the mock that opens them."""
+    mocker.patch("vflexctl.midi_transport.transport.mido.get_ioport_names", return_value=[*SERIALS, "Some Synth"])
+    return mocker.patch(
+        "vflexctl.midi_transport.transport.mido.open_ioport",
+        side_effect=lambda name: SimulatedVFlex(name, serial_number=SERIALS[name]),
+    )
+
+
+def _opened(open_ioport):
+    return [call.args[0] for call in open_ioport.call_args_list]
+
+
+def test_port_index_file_lives_in_the_app_data_dir(isolated_app_data_dir):
+    assert port_index.port_index_file() == isolated_app_data_dir / "ports.json"
+
+
+def test_update_port_index_keeps_other_ports_and_forgets_none():
+    port_index.update_port_index({"A": "SERIAL01", "B": "SERIAL02"})
+    port_index.update_port_index({"A": None, "C": "SERIAL01"})
+    assert port_index.load_port_index() == {"B": "SERIAL02", "C": "SERIAL01"}
+    assert port_index.ports_for_serial("SERIAL01") == ["C"]
+
+
+def test_load_port_index_falls_back_on_a_corrupt_file():
+    path = port_index.port_index_file()
+    path.parent.mkdir(parents=True)
+    path.write_text("[not json")
+    assert port_index.load_port_index() == {}
+
+
+def test_with_serial_probes_every_port_on_a_miss(simulated_ports):
+    v_flex = VFlex.with_serial("SIMTEST1")
+    assert v_flex.serial_number == "SIMTEST1"
+    assert v_flex.io_port.name == "Werewolf vFlex:1"
+    assert sorted(_opened(simulated_ports)) == sorted(SERIALS)
+    # Everything found along the way is remembered.
+    assert port_index.load_port_index() == SERIALS
+    v_flex.close()
+
+
+def test_with_serial_uses_the_port_index(simulated_ports):
+    port_index.update_port_index(SERIALS)
+    v_flex = VFlex.with_serial("SIMTEST2", wake=True)
+    assert _opened(simulated_ports) == ["Werewolf vFlex:2"]
+    assert (v_flex.serial_number, v_flex.firmware_version) == ("SIMTEST2", "APP.05.00.00")
+    # The wake-up's handshake was the only serial number query.
+    assert v_flex.io_port.device.command_counts[VFlexProto.CMD_GET_SERIAL_NUMBER] == 1
+    v_flex.close()
+
+
+def test_with_serial_falls_back_when_the_index_is_stale(simulated_ports):
+    # The adapters were swapped over since they were indexed.
+    port_index.update_port_index({"Werewolf vFlex:0": "SIMTEST1", "Werewolf vFlex:1": "SIMTEST0"})
+    v_flex = VFlex.with_serial("SIMTEST1")
+    assert v_flex.io_port.name == "Werewolf vFlex:1"
+    assert _opened(simulated_ports)[0] == "Werewolf vFlex:0"
+    assert port_index.load_port_index() == SERIALS
+    v_flex.close()
+
+
+def test_with_serial_raises_when_no_device_has_it(simulated_ports):
+    with pytest.raises(RuntimeError):
+        VFlex.with_serial("NOTFOUND")
+
+
+def test_discover_fills_in_the_port_index(simulated_ports):
+    fleet = VFlexFleet.discover(serials=["SIMTEST0"])
+    assert fleet.serial_numbers == ["SIMTEST0"]
+    assert port_index.load_port_index() == SERIALS
+    fleet.close()
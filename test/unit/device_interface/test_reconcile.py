@@ -0,0 +1,120 @@
+import pytest
+
+from vflexctl.command.led import LEDColour
+from vflexctl.device_interface import VFlex, VFlexFleet
+from vflexctl.device_interface.apply import DesiredState, Profile, load_led_colours
+from vflexctl.device_interface.reconcile import Reconciler
+from vflexctl.protocol import VFlexProto
+from vflexctl.simulator import SimulatedDevice, SimulatedVFlex
+
+PROFILE = Profile(
+    {"SIMTEST1": DesiredState(millivolts=12000, led_colour=LEDColour.BLUE)},
+    default=DesiredState(led_state=True),
+)
+
+
+class FakeMIDI:
+    """The MIDI ports currently plugged in, each with a simulated device behind it."""
+
+    def __init__(self, mocker):
+        self.devices: dict[str, SimulatedDevice] = {}
+        mocker.patch("vflexctl.midi_transport.transport.mido.get_ioport_names", side_effect=lambda: list(self.devices))
+        mocker.patch("vflexctl.midi_transport.transport.mido.open_ioport", side_effect=self.open)
+
+    def open(self, name):
+        return SimulatedVFlex(name, device=self.devices[name])
+
+    def plug(self, name, **device_kwargs):
+        self.devices[name] = SimulatedDevice(**device_kwargs)
+        return self.devices[name]
+
+
+@pytest.fixture
+def midi(mocker):
+    return FakeMIDI(mocker)
+
+
+@pytest.fixture
+def fleet(midi):
+    midi.plug("Werewolf vFlex:0", serial_number="SIMTEST1", millivolts=5000)
+    midi.plug("Werewolf vFlex:1", serial_number="SIMTEST2", millivolts=5000)
+    fleet = VFlexFleet(VFlex(midi.open(name), wake=True) for name in list(midi.devices))
+    yield fleet
+    fleet.close()
+
+
+def _make_due(reconciler: Reconciler) -> None:
+    for schedule in reconciler.schedules.values():
+        schedule.due_at = 0.0
+
+
+def test_reconcile_corrects_drift_with_the_fewest_writes(midi, fleet):
+    reconciler = Reconciler(fleet, PROFILE, reconnect=False)
+    outcome = reconciler.reconcile_once()
+    assert outcome.results == {"SIMTEST1": ["voltage", "led_state", "led_colour"], "SIMTEST2": ["led_state"]}
+    assert load_led_colours() == {"SIMTEST1": LEDColour.BLUE}
+
+    # Someone turns a device down by hand.
+    device = midi.devices["Werewolf vFlex:0"]
+    device.millivolts = 9000
+    _make_due(reconciler)
+    assert reconciler.reconcile_once().results == {"SIMTEST1": ["voltage"], "SIMTEST2": []}
+    assert device.millivolts == 12000
+    assert device.command_counts[VFlexProto.CMD_SET_LED_STATE] == 1
+    assert reconciler.schedules["SIMTEST1"].corrections == 2
+
+
+def test_reconcile_backs_off_on_healthy_devices(fleet):
+    reconciler = Reconciler(fleet, PROFILE, interval=1, max_interval=3, backoff=2, reconnect=False)
+    intervals = []
+    for _ in range(4):
+        _make_due(reconciler)
+        reconciler.reconcile_once()
+        intervals.append(reconciler.schedules["SIMTEST2"].interval)
+    # The first check corrects the LED state, then each clean check doubles the interval, up to the limit.
+    assert intervals == [1, 2, 3, 3]
+    assert reconciler.reconcile_once().results == {}
+
+
+def test_reconcile_checks_the_most_overdue_devices_first(fleet):
+    reconciler = Reconciler(fleet, PROFILE, max_checks=1, reconnect=False)
+    reconciler.schedules["SIMTEST1"].due_at = 2.0
+    reconciler.schedules["SIMTEST2"].due_at = 1.0
+    assert list(reconciler.reconcile_once().results) == ["SIMTEST2"]
+    assert list(reconciler.reconcile_once().results) == ["SIMTEST1"]
+
+
+def test_reconcile_puts_a_replugged_device_back(midi, fleet):
+    reconciled = []
+    reconciler = Reconciler(fleet, PROFILE, on_reconnect=reconciled.append)
+    reconciler.reconcile_once()
+    assert reconciler.watcher is not None
+
+    del midi.devices["Werewolf vFlex:0"]
+    reconciler.watcher.poll()
+    assert not reconciler.is_connected("SIMTEST1")
+    _make_due(reconciler)
+    assert list(reconciler.reconcile_once().results) == ["SIMTEST2"]
+
+    # It comes back power cycled, on another port.
+    device = midi.plug("Werewolf vFlex:2", serial_number="SIMTEST1", millivolts=5000)
+    reconciler.watcher.poll()
+    assert reconciled == [fleet["SIMTEST1"]]
+    assert reconciler.is_connected("SIMTEST1")
+    assert reconciler.reconcile_once().results == {"SIMTEST1": ["voltage", "led_state", "led_colour"]}
+    assert (device.millivolts, device.led_state, device.led_colour) == (12000, True, LEDColour.BLUE)
+
+
+def test_reconcile_run_stops_after_the_duration(fleet):
+    reconciler = Reconciler(fleet, PROFILE, interval=0.01, max_interval=0.02, reconnect=False)
+    rounds = list(reconciler.run(duration=0.2))
+    assert rounds[0].results == {"SIMTEST1": ["voltage", "led_state", "led_colour"], "SIMTEST2": ["led_state"]}
+    assert all(not changes for outcome in rounds[1:] for changes in outcome.results.values())
+    assert reconciler.schedules["SIMTEST1"].checks == len([r for r in rounds if "SIMTEST1" in r.results])
+
+
+def test_reconciler_needs_devices_the_profile_covers(fleet):
+    with pytest.raises(ValueError):
+        Reconciler(fleet, Profile({"SIMTEST9": DesiredState(millivolts=5000)}), reconnect=False)
+    with pytest.raises(ValueError):
+        Reconciler(fleet, PROFILE, interval=5, max_interval=1, reconnect=False)
@@ -0,0 +1,140 @@
+from collections import Counter
+
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.device_interface.apply import DesiredState
+from vflexctl.device_interface.retry import NO_RETRIES, CommandPolicy, RetryPolicy
+from vflexctl.exceptions import ReplyTimeoutError, WriteNotAppliedError
+from vflexctl.metrics import Metrics
+from vflexctl.protocol import VFlexProto
+from vflexctl.simulator import SimulatedVFlex
+
+# Short timeouts and no waiting between attempts, so lost replies don't slow the tests down.
+FAST = CommandPolicy(timeout=0.05, retries=2, delay=0)
+POLICY = RetryPolicy(reads=FAST, writes=CommandPolicy(timeout=0.05, retries=1, delay=0))
+
+
+class Flaky:
+    """Loses the next few commands (or only their replies) with a given command byte."""
+
+    def __init__(self, mocker, port: SimulatedVFlex):
+        self.device = port.device
+        self.reply_to = self.device.reply_to
+        self.losses: dict[int, list[str]] = {}
+        # Every command sent, including the ones lost on the way.
+        self.sent: Counter[int] = Counter()
+        mocker.patch.object(self.device, "reply_to", side_effect=self._reply_to)
+
+    def lose(self, command_byte: int, *what: str) -> None:
+        self.losses.setdefault(command_byte, []).extend(what)
+
+    def _reply_to(self, protocol_message):
+        self.sent[protocol_message[1]] += 1
+        losses = self.losses.get(protocol_message[1])
+        if not losses:
+            return self.reply_to(protocol_message)
+        if losses.pop(0) == "reply":
+            self.reply_to(protocol_message)
+        return None
+
+
+@pytest.fixture
+def port():
+    return SimulatedVFlex(serial_number="SIMTEST1", millivolts=5000)
+
+
+@pytest.fixture
+def flaky(mocker, port):
+    return Flaky(mocker, port)
+
+
+@pytest.fixture
+def v_flex(port):
+    v_flex = VFlex(port, wake=True, handshake_ttl=60, retry_policy=POLICY, metrics=Metrics())
+    yield v_flex
+    v_flex.close()
+
+
+def test_command_policy_backs_off_exponentially():
+    policy = CommandPolicy(delay=0.1, multiplier=2, max_delay=0.3)
+    assert [policy.backoff(retry) for retry in (1, 2, 3)] == [0.1, 0.2, 0.3]
+    with pytest.raises(ValueError):
+        CommandPolicy(timeout=0)
+
+
+def test_retry_policy_picks_the_policy_per_command():
+    voltage = CommandPolicy(timeout=2)
+    policy = RetryPolicy(commands={VFlexProto.CMD_GET_VOLTAGE: voltage})
+    assert policy.for_command(VFlexProto.CMD_GET_VOLTAGE) is voltage
+    assert policy.for_command(VFlexProto.CMD_GET_LED_STATE) is policy.reads
+    assert policy.for_command(VFlexProto.CMD_SET_LED_STATE) is policy.writes
+
+    overridden = policy.with_overrides(retries=5)
+    assert overridden.reads.retries == overridden.writes.retries == 5
+    assert overridden.for_command(VFlexProto.CMD_GET_VOLTAGE) == CommandPolicy(timeout=2, retries=5)
+
+
+def test_reads_are_retried(flaky, v_flex):
+    flaky.lose(VFlexProto.CMD_GET_VOLTAGE, "command", "reply")
+    assert v_flex.get_voltage() == 5000
+    assert v_flex.metrics.retries == 2
+    # The retries happened within the operation: the handshake didn't have to be redone.
+    assert v_flex.handshake_is_fresh
+
+
+def test_reads_give_up_after_their_retries(flaky, v_flex):
+    flaky.lose(VFlexProto.CMD_GET_LED_STATE, "command", "command", "command")
+    with pytest.raises(ReplyTimeoutError) as error:
+        v_flex.get_led_state()
+    assert error.value.attempts == 3
+    assert isinstance(error.value, ValueError)
+
+
+def test_a_write_whose_reply_was_lost_isnt_sent_again(flaky, v_flex):
+    flaky.lose(VFlexProto.CMD_SET_VOLTAGE, "reply")
+    v_flex.set_voltage(12000)
+    assert flaky.sent[VFlexProto.CMD_SET_VOLTAGE] == 1
+    assert v_flex.current_voltage == flaky.device.millivolts == 12000
+
+
+def test_a_lost_write_is_sent_again_after_a_read(flaky, v_flex):
+    flaky.lose(VFlexProto.CMD_SET_VOLTAGE, "command")
+    v_flex.set_voltage(12000)
+    assert flaky.sent[VFlexProto.CMD_SET_VOLTAGE] == 2
+    assert v_flex.current_voltage == flaky.device.millivolts == 12000
+
+    flaky.lose(VFlexProto.CMD_SET_LED_STATE, "command")
+    v_flex.set_led_state(True)
+    assert flaky.sent[VFlexProto.CMD_SET_LED_STATE] == 2
+    assert v_flex.led_state is flaky.device.led_state is True
+
+
+def test_a_write_the_device_never_applies_fails(mocker, flaky, v_flex):
+    # The device answers the set LED state command, but with its LED state unchanged.
+    reply_to = flaky.reply_to
+    mocker.patch.object(
+        flaky,
+        "reply_to",
+        side_effect=lambda protocol_message: reply_to(
+            [2, VFlexProto.CMD_GET_LED_STATE]
+            if protocol_message[1] == VFlexProto.CMD_SET_LED_STATE
+            else protocol_message
+        ),
+    )
+
+    with pytest.raises(WriteNotAppliedError) as error:
+        v_flex.set_led_state(True)
+    assert error.value.attempts == flaky.sent[VFlexProto.CMD_SET_LED_STATE] == 2
+    assert v_flex.led_state is flaky.device.led_state is False
+
+    with pytest.raises(WriteNotAppliedError):
+        v_flex.apply(DesiredState(led_state=True))
+
+
+def test_no_retries_fails_on_the_first_lost_reply(flaky, port):
+    v_flex = VFlex(port, wake=True, retry_policy=NO_RETRIES.with_overrides(timeout=0.05))
+    flaky.lose(VFlexProto.CMD_SET_VOLTAGE, "command")
+    with pytest.raises(ReplyTimeoutError):
+        v_flex.set_voltage(12000)
+    assert flaky.sent[VFlexProto.CMD_SET_VOLTAGE] == 1
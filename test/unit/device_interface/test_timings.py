@@ -0,0 +1,99 @@
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.device_interface.timings import Phase, Timings
+from vflexctl.simulator import SimulatedVFlex
+
+
+@pytest.fixture
+def timings():
+    return Timings()
+
+
+def test_phases_are_timed_exclusively(mocker, timings):
+    clock = iter(range(100))
+    mocker.patch("vflexctl.device_interface.timings.perf_counter", side_effect=lambda: next(clock))
+    with timings.operation("set_voltage"):  # 0
+        with timings.phase(Phase.HANDSHAKE):  # 1
+            with timings.phase(Phase.SEND):  # 2
+                pass  # 3
+            # 4
+        with timings.phase(Phase.FIRST_BYTE):  # 5
+            timings.switch(Phase.FRAME)  # 6
+        # 7
+    # 8
+    timing = timings.last
+    assert timing.operation == "set_voltage"
+    assert timing.total == 8
+    assert timing.phases == {"handshake": 1 + 1, "handshake/send": 1, "first_byte": 1, "frame": 1}
+    assert timing.other == 8 - 5
+
+
+def test_nested_operations_and_stray_phases_are_part_of_the_outer_operation(timings):
+    with timings.phase(Phase.SEND):
+        pass
+    with timings.operation("read"):
+        with timings.operation("query") as inner:
+            assert inner is None
+            with timings.phase(Phase.SEND):
+                pass
+    timings.switch(Phase.FRAME)
+    assert [timing.operation for timing in timings.operations] == ["read"]
+    assert list(timings.last.phases) == ["send"]
+
+
+def test_operations_are_bounded_and_summarised():
+    timings = Timings(max_operations=2)
+    for name in ["get_voltage", "get_voltage", "set_voltage"]:
+        with timings.operation(name):
+            pass
+    assert [timing.operation for timing in timings.operations] == ["get_voltage", "set_voltage"]
+    assert set(timings.summary()) == {"get_voltage", "set_voltage"}
+    assert set(timings.summary()["set_voltage"]) == {"total", "other"}
+    timings.clear()
+    assert timings.last is None
+
+
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_v_flex_records_every_phase_of_an_operation(timings, event_driven):
+    v_flex = VFlex(SimulatedVFlex(response_latency=0.002), wake=True, event_driven=event_driven, timings=timings)
+    # Without a pause after the last MIDI message sent, the device's latency is all in the wait for the reply.
+    v_flex.pause_length = 0
+    timings.clear()
+    v_flex.set_voltage(12000)
+    v_flex.close()
+
+    timing = timings.last
+    assert timing.operation == "set_voltage"
+    assert {
+        "handshake/encode",
+        "handshake/send",
+        "handshake/first_byte",
+        "encode",
+        "send",
+        "first_byte",
+        "frame",
+        "decode",
+    } <= set(timing.phases)
+    # The handshake's get_serial_number() etc. were part of set_voltage, not operations of their own.
+    assert [timing.operation for timing in timings.operations] == ["set_voltage"]
+    assert timing.phases["first_byte"] >= 0.001
+    assert sum(timing.phases.values()) + timing.other == pytest.approx(timing.total)
+
+
+def test_opening_a_port_is_timed(mocker, timings):
+    mocker.patch("vflexctl.midi_transport.transport.mido.get_ioport_names", return_value=["Werewolf vFlex"])
+    mocker.patch("vflexctl.midi_transport.transport.mido.open_ioport", side_effect=SimulatedVFlex)
+    v_flex = VFlex.get_any(timings=timings)
+    v_flex.get_serial_number()
+    v_flex.close()
+    assert [timing.operation for timing in timings.operations] == ["open_port", "get_serial_number"]
+    assert list(timings.operations[0].phases) == ["port_open"]
+
+
+def test_v_flex_without_timings_records_nothing(mocker):
+    v_flex = VFlex(SimulatedVFlex(), wake=True)
+    phase = mocker.spy(Timings, "phase")
+    v_flex.set_voltage(9000)
+    assert v_flex.timings is None
+    phase.assert_not_called()
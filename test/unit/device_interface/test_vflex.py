@@ -1,8 +1,11 @@
 import pytest
 
 from vflexctl.command.led import LEDColour
+from vflexctl.midi_transport.pacing import load_pacing, save_pacing, with_safety_margin
+from vflexctl.protocol import VFlexProto, prepare_command_for_sending
 from vflexctl.device_interface import VFlex
 from vflexctl.device_interface import vflex as vflex_module
+from vflexctl.device_interface.common_sequences import GET_LED_STATE_SEQUENCE
 from vflexctl.exceptions import (
     VoltageMismatchError,
     SerialNumberMismatchError,
@@ -11,6 +14,12 @@ from vflexctl.exceptions import (
 )
 
 
+@pytest.fixture(autouse=True)
+def no_batched_replies(mocker):
+    """Unless a test says otherwise, the device never answers a batch, so queries fall back to one at a time."""
+    yield mocker.patch("vflexctl.device_interface.vflex.drain_until_replies", return_value=[])
+
+
 @pytest.fixture
 def mock_io_port(mocker):
     yield mocker.MagicMock(name="mock_io_port")
@@ -18,7 +27,7 @@ def mock_io_port(mocker):
 
 @pytest.fixture
 def mock_protocol_message_from_midi_messages(mocker):
-    yield mocker.patch("vflexctl.device_interface.vflex.protocol_message_from_midi_messages")
+    yield mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
 
 
 @pytest.mark.parametrize("wake_up_commands", ["get_voltage", "get_led_state"])
@@ -26,25 +35,25 @@ def test_v_flex_runs_wakeup_with_expected_members(mock_io_port, wake_up_commands
     """
     This tests that the decorator is calling wake_up correctly before commands.
     """
-    mocker.patch("vflexctl.device_interface.vflex.protocol_message_from_midi_messages")
-    mocker.patch("vflexctl.device_interface.vflex.drain_incoming")
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_serial_number", return_value="fooSerial")
-    mocker.patch("vflexctl.device_interface.vflex.get_millivolts_from_protocol_message", return_value=5000)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_led_state", return_value=False)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_firmware_version", return_value="APP.04.00.00")
+    mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_serial_number", return_value="fooSerial")
+    mocker.patch("vflexctl.device_interface.core.get_millivolts_from_protocol_message", return_value=5000)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=False)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_firmware_version", return_value="APP.04.00.00")
     v_flex = VFlex(mock_io_port, safe_adjust=False)
-    v_flex.wake_up = mocker.MagicMock(name="wake_up")
+    v_flex._wake_up = mocker.MagicMock(name="_wake_up")
     getattr(v_flex, wake_up_commands, lambda: None)()
-    v_flex.wake_up.assert_called_once()
+    v_flex._wake_up.assert_called_once()
 
 
 def test_v_flex_initialises_with_wake_up_as_expected(mocker, mock_io_port):
-    mocker.patch("vflexctl.device_interface.vflex.protocol_message_from_midi_messages")
-    mocker.patch("vflexctl.device_interface.vflex.drain_incoming")
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_serial_number", return_value="fooSerial")
-    mocker.patch("vflexctl.device_interface.vflex.get_millivolts_from_protocol_message", return_value=5000)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_led_state", return_value=False)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_firmware_version", return_value="APP.04.00.00")
+    mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_serial_number", return_value="fooSerial")
+    mocker.patch("vflexctl.device_interface.core.get_millivolts_from_protocol_message", return_value=5000)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=False)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_firmware_version", return_value="APP.04.00.00")
     v_flex = VFlex(mock_io_port, safe_adjust=False)
     v_flex.initial_wake_up()
     assert v_flex.current_voltage == 5000
@@ -53,13 +62,11 @@ def test_v_flex_initialises_with_wake_up_as_expected(mocker, mock_io_port):
 
 
 def test_safe_adjust_guards_on_serial_number_changing(mocker, mock_io_port, mock_protocol_message_from_midi_messages):
-    mocker.patch("vflexctl.device_interface.vflex.drain_incoming")
-    mock_serial = mocker.patch(
-        "vflexctl.device_interface.vflex.protocol_decode_serial_number", return_value="fooSerial"
-    )
-    mocker.patch("vflexctl.device_interface.vflex.get_millivolts_from_protocol_message", return_value=5000)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_led_state", return_value=False)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_firmware_version", return_value="APP.04.00.00")
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mock_serial = mocker.patch("vflexctl.device_interface.core.protocol_decode_serial_number", return_value="fooSerial")
+    mocker.patch("vflexctl.device_interface.core.get_millivolts_from_protocol_message", return_value=5000)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=False)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_firmware_version", return_value="APP.04.00.00")
     v_flex = VFlex(mock_io_port, safe_adjust=True)
     v_flex.wake_up()
     assert v_flex.serial_number == "fooSerial"
@@ -71,13 +78,13 @@ def test_safe_adjust_guards_on_serial_number_changing(mocker, mock_io_port, mock
 def test_safe_adjust_stops_allowing_adjustment_if_we_dont_get_the_serial(
     mocker, mock_io_port, mock_protocol_message_from_midi_messages
 ):
-    mocker.patch("vflexctl.device_interface.vflex.drain_incoming")
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
     mocker.patch(
-        "vflexctl.device_interface.vflex.protocol_decode_serial_number",
+        "vflexctl.device_interface.core.protocol_decode_serial_number",
         side_effect=InvalidProtocolMessageLengthError([], 10),
     )
-    mocker.patch("vflexctl.device_interface.vflex.get_millivolts_from_protocol_message", return_value=5000)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_led_state", return_value=False)
+    mocker.patch("vflexctl.device_interface.core.get_millivolts_from_protocol_message", return_value=5000)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=False)
     with pytest.raises(InvalidProtocolMessageLengthError):
         v_flex = VFlex(mock_io_port, safe_adjust=True)
         v_flex.wake_up()
@@ -86,11 +93,11 @@ def test_safe_adjust_stops_allowing_adjustment_if_we_dont_get_the_serial(
 def test_set_voltage_guards_as_standard_if_the_voltage_changes(
     mocker, mock_io_port, mock_protocol_message_from_midi_messages
 ):
-    mocker.patch("vflexctl.device_interface.vflex.drain_incoming")
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_serial_number", return_value="fooSerial")
-    mocker.patch("vflexctl.device_interface.vflex.get_millivolts_from_protocol_message", return_value=5000)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_led_state", return_value=False)
-    mocker.patch("vflexctl.device_interface.vflex.protocol_decode_firmware_version", return_value="APP.04.00.00")
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_serial_number", return_value="fooSerial")
+    mocker.patch("vflexctl.device_interface.core.get_millivolts_from_protocol_message", return_value=5000)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=False)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_firmware_version", return_value="APP.04.00.00")
     v_flex = VFlex(mock_io_port, safe_adjust=True)
     v_flex.initial_wake_up()
     assert v_flex.current_voltage == 5000
@@ -104,45 +111,49 @@ def test_set_voltage_guards_as_standard_if_the_voltage_changes(
 
 def test_get_voltage_updates_self_and_returns(mocker, mock_io_port):
     mocker.patch("vflexctl.device_interface.vflex.send_sequence")
-    mock_drain = mocker.patch("vflexctl.device_interface.vflex.drain_incoming", return_value=["midi-bytes"])
+    mock_drain = mocker.patch("vflexctl.device_interface.vflex.drain_until_frame", return_value=["midi-bytes"])
     mock_protocol = mocker.patch(
-        "vflexctl.device_interface.vflex.protocol_message_from_midi_messages",
+        "vflexctl.device_interface.core.protocol_message_from_midi_messages",
         return_value=[4, 18, 0x2E, 0xE0],
     )
     mock_get_mv = mocker.patch(
-        "vflexctl.device_interface.vflex.get_millivolts_from_protocol_message",
+        "vflexctl.device_interface.core.get_millivolts_from_protocol_message",
         return_value=12000,
     )
 
     v_flex = VFlex(mock_io_port, safe_adjust=False)
     assert v_flex.current_voltage is None
 
-    result = VFlex.get_voltage.__wrapped__(v_flex, update_self=True)
+    with v_flex._within_handshake():
+        result = v_flex.get_voltage(update_self=True)
 
     assert result == 12000
     assert v_flex.current_voltage == 12000
 
-    mock_drain.assert_called_once_with(mock_io_port)
+    mock_drain.assert_called_once_with(
+        mock_io_port, VFlexProto.CMD_GET_VOLTAGE, seconds=0.5, on_first_message=None, on_timeout=None
+    )
     mock_protocol.assert_called_once_with(["midi-bytes"])
     mock_get_mv.assert_called_once_with([4, 18, 0x2E, 0xE0])
 
 
 def test_get_voltage_does_not_update_self_when_update_self_false(mocker, mock_io_port):
     mocker.patch("vflexctl.device_interface.vflex.send_sequence")
-    mocker.patch("vflexctl.device_interface.vflex.drain_incoming", return_value=["midi-bytes"])
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame", return_value=["midi-bytes"])
     mocker.patch(
-        "vflexctl.device_interface.vflex.protocol_message_from_midi_messages",
+        "vflexctl.device_interface.core.protocol_message_from_midi_messages",
         return_value=[4, 18, 0x2E, 0xE0],
     )
     mocker.patch(
-        "vflexctl.device_interface.vflex.get_millivolts_from_protocol_message",
+        "vflexctl.device_interface.core.get_millivolts_from_protocol_message",
         return_value=12000,
     )
 
     v_flex = VFlex(mock_io_port, safe_adjust=False)
     v_flex.current_voltage = 5000
 
-    result = VFlex.get_voltage.__wrapped__(v_flex, update_self=False)
+    with v_flex._within_handshake():
+        result = v_flex.get_voltage(update_self=False)
 
     assert result == 12000
     assert v_flex.current_voltage == 5000
@@ -150,17 +161,18 @@ def test_get_voltage_does_not_update_self_when_update_self_false(mocker, mock_io
 
 def test_get_led_state_updates_self_and_returns(mocker, mock_io_port):
     mocker.patch("vflexctl.device_interface.vflex.send_sequence")
-    mocker.patch("vflexctl.device_interface.vflex.drain_incoming", return_value=["midi-bytes"])
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame", return_value=["midi-bytes"])
     mocker.patch(
-        "vflexctl.device_interface.vflex.protocol_message_from_midi_messages",
+        "vflexctl.device_interface.core.protocol_message_from_midi_messages",
         return_value=[3, 15, 1],
     )
-    mock_decode_led = mocker.patch("vflexctl.device_interface.vflex.protocol_decode_led_state", return_value=True)
+    mock_decode_led = mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=True)
 
     v_flex = VFlex(mock_io_port, safe_adjust=False)
     v_flex.led_state = False
 
-    result = VFlex.get_led_state.__wrapped__(v_flex)
+    with v_flex._within_handshake():
+        result = v_flex.get_led_state()
 
     assert result is True
     assert v_flex.led_state is True
@@ -168,26 +180,18 @@ def test_get_led_state_updates_self_and_returns(mocker, mock_io_port):
 
 
 def test_set_voltage_sends_command_and_updates_voltage(mocker, mock_io_port):
-    mock_set_voltage_command = mocker.patch(
-        "vflexctl.device_interface.vflex.set_voltage_command",
-        return_value=["encoded-voltage"],
-    )
-    mock_prepare_frame = mocker.patch(
-        "vflexctl.device_interface.vflex.prepare_command_frame",
-        return_value=["framed"],
-    )
-    mock_prepare_for_sending = mocker.patch(
-        "vflexctl.device_interface.vflex.prepare_command_for_sending",
-        return_value=["midi-seq"],
+    mock_set_voltage_sequence = mocker.patch(
+        "vflexctl.device_interface.core.set_voltage_sequence",
+        return_value=("midi-seq",),
     )
     mock_send_sequence = mocker.patch("vflexctl.device_interface.vflex.send_sequence")
-    mock_drain = mocker.patch("vflexctl.device_interface.vflex.drain_incoming", return_value=["midi-return"])
+    mock_drain = mocker.patch("vflexctl.device_interface.vflex.drain_until_frame", return_value=["midi-return"])
     mock_protocol = mocker.patch(
-        "vflexctl.device_interface.vflex.protocol_message_from_midi_messages",
+        "vflexctl.device_interface.core.protocol_message_from_midi_messages",
         return_value=[4, 18, 0x2E, 0xE0],
     )
     mock_get_mv = mocker.patch(
-        "vflexctl.device_interface.vflex.get_millivolts_from_protocol_message",
+        "vflexctl.device_interface.core.get_millivolts_from_protocol_message",
         return_value=13000,
     )
 
@@ -196,14 +200,15 @@ def test_set_voltage_sends_command_and_updates_voltage(mocker, mock_io_port):
     # Bypass the decorator behaviour for _guard_voltage in this test.
     v_flex._guard_voltage = guard_mock  # type: ignore[method-assign]
 
-    VFlex.set_voltage.__wrapped__(v_flex, 13000)
+    with v_flex._within_handshake():
+        v_flex.set_voltage(13000)
 
     guard_mock.assert_called_once_with()
-    mock_set_voltage_command.assert_called_once_with(13000)
-    mock_prepare_frame.assert_called_once_with(["encoded-voltage"])
-    mock_prepare_for_sending.assert_called_once_with(["framed"])
-    mock_send_sequence.assert_called_once_with(mock_io_port, ["midi-seq"])
-    mock_drain.assert_called_once_with(mock_io_port)
+    mock_set_voltage_sequence.assert_called_once_with(13000)
+    mock_send_sequence.assert_called_once_with(mock_io_port, ("midi-seq",), pause=vflex_module.DEFAULT_PAUSE_LENGTH)
+    mock_drain.assert_called_once_with(
+        mock_io_port, VFlexProto.CMD_GET_VOLTAGE, seconds=0.5, on_first_message=None, on_timeout=None
+    )
     mock_protocol.assert_called_once_with(["midi-return"])
     mock_get_mv.assert_called_once_with([4, 18, 0x2E, 0xE0])
     assert v_flex.current_voltage == 13000
@@ -211,31 +216,32 @@ def test_set_voltage_sends_command_and_updates_voltage(mocker, mock_io_port):
 
 def test_set_led_state_sends_commands_and_updates_state(mocker, mock_io_port):
     mock_set_led_cmd = mocker.patch(
-        "vflexctl.device_interface.vflex.set_led_state_command",
+        "vflexctl.device_interface.core.set_led_state_command",
         return_value=["encoded-led"],
     )
     mock_prepare_frame = mocker.patch(
-        "vflexctl.device_interface.vflex.prepare_command_frame",
+        "vflexctl.device_interface.core.prepare_command_frame",
         return_value=["framed-led"],
     )
     mock_prepare_for_sending = mocker.patch(
-        "vflexctl.device_interface.vflex.prepare_command_for_sending",
+        "vflexctl.device_interface.core.prepare_command_for_sending",
         return_value=["midi-led"],
     )
     mock_send_sequence = mocker.patch("vflexctl.device_interface.vflex.send_sequence")
     mock_drain = mocker.patch(
-        "vflexctl.device_interface.vflex.drain_incoming",
+        "vflexctl.device_interface.vflex.drain_until_frame",
         side_effect=(["ignored"], ["midi-return"]),
     )
     mock_protocol = mocker.patch(
-        "vflexctl.device_interface.vflex.protocol_message_from_midi_messages",
+        "vflexctl.device_interface.core.protocol_message_from_midi_messages",
         return_value=[3, 15, 1],
     )
-    mock_decode_led = mocker.patch("vflexctl.device_interface.vflex.protocol_decode_led_state", return_value=True)
+    mock_decode_led = mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=True)
 
     v_flex = VFlex(mock_io_port, safe_adjust=False)
 
-    VFlex.set_led_state.__wrapped__(v_flex, True)
+    with v_flex._within_handshake():
+        v_flex.set_led_state(True)
 
     mock_set_led_cmd.assert_called_once_with(True)
     mock_prepare_frame.assert_called_once_with(["encoded-led"])
@@ -245,7 +251,7 @@ def test_set_led_state_sends_commands_and_updates_state(mocker, mock_io_port):
     assert mock_send_sequence.call_count == 2
     first_call, second_call = mock_send_sequence.call_args_list
     assert first_call.args == (mock_io_port, ["midi-led"])
-    assert second_call.args == (mock_io_port, vflex_module.GET_LED_STATE_SEQUENCE)
+    assert second_call.args == (mock_io_port, GET_LED_STATE_SEQUENCE)
 
     assert mock_drain.call_count == 2
     mock_protocol.assert_called_once_with(["midi-return"])
@@ -254,8 +260,8 @@ def test_set_led_state_sends_commands_and_updates_state(mocker, mock_io_port):
 
 
 def test_with_io_name_opens_ioport_and_respects_safe_adjust(mocker):
-    mocker.patch("vflexctl.device_interface.vflex.mido.get_ioport_names", return_value=["VFlex Port"])
-    mock_open = mocker.patch("vflexctl.device_interface.vflex.mido.open_ioport")
+    mocker.patch("vflexctl.midi_transport.transport.mido.get_ioport_names", return_value=["VFlex Port"])
+    mock_open = mocker.patch("vflexctl.midi_transport.transport.mido.open_ioport")
     mock_port = mocker.MagicMock(name="ioport")
     mock_open.return_value = mock_port
 
@@ -268,14 +274,14 @@ def test_with_io_name_opens_ioport_and_respects_safe_adjust(mocker):
 
 
 def test_with_io_name_raises_when_port_missing(mocker):
-    mocker.patch("vflexctl.device_interface.vflex.mido.get_ioport_names", return_value=[])
+    mocker.patch("vflexctl.midi_transport.transport.mido.get_ioport_names", return_value=[])
 
     with pytest.raises(RuntimeError):
         VFlex.with_io_name("Missing Port")
 
 
 def test_get_any_uses_default_port_name(mocker):
-    mock_open = mocker.patch("vflexctl.device_interface.vflex.mido.open_ioport")
+    mock_open = mocker.patch("vflexctl.midi_transport.transport.mido.open_ioport")
     mock_port = mocker.MagicMock(name="ioport")
     mock_open.return_value = mock_port
 
@@ -287,7 +293,7 @@ def test_get_any_uses_default_port_name(mocker):
 
 
 def test_get_any_passes_on_parameters_as_expected(mocker):
-    mock_open = mocker.patch("vflexctl.device_interface.vflex.mido.open_ioport")
+    mock_open = mocker.patch("vflexctl.midi_transport.transport.mido.open_ioport")
     mock_port = mocker.MagicMock(name="ioport")
     mock_open.return_value = mock_port
 
@@ -297,7 +303,7 @@ def test_get_any_passes_on_parameters_as_expected(mocker):
 
 
 def test_mutation_of_full_handshake_with_the_functions(mocker):
-    mocker.patch("vflexctl.device_interface.vflex.mido.open_ioport")
+    mocker.patch("vflexctl.midi_transport.transport.mido.open_ioport")
     mocker.MagicMock(name="ioport")
 
     v_flex = VFlex.get_any()
@@ -313,9 +319,9 @@ def test_mutation_of_full_handshake_with_the_functions(mocker):
 
 
 def test_firmware_version_is_correctly_separated(mocker):
-    mocker.patch("vflexctl.device_interface.vflex.mido.open_ioport")
+    mocker.patch("vflexctl.midi_transport.transport.mido.open_ioport")
     mocker.MagicMock(name="ioport")
-    mock_drain_incoming = mocker.patch("vflexctl.device_interface.vflex.drain_incoming")
+    mock_drain_incoming = mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
 
     mock_drain_incoming.return_value = [  # This returns APP.04.03.00
         (128, 0, 0),
@@ -361,3 +367,239 @@ def test_setting_led_colour_on_old_firmware_raises(mocker):
     v_flex.firmware_version = "APP.04.03.00"
     with pytest.raises(UnsupportedFirmwareVersionError):
         v_flex.set_led_colour(LEDColour.RED)
+
+
+def test_event_driven_v_flex_receives_through_the_callback_receiver(mocker, mock_io_port):
+    mock_drain = mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
+    mocker.patch("vflexctl.device_interface.core.get_millivolts_from_protocol_message", return_value=5000)
+
+    v_flex = VFlex(mock_io_port, safe_adjust=False, event_driven=True)
+    receiver_drain = mocker.patch.object(v_flex.receiver, "drain_until_frame", return_value=["midi-bytes"])
+    with v_flex._within_handshake():
+        v_flex.get_voltage()
+
+    receiver_drain.assert_called_once_with(
+        VFlexProto.CMD_GET_VOLTAGE, seconds=0.5, on_first_message=None, on_timeout=None
+    )
+    mock_drain.assert_not_called()
+
+    v_flex.close()
+    assert v_flex.receiver is None
+    assert mock_io_port.input.callback is None
+    mock_io_port.close.assert_called_once()
+
+
+def test_wake_up_switches_to_the_stored_tuned_pause(mocker, mock_io_port):
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_serial_number", return_value="fooSerial")
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_firmware_version", return_value="APP.04.00.00")
+    mock_send_sequence = mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    save_pacing("fooSerial", "APP.04.00.00", 0.004)
+
+    v_flex = VFlex(mock_io_port, safe_adjust=False)
+    assert v_flex.pause_length == vflex_module.DEFAULT_PAUSE_LENGTH
+    v_flex.wake_up()
+    assert v_flex.pause_length == 0.004
+    v_flex.wake_up()
+    assert mock_send_sequence.call_args.kwargs == {"pause": 0.004}
+
+
+def test_wake_up_keeps_the_default_pause_for_untuned_devices(mocker, mock_io_port):
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_serial_number", return_value="fooSerial")
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_firmware_version", return_value="APP.04.00.00")
+
+    v_flex = VFlex(mock_io_port, safe_adjust=False)
+    v_flex.wake_up()
+
+    assert v_flex.pause_length == vflex_module.DEFAULT_PAUSE_LENGTH
+
+
+def test_tune_pacing_binary_searches_for_the_smallest_reliable_pause(mocker, mock_io_port):
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    v_flex = VFlex(mock_io_port, safe_adjust=False)
+    v_flex.serial_number = "fooSerial"
+    v_flex.firmware_version = "APP.04.00.00"
+    mocker.patch.object(v_flex, "_pacing_trial", side_effect=lambda pause: pause >= 0.0061)
+
+    tuned_pause = v_flex.tune_pacing(trials=2, resolution=0.0005)
+
+    assert tuned_pause == pytest.approx(with_safety_margin(0.0061), abs=0.001)
+    assert v_flex.pause_length == tuned_pause
+    assert load_pacing("fooSerial", "APP.04.00.00") == tuned_pause
+
+
+def test_tune_pacing_refuses_when_the_default_pause_does_not_work(mocker, mock_io_port):
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    v_flex = VFlex(mock_io_port, safe_adjust=False)
+    v_flex.serial_number = "fooSerial"
+    v_flex.firmware_version = "APP.04.00.00"
+    mocker.patch.object(v_flex, "_pacing_trial", return_value=False)
+
+    with pytest.raises(RuntimeError):
+        v_flex.tune_pacing(save=False)
+    assert v_flex.pause_length == vflex_module.DEFAULT_PAUSE_LENGTH
+
+
+@pytest.fixture
+def fake_device(mocker):
+    """Patches the decoding so every reply is a valid one, returning the serial decode mock."""
+    mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    mocker.patch("vflexctl.device_interface.core.protocol_message_from_midi_messages")
+    mocker.patch("vflexctl.device_interface.core.get_millivolts_from_protocol_message", return_value=5000)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_led_state", return_value=False)
+    mocker.patch("vflexctl.device_interface.core.protocol_decode_firmware_version", return_value="APP.04.00.00")
+    yield mocker.patch("vflexctl.device_interface.core.protocol_decode_serial_number", return_value="fooSerial")
+
+
+@pytest.fixture
+def fake_clock(mocker):
+    clock = mocker.MagicMock(return_value=1000.0)
+    mocker.patch("vflexctl.device_interface.core.monotonic", clock)
+    yield clock
+
+
+def test_nested_handshake_decorated_calls_reuse_the_outer_handshake(mocker, mock_io_port, fake_device):
+    v_flex = VFlex(mock_io_port, safe_adjust=True)
+    v_flex.initial_wake_up()
+    fake_device.reset_mock()
+
+    v_flex.set_voltage(5000)
+
+    # set_voltage -> _guard_voltage -> get_voltage used to fetch the serial number three times.
+    assert fake_device.call_count == 1
+
+
+def test_handshake_is_skipped_while_fresh(mocker, mock_io_port, fake_device, fake_clock):
+    v_flex = VFlex(mock_io_port, safe_adjust=True, handshake_ttl=2.0)
+    v_flex.initial_wake_up()
+    fake_device.reset_mock()
+
+    fake_clock.return_value = 1001.0
+    v_flex.get_voltage()
+    v_flex.get_led_state()
+
+    fake_device.assert_not_called()
+
+
+def test_handshake_runs_again_at_the_ttl_boundary_and_still_catches_a_serial_change(
+    mocker, mock_io_port, fake_device, fake_clock
+):
+    v_flex = VFlex(mock_io_port, safe_adjust=True, handshake_ttl=2.0)
+    v_flex.initial_wake_up()
+    fake_device.return_value = "barSerial"
+
+    fake_clock.return_value = 1002.0
+    with pytest.raises(SerialNumberMismatchError):
+        v_flex.get_voltage()
+    assert v_flex.handshake_is_fresh is False
+
+
+def test_failed_operation_expires_the_handshake(mocker, mock_io_port, fake_device, fake_clock):
+    v_flex = VFlex(mock_io_port, safe_adjust=True, handshake_ttl=60.0)
+    v_flex.initial_wake_up()
+    assert v_flex.handshake_is_fresh
+    mocker.patch(
+        "vflexctl.device_interface.core.get_millivolts_from_protocol_message",
+        side_effect=InvalidProtocolMessageLengthError([], 4),
+    )
+
+    with pytest.raises(InvalidProtocolMessageLengthError):
+        v_flex.get_voltage()
+    assert v_flex.handshake_is_fresh is False
+
+
+def test_full_handshakes_ignore_the_ttl(mocker, mock_io_port, fake_device, fake_clock):
+    v_flex = VFlex(mock_io_port, safe_adjust=True, full_handshake=True, handshake_ttl=60.0)
+    v_flex.initial_wake_up()
+    fake_device.reset_mock()
+
+    v_flex.get_led_state()
+
+    fake_device.assert_called_once()
+
+
+def test_set_voltage_is_a_single_exchange_while_fresh(mocker, mock_io_port, fake_device, fake_clock):
+    v_flex = VFlex(mock_io_port, safe_adjust=True, handshake_ttl=60.0)
+    v_flex.initial_wake_up()
+    mock_send_sequence = vflex_module.send_sequence
+    mock_send_sequence.reset_mock()
+
+    v_flex.set_voltage(5000)
+
+    mock_send_sequence.assert_called_once()
+
+
+def test_voltage_guard_reads_again_once_the_ttl_has_passed(mocker, mock_io_port, fake_device, fake_clock):
+    v_flex = VFlex(mock_io_port, safe_adjust=True, handshake_ttl=2.0)
+    v_flex.initial_wake_up()
+    v_flex.current_voltage = 10000
+
+    fake_clock.return_value = 1002.0
+    with pytest.raises(VoltageMismatchError):
+        v_flex.set_voltage(12000)
+
+
+def _replies(*protocol_messages: list[int]) -> list:
+    """All the messages in one envelope, as the device answers a batch."""
+    return prepare_command_for_sending(list(protocol_messages))
+
+
+SERIAL_REPLY = [10, VFlexProto.CMD_GET_SERIAL_NUMBER, *b"fooSeria"]
+FIRMWARE_REPLY = [14, VFlexProto.CMD_GET_FIRMWARE_VERSION, *b"APP.05.00.00"]
+LED_STATE_REPLY = [3, VFlexProto.CMD_GET_LED_STATE, 1]
+VOLTAGE_REPLY = [4, VFlexProto.CMD_GET_VOLTAGE, 0x2E, 0xE0]
+
+
+def test_initial_wake_up_is_one_round_trip(mocker, mock_io_port, no_batched_replies):
+    mock_send = mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    mock_drain = mocker.patch("vflexctl.device_interface.vflex.drain_until_frame")
+    no_batched_replies.return_value = _replies(SERIAL_REPLY, FIRMWARE_REPLY, LED_STATE_REPLY, VOLTAGE_REPLY)
+
+    v_flex = VFlex(mock_io_port)
+    v_flex.initial_wake_up()
+
+    mock_send.assert_called_once()
+    mock_drain.assert_not_called()
+    assert (v_flex.serial_number, v_flex.firmware_version) == ("fooSeria", "APP.05.00.00")
+    assert (v_flex.led_state, v_flex.current_voltage) == (True, 12000)
+    assert v_flex.batch_queries
+
+
+def test_read_skips_the_serial_number_while_the_handshake_is_fresh(mocker, mock_io_port, no_batched_replies):
+    mock_send = mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    no_batched_replies.return_value = _replies(SERIAL_REPLY, FIRMWARE_REPLY, LED_STATE_REPLY, VOLTAGE_REPLY)
+    v_flex = VFlex(mock_io_port, handshake_ttl=60)
+    v_flex.initial_wake_up()
+    mock_send.reset_mock()
+    no_batched_replies.return_value = _replies(LED_STATE_REPLY, [4, VFlexProto.CMD_GET_VOLTAGE, 0x13, 0x88])
+
+    v_flex.read()
+
+    mock_send.assert_called_once_with(
+        mock_io_port,
+        prepare_command_for_sending([[2, VFlexProto.CMD_GET_LED_STATE], [2, VFlexProto.CMD_GET_VOLTAGE]]),
+        pause=v_flex.pause_length,
+    )
+    assert v_flex.current_voltage == 5000
+
+
+def test_query_sends_unanswered_commands_one_at_a_time(mocker, mock_io_port, no_batched_replies):
+    mock_send = mocker.patch("vflexctl.device_interface.vflex.send_sequence")
+    no_batched_replies.return_value = _replies(LED_STATE_REPLY)
+    mocker.patch("vflexctl.device_interface.vflex.drain_until_frame", return_value=_replies(VOLTAGE_REPLY))
+    v_flex = VFlex(mock_io_port)
+
+    results = v_flex.query([VFlexProto.CMD_GET_LED_STATE], [VFlexProto.CMD_GET_VOLTAGE])
+
+    assert results.replies == {VFlexProto.CMD_GET_LED_STATE: LED_STATE_REPLY, VFlexProto.CMD_GET_VOLTAGE: VOLTAGE_REPLY}
+    assert results.led_state is True
+    assert results.millivolts == 12000
+    assert mock_send.call_count == 2
+    assert not v_flex.batch_queries
@@ -0,0 +1,95 @@
+import pytest
+
+from vflexctl.device_interface.watch import WatchStats, watch
+from vflexctl.exceptions import SerialNumberMismatchError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(mocker):
+    fake_clock = FakeClock()
+    mocker.patch("vflexctl.device_interface.watch.monotonic", fake_clock.monotonic)
+    mocker.patch("vflexctl.device_interface.watch.sleep", fake_clock.sleep)
+    yield fake_clock
+
+
+@pytest.fixture
+def v_flex(mocker):
+    """A VFlex whose read() steps through a list of (millivolts, led_state) readings."""
+    device = mocker.MagicMock(name="v_flex", serial_number="fooSerial", current_voltage=None, led_state=None)
+    device.readings = iter([])
+
+    def _read():
+        device.current_voltage, device.led_state = next(device.readings)
+
+    device.read.side_effect = _read
+    yield device
+
+
+def test_watch_yields_every_sample(v_flex, clock):
+    v_flex.readings = iter([(5000, False), (5000, False), (9000, True)])
+
+    samples = list(watch(v_flex, 0.5, count=3))
+
+    assert [(s.millivolts, s.led_state, s.changed) for s in samples] == [
+        (5000, False, True),
+        (5000, False, False),
+        (9000, True, True),
+    ]
+    assert [s.sequence for s in samples] == [0, 1, 2]
+    assert clock.now == 101.0
+
+
+def test_watch_only_yields_changes(v_flex, clock):
+    v_flex.readings = iter([(5000, False), (5000, False), (9000, False), (9000, False)])
+    stats = WatchStats()
+
+    samples = list(watch(v_flex, 0.5, changes_only=True, count=4, stats=stats))
+
+    assert [s.sequence for s in samples] == [0, 2]
+    assert (stats.samples, stats.emitted) == (4, 2)
+    assert stats.achieved_rate == pytest.approx(2.0)
+
+
+def test_watch_counts_missed_deadlines_and_skips_ahead(v_flex, clock):
+    readings = iter([(5000, False)] * 4)
+
+    def _slow_read():
+        v_flex.current_voltage, v_flex.led_state = next(readings)
+        clock.now += 1.2
+
+    v_flex.read.side_effect = _slow_read
+    stats = WatchStats()
+
+    list(watch(v_flex, 0.5, count=4, stats=stats))
+
+    assert stats.missed_deadlines == 3
+    assert stats.max_lateness == pytest.approx(0.7)
+
+
+def test_watch_skips_failed_reads_but_raises_safety_errors(v_flex, clock):
+    v_flex.read.side_effect = [None, ValueError("no reply"), SerialNumberMismatchError("a", "b")]
+    v_flex.current_voltage, v_flex.led_state = 5000, False
+    stats = WatchStats()
+    samples = watch(v_flex, 0.1, stats=stats)
+
+    assert next(samples).sequence == 0
+    with pytest.raises(SerialNumberMismatchError):
+        next(samples)
+    assert (stats.samples, stats.errors) == (3, 1)
+
+
+def test_watch_stops_after_the_duration(v_flex, clock):
+    v_flex.readings = iter([(5000, False)] * 100)
+
+    assert len(list(watch(v_flex, 0.25, duration=1.0))) == 4
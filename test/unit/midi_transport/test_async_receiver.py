@@ -0,0 +1,82 @@
+import asyncio
+
+import mido
+
+from vflexctl.midi_transport.async_receiver import AsyncReceiver
+from vflexctl.protocol import VFlexProto
+
+VOLTAGE_REPLY = [(128, 0, 0), (144, 0, 4), (144, 1, 2), (144, 2, 14), (144, 14, 0), (160, 0, 0)]
+
+
+class FakeCallbackPort:
+    def __init__(self):
+        self.callback = None
+
+    def deliver(self, *triplets):
+        for triplet in triplets:
+            self.callback(mido.Message.from_bytes(list(triplet)))
+
+
+def test_drain_until_frame_wakes_for_messages_from_another_thread():
+    port = FakeCallbackPort()
+
+    async def scenario():
+        receiver = AsyncReceiver(port)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.02, lambda: loop.run_in_executor(None, port.deliver, *VOLTAGE_REPLY))
+        start = loop.time()
+        result = await receiver.drain_until_frame(VFlexProto.CMD_GET_VOLTAGE, seconds=5)
+        return result, loop.time() - start
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == VOLTAGE_REPLY
+    assert elapsed < 1
+
+
+def test_drain_until_frame_times_out_with_partial_data():
+    port = FakeCallbackPort()
+    timeouts = []
+
+    async def scenario():
+        receiver = AsyncReceiver(port)
+        port.deliver(*VOLTAGE_REPLY[:-1])
+        return await receiver.drain_until_frame(
+            VFlexProto.CMD_GET_VOLTAGE, seconds=0.05, on_timeout=lambda: timeouts.append(True)
+        )
+
+    assert asyncio.run(scenario()) == VOLTAGE_REPLY[:-1]
+    assert timeouts == [True]
+
+
+def test_drain_until_replies_waits_for_every_reply():
+    port = FakeCallbackPort()
+    led_state_reply = [(128, 0, 0), (144, 0, 3), (144, 0, 15), (144, 0, 1), (160, 0, 0)]
+    first_message = []
+
+    async def scenario():
+        receiver = AsyncReceiver(port)
+        loop = asyncio.get_running_loop()
+        port.deliver(*VOLTAGE_REPLY)
+        loop.call_later(0.02, lambda: loop.run_in_executor(None, port.deliver, *led_state_reply))
+        return await receiver.drain_until_replies(
+            {VFlexProto.CMD_GET_VOLTAGE, VFlexProto.CMD_GET_LED_STATE},
+            seconds=5,
+            on_first_message=lambda: first_message.append(True),
+        )
+
+    assert asyncio.run(scenario()) == VOLTAGE_REPLY + led_state_reply
+    assert first_message == [True]
+
+
+def test_close_detaches_the_callback():
+    port = FakeCallbackPort()
+
+    async def scenario():
+        receiver = AsyncReceiver(port)
+        port.deliver((144, 0, 1))
+        await asyncio.sleep(0)
+        assert receiver.drain_once() == [(144, 0, 1)]
+        receiver.close()
+
+    asyncio.run(scenario())
+    assert port.callback is None
@@ -0,0 +1,87 @@
+import threading
+from time import perf_counter
+
+import mido
+import pytest
+
+from vflexctl.midi_transport.callback_receiver import CallbackReceiver
+from vflexctl.protocol import VFlexProto
+
+
+class FakeCallbackPort:
+    """Stands in for an rtmidi-backed input, which delivers messages through ``callback``."""
+
+    def __init__(self):
+        self.callback = None
+
+    def deliver(self, *triplets):
+        for triplet in triplets:
+            self.callback(mido.Message.from_bytes(list(triplet)))
+
+
+VOLTAGE_REPLY = [(128, 0, 0), (144, 0, 4), (144, 1, 2), (144, 2, 14), (144, 14, 0), (160, 0, 0)]
+
+
+@pytest.fixture
+def port():
+    yield FakeCallbackPort()
+
+
+def test_callback_receiver_registers_on_the_input_side_of_an_io_port(mocker):
+    io_port = mocker.MagicMock(name="io_port")
+    receiver = CallbackReceiver(io_port)
+    assert io_port.input.callback == receiver._on_message
+
+    receiver.close()
+    assert io_port.input.callback is None
+
+
+def test_drain_once_returns_queued_triplets_as_tuples(port):
+    receiver = CallbackReceiver(port)
+    port.deliver((144, 0, 1), (144, 0, 2))
+
+    assert receiver.drain_once() == [(144, 0, 1), (144, 0, 2)]
+    assert receiver.drain_once() == []
+
+
+def test_drain_until_frame_wakes_when_the_frame_arrives_from_another_thread(port):
+    receiver = CallbackReceiver(port)
+    sender = threading.Timer(0.05, port.deliver, args=VOLTAGE_REPLY)
+    start = perf_counter()
+    sender.start()
+
+    result = receiver.drain_until_frame(VFlexProto.CMD_GET_VOLTAGE, seconds=5)
+
+    assert perf_counter() - start < 1
+    assert result == VOLTAGE_REPLY
+
+
+def test_drain_until_frame_times_out_with_partial_data(port):
+    receiver = CallbackReceiver(port)
+    port.deliver(*VOLTAGE_REPLY[:-1])
+    timeouts = []
+
+    result = receiver.drain_until_frame(
+        VFlexProto.CMD_GET_VOLTAGE, seconds=0.05, on_timeout=lambda: timeouts.append(True)
+    )
+
+    assert result == VOLTAGE_REPLY[:-1]
+    assert timeouts == [True]
+
+
+def test_drain_incoming_collects_for_the_whole_window(port):
+    receiver = CallbackReceiver(port)
+    threading.Timer(0.02, port.deliver, args=[(144, 0, 1)]).start()
+    start = perf_counter()
+
+    result = receiver.drain_incoming(seconds=0.1)
+
+    assert perf_counter() - start >= 0.1
+    assert result == [(144, 0, 1)]
+
+
+def test_wait_for_pending_returns_false_when_nothing_arrives(port):
+    receiver = CallbackReceiver(port)
+    assert receiver.wait_for_pending(0.01) is False
+    port.deliver((144, 0, 1))
+    assert receiver.wait_for_pending(0.01) is True
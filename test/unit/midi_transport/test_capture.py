@@ -0,0 +1,121 @@
+from time import monotonic
+
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.midi_transport.capture import (
+    HEADER_SIZE,
+    CaptureReader,
+    CaptureWriter,
+    Direction,
+    index_path,
+    rebuild_index,
+)
+from vflexctl.protocol import VFlexProto, prepare_command_for_sending, prepare_command_frame
+from vflexctl.simulator import SimulatedVFlex
+
+GET_VOLTAGE = prepare_command_for_sending(prepare_command_frame([VFlexProto.CMD_GET_VOLTAGE]))
+
+
+def _write_frames(path, frames=3):
+    with CaptureWriter(path) as capture:
+        for frame in range(frames):
+            for triplet in GET_VOLTAGE:
+                capture.record(Direction.SENT, triplet, port="VFlex A", serial_number="ABCDEFGH")
+            capture.record(Direction.RECEIVED, VFlexProto.COMMAND_START, port="VFlex B")
+            capture.record(Direction.RECEIVED, (0x90, 0, frame), port="VFlex B")
+            capture.record(Direction.RECEIVED, VFlexProto.COMMAND_END, port="VFlex B")
+
+
+def test_capture_round_trips_records(tmp_path):
+    path = tmp_path / "traffic.vcap"
+    _write_frames(path, frames=1)
+    with CaptureReader(path) as reader:
+        assert len(reader) == len(GET_VOLTAGE) + 3
+        assert reader.ports == ["VFlex A", "VFlex B"]
+        first, last = reader[0], reader[-1]
+        assert first.direction == Direction.SENT
+        assert (first.port, first.serial_number, first.triplet) == ("VFlex A", "ABCDEFGH", VFlexProto.COMMAND_START)
+        assert (last.direction, last.port, last.serial_number) == (Direction.RECEIVED, "VFlex B", None)
+        assert [record.triplet for record in reader.iter_records(stop=len(GET_VOLTAGE))] == GET_VOLTAGE
+        assert reader.started_at_monotonic <= first.timestamp <= last.timestamp <= monotonic()
+        with pytest.raises(IndexError):
+            reader[len(reader)]
+
+
+def test_capture_seeks_by_frame(tmp_path):
+    path = tmp_path / "traffic.vcap"
+    _write_frames(path)
+    with CaptureReader(path) as reader:
+        # Each round is a sent frame then a received one.
+        assert reader.frame_count == 6
+        assert reader.frame_start(2) == len(GET_VOLTAGE) + 3
+        reply = reader.frame(5)
+        assert [record.triplet for record in reply] == [VFlexProto.COMMAND_START, (0x90, 0, 2), VFlexProto.COMMAND_END]
+        assert [record.triplet for record in reader.frame(0)] == GET_VOLTAGE
+        with pytest.raises(IndexError):
+            reader.frame(6)
+
+
+def test_capture_seeks_by_time(tmp_path):
+    path = tmp_path / "traffic.vcap"
+    _write_frames(path)
+    with CaptureReader(path) as reader:
+        third_frame = reader[reader.frame_start(2)]
+        assert reader.frame_at(third_frame.timestamp) == 2
+        assert reader.position_at(third_frame.timestamp) <= reader.frame_start(2)
+        assert reader[reader.position_at(third_frame.timestamp)].timestamp == third_frame.timestamp
+        assert reader.position_at(0) == 0
+        assert reader.position_at(monotonic() + 60) == len(reader)
+        assert reader.frame_at(monotonic() + 60) == reader.frame_count
+
+
+def test_capture_rebuilds_a_missing_index(tmp_path):
+    path = tmp_path / "traffic.vcap"
+    _write_frames(path)
+    written_index = index_path(path).read_bytes()
+    index_path(path).unlink()
+    with CaptureReader(path) as reader:
+        assert reader.frame_count == 6
+    assert index_path(path).read_bytes() == written_index
+    assert rebuild_index(path) == 6
+
+
+def test_capture_cut_short_drops_the_partial_record(tmp_path):
+    path = tmp_path / "traffic.vcap"
+    _write_frames(path, frames=2)
+    data = path.read_bytes()
+    # Cut into the last frame's COMMAND_START, so its index entry points past the end.
+    path.write_bytes(data[: HEADER_SIZE + (len(GET_VOLTAGE) * 2 + 3) * 24 + 10])
+    with CaptureReader(path) as reader:
+        assert len(reader) == len(GET_VOLTAGE) * 2 + 3
+        assert reader.frame_count == 3
+
+
+def test_capture_rejects_other_files(tmp_path):
+    path = tmp_path / "not-a-capture"
+    path.write_bytes(b"\0" * HEADER_SIZE)
+    with pytest.raises(ValueError):
+        CaptureReader(path)
+
+
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_v_flex_records_both_directions(tmp_path, event_driven):
+    path = tmp_path / "traffic.vcap"
+    port = SimulatedVFlex(serial_number="SIMTEST1")
+    with CaptureWriter(path) as capture:
+        v_flex = VFlex(port, wake=True, event_driven=event_driven, capture=capture)
+        v_flex.set_voltage(5000)
+        v_flex.close()
+
+    with CaptureReader(path) as reader:
+        assert reader.ports == [port.name]
+        directions = {record.direction for record in reader}
+        assert directions == {Direction.SENT, Direction.RECEIVED}
+        # Nothing is known about the device until its serial number comes back.
+        assert reader[0].serial_number is None
+        assert reader[-1].serial_number == "SIMTEST1"
+        sent = [record.triplet for record in reader if record.direction == Direction.SENT]
+        received = [record.triplet for record in reader if record.direction == Direction.RECEIVED]
+        # The wake-up batches its queries into one frame, so the device sends more frames than it's sent.
+        assert 0 < sent.count(VFlexProto.COMMAND_START) <= received.count(VFlexProto.COMMAND_START)
@@ -1,6 +1,9 @@
+from time import perf_counter
+
 import mido
 
-from vflexctl.midi_transport.receivers import drain_once, drain_incoming
+from vflexctl.midi_transport.receivers import drain_once, drain_incoming, drain_until_frame, drain_until_replies
+from vflexctl.protocol import VFlexProto
 
 
 def test_drain_once_drains_as_tuple_when_list_is_returned(mocker):
@@ -44,3 +47,86 @@ def test_drain_incoming_keeps_draining_while_in_the_loop(mocker):
     # There should be way more than 5 calls, but this seems like a sensible minimum
     # to be able to say "yes, it tries to get all waiting messages"
     assert iterator_call_count > 5
+
+
+def _voltage_reply() -> list[mido.Message]:
+    triplets = [(128, 0, 0), (144, 0, 4), (144, 1, 2), (144, 2, 14), (144, 14, 0), (160, 0, 0)]
+    return [mido.Message.from_bytes(list(triplet)) for triplet in triplets]
+
+
+def test_drain_until_frame_returns_as_soon_as_the_frame_is_complete(mocker):
+    replies = iter([[], _voltage_reply()])
+    iterator_call_count: int = 0
+
+    def iter_pending_messages():
+        nonlocal iterator_call_count
+        iterator_call_count += 1
+        yield from next(replies, [])
+
+    mock_port = mocker.MagicMock(iter_pending=iter_pending_messages)
+    start = perf_counter()
+    result = drain_until_frame(mock_port, VFlexProto.CMD_GET_VOLTAGE, seconds=5)
+
+    assert perf_counter() - start < 1
+    assert iterator_call_count == 2
+    assert result == [tuple(message.bytes()) for message in _voltage_reply()]
+
+
+def test_drain_until_frame_calls_on_first_message_once(mocker):
+    replies = iter([[], _voltage_reply()[:2], _voltage_reply()[2:]])
+    mock_port = mocker.MagicMock(iter_pending=lambda: iter(next(replies, [])))
+    on_first_message = mocker.Mock()
+    on_timeout = mocker.Mock()
+    drain_until_frame(
+        mock_port, VFlexProto.CMD_GET_VOLTAGE, seconds=5, on_first_message=on_first_message, on_timeout=on_timeout
+    )
+    on_first_message.assert_called_once_with()
+    on_timeout.assert_not_called()
+
+
+def test_drain_until_frame_drops_stale_data_before_the_frame(mocker):
+    stale = mido.Message.from_bytes([144, 0, 1])
+    mock_port = mocker.MagicMock(iter_pending=lambda: iter([stale, *_voltage_reply()]))
+
+    result = drain_until_frame(mock_port, VFlexProto.CMD_GET_VOLTAGE)
+
+    assert result[0] == VFlexProto.COMMAND_START
+    assert (144, 0, 1) not in result
+
+
+def test_drain_until_frame_returns_everything_on_timeout(mocker):
+    message = mido.Message.from_bytes([144, 0, 1])
+    replies = iter([[message]])
+    mock_port = mocker.MagicMock(iter_pending=lambda: iter(next(replies, [])))
+
+    on_timeout = mocker.Mock()
+
+    result = drain_until_frame(mock_port, VFlexProto.CMD_GET_VOLTAGE, seconds=0.05, on_timeout=on_timeout)
+
+    assert result == [(144, 0, 1)]
+    on_timeout.assert_called_once_with()
+
+
+def test_drain_until_frame_returns_empty_list_if_seconds_is_negative():
+    assert drain_until_frame(None, seconds=-1) == []
+
+
+def test_drain_until_replies_waits_for_every_reply(mocker):
+    led_reply = [
+        mido.Message.from_bytes(list(t)) for t in [(128, 0, 0), (144, 0, 3), (144, 0, 15), (144, 0, 1), (160, 0, 0)]
+    ]
+    replies = iter([_voltage_reply(), [], led_reply])
+    mock_port = mocker.MagicMock(iter_pending=lambda: iter(next(replies, [])))
+
+    result = drain_until_replies(mock_port, {VFlexProto.CMD_GET_VOLTAGE, VFlexProto.CMD_GET_LED_STATE}, seconds=5)
+
+    assert result == [tuple(message.bytes()) for message in _voltage_reply() + led_reply]
+
+
+def test_drain_until_replies_returns_everything_on_timeout(mocker):
+    replies = iter([_voltage_reply()])
+    mock_port = mocker.MagicMock(iter_pending=lambda: iter(next(replies, [])))
+
+    result = drain_until_replies(mock_port, {VFlexProto.CMD_GET_VOLTAGE, VFlexProto.CMD_GET_LED_STATE}, seconds=0.05)
+
+    assert result == [tuple(message.bytes()) for message in _voltage_reply()]
@@ -1,4 +1,7 @@
+import asyncio
+
 from vflexctl.midi_transport import senders
+from vflexctl.protocol import VFlexProto
 from vflexctl.types import MIDITriplet
 
 
@@ -22,38 +25,50 @@ def test_send_triplet_sends_single_midi_message(mocker):
     mock_sleep.assert_called_once_with(0.5)
 
 
-def test_send_sequence_calls_send_triplet_for_each_triplet(mocker):
-    """send_sequence should delegate to send_triplet once per triplet, preserving order."""
+def test_send_sequence_sends_each_triplet_in_order(mocker):
+    """send_sequence should send one MIDI message per triplet, preserving order, all through the same output."""
     output = mocker.MagicMock()
+    mocker.patch.object(senders, "sleep")
     sequence: list[MIDITriplet] = [
         (0x90, 0x00, 0x01),
         (0x90, 0x00, 0x02),
         (0x90, 0x01, 0x03),
     ]
 
-    mock_send_triplet = mocker.patch("vflexctl.midi_transport.senders.send_triplet")
-
     senders.send_sequence(output, sequence)
 
-    # We expect one call per triplet, in order.
-    assert mock_send_triplet.call_count == len(sequence)
-    assert [call.args[1] for call in mock_send_triplet.call_args_list] == sequence
-    # First arg should always be the same output.
-    assert all(call.args[0] is output for call in mock_send_triplet.call_args_list)
+    assert [call.args[0].bytes() for call in output.send.call_args_list] == [list(t) for t in sequence]
+
+
+def test_send_sequence_reuses_prebuilt_messages(mocker):
+    output = mocker.MagicMock()
+    mocker.patch.object(senders, "sleep")
+    from_bytes = mocker.spy(senders.Message, "from_bytes")
+
+    senders.send_sequence(output, [VFlexProto.COMMAND_START, (0x90, 0x01, 0x02), VFlexProto.COMMAND_END])
+    senders.send_sequence(output, [VFlexProto.COMMAND_START, (0x90, 0x01, 0x02), VFlexProto.COMMAND_END])
+
+    from_bytes.assert_not_called()
+    first, second = output.send.call_args_list[:3], output.send.call_args_list[3:]
+    assert all(a.args[0] is b.args[0] for a, b in zip(first, second))
+
+
+def test_message_for_triplet_builds_messages_outside_the_protocol():
+    assert senders.message_for_triplet([0xB0, 0x07, 0x64]).bytes() == [0xB0, 0x07, 0x64]
 
 
 def test_send_sequence_logs_sequence(mocker):
-    """send_sequence should log the sequence it is about to send."""
+    """send_sequence should log the sequence it is about to send, at debug level as it runs on every command."""
     mock_log = mocker.patch.object(senders, "log")
     output = mocker.MagicMock()
     sequence: list[MIDITriplet] = [(0x90, 0x00, 0x01)]
 
-    # Patch send_triplet so we don't rely on its behaviour here.
-    mocker.patch("vflexctl.midi_transport.senders.send_triplet")
+    mocker.patch.object(senders, "sleep")
 
     senders.send_sequence(output, sequence)
 
-    mock_log.info.assert_called_once_with("Sending MIDI Sequence", sequence=sequence)
+    mock_log.debug.assert_called_once_with("Sending MIDI Sequence", sequence=sequence)
+    mock_log.info.assert_not_called()
 
 
 def test_send_triplet_uses_default_pause_length_when_not_explicitly_set(mocker):
@@ -64,3 +79,24 @@ def test_send_triplet_uses_default_pause_length_when_not_explicitly_set(mocker):
     senders.send_triplet(output, triplet)
 
     mock_sleep.assert_any_call(senders.DEFAULT_PAUSE_LENGTH)
+
+
+def test_send_sequence_passes_the_pause_to_each_triplet(mocker):
+    output = mocker.MagicMock()
+    mock_sleep = mocker.patch.object(senders, "sleep")
+
+    senders.send_sequence(output, [(0x90, 0x00, 0x01), (0x90, 0x00, 0x02)], pause=0.004)
+
+    assert mock_sleep.call_args_list == [mocker.call(0.004), mocker.call(0.004)]
+
+
+def test_async_send_sequence_paces_with_asyncio_sleep(mocker):
+    output = mocker.MagicMock()
+    mock_sleep = mocker.patch("vflexctl.midi_transport.senders.asyncio.sleep", new=mocker.AsyncMock())
+    sequence: list[MIDITriplet] = [(0x90, 0x00, 0x01), (0x90, 0x00, 0x02)]
+
+    asyncio.run(senders.async_send_sequence(output, sequence, pause=0.01))
+
+    assert [call.args[0].bytes() for call in output.send.call_args_list] == [list(t) for t in sequence]
+    assert mock_sleep.await_count == 2
+    mock_sleep.assert_awaited_with(0.01)
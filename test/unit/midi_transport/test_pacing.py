@@ -0,0 +1,54 @@
+import json
+
+from vflexctl.midi_transport import pacing
+from vflexctl.midi_transport.senders import DEFAULT_PAUSE_LENGTH
+
+
+def test_pacing_file_lives_in_the_app_data_dir(isolated_app_data_dir):
+    assert pacing.pacing_file() == isolated_app_data_dir / "pacing.json"
+
+
+def test_load_pacing_returns_none_when_nothing_is_stored():
+    assert pacing.load_pacing("ABCDEFGH", "APP.04.03.00") is None
+
+
+def test_save_and_load_pacing_is_keyed_by_serial_and_firmware():
+    pacing.save_pacing("ABCDEFGH", "APP.04.03.00", 0.004)
+    pacing.save_pacing("ABCDEFGH", "APP.05.00.00", 0.006)
+    pacing.save_pacing("HGFEDCBA", "APP.04.03.00", 0.008)
+
+    assert pacing.load_pacing("ABCDEFGH", "APP.04.03.00") == 0.004
+    assert pacing.load_pacing("ABCDEFGH", "APP.05.00.00") == 0.006
+    assert pacing.load_pacing("HGFEDCBA", "APP.04.03.00") == 0.008
+
+
+def test_forget_pacing_removes_only_that_device():
+    pacing.save_pacing("ABCDEFGH", "APP.04.03.00", 0.004)
+    pacing.save_pacing("HGFEDCBA", "APP.04.03.00", 0.008)
+
+    pacing.forget_pacing("ABCDEFGH", "APP.04.03.00")
+
+    assert pacing.load_pacing("ABCDEFGH", "APP.04.03.00") is None
+    assert pacing.load_pacing("HGFEDCBA", "APP.04.03.00") == 0.008
+
+
+def test_load_pacing_falls_back_on_a_corrupt_file():
+    path = pacing.pacing_file()
+    path.parent.mkdir(parents=True)
+    path.write_text("{not json")
+
+    assert pacing.load_pacing("ABCDEFGH", "APP.04.03.00") is None
+
+
+def test_load_pacing_ignores_non_numeric_values():
+    path = pacing.pacing_file()
+    path.parent.mkdir(parents=True)
+    path.write_text(json.dumps({pacing.pacing_key("ABCDEFGH", "APP.04.03.00"): "fast"}))
+
+    assert pacing.load_pacing("ABCDEFGH", "APP.04.03.00") is None
+
+
+def test_safety_margin_is_added_but_capped_at_the_default():
+    assert pacing.with_safety_margin(0.0) == pacing.PACING_SAFETY_OFFSET
+    assert pacing.with_safety_margin(0.004) > 0.004
+    assert pacing.with_safety_margin(DEFAULT_PAUSE_LENGTH) == DEFAULT_PAUSE_LENGTH
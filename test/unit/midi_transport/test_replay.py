@@ -0,0 +1,113 @@
+from time import sleep
+
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.midi_transport.capture import CaptureWriter, CapturingTransport, Direction
+from vflexctl.midi_transport.receivers import drain_until_frame
+from vflexctl.midi_transport.replay import Replay
+from vflexctl.protocol import VFlexProto, prepare_command_for_sending, protocol_messages_from_midi_messages
+from vflexctl.simulator import SimulatedVFlex
+
+
+@pytest.fixture
+def recorded_session(tmp_path):
+    """A capture of a VFlex waking up and being set to 5V."""
+    path = tmp_path / "session.vcap"
+    with CaptureWriter(path) as capture:
+        v_flex = VFlex(SimulatedVFlex(serial_number="SIMTEST1", millivolts=9000), wake=True, capture=capture)
+        v_flex.set_voltage(5000)
+        v_flex.close()
+    return path
+
+
+def _replayed_v_flex(replay, **kwargs):
+    v_flex = VFlex(replay.transport(), **kwargs)
+    v_flex.use_tuned_pacing = False
+    v_flex.pause_length = 0
+    return v_flex
+
+
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_replay_reproduces_the_session(recorded_session, event_driven):
+    with Replay(recorded_session) as replay:
+        v_flex = _replayed_v_flex(replay, event_driven=event_driven)
+        v_flex.initial_wake_up()
+        assert (v_flex.serial_number, v_flex.current_voltage) == ("SIMTEST1", 9000)
+        v_flex.set_voltage(5000)
+        assert v_flex.current_voltage == 5000
+        v_flex.close()
+        assert replay.divergences == []
+        assert replay.matched
+
+
+def test_replay_reports_divergences(recorded_session):
+    with Replay(recorded_session) as replay:
+        v_flex = _replayed_v_flex(replay, wake=True)
+        v_flex.set_voltage(6000)
+        assert replay.divergences
+        divergence = replay.divergences[0]
+        assert divergence.port == replay.ports[0]
+        assert divergence.expected != divergence.actual
+        assert replay.reader[divergence.position].triplet == divergence.expected
+        assert not replay.matched
+        # The device gave back what it was recorded giving back.
+        assert v_flex.current_voltage == 5000
+
+
+def test_replay_counts_what_was_never_sent(recorded_session):
+    with Replay(recorded_session) as replay:
+        _replayed_v_flex(replay, wake=True)
+        assert replay.divergences == []
+        assert replay.unsent > 0
+        assert not replay.matched
+
+
+def test_replay_catches_up_after_a_short_frame(tmp_path):
+    path = tmp_path / "frames.vcap"
+    first_frame = [VFlexProto.COMMAND_START, (0x90, 0, 1), (0x90, 0, 2), VFlexProto.COMMAND_END]
+    second_frame = [VFlexProto.COMMAND_START, (0x90, 0, 3), VFlexProto.COMMAND_END]
+    with CaptureWriter(path) as capture:
+        for triplet in first_frame + second_frame:
+            capture.record(Direction.SENT, triplet, port="VFlex")
+        capture.record(Direction.RECEIVED, (0x90, 0, 4), port="VFlex")
+
+    with Replay(path) as replay:
+        transport = replay.transport()
+        for triplet in [VFlexProto.COMMAND_START, (0x90, 0, 1), VFlexProto.COMMAND_END] + second_frame:
+            transport.send_triplet(triplet)
+        assert [(d.position, d.expected, d.actual) for d in replay.divergences] == [
+            (2, (0x90, 0, 2), VFlexProto.COMMAND_END),
+            (3, VFlexProto.COMMAND_END, None),
+        ]
+        assert transport.drain() == [(0x90, 0, 4)]
+        assert replay.unsent == 0
+
+        transport.send_triplet(VFlexProto.COMMAND_START)
+        assert replay.divergences[-1] == (transport.name, None, None, VFlexProto.COMMAND_START)
+
+
+def test_replay_keeps_the_captured_timing(tmp_path):
+    path = tmp_path / "slow.vcap"
+    with CaptureWriter(path) as capture:
+        port = CapturingTransport(SimulatedVFlex(response_latency=0.05), capture)
+        for triplet in prepare_command_for_sending([2, VFlexProto.CMD_GET_VOLTAGE]):
+            port.send_triplet(triplet)
+        assert drain_until_frame(port, VFlexProto.CMD_GET_VOLTAGE)
+        port.close()
+
+    with Replay(path, speed=1.0) as replay:
+        transport = replay.transport()
+        for triplet in prepare_command_for_sending([2, VFlexProto.CMD_GET_VOLTAGE]):
+            transport.send_triplet(triplet)
+        assert transport.drain() == []
+        sleep(0.1)
+        assert protocol_messages_from_midi_messages(transport.drain()) == [[4, VFlexProto.CMD_GET_VOLTAGE, 0x13, 0x88]]
+
+
+def test_replay_rejects_unknown_ports_and_speeds(recorded_session):
+    with pytest.raises(ValueError):
+        Replay(recorded_session, speed=0)
+    with Replay(recorded_session) as replay:
+        with pytest.raises(ValueError):
+            replay.transport("Not a VFlex")
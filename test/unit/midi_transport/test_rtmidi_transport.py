@@ -0,0 +1,152 @@
+from collections import deque
+
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.midi_transport import senders
+from vflexctl.midi_transport.callback_receiver import CallbackReceiver
+from vflexctl.midi_transport.receivers import drain_once
+from vflexctl.midi_transport.rtmidi_transport import RtMidiTransport
+from vflexctl.midi_transport.transport import get_ioport_names, open_ioport
+from vflexctl.protocol import VFlexProto, prepare_command_for_sending
+from vflexctl.simulator import SimulatedDevice
+
+
+class FakeMidiIn:
+    """Just enough of rtmidi.MidiIn: raw byte lists, polled or through a callback."""
+
+    def __init__(self):
+        self.queued = deque()
+        self.callback = None
+        self.ignored = None
+        self.closed = False
+
+    def ignore_types(self, **kwargs):
+        self.ignored = kwargs
+
+    def get_message(self):
+        return (self.queued.popleft(), 0.0) if self.queued and self.callback is None else None
+
+    def set_callback(self, callback):
+        self.callback = callback
+
+    def cancel_callback(self):
+        self.callback = None
+
+    def receive(self, data):
+        if self.callback is not None:
+            self.callback((list(data), 0.0), None)
+        else:
+            self.queued.append(list(data))
+
+    def close_port(self):
+        self.closed = True
+
+    def delete(self):
+        pass
+
+
+class FakeMidiOut:
+    """rtmidi.MidiOut with a simulated VFlex on the other end."""
+
+    def __init__(self, midi_in, device=None):
+        self.midi_in = midi_in
+        self.device = device or SimulatedDevice()
+        self.sent = []
+        self.closed = False
+
+    def send_message(self, data):
+        self.sent.append(data)
+        reply = self.device.receive(tuple(data))
+        if reply is not None:
+            for triplet in reply[1]:
+                self.midi_in.receive(triplet)
+
+    def close_port(self):
+        self.closed = True
+
+    def delete(self):
+        pass
+
+
+@pytest.fixture
+def transport():
+    midi_in = FakeMidiIn()
+    transport = RtMidiTransport("Werewolf vFlex", midi_in=midi_in, midi_out=FakeMidiOut(midi_in))
+    yield transport
+    transport.close()
+
+
+def test_transport_ignores_clock_and_sysex(transport):
+    assert transport._midi_in.ignored == {"sysex": True, "timing": True, "active_sense": True}
+
+
+def test_send_sequence_writes_raw_triplets_without_mido_messages(transport, mocker):
+    mocker.patch.object(senders, "sleep")
+    from_bytes = mocker.spy(senders.Message, "from_bytes")
+    sequence = prepare_command_for_sending([2, VFlexProto.CMD_GET_VOLTAGE])
+
+    senders.send_sequence(transport, sequence)
+
+    assert transport._midi_out.sent == sequence
+    from_bytes.assert_not_called()
+
+
+def test_drain_once_returns_raw_triplets(transport):
+    transport._midi_in.receive([0x90, 0, 1])
+    transport._midi_in.receive([0x90, 0, 2])
+
+    assert drain_once(transport) == [(0x90, 0, 1), (0x90, 0, 2)]
+    assert drain_once(transport) == []
+
+
+def test_callback_receiver_uses_the_transport_callback(transport):
+    receiver = CallbackReceiver(transport)
+    for triplet in prepare_command_for_sending([3, VFlexProto.CMD_GET_LED_STATE, 1]):
+        transport._midi_in.receive(triplet)
+
+    assert receiver.drain_until_frame(VFlexProto.CMD_GET_LED_STATE, seconds=0.1)[1:-1] == [
+        (0x90, 0, 3),
+        (0x90, 0, VFlexProto.CMD_GET_LED_STATE),
+        (0x90, 0, 1),
+    ]
+    receiver.close()
+    assert transport._midi_in.callback is None
+
+
+@pytest.mark.parametrize("event_driven", [False, True])
+def test_v_flex_runs_over_the_transport(transport, event_driven, monkeypatch):
+    monkeypatch.setattr("vflexctl.device_interface.vflex.DEFAULT_PAUSE_LENGTH", 0.0)
+    v_flex = VFlex(transport, wake=True, event_driven=event_driven)
+
+    v_flex.set_voltage(20000)
+
+    assert v_flex.serial_number == "SIM00001"
+    assert v_flex.current_voltage == 20000
+    v_flex.close()
+    assert transport.closed and transport._midi_in.closed and transport._midi_out.closed
+
+
+def test_open_ioport_and_names_use_rtmidi_for_the_rtmidi_backend(mocker):
+    midi_in, midi_out = mocker.MagicMock(name="MidiIn"), mocker.MagicMock(name="MidiOut")
+    midi_in.get_ports.return_value = ["Other", "Werewolf vFlex"]
+    midi_out.get_ports.return_value = ["Werewolf vFlex"]
+    mocker.patch("rtmidi.MidiIn", return_value=midi_in, create=True)
+    mocker.patch("rtmidi.MidiOut", return_value=midi_out, create=True)
+
+    assert get_ioport_names("rtmidi") == ["Werewolf vFlex"]
+    transport = open_ioport("Werewolf vFlex", "rtmidi")
+
+    assert isinstance(transport, RtMidiTransport)
+    midi_in.open_port.assert_called_once_with(1)
+    midi_out.open_port.assert_called_once_with(0)
+
+
+def test_opening_an_unknown_port_fails(mocker):
+    midi_in = mocker.MagicMock(name="MidiIn")
+    midi_in.get_ports.return_value = []
+    mocker.patch("rtmidi.MidiIn", return_value=midi_in, create=True)
+    mocker.patch("rtmidi.MidiOut", create=True)
+
+    with pytest.raises(OSError):
+        RtMidiTransport("Werewolf vFlex")
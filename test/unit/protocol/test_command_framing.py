@@ -35,3 +35,10 @@ def test_prepare_command_for_sending_makes_a_list_of_midi_messages():
     prepared_command = prepare_command_for_sending(command_frame)
     for midi_triplet in prepared_command:
         _ = mido.Message.from_bytes(midi_triplet)
+
+
+def test_midi_triplet_table_matches_splitting_each_byte():
+    assert len(MIDI_TRIPLET_FOR_PROTOCOL_BYTE) == 256
+    for protocol_byte, triplet in enumerate(MIDI_TRIPLET_FOR_PROTOCOL_BYTE):
+        assert triplet == (VFlexProto.NOTE_STATUS, protocol_byte >> 4, protocol_byte & 0x0F)
+    assert prepare_command_for_sending([3, 0xAB, 0x01])[1:-1] == [(0x90, 0, 3), (0x90, 0xA, 0xB), (0x90, 0, 1)]
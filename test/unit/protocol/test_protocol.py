@@ -5,6 +5,7 @@ from vflexctl.protocol.protocol import (
     protocol_message_from_midi_messages,
     validate_and_trim_protocol_message,
 )
+from vflexctl.protocol.stream_decoder import missing_replies, protocol_messages_from_midi_messages
 from vflexctl.protocol.command_framing import midi_bytes_from_protocol_byte
 from vflexctl.types import MIDITriplet
 
@@ -72,3 +73,37 @@ def test_validate_and_trim_protocol_message_raises_when_too_short() -> None:
 
     with pytest.raises(ValueError):
         validate_and_trim_protocol_message(message)
+
+
+def _framed(proto_bytes: list[int]) -> list[MIDITriplet]:
+    midi_messages: list[MIDITriplet] = [VFlexProto.COMMAND_START]
+    midi_messages.extend(midi_bytes_from_protocol_byte(b) for b in proto_bytes)
+    midi_messages.append(VFlexProto.COMMAND_END)
+    return midi_messages
+
+
+def test_protocol_messages_from_midi_messages_splits_batched_envelopes() -> None:
+    batched = _framed([3, VFlexProto.CMD_GET_LED_STATE, 1, 4, VFlexProto.CMD_GET_VOLTAGE, 0x2E, 0xE0])
+    single = _framed([3, VFlexProto.CMD_GET_LED_STATE, 0])
+
+    assert protocol_messages_from_midi_messages(batched + [(0xF8, 0, 0)] + single) == [
+        [3, VFlexProto.CMD_GET_LED_STATE, 1],
+        [4, VFlexProto.CMD_GET_VOLTAGE, 0x2E, 0xE0],
+        [3, VFlexProto.CMD_GET_LED_STATE, 0],
+    ]
+
+
+def test_protocol_messages_from_midi_messages_skips_incomplete_messages() -> None:
+    truncated = _framed([3, VFlexProto.CMD_GET_LED_STATE, 1, 4, VFlexProto.CMD_GET_VOLTAGE, 0x2E])
+    unterminated = _framed([3, VFlexProto.CMD_GET_LED_STATE])[:-1]
+
+    assert protocol_messages_from_midi_messages(truncated + unterminated) == [[3, VFlexProto.CMD_GET_LED_STATE, 1]]
+
+
+def test_missing_replies() -> None:
+    midi_messages = _framed([3, VFlexProto.CMD_GET_LED_STATE, 1])
+
+    assert missing_replies(midi_messages, [VFlexProto.CMD_GET_LED_STATE, VFlexProto.CMD_GET_VOLTAGE]) == {
+        VFlexProto.CMD_GET_VOLTAGE
+    }
+    assert missing_replies(midi_messages, [VFlexProto.CMD_GET_LED_STATE]) == set()
@@ -0,0 +1,100 @@
+import tracemalloc
+
+from vflexctl.protocol import StreamDecoder, VFlexProto
+from vflexctl.protocol.command_framing import midi_bytes_from_protocol_byte, prepare_command_for_sending
+from vflexctl.types import MIDITriplet
+
+VOLTAGE_REPLY = [4, VFlexProto.CMD_GET_VOLTAGE, 0x2E, 0xE0]
+LED_STATE_REPLY = [3, VFlexProto.CMD_GET_LED_STATE, 1]
+
+
+def _nibbles(proto_bytes: list[int]) -> list[MIDITriplet]:
+    return [midi_bytes_from_protocol_byte(b) for b in proto_bytes]
+
+
+def test_message_is_returned_as_soon_as_its_last_byte_arrives() -> None:
+    decoder = StreamDecoder()
+    midi_messages = prepare_command_for_sending(VOLTAGE_REPLY)
+
+    results = [decoder.push(midi_message) for midi_message in midi_messages]
+
+    # Complete on the last nibble, before the COMMAND_END.
+    assert results[-2] == VOLTAGE_REPLY
+    assert results[:-2] == [None] * (len(midi_messages) - 2)
+    assert results[-1] is None
+    assert decoder.messages_decoded == 1
+
+
+def test_several_messages_per_envelope_and_per_chunk() -> None:
+    decoder = StreamDecoder()
+    chunk = prepare_command_for_sending([LED_STATE_REPLY, VOLTAGE_REPLY]) + prepare_command_for_sending(LED_STATE_REPLY)
+
+    assert decoder.feed(chunk[:4]) == [LED_STATE_REPLY]
+    assert decoder.feed(chunk[4:]) == [VOLTAGE_REPLY, LED_STATE_REPLY]
+
+
+def test_feed_until_reply_skips_replies_to_other_commands() -> None:
+    decoder = StreamDecoder()
+    midi_messages = prepare_command_for_sending(LED_STATE_REPLY) + prepare_command_for_sending(VOLTAGE_REPLY)
+
+    # The reply only counts once its envelope has ended.
+    assert decoder.feed_until_reply(midi_messages[:-1], VFlexProto.CMD_GET_VOLTAGE) is None
+    assert decoder.feed_until_reply(midi_messages[-1:], VFlexProto.CMD_GET_VOLTAGE) == VOLTAGE_REPLY
+    assert StreamDecoder().feed_until_reply(midi_messages) == LED_STATE_REPLY
+
+
+def test_feed_until_reply_ignores_messages_shorter_than_their_length() -> None:
+    decoder = StreamDecoder()
+
+    assert decoder.feed_until_reply(prepare_command_for_sending(VOLTAGE_REPLY[:3])) is None
+
+
+def test_recovers_after_a_truncated_message() -> None:
+    decoder = StreamDecoder()
+    truncated = [VFlexProto.COMMAND_START, *_nibbles(VOLTAGE_REPLY[:2])]
+
+    assert decoder.feed(truncated + prepare_command_for_sending(LED_STATE_REPLY)) == [LED_STATE_REPLY]
+    assert decoder.bytes_discarded == 2
+
+
+def test_skips_stray_data_and_heartbeats() -> None:
+    decoder = StreamDecoder()
+    stray = [*_nibbles([1, 2]), (0xF8,), (0xB0, 1, 2)]
+
+    assert decoder.feed(stray + prepare_command_for_sending(VOLTAGE_REPLY) + stray) == [VOLTAGE_REPLY]
+    assert decoder.bytes_discarded == 4
+
+
+def test_skips_the_rest_of_an_envelope_with_a_bad_length_byte() -> None:
+    decoder = StreamDecoder()
+    corrupt = [VFlexProto.COMMAND_START, *_nibbles([0, *VOLTAGE_REPLY]), VFlexProto.COMMAND_END]
+
+    assert decoder.feed(corrupt + prepare_command_for_sending(LED_STATE_REPLY)) == [LED_STATE_REPLY]
+    assert not decoder.in_message
+
+
+def test_iter_decode_is_lazy() -> None:
+    def endless():
+        while True:
+            yield from prepare_command_for_sending(VOLTAGE_REPLY)
+
+    decoded = StreamDecoder().iter_decode(endless())
+
+    assert [next(decoded) for _ in range(3)] == [VOLTAGE_REPLY] * 3
+
+
+def test_memory_does_not_grow_with_the_stream() -> None:
+    decoder = StreamDecoder()
+    chunk = prepare_command_for_sending([VOLTAGE_REPLY, LED_STATE_REPLY]) + _nibbles([5, 6])
+    decoder.feed(chunk)
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(2000):
+            decoder.feed(chunk)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert decoder.messages_decoded == 4002
+    assert after - before < 4096
@@ -0,0 +1,103 @@
+from time import monotonic, sleep
+
+import mido
+import pytest
+
+from vflexctl.command.led import LEDColour
+from vflexctl.device_interface import VFlex
+from vflexctl.protocol import VFlexProto, prepare_command_for_sending, protocol_messages_from_midi_messages
+from vflexctl.simulator import SimulatedDevice, SimulatedVFlex, VirtualVFlex
+
+
+@pytest.fixture
+def simulated_port():
+    port = SimulatedVFlex(serial_number="SIMTEST1", millivolts=9000)
+    yield port
+    port.close()
+
+
+def test_simulated_device_answers_gets():
+    device = SimulatedDevice(serial_number="ABCDEFGH", millivolts=12000, led_state=True)
+    assert device.reply_to([2, VFlexProto.CMD_GET_SERIAL_NUMBER]) == [
+        10,
+        VFlexProto.CMD_GET_SERIAL_NUMBER,
+        *b"ABCDEFGH",
+    ]
+    assert device.reply_to([2, VFlexProto.CMD_GET_VOLTAGE]) == [4, VFlexProto.CMD_GET_VOLTAGE, 0x2E, 0xE0]
+    assert device.reply_to([2, VFlexProto.CMD_GET_LED_STATE]) == [3, VFlexProto.CMD_GET_LED_STATE, 1]
+    assert device.command_counts[VFlexProto.CMD_GET_VOLTAGE] == 1
+
+
+def test_simulated_device_ignores_led_colour_before_firmware_5():
+    device = SimulatedDevice(firmware_version="APP.04.00.00")
+    assert device.reply_to([6, VFlexProto.CMD_SET_LED_COLOUR, 1, int(LEDColour.RED), 2, 0]) is None
+    assert device.led_colour == LEDColour.WHITE
+
+
+def test_simulated_device_rejects_bad_identity():
+    with pytest.raises(ValueError):
+        SimulatedDevice(serial_number="SHORT")
+
+
+def test_v_flex_runs_unchanged_against_simulated_port(simulated_port):
+    v_flex = VFlex(simulated_port, wake=True)
+    assert v_flex.serial_number == "SIMTEST1"
+    assert v_flex.firmware_version == "APP.05.00.00"
+    assert v_flex.current_voltage == 9000
+
+    v_flex.set_voltage(15000)
+    v_flex.set_led_state(True)
+    v_flex.set_led_colour(LEDColour.GREEN)
+
+    device = simulated_port.device
+    assert (device.millivolts, device.led_state, device.led_colour) == (15000, True, LEDColour.GREEN)
+    assert v_flex.current_voltage == 15000
+    assert v_flex.led_state is True
+
+
+def test_simulated_port_answers_batched_queries(simulated_port):
+    v_flex = VFlex(simulated_port, wake=True)
+    v_flex.read()
+    assert v_flex.batch_queries is True
+    assert simulated_port.device.command_counts[VFlexProto.CMD_GET_VOLTAGE] == 2
+
+
+def test_simulated_port_works_event_driven(simulated_port):
+    v_flex = VFlex(simulated_port, wake=True, event_driven=True)
+    v_flex.set_voltage(5000)
+    assert simulated_port.device.millivolts == 5000
+    v_flex.close()
+
+
+def test_simulated_port_delivers_replies_after_latency():
+    port = SimulatedVFlex(response_latency=0.05)
+    sent_at = monotonic()
+    for triplet in prepare_command_for_sending([2, VFlexProto.CMD_GET_VOLTAGE]):
+        port.send(mido.Message.from_bytes(list(triplet)))
+    assert list(port.iter_pending()) == []
+
+    sleep(0.1)
+    received = [tuple(message.bytes()) for message in port.iter_pending()]
+    assert protocol_messages_from_midi_messages(received) == [[4, VFlexProto.CMD_GET_VOLTAGE, 0x13, 0x88]]
+    assert monotonic() - sent_at >= 0.05
+    port.close()
+
+
+def test_virtual_v_flex_reports_missing_virtual_port_support(mocker):
+    mocker.patch(
+        "vflexctl.simulator.virtual_port.mido.open_ioport", side_effect=NotImplementedError("no virtual ports")
+    )
+    with pytest.raises(RuntimeError):
+        VirtualVFlex().open()
+
+
+def test_virtual_v_flex_wires_port_to_simulated_device(mocker):
+    port = mocker.MagicMock(name="virtual_port")
+    mocker.patch("vflexctl.simulator.virtual_port.mido.open_ioport", return_value=port)
+    with VirtualVFlex(millivolts=7000) as virtual:
+        assert virtual.is_open
+        for triplet in prepare_command_for_sending([2, VFlexProto.CMD_GET_VOLTAGE]):
+            port.input.callback(mido.Message.from_bytes(list(triplet)))
+    replies = [tuple(call.args[0].bytes()) for call in port.send.call_args_list]
+    assert protocol_messages_from_midi_messages(replies) == [[4, VFlexProto.CMD_GET_VOLTAGE, 0x1B, 0x58]]
+    port.close.assert_called_once()
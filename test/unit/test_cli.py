@@ -7,3 +7,52 @@ from vflexctl.command.led import LEDColour
 @pytest.mark.parametrize(["option", "expected_value"], list(zip(LEDColourOption, LEDColour)))
 def test_led_option_switches_to_correct_colour(option: LEDColourOption, expected_value: LEDColour):
     assert option.to_led_colour() == expected_value
+
+
+def test_version_is_looked_up_lazily():
+    from vflexctl import main
+
+    assert main.__version_str__ == f"{main.APP_NAME} {main.__version__}"
+    assert main.get_version_str() == main.__version_str__
+
+
+def test_watch_receives_through_a_port_callback(mocker):
+    from typer.testing import CliRunner
+
+    from vflexctl.device_interface import VFlex
+    from vflexctl.main import cli
+    from vflexctl.simulator import SimulatedVFlex
+
+    get_any = mocker.patch.object(
+        VFlex, "get_any", side_effect=lambda **kwargs: VFlex(SimulatedVFlex(), event_driven=kwargs["event_driven"])
+    )
+
+    result = CliRunner().invoke(cli, ["watch", "--count", "1", "--no-reconnect"])
+
+    assert result.exit_code == 0, result.output
+    assert get_any.call_args.kwargs["event_driven"]
+    assert '"millivolts": 5000' in result.output
+
+
+def test_reconcile_receives_through_port_callbacks(mocker, tmp_path):
+    from typer.testing import CliRunner
+
+    from vflexctl.device_interface import VFlex
+    from vflexctl.main import cli
+    from vflexctl.simulator import SimulatedVFlex
+
+    with_serial = mocker.patch.object(
+        VFlex,
+        "with_serial",
+        side_effect=lambda serial, **kwargs: VFlex(
+            SimulatedVFlex(), wake=kwargs["wake"], event_driven=kwargs["event_driven"]
+        ),
+    )
+    profile_path = tmp_path / "profile.toml"
+    profile_path.write_text("[devices.SIM00001]\nvoltage = 12\n")
+
+    result = CliRunner().invoke(cli, ["reconcile", str(profile_path), "--duration", "0.2", "--no-reconnect"])
+
+    assert result.exit_code == 0, result.output
+    assert with_serial.call_args.kwargs["event_driven"]
+    assert "SIM00001: set voltage" in result.output
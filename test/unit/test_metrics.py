@@ -0,0 +1,80 @@
+import urllib.request
+
+import pytest
+
+from vflexctl.device_interface import VFlex
+from vflexctl.exceptions import ReplyTimeoutError, VoltageMismatchError
+from vflexctl.metrics import Histogram, Metrics, MetricsServer, TextfileWriter
+from vflexctl.simulator import SimulatedVFlex
+
+
+def test_histogram_tracks_quantiles_and_max():
+    histogram = Histogram([0.01, 0.1, 1.0])
+    for value in [0.005] * 50 + [0.05] * 49 + [0.5]:
+        histogram.observe(value)
+    assert histogram.counts == [50, 49, 1, 0]
+    assert histogram.quantile(0.5) == pytest.approx(0.01)
+    assert 0.01 < histogram.quantile(0.99) <= 0.1
+    assert histogram.quantile(1) == histogram.max == 0.5
+    assert Histogram().quantile(0.5) == 0
+
+
+def test_prometheus_text_has_cumulative_buckets_and_escaped_labels():
+    metrics = Metrics(buckets=[0.1, 1.0])
+    metrics.observe_operation('say "hi"', 0.05)
+    metrics.observe_operation('say "hi"', 2.0, error=ValueError())
+    metrics.count_sent(4)
+    text = metrics.to_prometheus()
+    assert 'vflexctl_operation_duration_seconds_bucket{operation="say \\"hi\\"",le="0.1"} 1' in text
+    assert 'vflexctl_operation_duration_seconds_bucket{operation="say \\"hi\\"",le="+Inf"} 2' in text
+    assert 'vflexctl_operation_duration_seconds_count{operation="say \\"hi\\""} 2' in text
+    assert 'vflexctl_operation_duration_max_seconds{operation="say \\"hi\\""} 2.0' in text
+    assert 'vflexctl_errors_total{operation="say \\"hi\\"",error="ValueError"} 1' in text
+    assert "vflexctl_midi_bytes_sent_total 12" in text
+    assert text.endswith("\n")
+
+
+def test_v_flex_records_traffic_timeouts_and_errors(mocker):
+    metrics = Metrics()
+    port = SimulatedVFlex()
+    v_flex = VFlex(port, wake=True, metrics=metrics)
+    v_flex.set_voltage(12000)
+    # Only the outermost operation is recorded: set_voltage's handshake and voltage check are part of it.
+    assert set(metrics.latencies) == {"initial_wake_up", "set_voltage"}
+    assert metrics.latencies["set_voltage"].count == 1
+    assert metrics.messages_sent > 0 and metrics.messages_received > 0
+    assert metrics.timeouts == 0
+
+    port.device.millivolts = 5000
+    v_flex.expire_handshake()
+    with pytest.raises(VoltageMismatchError):
+        v_flex.set_voltage(9000)
+    assert metrics.error_count(VoltageMismatchError) == 1
+
+    # The device stops answering: the read is retried, then given up on.
+    mocker.patch.object(port.device, "receive", return_value=None)
+    with pytest.raises(ReplyTimeoutError):
+        v_flex.get_serial_number()
+    assert metrics.timeouts == 3
+    assert metrics.retries == 2
+    assert metrics.error_count(ReplyTimeoutError) == 1
+
+
+def test_metrics_server_serves_the_registry():
+    metrics = Metrics()
+    metrics.count_timeouts()
+    with MetricsServer(metrics, port=0) as server:
+        host, port = server.address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "vflexctl_timeouts_total 1" in response.read().decode()
+
+
+def test_textfile_writer_writes_on_stop(tmp_path):
+    metrics = Metrics()
+    metrics.count_received(2)
+    path = tmp_path / "textfile" / "vflexctl.prom"
+    with TextfileWriter(metrics, path, interval=60):
+        pass
+    assert "vflexctl_midi_messages_received_total 2" in path.read_text()
+    assert [p.name for p in path.parent.iterdir()] == ["vflexctl.prom"]
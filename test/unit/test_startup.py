@@ -0,0 +1,54 @@
+"""
+Guards CLI cold-start time: ``--help`` and ``--version`` must not pull in the device stack, and the
+total import time has to stay under budget.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import vflexctl
+
+# Total import time (sum of every module's own import time, as reported by -X importtime) allowed for
+# ``vflexctl --help``. Most of it is typer rendering the help with rich; the device stack, structlog and
+# pydantic on top of that push it well past this.
+STARTUP_IMPORT_BUDGET_MS = 350
+
+# Modules that --help/--version must never import.
+HEAVY_MODULES = ["mido", "rtmidi", "structlog", "pydantic", "vflexctl.device_interface", "vflexctl.midi_transport"]
+
+
+def _imports_for(*args: str) -> dict[str, int]:
+    env = dict(os.environ)
+    src_dir = str(Path(vflexctl.__file__).parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src_dir, env.get("PYTHONPATH")]))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "vflexctl.main", *args],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    imports: dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _cumulative, module = line.removeprefix("import time:").split("|")
+        imports[module.strip()] = imports.get(module.strip(), 0) + int(self_us)
+    return imports
+
+
+@pytest.mark.parametrize("flag", ["--help", "--version"])
+def test_help_and_version_do_not_import_the_device_stack(flag):
+    imports = _imports_for(flag)
+    loaded = [name for name in imports if any(name == m or name.startswith(m + ".") for m in HEAVY_MODULES)]
+    assert loaded == []
+
+
+def test_help_is_within_the_startup_import_budget():
+    # Take the best of a few runs, so a busy machine doesn't fail the test on its own.
+    total_ms = min(sum(_imports_for("--help").values()) / 1000 for _ in range(3))
+    assert total_ms <= STARTUP_IMPORT_BUDGET_MS, f"--help imports took {total_ms:.0f}ms"